@@ -65,6 +65,7 @@ def eye(
     hide_ui=False,
     debug=False,
     pub_socket_hwm=None,
+    shared_memory=False,
 ):
     """reads eye video and detects the pupil.
 
@@ -87,6 +88,8 @@ def eye(
     Emits data:
         ``pupil.<eye id>``: Pupil data for eye with id ``<eye id>``
         ``frame.eye.<eye id>``: Eye frames with id ``<eye id>``
+        ``shm.pupil.<eye id>``: Shared memory locations of the pupil data, if
+            ``shared_memory`` is enabled. See zmq_tools.Shared_Memory_Msg_Receiver
     """
 
     # We deferr the imports becasue of multiprocessing.
@@ -96,7 +99,14 @@ def eye(
 
     zmq_ctx = zmq.Context()
     ipc_socket = zmq_tools.Msg_Dispatcher(zmq_ctx, ipc_push_url)
-    pupil_socket = zmq_tools.Msg_Streamer(zmq_ctx, ipc_pub_url, pub_socket_hwm)
+    if shared_memory:
+        # Eye frames are not read from shared memory locally and would overwrite
+        # pending pupil data, so they are only published via zmq.
+        pupil_socket = zmq_tools.Shared_Memory_Msg_Streamer(
+            zmq_ctx, ipc_pub_url, pub_socket_hwm, topics=("pupil",)
+        )
+    else:
+        pupil_socket = zmq_tools.Msg_Streamer(zmq_ctx, ipc_pub_url, pub_socket_hwm)
     notify_sub = zmq_tools.Msg_Receiver(zmq_ctx, ipc_sub_url, topics=("notify",))
 
     # logging setup
@@ -137,6 +147,7 @@ def eye(
 
         # Plug-ins
         from plugin import Plugin_List
+        from plugin_timing import Plugin_Timer, capture_frame_interval
 
         # helpers/utils
         from uvc import get_time_monotonic
@@ -198,6 +209,12 @@ def eye(
 
         g_pool.get_timestamp = get_timestamp
         g_pool.get_now = get_time_monotonic
+        g_pool.plugin_timing = Plugin_Timer(
+            g_pool.process,
+            ipc_socket.notify,
+            trace_dir=user_dir,
+            get_budget=lambda: capture_frame_interval(g_pool),
+        )
 
         default_2d, default_3d, available_detectors = available_detector_plugins()
         plugins = manager_classes + source_classes + available_detectors + [Roi]
@@ -237,8 +254,7 @@ def eye(
             clear_gl_screen()
 
             glViewport(0, 0, *g_pool.camera_render_size)
-            for p in g_pool.plugins:
-                p.gl_display()
+            g_pool.plugin_timing.gl_display(g_pool.plugins)
 
             glViewport(0, 0, *window_size)
             # render graphs
@@ -619,12 +635,10 @@ def eye(
                     except KeyError as err:
                         logger.error(f"Attempt to load unknown plugin: {err}")
 
-                for plugin in g_pool.plugins:
-                    plugin.on_notify(notification)
+                g_pool.plugin_timing.on_notify(g_pool.plugins, notification)
 
             event = {}
-            for plugin in g_pool.plugins:
-                plugin.recent_events(event)
+            g_pool.plugin_timing.recent_events(g_pool.plugins, event)
 
             frame = event.get("frame")
             if frame:
@@ -693,7 +707,10 @@ def eye(
                     consume_events_and_render_buffer()
                 glfw.glfwPollEvents()
 
+            g_pool.plugin_timing.finish_iteration()
+
         # END while running
+        g_pool.plugin_timing.stop_trace()
 
         # in case eye recording was still runnnig: Save&close
         if g_pool.writer:
@@ -748,6 +765,7 @@ def eye_profiled(
     hide_ui=False,
     debug=False,
     pub_socket_hwm=None,
+    shared_memory=False,
 ):
     import cProfile
     import subprocess
@@ -755,7 +773,7 @@ def eye_profiled(
     from .eye import eye
 
     cProfile.runctx(
-        "eye(timebase, is_alive_flag,ipc_pub_url,ipc_sub_url,ipc_push_url, user_dir, version, eye_id, overwrite_cap_settings, hide_ui, debug)",
+        "eye(timebase, is_alive_flag,ipc_pub_url,ipc_sub_url,ipc_push_url, user_dir, version, eye_id, overwrite_cap_settings, hide_ui, debug, pub_socket_hwm, shared_memory)",
         {
             "timebase": timebase,
             "is_alive_flag": is_alive_flag,
@@ -769,6 +787,7 @@ def eye_profiled(
             "hide_ui": hide_ui,
             "debug": debug,
             "pub_socket_hwm": pub_socket_hwm,
+            "shared_memory": shared_memory,
         },
         locals(),
         "eye{}.pstats".format(eye_id),
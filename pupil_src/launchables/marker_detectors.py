@@ -9,8 +9,6 @@ See COPYING and COPYING.LESSER for license details.
 ---------------------------------------------------------------------------~(*)
 """
 
-from types import SimpleNamespace
-
 
 def circle_detector(ipc_push_url, pair_url, source_path, batch_size=20):
 
@@ -33,65 +31,109 @@ def circle_detector(ipc_push_url, pair_url, source_path, batch_size=20):
     logger = logging.getLogger(__name__)
 
     # imports
+    import multiprocessing as mp
+    import os
     from time import sleep
-    from video_capture import File_Source, EndofVideoError
-    from circle_detector import CircleTracker
 
+    import numpy as np
+
+    from circle_marker_detection import (
+        detect_circle_markers_task,
+        keyframe_indices,
+        split_frame_indices,
+    )
+    from marker_detection_store import Circle_Marker_Detection_Store
+    from video_capture.utils import VideoSet
+
+    def reference(frame_index, timestamp, markers):
+        markers = [m for m in markers if m["marker_type"] == "Ref"]
+        if not markers:
+            return None
+        return {
+            "norm_pos": tuple(markers[0]["norm_pos"]),
+            "screen_pos": tuple(markers[0]["img_pos"]),
+            "timestamp": timestamp,
+            "index_range": tuple(range(frame_index - 5, frame_index + 5)),
+            "index": frame_index,
+        }
+
+    def should_terminate():
+        while process_pipe.new_data:
+            topic, n = process_pipe.recv()
+            if topic == "terminate":
+                return True
+        return False
+
+    store = None
     try:
-        # TODO: we need fill_gaps=True for correct frame indices to paint the circle
-        # markers on the world stream. But actually we don't want to process gap frames
-        # with the marker detector. We should make an option to only receive non-gap
-        # frames, but with gap-like indices?
-        src = File_Source(SimpleNamespace(), source_path, timing=None, fill_gaps=True)
+        rec_dir, file_name = os.path.split(source_path)
+        set_name = os.path.splitext(file_name)[0]
+        # Gap frames are never decoded, but fill_gaps=True yields the frame
+        # indices of the world stream that the markers are painted on.
+        videoset = VideoSet(rec_dir, set_name, fill_gaps=True)
+        videoset.load_or_build_lookup()
+        timestamps = videoset.lookup.timestamp
+        real_frames = np.flatnonzero(videoset.lookup.container_idx > -1).tolist()
+        store = Circle_Marker_Detection_Store(
+            rec_dir, [video.path for video in videoset.videos]
+        )
 
-        frame = src.get_frame()
         logger.info("Starting calibration marker detection...")
-        frame_count = src.get_frame_count()
+        cached_frames = [idx for idx in real_frames if idx in store]
+        pending_frames = [idx for idx in real_frames if idx not in store]
+        processed_count = len(cached_frames)
+        if cached_frames:
+            logger.info(f"Using stored detections of {processed_count} frames")
 
-        queue = []
-        circle_tracker = CircleTracker()
+        def progress():
+            return 100.0 * processed_count / max(len(real_frames), 1)
 
-        while True:
-            while process_pipe.new_data:
-                topic, n = process_pipe.recv()
-                if topic == "terminate":
+        queue = []
+        for idx in cached_frames:
+            ref = reference(idx, float(timestamps[idx]), store.get(idx))
+            if ref is not None:
+                queue.append((progress(), ref))
+        for batch_start in range(0, len(queue), batch_size):
+            batch = queue[batch_start : batch_start + batch_size]
+            process_pipe.send({"topic": "progress", "data": batch})
+
+        tasks = []
+        if pending_frames:
+            tasks = split_frame_indices(pending_frames, keyframe_indices(videoset))
+        # OpenCV does not work with forked processes
+        context = mp.get_context("spawn")
+        worker_count = max(1, min(len(tasks), mp.cpu_count() - 1))
+        with context.Pool(worker_count) as pool:
+            detections = pool.imap_unordered(
+                detect_circle_markers_task,
+                [(rec_dir, set_name, task) for task in tasks],
+            )
+            remaining_tasks = len(tasks)
+            while remaining_tasks:
+                if should_terminate():
+                    pool.terminate()
                     process_pipe.send(
                         {"topic": "exception", "reason": "User terminated."}
                     )
                     logger.debug("Process terminated")
-                    sleep(1.0)
                     return
-
-            progress = 100.0 * frame.index / frame_count
-
-            markers = [
-                m
-                for m in circle_tracker.update(frame.gray)
-                if m["marker_type"] == "Ref"
-            ]
-
-            if len(markers):
-                ref = {
-                    "norm_pos": markers[0]["norm_pos"],
-                    "screen_pos": markers[0]["img_pos"],
-                    "timestamp": frame.timestamp,
-                    "index_range": tuple(range(frame.index - 5, frame.index + 5)),
-                    "index": frame.index,
-                }
-                queue.append((progress, ref))
-            else:
-                queue.append((progress, None))
-
-            if len(queue) > batch_size:
-                # dequeue batch
-                data = queue[:batch_size]
-                del queue[:batch_size]
-                process_pipe.send({"topic": "progress", "data": data})
-
-            frame = src.get_frame()
-
-    except EndofVideoError:
-        process_pipe.send({"topic": "progress", "data": queue})
+                try:
+                    results = detections.next(timeout=0.1)
+                except mp.TimeoutError:
+                    continue
+                remaining_tasks -= 1
+
+                queue = []
+                for frame_index, timestamp, markers in results:
+                    store.update(frame_index, timestamp, markers)
+                    processed_count += 1
+                    ref = reference(frame_index, timestamp, markers)
+                    if ref is not None:
+                        queue.append((progress(), ref))
+                queue.append((progress(), None))
+                process_pipe.send({"topic": "progress", "data": queue})
+
+        process_pipe.send({"topic": "progress", "data": [(100.0, None)]})
         process_pipe.send({"topic": "finished"})
         logger.debug("Process finished")
 
@@ -101,4 +143,7 @@ def circle_detector(ipc_push_url, pair_url, source_path, batch_size=20):
         process_pipe.send({"topic": "exception", "reason": traceback.format_exc()})
         logger.debug("Process raised Exception")
 
-    sleep(1.0)
+    finally:
+        if store is not None:
+            store.save_to_disk()
+        sleep(1.0)
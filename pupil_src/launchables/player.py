@@ -114,6 +114,7 @@ def player(
             GazeFromOfflineCalibration,
         )
         from system_graphs import System_Graphs
+        from plugin_timing import Plugin_Timer
         from system_timelines import System_Timelines
         from blink_detection import Offline_Blink_Detection
         from audio_playback import Audio_Playback
@@ -372,6 +373,7 @@ def player(
         g_pool.get_timestamp = lambda: 0.0
         g_pool.user_dir = user_dir
         g_pool.rec_dir = rec_dir
+        g_pool.plugin_timing = Plugin_Timer(g_pool.app, ipc_pub.notify, user_dir)
         g_pool.meta_info = meta_info
         g_pool.min_data_confidence = session_settings.get(
             "min_data_confidence", MIN_DATA_CONFIDENCE_DEFAULT
@@ -656,8 +658,7 @@ def player(
             # notify each plugin if there are new notifications:
             for n in new_notifications:
                 handle_notifications(n)
-                for p in g_pool.plugins:
-                    p.on_notify(n)
+                g_pool.plugin_timing.on_notify(g_pool.plugins, n)
 
             events = {}
             # report time between now and the last loop interation
@@ -668,8 +669,7 @@ def player(
             events["gaze"] = []
 
             # allow each Plugin to do its work.
-            for p in g_pool.plugins:
-                p.recent_events(events)
+            g_pool.plugin_timing.recent_events(g_pool.plugins, events)
 
             # check if a plugin need to be destroyed
             g_pool.plugins.clean()
@@ -681,8 +681,7 @@ def player(
 
                 gl_utils.glViewport(0, 0, *g_pool.camera_render_size)
                 g_pool.capture.gl_display()
-                for p in g_pool.plugins:
-                    p.gl_display()
+                g_pool.plugin_timing.gl_display(g_pool.plugins)
 
                 gl_utils.glViewport(0, 0, *window_size)
 
@@ -725,6 +724,9 @@ def player(
                 g_pool.seek_control.wait(events["frame"].timestamp)
                 glfw.glfwSwapBuffers(main_window)
 
+            g_pool.plugin_timing.finish_iteration()
+
+        g_pool.plugin_timing.stop_trace()
         session_settings["loaded_plugins"] = g_pool.plugins.get_initializers()
         session_settings["min_data_confidence"] = g_pool.min_data_confidence
         session_settings[
@@ -26,6 +26,7 @@ def service(
     preferred_remote_port,
     hide_ui,
     debug,
+    shared_memory=False,
 ):
     """Maps pupil to gaze data, can run various plug-ins.
 
@@ -60,7 +61,12 @@ def service(
     zmq_ctx = zmq.Context()
     ipc_pub = zmq_tools.Msg_Dispatcher(zmq_ctx, ipc_push_url)
     gaze_pub = zmq_tools.Msg_Streamer(zmq_ctx, ipc_pub_url)
-    pupil_sub = zmq_tools.Msg_Receiver(zmq_ctx, ipc_sub_url, topics=("pupil",))
+    if shared_memory:
+        pupil_sub = zmq_tools.Shared_Memory_Msg_Receiver(
+            zmq_ctx, ipc_sub_url, topics=("pupil",)
+        )
+    else:
+        pupil_sub = zmq_tools.Msg_Receiver(zmq_ctx, ipc_sub_url, topics=("pupil",))
     notify_sub = zmq_tools.Msg_Receiver(zmq_ctx, ipc_sub_url, topics=("notify",))
 
     poller = zmq.Poller()
@@ -94,6 +100,7 @@ def service(
 
         # Plug-ins
         from plugin import Plugin, Plugin_List, import_runtime_plugins
+        from plugin_timing import Plugin_Timer
         from calibration_choreography import (
             available_calibration_choreography_plugins,
             patch_loaded_plugins_with_choreography_plugin,
@@ -145,6 +152,7 @@ def service(
             return get_time_monotonic() - g_pool.timebase.value
 
         g_pool.get_timestamp = get_timestamp
+        g_pool.plugin_timing = Plugin_Timer(g_pool.app, ipc_pub.notify, user_dir)
 
         # manage plugins
         runtime_plugins = import_runtime_plugins(
@@ -276,17 +284,18 @@ def service(
                         gaze_pub.send(gaze_datum)
                         events["gaze"].append(gaze_datum)
 
-                for plugin in g_pool.plugins:
-                    plugin.recent_events(events=events)
+                g_pool.plugin_timing.recent_events(g_pool.plugins, events)
 
             if notify_sub.socket in socks:
                 topic, n = notify_sub.recv()
                 handle_notifications(n)
-                for plugin in g_pool.plugins:
-                    plugin.on_notify(n)
+                g_pool.plugin_timing.on_notify(g_pool.plugins, n)
 
             # check if a plugin need to be destroyed
             g_pool.plugins.clean()
+            g_pool.plugin_timing.finish_iteration()
+
+        g_pool.plugin_timing.stop_trace()
 
         session_settings["loaded_plugins"] = g_pool.plugins.get_initializers()
         session_settings["version"] = str(g_pool.version)
@@ -334,12 +343,13 @@ def service_profiled(
     preferred_remote_port,
     hide_ui,
     debug,
+    shared_memory=False,
 ):
     import cProfile, subprocess, os
     from .service import service
 
     cProfile.runctx(
-        "service(timebase,eye_procs_alive,ipc_pub_url,ipc_sub_url,ipc_push_url,user_dir,version,preferred_remote_port,hide_ui,debug)",
+        "service(timebase,eye_procs_alive,ipc_pub_url,ipc_sub_url,ipc_push_url,user_dir,version,preferred_remote_port,hide_ui,debug,shared_memory)",
         {
             "timebase": timebase,
             "eye_procs_alive": eye_procs_alive,
@@ -351,6 +361,7 @@ def service_profiled(
             "preferred_remote_port": preferred_remote_port,
             "hide_ui": hide_ui,
             "debug": debug,
+            "shared_memory": shared_memory,
         },
         locals(),
         "service.pstats",
@@ -25,6 +25,7 @@ def world(
     preferred_remote_port,
     hide_ui,
     debug,
+    shared_memory=False,
 ):
     """Reads world video and runs plugins.
 
@@ -178,6 +179,7 @@ def world(
         from accuracy_visualizer import Accuracy_Visualizer
 
         from system_graphs import System_Graphs
+        from plugin_timing import Plugin_Timer, capture_frame_interval
         from camera_intrinsics_estimation import Camera_Intrinsics_Estimation
         from hololens_relay import Hololens_Relay
         from head_pose_tracker.online_head_pose_tracker import Online_Head_Pose_Tracker
@@ -225,12 +227,19 @@ def world(
         g_pool.ipc_push_url = ipc_push_url
         g_pool.eye_procs_alive = eye_procs_alive
         g_pool.preferred_remote_port = preferred_remote_port
+        g_pool.shared_memory_transport = shared_memory
 
         def get_timestamp():
             return get_time_monotonic() - g_pool.timebase.value
 
         g_pool.get_timestamp = get_timestamp
         g_pool.get_now = get_time_monotonic
+        g_pool.plugin_timing = Plugin_Timer(
+            g_pool.process,
+            ipc_pub.notify,
+            trace_dir=user_dir,
+            get_budget=lambda: capture_frame_interval(g_pool),
+        )
 
         # manage plugins
         runtime_plugins = import_runtime_plugins(
@@ -701,8 +710,7 @@ def world(
             # notify each plugin if there are new notifications:
             for n in new_notifications:
                 handle_notifications(n)
-                for p in g_pool.plugins:
-                    p.on_notify(n)
+                g_pool.plugin_timing.on_notify(g_pool.plugins, n)
 
             # a dictionary that allows plugins to post and read events
             events = {}
@@ -710,8 +718,7 @@ def world(
             events["dt"] = get_dt()
 
             # allow each Plugin to do its work.
-            for p in g_pool.plugins:
-                p.recent_events(events)
+            g_pool.plugin_timing.recent_events(g_pool.plugins, events)
 
             # check if a plugin need to be destroyed
             g_pool.plugins.clean()
@@ -741,8 +748,7 @@ def world(
             if window_should_update() and gl_utils.is_window_visible(main_window):
 
                 gl_utils.glViewport(0, 0, *camera_render_size)
-                for p in g_pool.plugins:
-                    p.gl_display()
+                g_pool.plugin_timing.gl_display(g_pool.plugins)
 
                 gl_utils.glViewport(0, 0, *window_size)
                 try:
@@ -782,6 +788,9 @@ def world(
 
                 glfw.glfwSwapBuffers(main_window)
 
+            g_pool.plugin_timing.finish_iteration()
+
+        g_pool.plugin_timing.stop_trace()
         session_settings["loaded_plugins"] = g_pool.plugins.get_initializers()
         session_settings["ui_config"] = g_pool.gui.configuration
         session_settings["version"] = str(g_pool.version)
@@ -844,6 +853,7 @@ def world_profiled(
     preferred_remote_port,
     hide_ui,
     debug,
+    shared_memory=False,
 ):
     import cProfile
     import subprocess
@@ -851,7 +861,7 @@ def world_profiled(
     from .world import world
 
     cProfile.runctx(
-        "world(timebase, eye_procs_alive, ipc_pub_url,ipc_sub_url,ipc_push_url,user_dir,version,preferred_remote_port, hide_ui, debug)",
+        "world(timebase, eye_procs_alive, ipc_pub_url,ipc_sub_url,ipc_push_url,user_dir,version,preferred_remote_port, hide_ui, debug, shared_memory)",
         {
             "timebase": timebase,
             "eye_procs_alive": eye_procs_alive,
@@ -863,6 +873,7 @@ def world_profiled(
             "preferred_remote_port": preferred_remote_port,
             "hide_ui": hide_ui,
             "debug": debug,
+            "shared_memory": shared_memory,
         },
         locals(),
         "world.pstats",
@@ -26,6 +26,7 @@ default_args = {
     "version": False,
     "hide_ui": False,
     "port": 50020,
+    "shared_memory": False,
 }
 parsed_args, unknown_args = PupilArgParser().parse(running_from_bundle, **default_args)
 
@@ -298,6 +299,7 @@ def launcher():
                             parsed_args.hide_ui,
                             parsed_args.debug,
                             n.get("pub_socket_hwm"),
+                            parsed_args.shared_memory,
                         ),
                     ).start()
                 elif "notify.player_process.should_start" in topic:
@@ -329,6 +331,7 @@ def launcher():
                             parsed_args.port,
                             parsed_args.hide_ui,
                             parsed_args.debug,
+                            parsed_args.shared_memory,
                         ),
                     ).start()
                 elif "notify.clear_settings_process.should_start" in topic:
@@ -350,6 +353,7 @@ def launcher():
                             parsed_args.port,
                             parsed_args.hide_ui,
                             parsed_args.debug,
+                            parsed_args.shared_memory,
                         ),
                     ).start()
                 elif "notify.player_drop_process.should_start" in topic:
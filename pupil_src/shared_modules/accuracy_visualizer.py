@@ -380,7 +380,7 @@ class Accuracy_Visualizer(Plugin):
     ):
         gazer = gazer_class(g_pool, params=gazer_params)
 
-        gaze_pos = gazer.map_pupil_to_gaze(pupil_list)
+        gaze_pos = gazer.map_pupil_to_gaze_batch(pupil_list)
         ref_pos = ref_list
 
         width, height = intrinsics.resolution
@@ -169,9 +169,11 @@ class Audio_Playback(System_Plugin_Base):
 
     def _setup_audio_vis(self):
         self.audio_timeline = None
-        self.audio_viz_trans = Audio_Viz_Transform(self.g_pool.rec_dir)
-        self.audio_viz_data = None
+        self.audio_viz_trans = Audio_Viz_Transform(
+            self.g_pool.rec_dir, audio_parts=self.audio_all
+        )
         self.log_scale = False
+        self._drawn_log_scale = False
         self.xlim = (self.g_pool.timestamps[0], self.g_pool.timestamps[-1])
         self.ylim = (0, 210)
 
@@ -316,12 +318,13 @@ class Audio_Playback(System_Plugin_Base):
             return self.audio.timestamps[audio_idx]
 
     def update_audio_viz(self):
-        if self.audio_viz_trans is not None:
-            self.audio_viz_data, finished = self.audio_viz_trans.get_data(
-                log_scale=self.log_scale
-            )
-            if not finished:
-                self.audio_timeline.refresh()
+        if self.audio_viz_trans is None:
+            return
+        envelopes_changed = self.audio_viz_trans.update()
+        log_scale_changed = self.log_scale != self._drawn_log_scale
+        if self.audio_timeline is not None and (envelopes_changed or log_scale_changed):
+            self._drawn_log_scale = self.log_scale
+            self.audio_timeline.refresh()
 
     def setup_pyaudio_output_if_necessary(self):
         if self.pa_stream is not None and not self.pa_stream.is_stopped():
@@ -404,10 +407,14 @@ class Audio_Playback(System_Plugin_Base):
             self.audio_bytes_fifo.append((audio_buffer, audio_playback_time))
 
     def draw_audio(self, width, height, scale):
-        if self.audio_viz_data is None:
+        # One bar per pixel, drawn from the matching envelope level
+        vertices = self.audio_viz_trans.get_vertices(
+            self.xlim, int(width), self.ylim[1], log_scale=self.log_scale
+        )
+        if vertices is None:
             return
         with gl_utils.Coord_System(*self.xlim, *self.ylim):
-            pyglui_utils.draw_bars_buffer(self.audio_viz_data, color=viz_color)
+            pyglui_utils.draw_bars_buffer(vertices, color=viz_color)
 
     def init_ui(self):
         if self.pa_stream is None:
@@ -444,6 +451,8 @@ class Audio_Playback(System_Plugin_Base):
         if self.audio_timer is not None:
             self.audio_timer.cancel()
             self.audio_timer = None
+        if self.audio_viz_trans is not None:
+            self.audio_viz_trans.cleanup()
 
     def check_ts_consistency(self, reference_frame):
         if self.should_check_ts_consistency:
@@ -10,10 +10,14 @@ See COPYING and COPYING.LESSER for license details.
 """
 import collections
 import logging
+import os
+import typing as T
 
 import av
 import numpy as np
 
+import background_helper as bh
+import file_methods as fm
 import pupil_recording
 
 logger = logging.getLogger(__name__)
@@ -86,169 +90,261 @@ def _load_audio_single(file_path, return_pts_based_timestamps=False):
     return LoadedAudio(container, stream, timestamps)
 
 
-class Audio_Viz_Transform:
-    def __init__(self, rec_dir, sps_rate=60):
-        self.audio_all = iter(load_audio(rec_dir))
-        self._setup_next_audio_part()
-        self._first_part_start = self.audio.timestamps[0]
-
-        self.sps_rate = sps_rate
-        self.all_abs_samples = None
-        self.finished = False
-        self.a_levels = None
-        self.a_levels_log = None
-        self.final_rescale = True
-        self.log_scaling = False
-
-    def _setup_next_audio_part(self):
-        self.audio = next(self.audio_all)
-        self.audio_resampler = av.audio.resampler.AudioResampler(
-            format=self.audio.stream.format, layout=self.audio.stream.layout, rate=60
-        )
-        self.next_audio_frame = self._next_audio_frame()
-        self.start_ts = self.audio.timestamps[0]
-
-    def _next_audio_frame(self):
-        for packet in self.audio.container.demux(self.audio.stream):
-            for frame in packet.decode():
-                if frame:
-                    yield frame
-
-    def sec_to_frames(self, sec):
-        return int(np.ceil(sec * self.audio.stream.rate / self.audio.stream.frame_size))
-
-    def get_data(self, seconds=30.0, height=210, log_scale=False):
-        import itertools
-
-        finished = self.finished
-        if not finished:
-            allSamples = None
-            frames_to_fetch = self.sec_to_frames(seconds)
-            if frames_to_fetch > 0:
-                frames_chunk = itertools.islice(self.next_audio_frame, frames_to_fetch)
-            for af in frames_chunk:
-                audio_frame = af
+# Number of audio samples per bin of the finest envelope level
+ENVELOPE_BASE_BIN_SIZE = 256
+
+
+def _audio_file_key(file_path) -> T.List[int]:
+    stat = os.stat(file_path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+class Audio_Envelope:
+    """Min/max pyramid of the waveform of an audio file
+
+    Level 0 holds the minimum and maximum of every `base_bin_size` samples, every
+    further level halves the number of bins until a single bin remains. Envelopes
+    are stored next to the recording and memory-mapped when loaded.
+    """
+
+    version = 1
+
+    def __init__(self, levels, sample_rate: float, base_bin_size: int):
+        self._levels = levels
+        self.sample_rate = sample_rate
+        self.base_bin_size = base_bin_size
+
+    @classmethod
+    def from_base_level(cls, minima, maxima, sample_rate, base_bin_size):
+        level = np.column_stack((minima, maxima)).astype(np.float32)
+        levels = [level]
+        while len(level) > 1:
+            if len(level) % 2:
+                level = np.concatenate((level, level[-1:]))
+            pairs = level.reshape(-1, 2, 2)
+            level = np.column_stack(
+                (pairs[:, :, 0].min(axis=1), pairs[:, :, 1].max(axis=1))
+            )
+            levels.append(level)
+        return cls(levels, sample_rate, base_bin_size)
+
+    @property
+    def level_count(self) -> int:
+        return len(self._levels)
+
+    @property
+    def peak(self) -> float:
+        """Highest absolute amplitude of the whole file"""
+        if not len(self._levels[-1]):
+            return 0.0
+        return float(np.abs(self._levels[-1]).max())
+
+    def level(self, level_idx: int) -> np.ndarray:
+        """(minimum, maximum) per bin of a level"""
+        return self._levels[level_idx]
+
+    def bin_duration(self, level_idx: int) -> float:
+        return self.base_bin_size * 2 ** level_idx / self.sample_rate
+
+    def level_idx_for(self, bin_duration: float) -> int:
+        """Finest level with bins of at least `bin_duration` seconds"""
+        for level_idx in range(self.level_count):
+            if self.bin_duration(level_idx) >= bin_duration:
+                return level_idx
+        return self.level_count - 1
+
+    @staticmethod
+    def _paths(cache_dir, file_path) -> T.Tuple[str, str]:
+        base_path = os.path.join(cache_dir, os.path.basename(file_path) + ".envelope")
+        return base_path + ".npy", base_path + ".meta"
+
+    def save(self, cache_dir, file_path):
+        data_path, meta_path = self._paths(cache_dir, file_path)
+        os.makedirs(cache_dir, exist_ok=True)
+        level_offsets = np.cumsum([0] + [len(level) for level in self._levels])
+        np.save(data_path, np.concatenate(self._levels))
+        meta = {
+            "version": self.version,
+            "key": _audio_file_key(file_path),
+            "level_offsets": level_offsets.tolist(),
+            "sample_rate": self.sample_rate,
+            "base_bin_size": self.base_bin_size,
+        }
+        fm.save_object(meta, meta_path)
+
+    @classmethod
+    def load(cls, cache_dir, file_path) -> T.Optional["Audio_Envelope"]:
+        """Stored envelope of an audio file, None if missing or outdated"""
+        data_path, meta_path = cls._paths(cache_dir, file_path)
+        try:
+            meta = fm.load_object(meta_path, allow_legacy=False)
+            key = _audio_file_key(file_path)
+            if meta["version"] != cls.version or meta["key"] != key:
+                return None
+            data = np.load(data_path, mmap_mode="r")
+        except (OSError, ValueError, KeyError):
+            return None
+        offsets = meta["level_offsets"]
+        levels = [data[start:stop] for start, stop in zip(offsets, offsets[1:])]
+        return cls(levels, meta["sample_rate"], meta["base_bin_size"])
+
+
+def compute_audio_envelope(
+    file_path, base_bin_size=ENVELOPE_BASE_BIN_SIZE
+) -> T.Optional[Audio_Envelope]:
+    try:
+        container = av.open(str(file_path))
+        stream = next(iter(container.streams.audio))
+    except (av.AVError, StopIteration):
+        return None
+
+    resampler = av.audio.resampler.AudioResampler(
+        format="flt", layout="mono", rate=stream.rate
+    )
+    minima, maxima = [], []
+    pending = np.empty(0, dtype=np.float32)
+
+    def add_samples(audio_frame, pending):
+        samples = np.frombuffer(audio_frame.planes[0], dtype=np.float32)
+        pending = np.concatenate((pending, samples[: audio_frame.samples]))
+        full_bins_size = len(pending) - len(pending) % base_bin_size
+        if full_bins_size:
+            bins = pending[:full_bins_size].reshape(-1, base_bin_size)
+            minima.append(bins.min(axis=1))
+            maxima.append(bins.max(axis=1))
+        return pending[full_bins_size:]
+
+    try:
+        for packet in container.demux(stream):
+            for audio_frame in packet.decode():
                 audio_frame.pts = None
-                # af_dbl = audio_resampler1.resample(af)
-                # lp_graph_list[0].push(af)
-                # audio_frame = lp_graph_list[-1].pull()
-                # if audio_frame is None:
-                #    continue
-                # audio_frame.pts = None
-                audio_frame_rs = self.audio_resampler.resample(audio_frame)
-                if audio_frame_rs is None:
-                    continue
-                samples = np.frombuffer(audio_frame_rs.planes[0], dtype=np.float32)
-                if allSamples is not None:
-                    allSamples = np.concatenate((allSamples, samples), axis=0)
-                else:
-                    allSamples = samples
-
-            # flush
-            audio_frame_rs = self.audio_resampler.resample(None)
-            if audio_frame_rs is not None:
-                samples = np.frombuffer(audio_frame_rs.planes[0], dtype=np.float32)
-                if allSamples is not None:
-                    allSamples = np.concatenate((allSamples, samples), axis=0)
-                else:
-                    allSamples = samples
-            if allSamples is not None:
-                new_ts = (
-                    np.arange(0, len(allSamples), 1, dtype=np.float32)
-                    / self.audio_resampler.rate
-                )
-                new_ts += self.start_ts
-                self.start_ts = new_ts[-1] + 1 / self.audio_resampler.rate
-
-                abs_samples = np.abs(allSamples)
-                if self.all_abs_samples is not None:
-                    self.all_abs_samples = np.concatenate(
-                        (self.all_abs_samples, abs_samples), axis=0
-                    )
-                else:
-                    self.all_abs_samples = abs_samples
-
-                scaled_samples_log = self.log_scale(abs_samples)
-
-                if abs_samples.max() - abs_samples.min() > 0.0:
-                    scaled_samples = (abs_samples - abs_samples.min()) / (
-                        abs_samples.max() - abs_samples.min()
-                    )
-                elif abs_samples.max() > 0.0:
-                    scaled_samples = abs_samples / abs_samples.max()
-                else:
-                    scaled_samples = abs_samples
-
-            else:
-                new_ts = self.a_levels[::4]  # reconstruct correct ts
-
-                # self.all_abs_samples = np.log10(self.all_abs_samples)
-                self.all_abs_samples[-1] = 0.0
-
-                scaled_samples_log = self.log_scale(self.all_abs_samples)
-
-                if self.all_abs_samples.max() - self.all_abs_samples.min() > 0.0:
-                    scaled_samples = (
-                        self.all_abs_samples - self.all_abs_samples.min()
-                    ) / (self.all_abs_samples.max() - self.all_abs_samples.min())
-                elif self.all_abs_samples.max() > 0.0:
-                    scaled_samples = self.all_abs_samples / self.all_abs_samples.max()
-                else:
-                    scaled_samples = self.all_abs_samples
-                self.a_levels = None
-
-                try:
-                    self._setup_next_audio_part()
-                except StopIteration:
-                    self.finished = True
-            if not self.finished or self.final_rescale:
-                a_levels = self.get_verteces(new_ts, scaled_samples, height)
-
-                if self.a_levels is not None:
-                    self.a_levels = np.concatenate((self.a_levels, a_levels), axis=0)
-                else:
-                    self.a_levels = a_levels
-
-                a_levels_log = self.get_verteces(new_ts, scaled_samples_log, height)
-
-                if self.a_levels_log is not None:
-                    self.a_levels_log = np.concatenate(
-                        (self.a_levels_log, a_levels_log), axis=0
-                    )
-                else:
-                    self.a_levels_log = a_levels_log
-
-        if not log_scale:
-            ret = self.a_levels
-        else:
-            ret = self.a_levels_log
-
-        if self.log_scaling != log_scale:
-            self.log_scaling = log_scale
-            finished = False
-
-        return ret, finished
-
-    def get_verteces(self, new_ts, scaled_samples, height):
-        points_y1 = scaled_samples * (-height / 2) + height / 2
-        points_xy1 = np.concatenate(
-            (new_ts.reshape(-1, 1), points_y1.reshape(-1, 1)), 1
-        )
-        points_y2 = scaled_samples * (height / 2) + height / 2
-        points_xy2 = np.concatenate(
-            (new_ts.reshape(-1, 1), points_y2.reshape(-1, 1)), 1
-        )
-        # a_levels = [alevel for alevel in zip(new_ts, scaled_samples)]
-        a_levels = np.concatenate((points_xy1, points_xy2), 1).reshape(-1)
+                audio_frame = resampler.resample(audio_frame)
+                if audio_frame is not None:
+                    pending = add_samples(audio_frame, pending)
+        # flush
+        audio_frame = resampler.resample(None)
+        if audio_frame is not None:
+            pending = add_samples(audio_frame, pending)
+    except av.AVError:
+        logger.warning(f"Could not decode all audio of {file_path}")
+    finally:
+        container.close()
+
+    if len(pending):
+        minima.append(pending.min(keepdims=True))
+        maxima.append(pending.max(keepdims=True))
+    if not minima:
+        return None
+    return Audio_Envelope.from_base_level(
+        np.concatenate(minima), np.concatenate(maxima), stream.rate, base_bin_size
+    )
+
 
-        return a_levels
+def build_audio_envelopes(file_paths, cache_dir):
+    """Computes envelopes of audio files, yields (file path, envelope) of each
+
+    Envelopes are stored in `cache_dir` if possible. The stored envelopes are only a
+    cache, e.g. read-only recordings are visualized without them.
+    """
+    for file_path in file_paths:
+        envelope = compute_audio_envelope(file_path)
+        if envelope is not None:
+            try:
+                envelope.save(cache_dir, file_path)
+            except OSError:
+                logger.debug(
+                    f"Could not save audio envelope to {cache_dir}", exc_info=True
+                )
+        yield file_path, envelope
 
-    def log_scale(self, abs_samples):
-        scaled_samples = abs_samples / abs_samples.max() + 0.0001
-        scaled_samples_log = 10 * np.log10(scaled_samples)
-        sc_min = scaled_samples_log.min()
-        scaled_samples_log += -sc_min
-        sc_max = scaled_samples_log.max()
-        scaled_samples_log /= sc_max
 
-        return scaled_samples_log
+class Audio_Viz_Transform:
+    """Audio waveform of a recording for the audio timeline
+
+    Envelopes are computed once per audio file by a background process and memory-
+    mapped on later opens. The timeline is drawn from the envelope level that
+    matches its resolution, without decoding audio in the main loop.
+    """
+
+    def __init__(self, rec_dir, audio_parts=None):
+        if audio_parts is None:
+            audio_parts = load_audio(rec_dir)
+        self._cache_dir = os.path.join(rec_dir, "offline_data", "audio_envelopes")
+        self._file_paths = [part.container.name for part in audio_parts]
+        self._start_timestamps = [float(part.timestamps[0]) for part in audio_parts]
+        self._envelopes = [
+            Audio_Envelope.load(self._cache_dir, file_path)
+            for file_path in self._file_paths
+        ]
+
+        missing = [
+            file_path
+            for file_path, envelope in zip(self._file_paths, self._envelopes)
+            if envelope is None
+        ]
+        self._task = None
+        if missing:
+            self._task = bh.IPC_Logging_Task_Proxy(
+                "Audio envelopes",
+                build_audio_envelopes,
+                args=(missing, self._cache_dir),
+            )
+
+    def update(self) -> bool:
+        """Takes envelopes finished in the background, returns True if any"""
+        if self._task is None:
+            return False
+        changed = False
+        for file_path, envelope in self._task.fetch():
+            idx = self._file_paths.index(file_path)
+            self._envelopes[idx] = envelope
+            changed = True
+        if self._task.completed:
+            self._task = None
+        return changed
+
+    def get_vertices(self, xlim, bin_count, height, log_scale=False):
+        """Bars for `draw_bars_buffer()`, one per timeline bin, or None if no data"""
+        start, stop = xlim
+        bin_duration = (stop - start) / max(bin_count, 1)
+        peaks = [env.peak for env in self._envelopes if env is not None]
+        if not peaks:
+            return None
+
+        timestamps, amplitudes = [], []
+        for start_ts, envelope in zip(self._start_timestamps, self._envelopes):
+            if envelope is None:
+                continue
+            level_idx = envelope.level_idx_for(bin_duration)
+            level = envelope.level(level_idx)
+            duration = envelope.bin_duration(level_idx)
+            first = max(int((start - start_ts) / duration), 0)
+            last = min(int(np.ceil((stop - start_ts) / duration)), len(level))
+            if first >= last:
+                continue
+            amplitudes.append(np.abs(level[first:last]).max(axis=1))
+            timestamps.append(start_ts + (np.arange(first, last) + 0.5) * duration)
+        if not timestamps:
+            return None
+
+        timestamps = np.concatenate(timestamps)
+        amplitudes = np.concatenate(amplitudes)
+        if max(peaks) > 0.0:
+            amplitudes = amplitudes / max(peaks)
+        if log_scale:
+            amplitudes = self.log_scale(amplitudes)
+
+        points_y1 = amplitudes * (-height / 2) + height / 2
+        points_y2 = amplitudes * (height / 2) + height / 2
+        vertices = np.column_stack((timestamps, points_y1, timestamps, points_y2))
+        return vertices.astype(np.float32).reshape(-1)
+
+    def log_scale(self, amplitudes):
+        """Maps normalized amplitudes to [0, 1] over a range of 40 dB"""
+        scaled_samples_log = 10 * np.log10(amplitudes + 0.0001)
+        return (scaled_samples_log + 40.0) / 40.0
+
+    def cleanup(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
@@ -611,3 +611,91 @@ class _AudioPacketIterator:
         "u8": "u1",
         "u8p": "u1",
     }
+
+
+def _video_stream_signature(stream) -> tuple:
+    codec_context = stream.codec_context
+    extradata = codec_context.extradata or b""
+    return codec_context.name, codec_context.width, codec_context.height, extradata
+
+
+def _check_video_segments_compatible(segment_paths: T.Sequence[str]):
+    """Raises ValueError if the segments can not be remuxed into a single stream"""
+    signatures = []
+    for segment_path in segment_paths:
+        with av.open(segment_path) as container:
+            signatures.append(_video_stream_signature(container.streams.video[0]))
+    for segment_path, signature in zip(segment_paths[1:], signatures[1:]):
+        if signature != signatures[0]:
+            raise ValueError(
+                f"Video segment {segment_path} was encoded differently than"
+                f" {segment_paths[0]} and can not be concatenated without"
+                " re-encoding"
+            )
+
+
+def concatenate_video_segments(
+    segment_paths: T.Sequence[str],
+    output_file_path: str,
+    start_time_synced: float,
+    audio_dir: T.Optional[str] = None,
+    timestamp_export_format: T.Optional[str] = "npy",
+):
+    """Concatenates videos written by AV_Writer without re-encoding
+
+    All segments need to be written with the same codec settings and the same
+    `start_time_synced`, such that their pts are continuous, and with their
+    timestamps saved as `npy`. Audio from `audio_dir` is muxed once for the
+    whole output, equivalent to MPEG_Audio_Writer.
+    """
+    _check_video_segments_compatible(segment_paths)
+
+    timestamps = []
+    output = av.open(output_file_path, "w")
+    template_container = av.open(segment_paths[0])
+    try:
+        video_stream = output.add_stream(template=template_container.streams.video[0])
+
+        audio_packets, audio_time_base = iter(()), None
+        if audio_dir is not None:
+            try:
+                audio_parts = audio_utils.load_audio(audio_dir)
+            except audio_utils.NoAudioLoadedError:
+                logger.debug("Could not mux audio. File not found.")
+            else:
+                audio_stream = MPEG_Audio_Writer._add_stream(
+                    container=output, template=audio_parts[0].stream
+                )
+                audio_packets = _AudioPacketIterator(
+                    start_time=start_time_synced,
+                    audio_parts=audio_parts,
+                    audio_export_stream=audio_stream,
+                    fill_gaps=True,
+                ).iterate_audio_packets()
+                audio_time_base = audio_stream.time_base
+
+        for segment_path in segment_paths:
+            segment = Video(segment_path)
+            timestamps.append(segment.timestamps)
+            with av.open(segment_path) as container:
+                for packet in container.demux(video=0):
+                    if packet.dts is None:
+                        # flushing packet, does not contain data
+                        continue
+                    video_ts = packet.pts * packet.time_base
+                    packet.stream = video_stream
+                    output.mux(packet)
+
+                    # mux all audio packets up to the current frame timestamp
+                    for audio_packet in audio_packets:
+                        output.mux(audio_packet)
+                        if audio_packet.pts * audio_time_base > video_ts:
+                            break
+    finally:
+        output.close()
+        template_container.close()
+
+    if timestamp_export_format is not None:
+        write_timestamps(
+            output_file_path, np.concatenate(timestamps), timestamp_export_format
+        )
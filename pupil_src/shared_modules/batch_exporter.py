@@ -30,8 +30,12 @@ if __name__ == "__main__":
 
 from plugin import Plugin, System_Plugin_Base
 
-from exporter import export as export_function
 from player_methods import is_pupil_rec_dir
+from video_export.plugins.world_video_exporter import (
+    Segmented_World_Video_Export,
+    export_segment_count,
+    split_export_range,
+)
 
 
 def get_recording_dirs(data_dir):
@@ -159,20 +163,21 @@ class Batch_Export(System_Plugin_Base):
 
     def init_export(self):
         self.in_queue = False
+        segments = split_export_range(0, self.frames_to_export, export_segment_count())
+        # the last segment includes frames filling gaps after the last recorded one
+        segments[-1] = (segments[-1][0], None)
+        # empty eye data: recorded pupil and gaze data are loaded by each segment
         args = (
             self.rec_dir,
             self.g_pool.user_dir,
             self.g_pool.min_data_confidence,
-            None,
-            None,
+            segments,
             self.plugins,
             self.out_file_path,
-            {},
+            [{}] * len(segments),
         )
-        self.process = bh.IPC_Logging_Task_Proxy(
-            "Pupil Batch Export {}".format(self.out_file_path),
-            export_function,
-            args=args,
+        self.process = Segmented_World_Video_Export(
+            "Pupil Batch Export {}".format(self.out_file_path), *args
         )
         self.notify_all(
             {"subject": "batch_export.started", "out_file_path": self.out_file_path}
@@ -0,0 +1,20 @@
+"""
+(*)~---------------------------------------------------------------------------
+Pupil - eye tracking platform
+Copyright (C) 2012-2020 Pupil Labs
+
+Distributed under the terms of the GNU
+Lesser General Public License (LGPL v3.0).
+See COPYING and COPYING.LESSER for license details.
+---------------------------------------------------------------------------~(*)
+"""
+from .runner import (
+    DEFAULT_MEMORY_PER_WORKER,
+    Pipeline_Runner,
+    Stage_Scheduler,
+    default_worker_count,
+    run_stage,
+    save_report,
+)
+from .stage_cache import Stage_Cache
+from .stages import Recording_Job, Stage, Stage_Not_Applicable, default_stages
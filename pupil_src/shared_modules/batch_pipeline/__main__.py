@@ -0,0 +1,150 @@
+"""
+(*)~---------------------------------------------------------------------------
+Pupil - eye tracking platform
+Copyright (C) 2012-2020 Pupil Labs
+
+Distributed under the terms of the GNU
+Lesser General Public License (LGPL v3.0).
+See COPYING and COPYING.LESSER for license details.
+---------------------------------------------------------------------------~(*)
+"""
+import argparse
+import logging
+import os
+import sys
+from textwrap import dedent
+
+# Make all pupil shared_modules available to this Python session.
+pupil_base_dir = os.path.abspath(__file__).rsplit("pupil_src", 1)[0]
+sys.path.append(os.path.join(pupil_base_dir, "pupil_src", "shared_modules"))
+
+from batch_pipeline import (
+    DEFAULT_MEMORY_PER_WORKER,
+    Pipeline_Runner,
+    Recording_Job,
+    default_stages,
+    save_report,
+)
+from batch_pipeline.runner import STATUS_FAILED
+from batch_exporter import get_recording_dirs
+from file_methods import Persistent_Dict
+
+logger = logging.getLogger(__name__)
+
+# Player defaults, see launchables/player.py
+MIN_DATA_CONFIDENCE_DEFAULT = 0.6
+MIN_CALIBRATION_CONFIDENCE_DEFAULT = 0.8
+
+
+def create_jobs(data_dir, user_dir, export_root):
+    session_settings = Persistent_Dict(os.path.join(user_dir, "user_settings_player"))
+    plugin_settings = {
+        name: init_dict
+        for name, init_dict in session_settings.get("loaded_plugins", ())
+    }
+    jobs = []
+    for rec_dir in sorted(set(get_recording_dirs(data_dir))):
+        if export_root:
+            export_name = os.path.relpath(rec_dir, data_dir)
+            if export_name == os.curdir:
+                export_name = os.path.basename(os.path.abspath(rec_dir))
+            export_dir = os.path.join(export_root, export_name.replace(os.sep, "_"))
+        else:
+            export_dir = os.path.join(rec_dir, "exports", "batch_pipeline")
+        jobs.append(
+            Recording_Job(
+                rec_dir=rec_dir,
+                export_dir=export_dir,
+                user_dir=user_dir,
+                plugin_settings=plugin_settings,
+                min_data_confidence=session_settings.get(
+                    "min_data_confidence", MIN_DATA_CONFIDENCE_DEFAULT
+                ),
+                min_calibration_confidence=session_settings.get(
+                    "min_calibration_confidence", MIN_CALIBRATION_CONFIDENCE_DEFAULT
+                ),
+            )
+        )
+    return jobs
+
+
+def main():
+    stages = default_stages()
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description=dedent(
+            """\
+            ***************************************************
+            Run the offline analysis chain of Pupil Player headlessly on
+            many recordings: lookup tables, pupil detection, post-hoc
+            calibration and gaze mapping, fixations, blinks, surface
+            tracking and raw data export. Stages whose outputs are still
+            up to date are skipped.
+
+            Usage Example:
+                python pupil_src/shared_modules/batch_pipeline -d /path/to/folder-with-many-recordings -r report.json
+            ***************************************************\
+        """
+        ),
+    )
+    parser.add_argument(
+        "-d", "--rec-dir", required=True, help="recording or folder of recordings"
+    )
+    parser.add_argument(
+        "-u",
+        "--user-dir",
+        default=os.path.join(pupil_base_dir, "player_settings"),
+        help="Pupil Player settings directory to read plugin settings from",
+    )
+    parser.add_argument(
+        "-e",
+        "--export-to-dir",
+        default=None,
+        help="export root directory instead of <recording>/exports/batch_pipeline",
+    )
+    parser.add_argument(
+        "-r", "--report", default="batch_pipeline_report.json", help="report path"
+    )
+    parser.add_argument(
+        "-w", "--workers", type=int, default=None, help="number of worker processes"
+    )
+    parser.add_argument(
+        "-m",
+        "--memory-per-worker",
+        type=float,
+        default=DEFAULT_MEMORY_PER_WORKER / 1024 ** 3,
+        help="expected memory usage per worker in GiB, limits the worker count",
+    )
+    parser.add_argument(
+        "--stages",
+        nargs="+",
+        choices=[stage.name for stage in stages],
+        default=None,
+        help="only run these stages",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s %(processName)s %(name)s: %(message)s"
+    )
+
+    if args.stages:
+        stages = [stage for stage in stages if stage.name in args.stages]
+    jobs = create_jobs(args.rec_dir, args.user_dir, args.export_to_dir)
+    if not jobs:
+        logger.error(f"No recordings found in {args.rec_dir}")
+        return 1
+
+    runner = Pipeline_Runner(
+        stages,
+        worker_count=args.workers,
+        memory_per_worker=int(args.memory_per_worker * 1024 ** 3),
+    )
+    report = runner.run(jobs)
+    save_report(report, args.report)
+    logger.info(f"Summary: {report['summary']}. Report saved to {args.report}")
+    return 1 if STATUS_FAILED in report["summary"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
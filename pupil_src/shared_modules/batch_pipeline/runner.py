@@ -0,0 +1,240 @@
+"""
+(*)~---------------------------------------------------------------------------
+Pupil - eye tracking platform
+Copyright (C) 2012-2020 Pupil Labs
+
+Distributed under the terms of the GNU
+Lesser General Public License (LGPL v3.0).
+See COPYING and COPYING.LESSER for license details.
+---------------------------------------------------------------------------~(*)
+"""
+import collections
+import datetime
+import json
+import logging
+import multiprocessing as mp
+import time
+import traceback
+import typing as T
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import psutil
+
+from .stage_cache import Stage_Cache
+from .stages import Recording_Job, Stage, Stage_Not_Applicable
+
+logger = logging.getLogger(__name__)
+
+STATUS_COMPLETED = "completed"
+STATUS_CACHED = "cached"
+STATUS_NOT_APPLICABLE = "not_applicable"
+STATUS_FAILED = "failed"
+STATUS_BLOCKED = "blocked"
+
+# Decoding videos and holding pupil and gaze data of long recordings
+DEFAULT_MEMORY_PER_WORKER = 2 * 1024 ** 3
+
+
+def default_worker_count(memory_per_worker=DEFAULT_MEMORY_PER_WORKER) -> int:
+    """Number of workers that fit into the available CPUs and memory"""
+    memory_limit = psutil.virtual_memory().available // memory_per_worker
+    return max(1, min(mp.cpu_count(), int(memory_limit)))
+
+
+def run_stage(stage: Stage, job: Recording_Job) -> dict:
+    """Runs `stage` on a recording unless its cached outputs are still valid"""
+    start = time.perf_counter()
+    cache = Stage_Cache(job.rec_dir)
+    try:
+        fingerprint = cache.fingerprint(
+            stage.version, stage.settings(job), stage.input_paths(job)
+        )
+        if cache.is_valid(stage.name, fingerprint, stage.output_paths(job)):
+            status, message = STATUS_CACHED, "Outputs are up to date"
+        else:
+            cache.invalidate(stage.name)
+            message = stage.run(job)
+            # Stages might update some of their own inputs, e.g. the marker cache
+            fingerprint = cache.fingerprint(
+                stage.version, stage.settings(job), stage.input_paths(job)
+            )
+            cache.store(stage.name, fingerprint)
+            status = STATUS_COMPLETED
+    except Stage_Not_Applicable as err:
+        cache.invalidate(stage.name)
+        status, message = STATUS_NOT_APPLICABLE, str(err)
+    except Exception:
+        cache.invalidate(stage.name)
+        status, message = STATUS_FAILED, traceback.format_exc()
+        logger.error(f"Stage '{stage.name}' failed for {job.rec_dir}:\n{message}")
+    return {
+        "status": status,
+        "message": message,
+        "duration_s": round(time.perf_counter() - start, 3),
+    }
+
+
+def _task_result(future, duration: float) -> dict:
+    """Result of `run_stage()`, or a failed result if its worker did not return"""
+    try:
+        return future.result()
+    except BrokenProcessPool:
+        message = (
+            "The worker process terminated abruptly, e.g. because it ran out of"
+            " memory or crashed"
+        )
+    except Exception as err:
+        message = repr(err)
+    return {
+        "status": STATUS_FAILED,
+        "message": message,
+        "duration_s": round(duration, 3),
+    }
+
+
+class Stage_Scheduler:
+    """Tracks which stages of which recordings are ready to run
+
+    A stage is ready once all stages it depends on finished for the same
+    recording. Stages that depend on a failed stage are not run, but reported as
+    blocked. Dependencies on stages that are not part of the run are ignored.
+    """
+
+    def __init__(self, job_count: int, stages: T.Sequence[Stage]):
+        self._stages = list(stages)
+        stage_names = {stage.name for stage in self._stages}
+        self._dependencies = {
+            stage.name: [name for name in stage.depends_on if name in stage_names]
+            for stage in self._stages
+        }
+        self.results = [{} for _ in range(job_count)]
+        self._pending = collections.OrderedDict(
+            ((job_idx, stage.name), stage)
+            for job_idx in range(job_count)
+            for stage in self._stages
+        )
+        self._running = set()
+
+    @property
+    def finished(self) -> bool:
+        return not self._pending and not self._running
+
+    def pop_ready(self) -> T.List[T.Tuple[int, Stage]]:
+        """Ready tasks in recording order, marked as running"""
+        ready = []
+        for (job_idx, stage_name), stage in list(self._pending.items()):
+            results = self.results[job_idx]
+            dependencies = self._dependencies[stage_name]
+            if all(name in results for name in dependencies):
+                del self._pending[job_idx, stage_name]
+                self._running.add((job_idx, stage_name))
+                ready.append((job_idx, stage))
+        return ready
+
+    def complete(self, job_idx: int, stage_name: str, result: dict):
+        self._running.discard((job_idx, stage_name))
+        self.results[job_idx][stage_name] = result
+        if result["status"] in (STATUS_FAILED, STATUS_BLOCKED):
+            self._block_dependents(job_idx, stage_name)
+
+    def _block_dependents(self, job_idx, stage_name):
+        for stage in self._stages:
+            key = (job_idx, stage.name)
+            if key in self._pending and stage_name in self._dependencies[stage.name]:
+                del self._pending[key]
+                self.complete(
+                    job_idx,
+                    stage.name,
+                    {
+                        "status": STATUS_BLOCKED,
+                        "message": f"Stage '{stage_name}' did not succeed",
+                        "duration_s": 0.0,
+                    },
+                )
+
+
+class Pipeline_Runner:
+    """Runs the stages of many recordings in up to `worker_count` worker processes
+
+    Each stage of each recording is a separate task. Tasks are started as soon as
+    their dependencies finished, such that idle workers pick up any ready task
+    instead of waiting for the remaining stages of a single recording.
+    """
+
+    def __init__(
+        self,
+        stages: T.Sequence[Stage],
+        worker_count: T.Optional[int] = None,
+        memory_per_worker: int = DEFAULT_MEMORY_PER_WORKER,
+    ):
+        self.stages = list(stages)
+        self.worker_count = worker_count or default_worker_count(memory_per_worker)
+
+    def run(self, jobs: T.Sequence[Recording_Job]) -> dict:
+        """Processes all jobs and returns the run report"""
+        started = datetime.datetime.now()
+        start = time.perf_counter()
+        scheduler = Stage_Scheduler(len(jobs), self.stages)
+        ready = collections.deque()
+        running = {}
+
+        logger.info(
+            f"Processing {len(jobs)} recordings with {self.worker_count} workers"
+        )
+        try:
+            while not scheduler.finished:
+                ready.extend(scheduler.pop_ready())
+                while ready and len(running) < self.worker_count:
+                    job_idx, stage = ready.popleft()
+                    # Each task runs in its own worker process. This returns the
+                    # memory of large recordings to the system and identifies the
+                    # task if the process dies, e.g. when it runs out of memory.
+                    executor = ProcessPoolExecutor(max_workers=1)
+                    future = executor.submit(run_stage, stage, jobs[job_idx])
+                    task_start = time.perf_counter()
+                    running[future] = (job_idx, stage.name, executor, task_start)
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job_idx, stage_name, executor, task_start = running.pop(future)
+                    executor.shutdown(wait=True)
+                    result = _task_result(future, time.perf_counter() - task_start)
+                    scheduler.complete(job_idx, stage_name, result)
+                    logger.info(
+                        f"{jobs[job_idx].rec_dir}: {stage_name} {result['status']} "
+                        f"({result['duration_s']:.1f}s)"
+                    )
+        finally:
+            for _, _, executor, _ in running.values():
+                executor.shutdown(wait=False)
+
+        return self._report(jobs, scheduler.results, started, start)
+
+    def _report(self, jobs, results, started, start) -> dict:
+        summary = collections.Counter(
+            result["status"]
+            for stage_results in results
+            for result in stage_results.values()
+        )
+        return {
+            "started": started.isoformat(timespec="seconds"),
+            "duration_s": round(time.perf_counter() - start, 3),
+            "worker_count": self.worker_count,
+            "summary": dict(summary),
+            "recordings": [
+                {
+                    "rec_dir": job.rec_dir,
+                    "export_dir": job.export_dir,
+                    "stages": {
+                        stage.name: stage_results[stage.name] for stage in self.stages
+                    },
+                }
+                for job, stage_results in zip(jobs, results)
+            ],
+        }
+
+
+def save_report(report: dict, path: str):
+    with open(path, "w", encoding="utf-8") as report_file:
+        json.dump(report, report_file, indent=4)
@@ -0,0 +1,68 @@
+"""
+(*)~---------------------------------------------------------------------------
+Pupil - eye tracking platform
+Copyright (C) 2012-2020 Pupil Labs
+
+Distributed under the terms of the GNU
+Lesser General Public License (LGPL v3.0).
+See COPYING and COPYING.LESSER for license details.
+---------------------------------------------------------------------------~(*)
+"""
+import json
+import os
+import typing as T
+
+CACHE_DIR_NAME = "batch_pipeline"
+
+
+def file_fingerprint(path) -> T.List:
+    """(path, size, modification time) of a file, or (path, None, None) if missing"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return [str(path), None, None]
+    return [str(path), stat.st_size, stat.st_mtime_ns]
+
+
+class Stage_Cache:
+    """Fingerprints of the inputs and settings each stage of a recording last ran with
+
+    A stage's cached outputs are valid if the stage would run with the same
+    fingerprint again and all of its outputs still exist. Each stage has its own
+    fingerprint file, such that stages of the same recording can run concurrently.
+    """
+
+    def __init__(self, rec_dir):
+        self.directory = os.path.join(rec_dir, "offline_data", CACHE_DIR_NAME)
+
+    def fingerprint(self, stage_version, settings, input_paths) -> dict:
+        fingerprint = {
+            "version": stage_version,
+            "settings": settings,
+            "inputs": sorted(file_fingerprint(path) for path in input_paths),
+        }
+        # normalize, e.g. tuples to lists, to compare with loaded fingerprints
+        return json.loads(json.dumps(fingerprint, sort_keys=True, default=str))
+
+    def is_valid(self, stage_name, fingerprint, output_paths) -> bool:
+        if not all(os.path.exists(path) for path in output_paths):
+            return False
+        try:
+            with open(self._path(stage_name), encoding="utf-8") as cache_file:
+                return json.load(cache_file) == fingerprint
+        except (FileNotFoundError, ValueError):
+            return False
+
+    def store(self, stage_name, fingerprint):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self._path(stage_name), "w", encoding="utf-8") as cache_file:
+            json.dump(fingerprint, cache_file, sort_keys=True)
+
+    def invalidate(self, stage_name):
+        try:
+            os.remove(self._path(stage_name))
+        except FileNotFoundError:
+            pass
+
+    def _path(self, stage_name) -> str:
+        return os.path.join(self.directory, stage_name + ".json")
@@ -0,0 +1,879 @@
+"""
+(*)~---------------------------------------------------------------------------
+Pupil - eye tracking platform
+Copyright (C) 2012-2020 Pupil Labs
+
+Distributed under the terms of the GNU
+Lesser General Public License (LGPL v3.0).
+See COPYING and COPYING.LESSER for license details.
+---------------------------------------------------------------------------~(*)
+"""
+import abc
+import glob
+import json
+import logging
+import os
+import typing as T
+from types import SimpleNamespace
+
+import numpy as np
+
+import file_methods as fm
+import player_methods as pm
+
+from .stage_cache import CACHE_DIR_NAME
+
+logger = logging.getLogger(__name__)
+
+OFFLINE_PUPIL_NAME = "offline_pupil"
+VIDEO_SET_NAMES = ("world", "eye0", "eye1")
+
+
+class Recording_Job(T.NamedTuple):
+    """Everything the stages need to know to process a single recording"""
+
+    rec_dir: str
+    export_dir: str
+    user_dir: str
+    # Player's `loaded_plugins` session setting as {plugin class name: init dict}
+    plugin_settings: T.Dict[str, dict]
+    min_data_confidence: float
+    min_calibration_confidence: float
+
+    def plugin_init_dict(self, plugin_name, **defaults) -> dict:
+        return {**defaults, **self.plugin_settings.get(plugin_name, {})}
+
+
+class Stage_Not_Applicable(Exception):
+    """Raised by `Stage.run()` if a recording lacks what the stage needs"""
+
+
+class Stage(abc.ABC):
+    """One step of the offline analysis chain of a recording
+
+    Stages run in worker processes and import their dependencies lazily. The
+    outputs of a stage are reused as long as its settings and the fingerprints of
+    its input files do not change, see `Stage_Cache`.
+    """
+
+    name = ""
+    version = 1
+    depends_on: T.Tuple[str, ...] = ()
+
+    def settings(self, job: Recording_Job) -> dict:
+        return {}
+
+    def input_paths(self, job: Recording_Job) -> T.List[str]:
+        return []
+
+    def output_paths(self, job: Recording_Job) -> T.List[str]:
+        return []
+
+    @abc.abstractmethod
+    def run(self, job: Recording_Job) -> str:
+        """Runs the stage and returns a short summary of its results"""
+
+
+def pipeline_data_dir(rec_dir) -> str:
+    return os.path.join(rec_dir, "offline_data", CACHE_DIR_NAME)
+
+
+def _pldata_paths(directory, name) -> T.List[str]:
+    return [
+        os.path.join(directory, name + ".pldata"),
+        os.path.join(directory, name + "_timestamps.npy"),
+    ]
+
+
+def _video_paths(rec_dir, set_name) -> T.List[str]:
+    from video_capture.utils import VideoSet
+
+    paths = []
+    for video in VideoSet(rec_dir, set_name, fill_gaps=False).videos:
+        paths.append(video.path)
+        paths.append(os.path.splitext(video.path)[0] + "_timestamps.npy")
+    return paths
+
+
+def _lookup_path(rec_dir, set_name) -> str:
+    return os.path.join(rec_dir, f"{set_name}_lookup.npy")
+
+
+def _pupil_paths(rec_dir) -> T.List[str]:
+    offline_dir = os.path.join(rec_dir, "offline_data")
+    return _pldata_paths(offline_dir, OFFLINE_PUPIL_NAME) + _pldata_paths(
+        rec_dir, "pupil"
+    )
+
+
+def _gaze_paths(rec_dir) -> T.List[str]:
+    return _pldata_paths(pipeline_data_dir(rec_dir), "gaze") + _pldata_paths(
+        rec_dir, "gaze"
+    )
+
+
+def _fixation_paths(rec_dir) -> T.List[str]:
+    return _pldata_paths(pipeline_data_dir(rec_dir), "fixations")
+
+
+def _remove_pldata(directory, name):
+    for path in _pldata_paths(directory, name):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def load_pupil_positions(rec_dir) -> pm.PupilDataBisector:
+    """Post-hoc detected pupil data if available, recorded pupil data otherwise"""
+    offline_dir = os.path.join(rec_dir, "offline_data")
+    if os.path.exists(_pldata_paths(offline_dir, OFFLINE_PUPIL_NAME)[0]):
+        return pm.PupilDataBisector.load_from_file(offline_dir, OFFLINE_PUPIL_NAME)
+    return pm.PupilDataBisector.load_from_file(rec_dir, "pupil")
+
+
+def load_gaze_positions(rec_dir) -> pm.Bisector:
+    """Post-hoc mapped gaze if available, recorded gaze otherwise"""
+    directory = pipeline_data_dir(rec_dir)
+    if not os.path.exists(_pldata_paths(directory, "gaze")[0]):
+        directory = rec_dir
+    gaze = fm.load_pldata_file(directory, "gaze")
+    return pm.Bisector(gaze.data, gaze.timestamps)
+
+
+def load_fixations(rec_dir) -> pm.Affiliator:
+    fixations = fm.load_pldata_file(pipeline_data_dir(rec_dir), "fixations")
+    stop_timestamps = [
+        ts + fixation["duration"] / 1000
+        for ts, fixation in zip(fixations.timestamps, fixations.data)
+    ]
+    return pm.Affiliator(fixations.data, fixations.timestamps, stop_timestamps)
+
+
+def load_world_capture(rec_dir) -> SimpleNamespace:
+    """Frame size, intrinsics, timestamps and path of the world video"""
+    from pupil_recording import PupilRecording
+    from video_capture import File_Source
+
+    videos = PupilRecording(rec_dir).files().core().world().videos()
+    if not videos:
+        raise Stage_Not_Applicable("No world video found")
+    source = File_Source(
+        SimpleNamespace(), source_path=str(videos[0]), fill_gaps=True, timing=None
+    )
+    capture = SimpleNamespace(
+        source_path=source.source_path,
+        frame_size=source.frame_size,
+        intrinsics=source.intrinsics,
+        timestamps=np.asarray(source.timestamps),
+    )
+    source.cleanup()
+    return capture
+
+
+def _export_window(world_timestamps):
+    return pm.exact_window(world_timestamps, (0, len(world_timestamps) - 1))
+
+
+class Lookup_Table_Stage(Stage):
+    name = "lookup_tables"
+
+    def input_paths(self, job):
+        return [
+            path
+            for set_name in VIDEO_SET_NAMES
+            for path in _video_paths(job.rec_dir, set_name)
+        ]
+
+    def output_paths(self, job):
+        return [
+            _lookup_path(job.rec_dir, set_name)
+            for set_name in VIDEO_SET_NAMES
+            if _video_paths(job.rec_dir, set_name)
+        ]
+
+    def run(self, job):
+        from video_capture.utils import VideoSet
+
+        built = []
+        for set_name in VIDEO_SET_NAMES:
+            # Player fills gaps in world videos only
+            videoset = VideoSet(job.rec_dir, set_name, fill_gaps=set_name == "world")
+            if not videoset.videos:
+                continue
+            videoset.build_lookup()
+            built.append(set_name)
+        if not built:
+            raise Stage_Not_Applicable("No videos found")
+        return f"Built lookup tables of {', '.join(built)}"
+
+
+class Pupil_Detection_Stage(Stage):
+    name = "pupil_detection"
+    depends_on = ("lookup_tables",)
+
+    def settings(self, job):
+        return {"roi": [self._roi_settings(job, eye_id) for eye_id in range(2)]}
+
+    def input_paths(self, job):
+        return [
+            path
+            for eye_id in range(2)
+            for path in _video_paths(job.rec_dir, f"eye{eye_id}")
+        ]
+
+    def output_paths(self, job):
+        offline_dir = os.path.join(job.rec_dir, "offline_data")
+        return _pldata_paths(offline_dir, OFFLINE_PUPIL_NAME) + [
+            os.path.join(offline_dir, OFFLINE_PUPIL_NAME + ".meta")
+        ]
+
+    def run(self, job):
+        import offline_pupil_detection as opd
+        from pupil_producers import Offline_Pupil_Detection
+
+        data_dir = os.path.join(job.rec_dir, "offline_data")
+        if self._is_detection_complete(job, data_dir):
+            pupil_positions = pm.PupilDataBisector.load_from_file(
+                data_dir, OFFLINE_PUPIL_NAME
+            )
+            return f"Reused {len(pupil_positions[..., ...])} detected pupil positions"
+
+        os.makedirs(data_dir, exist_ok=True)
+        detection_status = ["No eye video found.", "No eye video found."]
+        for eye_id in range(2):
+            video_path = self._eye_video_path(job, eye_id)
+            if video_path is None:
+                continue
+            # Chunks of an interrupted run might stem from different settings
+            opd.clear_detected_chunks(data_dir, eye_id)
+            for _ in opd.detect_pupils(
+                video_path, data_dir, eye_id, self._roi_settings(job, eye_id)
+            ):
+                pass
+            detection_status[eye_id] = "complete"
+
+        if "complete" not in detection_status:
+            raise Stage_Not_Applicable("No eye video found")
+
+        opd.merge_detected_chunks(data_dir, OFFLINE_PUPIL_NAME)
+        for eye_id in range(2):
+            opd.clear_detected_chunks(data_dir, eye_id)
+        session_meta_data = {
+            "detection_status": detection_status,
+            "version": Offline_Pupil_Detection.session_data_version,
+            "roi_settings": self._roi_fingerprint(job),
+        }
+        fm.save_object(
+            session_meta_data, os.path.join(data_dir, OFFLINE_PUPIL_NAME + ".meta")
+        )
+        pupil_positions = pm.PupilDataBisector.load_from_file(
+            data_dir, OFFLINE_PUPIL_NAME
+        )
+        return f"Detected {len(pupil_positions[..., ...])} pupil positions"
+
+    def _is_detection_complete(self, job, data_dir) -> bool:
+        """Whether Player or an earlier run detected the pupils of all eye videos
+
+        Data detected by Player is used as is, like Player does. Data of earlier runs
+        is only reused if it was detected with the current Roi settings.
+        """
+        from pupil_producers import Offline_Pupil_Detection
+
+        pldata_paths = _pldata_paths(data_dir, OFFLINE_PUPIL_NAME)
+        if not all(os.path.exists(path) for path in pldata_paths):
+            return False
+        try:
+            session_meta_data = fm.load_object(
+                os.path.join(data_dir, OFFLINE_PUPIL_NAME + ".meta")
+            )
+        except FileNotFoundError:
+            return False
+        version = Offline_Pupil_Detection.session_data_version
+        if session_meta_data.get("version") != version:
+            return False
+        roi_settings = session_meta_data.get("roi_settings")
+        if roi_settings is not None and roi_settings != self._roi_fingerprint(job):
+            return False
+        eye_ids = [
+            eye_id
+            for eye_id in range(2)
+            if self._eye_video_path(job, eye_id) is not None
+        ]
+        detection_status = session_meta_data["detection_status"]
+        return bool(eye_ids) and all(
+            detection_status[eye_id] == "complete" for eye_id in eye_ids
+        )
+
+    def _roi_fingerprint(self, job) -> str:
+        return json.dumps(self.settings(job)["roi"], sort_keys=True, default=str)
+
+    def _eye_video_path(self, job, eye_id) -> T.Optional[str]:
+        for ext in (".mjpeg", ".mp4", ".mkv"):
+            path = os.path.join(job.rec_dir, f"eye{eye_id}{ext}")
+            if os.path.exists(path):
+                return path
+        return None
+
+    def _roi_settings(self, job, eye_id):
+        """Roi of the eye process that would have run the detection in Player"""
+        session_settings = fm.Persistent_Dict(
+            os.path.join(job.user_dir, f"user_settings_eye{eye_id}")
+        )
+        for name, init_dict in session_settings.get("loaded_plugins", ()):
+            if name == "Roi":
+                return init_dict
+        return None
+
+
+class Gaze_Mapping_Stage(Stage):
+    """Post-hoc calibration and gaze mapping based on stored reference locations"""
+
+    name = "gaze_mapping"
+    depends_on = ("lookup_tables", "pupil_detection")
+
+    def settings(self, job):
+        return {"min_calibration_confidence": job.min_calibration_confidence}
+
+    def input_paths(self, job):
+        offline_dir = os.path.join(job.rec_dir, "offline_data")
+        calibration_paths = glob.glob(os.path.join(job.rec_dir, "calibrations", "*"))
+        return (
+            _pupil_paths(job.rec_dir)
+            + calibration_paths
+            + [
+                os.path.join(offline_dir, "reference_locations.msgpack"),
+                os.path.join(offline_dir, "gaze_mappers.msgpack"),
+                os.path.join(job.rec_dir, "world_timestamps.npy"),
+            ]
+        )
+
+    def output_paths(self, job):
+        return _pldata_paths(pipeline_data_dir(job.rec_dir), "gaze")
+
+    def run(self, job):
+        from gaze_producer import model
+
+        reference_locations = model.ReferenceLocationStorage(job.rec_dir)
+        if reference_locations.is_empty:
+            # do not leave stale gaze behind that would be used instead of recorded gaze
+            _remove_pldata(pipeline_data_dir(job.rec_dir), "gaze")
+            raise Stage_Not_Applicable(
+                "No reference locations, detect or annotate them in Player first"
+            )
+
+        from pupil_recording import PupilRecording
+
+        capture = load_world_capture(job.rec_dir)
+        index_range = (0, len(capture.timestamps) - 1)
+        pupil_positions = load_pupil_positions(job.rec_dir)
+
+        calibration_storage = model.CalibrationStorage(
+            rec_dir=job.rec_dir,
+            get_recording_index_range=lambda: index_range,
+            recording_uuid=PupilRecording(job.rec_dir).meta_info.recording_uuid,
+        )
+        gaze_mapper_storage = model.GazeMapperStorage(
+            calibration_storage,
+            rec_dir=job.rec_dir,
+            get_recording_index_range=lambda: index_range,
+        )
+
+        calibrated = self._calculate_calibrations(
+            job, capture, pupil_positions, calibration_storage, reference_locations
+        )
+        calibration_storage.save_to_disk()
+        self._map_gaze(
+            job, capture, pupil_positions, calibration_storage, gaze_mapper_storage
+        )
+        gaze_mapper_storage.save_to_disk()
+
+        gaze_ts_and_data = sorted(
+            (
+                (ts, gaze)
+                for mapper in gaze_mapper_storage
+                if mapper.activate_gaze
+                for ts, gaze in zip(mapper.gaze_ts, mapper.gaze)
+            ),
+            key=lambda ts_and_data: ts_and_data[0],
+        )
+        directory = pipeline_data_dir(job.rec_dir)
+        os.makedirs(directory, exist_ok=True)
+        with fm.PLData_Writer(directory, "gaze") as writer:
+            for ts, gaze in gaze_ts_and_data:
+                writer.append_serialized(ts, "gaze", gaze.serialized)
+        return (
+            f"Calculated {calibrated} calibrations, "
+            f"mapped {len(gaze_ts_and_data)} gaze positions"
+        )
+
+    def _fake_gpool(self, job, capture, min_calibration_confidence):
+        from gaze_producer.worker.fake_gpool import FakeGPool
+
+        return FakeGPool(
+            frame_size=capture.frame_size,
+            intrinsics=capture.intrinsics,
+            rec_dir=job.rec_dir,
+            user_dir=job.user_dir,
+            min_calibration_confidence=min_calibration_confidence,
+        )
+
+    def _calculate_calibrations(
+        self, job, capture, pupil_positions, calibration_storage, reference_locations
+    ) -> int:
+        from gaze_producer.worker.create_calibration import _create_calibration
+        from methods import normalize
+        from pupil_recording import PupilRecording
+
+        recording_uuid = str(PupilRecording(job.rec_dir).meta_info.recording_uuid)
+        calibrated = 0
+        for calibration in calibration_storage:
+            if not (
+                calibration.recording_uuid == recording_uuid
+                and calibration.is_offline_calibration
+            ):
+                continue
+            calibration_window = pm.exact_window(
+                capture.timestamps, calibration.frame_index_range
+            )
+            frame_start, frame_end = calibration.frame_index_range
+            ref_dicts_in_calib_range = [
+                {
+                    "screen_pos": ref.screen_pos,
+                    "norm_pos": normalize(
+                        ref.screen_pos, capture.frame_size, flip_y=True
+                    ),
+                    "timestamp": ref.timestamp,
+                }
+                for ref in reference_locations
+                if frame_start <= ref.frame_index <= frame_end
+            ]
+            calibration.status, result = _create_calibration(
+                self._fake_gpool(job, capture, calibration.minimum_confidence),
+                calibration.gazer_class_name,
+                ref_dicts_in_calib_range,
+                pupil_positions.by_ts_window(calibration_window),
+            )
+            if result is not None:
+                calibration.gazer_class_name = result.gazer_class_name
+                calibration.update(calib_params=result.params)
+                calibrated += 1
+        return calibrated
+
+    def _map_gaze(
+        self, job, capture, pupil_positions, calibration_storage, gaze_mapper_storage
+    ):
+        from gaze_producer.worker.map_gaze import _map_gaze
+
+        fake_gpool = self._fake_gpool(job, capture, job.min_calibration_confidence)
+        for gaze_mapper in gaze_mapper_storage:
+            gaze_mapper.gaze = []
+            gaze_mapper.gaze_ts = []
+            calibration = calibration_storage.get_or_none(
+                gaze_mapper.calibration_unique_id
+            )
+            if calibration is None or calibration.params is None:
+                gaze_mapper.status = "The calibration was not calculated or found"
+                continue
+            mapping_window = pm.exact_window(
+                capture.timestamps, gaze_mapper.mapping_index_range
+            )
+            pupil_pos_in_mapping_range = pupil_positions.by_ts_window(mapping_window)
+            if not pupil_pos_in_mapping_range:
+                gaze_mapper.status = "There is no pupil data to be mapped!"
+                continue
+
+            for mapped_gaze_ts_and_data in _map_gaze(
+                calibration.gazer_class_name,
+                calibration.params,
+                fake_gpool,
+                pupil_pos_in_mapping_range,
+                gaze_mapper.manual_correction_x,
+                gaze_mapper.manual_correction_y,
+                SimpleNamespace(progress=0.0),
+            ):
+                for timestamp, gaze_datum in mapped_gaze_ts_and_data:
+                    gaze_mapper.gaze.append(gaze_datum)
+                    gaze_mapper.gaze_ts.append(timestamp)
+            if gaze_mapper.empty():
+                gaze_mapper.status = "No data mapped!"
+            else:
+                gaze_mapper.status = "Successfully completed mapping"
+
+
+class Fixation_Stage(Stage):
+    name = "fixations"
+    depends_on = ("lookup_tables", "gaze_mapping")
+
+    def settings(self, job):
+        return {
+            **self._init_dict(job),
+            "min_data_confidence": job.min_data_confidence,
+        }
+
+    def input_paths(self, job):
+        return _gaze_paths(job.rec_dir) + [
+            os.path.join(job.rec_dir, "world_timestamps.npy")
+        ]
+
+    def output_paths(self, job):
+        return _fixation_paths(job.rec_dir) + [
+            os.path.join(job.export_dir, "fixations.csv"),
+            os.path.join(job.export_dir, "fixation_report.csv"),
+        ]
+
+    def run(self, job):
+        from fixation_detector import detect_fixations, export_fixations_to_csv
+
+        settings = self._init_dict(job)
+        capture = load_world_capture(job.rec_dir)
+        gaze_positions = load_gaze_positions(job.rec_dir)
+
+        directory = pipeline_data_dir(job.rec_dir)
+        os.makedirs(directory, exist_ok=True)
+        with fm.PLData_Writer(directory, "fixations") as writer:
+            for _, fixation_result in detect_fixations(
+                capture,
+                [gaze.serialized for gaze in gaze_positions],
+                np.deg2rad(settings["max_dispersion"]),
+                settings["min_duration"] / 1000,
+                settings["max_duration"] / 1000,
+                job.min_data_confidence,
+            ):
+                if fixation_result:
+                    serialized, start_ts, _ = fixation_result
+                    writer.append_serialized(start_ts, "fixations", serialized)
+
+        fixations = load_fixations(job.rec_dir)
+        os.makedirs(job.export_dir, exist_ok=True)
+        export_fixations_to_csv(
+            fixations.by_ts_window(_export_window(capture.timestamps)),
+            job.export_dir,
+            max_dispersion=settings["max_dispersion"],
+            min_duration=settings["min_duration"],
+            max_duration=settings["max_duration"],
+        )
+        return f"Detected {len(fixations)} fixations"
+
+    def _init_dict(self, job):
+        init_dict = job.plugin_init_dict(
+            "Offline_Fixation_Detector",
+            max_dispersion=1.50,
+            min_duration=80,
+            max_duration=220,
+        )
+        init_dict.pop("show_fixations", None)
+        return init_dict
+
+
+class Blink_Stage(Stage):
+    name = "blinks"
+    depends_on = ("lookup_tables", "pupil_detection")
+
+    def settings(self, job):
+        return self._init_dict(job)
+
+    def input_paths(self, job):
+        return _pupil_paths(job.rec_dir) + [
+            os.path.join(job.rec_dir, "world_timestamps.npy")
+        ]
+
+    def output_paths(self, job):
+        return [
+            os.path.join(job.export_dir, "blinks.csv"),
+            os.path.join(job.export_dir, "blink_detection_report.csv"),
+        ]
+
+    def run(self, job):
+        from blink_detection import (
+            blink_filter_response,
+            blink_pupil_data,
+            classify_blink_response,
+            consolidate_blink_classifications,
+            export_blinks_to_csv,
+        )
+
+        settings = self._init_dict(job)
+        capture = load_world_capture(job.rec_dir)
+        pupil_data = blink_pupil_data(load_pupil_positions(job.rec_dir))
+        if not pupil_data:
+            raise Stage_Not_Applicable("No pupil data found")
+
+        filter_response = blink_filter_response(pupil_data, settings["history_length"])
+        response_classification = classify_blink_response(
+            filter_response,
+            settings["onset_confidence_threshold"],
+            settings["offset_confidence_threshold"],
+        )
+        blinks = consolidate_blink_classifications(
+            pupil_data, filter_response, response_classification, capture.timestamps
+        )
+        os.makedirs(job.export_dir, exist_ok=True)
+        export_blinks_to_csv(
+            blinks.by_ts_window(_export_window(capture.timestamps)),
+            job.export_dir,
+            **settings,
+        )
+        return f"Detected {len(blinks)} blinks"
+
+    def _init_dict(self, job):
+        return job.plugin_init_dict(
+            "Offline_Blink_Detection",
+            history_length=0.2,
+            onset_confidence_threshold=0.5,
+            offset_confidence_threshold=0.5,
+        )
+
+
+class Surface_Tracking_Stage(Stage):
+    name = "surface_tracking"
+    depends_on = ("lookup_tables", "gaze_mapping", "fixations")
+
+    def settings(self, job):
+        return {
+            **self._init_dict(job),
+            "min_data_confidence": job.min_data_confidence,
+        }
+
+    def input_paths(self, job):
+        from surface_tracker.surface_file_store import Surface_File_Store
+
+        return (
+            _video_paths(job.rec_dir, "world")
+            + _gaze_paths(job.rec_dir)
+            + _fixation_paths(job.rec_dir)
+            + [
+                Surface_File_Store(parent_dir=job.rec_dir).file_path,
+                self._marker_cache_path(job),
+            ]
+        )
+
+    def output_paths(self, job):
+        return [
+            self._marker_cache_path(job),
+            os.path.join(job.export_dir, "surfaces"),
+        ]
+
+    def run(self, job):
+        from surface_tracker import background_tasks, offline_utils
+        from surface_tracker.cache import Cache
+        from surface_tracker.surface_file_store import Surface_File_Store
+        from surface_tracker.surface_marker_detector import MarkerType
+        from surface_tracker.surface_offline import Surface_Offline
+
+        surfaces = [
+            surface
+            for surface in Surface_File_Store(
+                parent_dir=job.rec_dir
+            ).read_surfaces_from_file(surface_class=Surface_Offline)
+            if surface.defined
+        ]
+        if not surfaces:
+            raise Stage_Not_Applicable("No surfaces defined")
+
+        settings = self._init_dict(job)
+        capture = load_world_capture(job.rec_dir)
+        marker_cache, detector_mode = self._marker_cache(job, capture, settings)
+        if detector_mode.marker_type == MarkerType.SQUARE_MARKER:
+            marker_cache = [
+                [m for m in markers if m.perimeter >= settings["marker_min_perimeter"]]
+                for markers in marker_cache
+            ]
+
+        for surface in surfaces:
+            locate = offline_utils.surface_locater_callable(
+                capture.intrinsics,
+                surface.registered_markers_undist,
+                surface.registered_markers_dist,
+            )
+            locations = [locate(markers) for markers in marker_cache]
+            surface.location_cache = Cache(locations)
+
+        fixations = (
+            load_fixations(job.rec_dir)
+            if os.path.exists(_fixation_paths(job.rec_dir)[0])
+            else pm.Affiliator()
+        )
+        os.makedirs(job.export_dir, exist_ok=True)
+        exporter = background_tasks.Exporter(
+            job.export_dir,
+            (0, len(capture.timestamps)),
+            surfaces,
+            capture.timestamps,
+            load_gaze_positions(job.rec_dir),
+            fixations,
+            capture.intrinsics,
+            job.min_data_confidence,
+        )
+        for _ in exporter.save_surface_statisics_to_file():
+            pass
+        return f"Tracked {len(surfaces)} surfaces"
+
+    def _init_dict(self, job):
+        from surface_tracker.surface_tracker import (
+            APRILTAG_HIGH_RES_ON,
+            APRILTAG_SHARPENING_ON,
+            DEFAULT_DETECTOR_MODE,
+        )
+
+        return job.plugin_init_dict(
+            "Surface_Tracker_Offline",
+            marker_min_perimeter=60,
+            inverted_markers=False,
+            marker_detector_mode=DEFAULT_DETECTOR_MODE.as_tuple(),
+            use_high_res=APRILTAG_HIGH_RES_ON,
+            sharpen=APRILTAG_SHARPENING_ON,
+        )
+
+    def _marker_cache_path(self, job):
+        return os.path.join(job.rec_dir, "square_marker_cache")
+
+    def _marker_cache(self, job, capture, settings):
+        """Unfiltered markers per world frame, restored or detected like in Player"""
+        from surface_tracker.surface_marker import Surface_Marker
+        from surface_tracker.surface_marker_detector import MarkerDetectorMode
+        from surface_tracker.surface_tracker_offline import Surface_Tracker_Offline
+
+        cache_file = fm.Persistent_Dict(self._marker_cache_path(job))
+        # Like Player, prefer the detector parameters the cache was computed with
+        inverted_markers = cache_file.get(
+            "inverted_markers", settings["inverted_markers"]
+        )
+        quad_decimate = cache_file.get("quad_decimate", settings["use_high_res"])
+        sharpening = cache_file.get("sharpening", settings["sharpen"])
+        detector_mode = MarkerDetectorMode.from_tuple(settings["marker_detector_mode"])
+
+        cache = cache_file.get("marker_cache_unfiltered", None)
+        version = cache_file.get("version", 0)
+        if (
+            cache is not None
+            and version == Surface_Tracker_Offline.MARKER_CACHE_VERSION
+            and len(cache) == len(capture.timestamps)
+            and all(markers is not None for markers in cache)
+        ):
+            marker_cache = [
+                [Surface_Marker.deserialize(args) for args in markers if args]
+                if markers
+                else []
+                for markers in cache
+            ]
+            first_marker = next((m for markers in marker_cache for m in markers), None)
+            if first_marker is not None:
+                detector_mode = MarkerDetectorMode.from_marker(first_marker)
+            return marker_cache, detector_mode
+
+        marker_cache = self._detect_markers(
+            capture,
+            detector_mode,
+            Surface_Tracker_Offline.CACHE_MIN_MARKER_PERIMETER,
+            inverted_markers,
+            quad_decimate,
+            sharpening,
+        )
+        cache_file["marker_cache_unfiltered"] = marker_cache
+        cache_file["version"] = Surface_Tracker_Offline.MARKER_CACHE_VERSION
+        cache_file["inverted_markers"] = inverted_markers
+        cache_file["quad_decimate"] = quad_decimate
+        cache_file["sharpening"] = sharpening
+        cache_file.save()
+        return marker_cache, detector_mode
+
+    def _detect_markers(
+        self,
+        capture,
+        detector_mode,
+        min_perimeter,
+        inverted_markers,
+        quad_decimate,
+        sharpening,
+    ):
+        import video_capture
+        from surface_tracker import offline_utils
+        from surface_tracker.surface_tracker import remove_duplicate_markers
+
+        detect_markers = offline_utils.marker_detection_callable(
+            marker_detector_mode=detector_mode,
+            marker_min_perimeter=min_perimeter,
+            square_marker_inverted_markers=inverted_markers,
+            square_marker_use_online_mode=False,
+            apriltag_quad_decimate=quad_decimate,
+            apriltag_decode_sharpening=sharpening,
+        )
+        source = video_capture.File_Source(
+            SimpleNamespace(),
+            source_path=capture.source_path,
+            fill_gaps=True,
+            timing=None,
+        )
+        # Frames that cannot be decoded count as visited without markers
+        marker_cache = [[] for _ in capture.timestamps]
+        while True:
+            try:
+                frame = source.get_frame()
+            except video_capture.EndofVideoError:
+                break
+            if frame.index < len(marker_cache):
+                marker_cache[frame.index] = remove_duplicate_markers(
+                    detect_markers(frame)
+                )
+        source.cleanup()
+        return marker_cache
+
+
+class Raw_Data_Export_Stage(Stage):
+    name = "raw_data_export"
+    depends_on = ("lookup_tables", "pupil_detection", "gaze_mapping")
+
+    def input_paths(self, job):
+        return (
+            _pupil_paths(job.rec_dir)
+            + _gaze_paths(job.rec_dir)
+            + [os.path.join(job.rec_dir, "world_timestamps.npy")]
+        )
+
+    def output_paths(self, job):
+        return [
+            os.path.join(job.export_dir, "pupil_positions.csv"),
+            os.path.join(job.export_dir, "gaze_positions.csv"),
+            os.path.join(job.export_dir, "pupil_gaze_positions_info.txt"),
+        ]
+
+    def run(self, job):
+        from raw_data_exporter import (
+            Gaze_Positions_Exporter,
+            Pupil_Positions_Exporter,
+            Raw_Data_Exporter,
+        )
+
+        capture = load_world_capture(job.rec_dir)
+        export_window = _export_window(capture.timestamps)
+        os.makedirs(job.export_dir, exist_ok=True)
+        Pupil_Positions_Exporter().csv_export_write(
+            positions_bisector=load_pupil_positions(job.rec_dir)[..., ...],
+            timestamps=capture.timestamps,
+            export_window=export_window,
+            export_dir=job.export_dir,
+        )
+        Gaze_Positions_Exporter().csv_export_write(
+            positions_bisector=load_gaze_positions(job.rec_dir),
+            timestamps=capture.timestamps,
+            export_window=export_window,
+            export_dir=job.export_dir,
+        )
+        field_info_path = os.path.join(job.export_dir, "pupil_gaze_positions_info.txt")
+        with open(field_info_path, "w", encoding="utf-8", newline="") as info_file:
+            info_file.write(Raw_Data_Exporter.__doc__)
+        return "Exported pupil and gaze positions"
+
+
+def default_stages() -> T.List[Stage]:
+    """All stages of the offline analysis chain, in dependency order"""
+    return [
+        Lookup_Table_Stage(),
+        Pupil_Detection_Stage(),
+        Gaze_Mapping_Stage(),
+        Fixation_Stage(),
+        Blink_Stage(),
+        Surface_Tracking_Stage(),
+        Raw_Data_Export_Stage(),
+    ]
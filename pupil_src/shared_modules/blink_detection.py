@@ -28,6 +28,7 @@ import gl_utils
 import player_methods as pm
 from observable import Observable
 from plugin import Plugin
+from timeline_pyramid import Timeline_Pyramid, min_max_polyline
 
 logger = logging.getLogger(__name__)
 
@@ -209,7 +210,7 @@ class Offline_Blink_Detection(Observable, Blink_Detection):
         self.response_classification = []
         self.timestamps = []
         g_pool.blinks = pm.Affiliator()
-        self.cache = {"response_points": (), "class_points": (), "thresholds": ()}
+        self.cache = {"response": None, "class_points": (), "thresholds": ()}
 
         self.pupil_positions_listener = data_changed.Listener(
             "pupil_positions", g_pool.rec_dir, plugin=self
@@ -219,11 +220,7 @@ class Offline_Blink_Detection(Observable, Blink_Detection):
         )
 
     def _pupil_data(self):
-        data = self.g_pool.pupil_positions[..., "2d"]
-        if not data:
-            # Fall back to 3d data
-            data = self.g_pool.pupil_positions[..., "3d"]
-        return data
+        return blink_pupil_data(self.g_pool.pupil_positions)
 
     def init_ui(self):
         super().init_ui()
@@ -280,170 +277,42 @@ class Offline_Blink_Detection(Observable, Blink_Detection):
             )
             return
 
-        header = (
-            "id",
-            "start_timestamp",
-            "duration",
-            "end_timestamp",
-            "start_frame_index",
-            "index",
-            "end_frame_index",
-            "confidence",
-            "filter_response",
-            "base_data",
+        export_blinks_to_csv(
+            self.g_pool.blinks.by_ts_window(export_window),
+            export_dir,
+            history_length=self.history_length,
+            onset_confidence_threshold=self.onset_confidence_threshold,
+            offset_confidence_threshold=self.offset_confidence_threshold,
         )
 
-        blinks_in_section = self.g_pool.blinks.by_ts_window(export_window)
-
-        with open(
-            os.path.join(export_dir, "blinks.csv"), "w", encoding="utf-8", newline=""
-        ) as csvfile:
-            csv_writer = csv.writer(csvfile)
-            csv_writer.writerow(header)
-            for b in blinks_in_section:
-                csv_writer.writerow(self.csv_representation_for_blink(b, header))
-            logger.info("Created 'blinks.csv' file.")
-
-        with open(
-            os.path.join(export_dir, "blink_detection_report.csv"),
-            "w",
-            encoding="utf-8",
-            newline="",
-        ) as csvfile:
-            csv_utils.write_key_value_file(
-                csvfile,
-                {
-                    "history_length": self.history_length,
-                    "onset_confidence_threshold": self.onset_confidence_threshold,
-                    "offset_confidence_threshold": self.offset_confidence_threshold,
-                    "blinks_exported": len(blinks_in_section),
-                },
-            )
-            logger.info("Created 'blink_detection_report.csv' file.")
-
     def recalculate(self):
         import time
 
         t0 = time.time()
         all_pp = self._pupil_data()
-        if not all_pp:
-            self.filter_response = []
-            self.response_classification = []
-            self.timestamps = []
-            self.consolidate_classifications()
-            return
-
-        self.timestamps = all_pp.timestamps
-        total_time = self.timestamps[-1] - self.timestamps[0]
-
-        conf_iter = (pp["confidence"] for pp in all_pp)
-        activity = np.fromiter(conf_iter, dtype=float, count=len(all_pp))
-        total_time = all_pp[-1]["timestamp"] - all_pp[0]["timestamp"]
-        filter_size = 2 * round(len(all_pp) * self.history_length / total_time / 2.0)
-        blink_filter = np.ones(filter_size) / filter_size
-
-        # This is different from the online filter. Convolution will flip
-        # the filter and result in a reverse filter response. Therefore
-        # we set the first half of the filter to -1 instead of the second
-        # half such that we get the expected result.
-        blink_filter[: filter_size // 2] *= -1
-
-        # The theoretical response maximum is +-0.5
-        # Response of +-0.45 seems sufficient for a confidence of 1.
-        self.filter_response = fftconvolve(activity, blink_filter, "same") / 0.45
-
-        onsets = self.filter_response > self.onset_confidence_threshold
-        offsets = self.filter_response < -self.offset_confidence_threshold
-
-        self.response_classification = np.zeros(self.filter_response.shape)
-        self.response_classification[onsets] = 1.0
-        self.response_classification[offsets] = -1.0
-
+        self.timestamps = all_pp.timestamps if all_pp else []
+        self.filter_response = blink_filter_response(all_pp, self.history_length)
+        self.response_classification = classify_blink_response(
+            self.filter_response,
+            self.onset_confidence_threshold,
+            self.offset_confidence_threshold,
+        )
         self.consolidate_classifications()
 
         tm1 = time.time()
         logger.debug(
-            "Recalculating took\n\t{:.4f}sec for {} pp\n\t{} pp/sec\n\tsize: {}".format(
-                tm1 - t0, len(all_pp), len(all_pp) / (tm1 - t0), filter_size
+            "Recalculating took\n\t{:.4f}sec for {} pp\n\t{} pp/sec".format(
+                tm1 - t0, len(all_pp), len(all_pp) / max(tm1 - t0, 1e-9)
             )
         )
 
     def consolidate_classifications(self):
-        blink = None
-        state = "no blink"  # others: 'blink started' | 'blink ending'
-        blink_data = deque()
-        blink_start_ts = deque()
-        blink_stop_ts = deque()
-        counter = 1
-
-        # NOTE: Cache result for performance reasons
-        pupil_data = self._pupil_data()
-
-        def start_blink(idx):
-            nonlocal blink
-            nonlocal state
-            nonlocal counter
-            blink = {
-                "topic": "blink",
-                "__start_response_index__": idx,
-                "start_timestamp": self.timestamps[idx],
-                "id": counter,
-            }
-            state = "blink started"
-            counter += 1
-
-        def blink_finished(idx):
-            nonlocal blink
-
-            # get tmp pupil idx
-            start_idx = blink["__start_response_index__"]
-            del blink["__start_response_index__"]
-
-            blink["end_timestamp"] = self.timestamps[idx]
-            blink["timestamp"] = (blink["end_timestamp"] + blink["start_timestamp"]) / 2
-            blink["duration"] = blink["end_timestamp"] - blink["start_timestamp"]
-            blink["base_data"] = pupil_data[start_idx:idx].tolist()
-            blink["filter_response"] = self.filter_response[start_idx:idx].tolist()
-            # blink confidence is the mean of the absolute filter response
-            # during the blink event, clamped at 1.
-            blink["confidence"] = min(
-                float(np.abs(blink["filter_response"]).mean()), 1.0
-            )
-
-            # correlate world indices
-            ts_start, ts_end = blink["start_timestamp"], blink["end_timestamp"]
-
-            idx_start, idx_end = np.searchsorted(
-                self.g_pool.timestamps, [ts_start, ts_end]
-            )
-            # fix `list index out of range` error
-            idx_end = min(idx_end, len(self.g_pool.timestamps) - 1)
-            blink["start_frame_index"] = int(idx_start)
-            blink["end_frame_index"] = int(idx_end)
-            blink["index"] = int((idx_start + idx_end) // 2)
-
-            blink_data.append(fm.Serialized_Dict(python_dict=blink))
-            blink_start_ts.append(ts_start)
-            blink_stop_ts.append(ts_end)
-
-        for idx, classification in enumerate(self.response_classification):
-            if state == "no blink" and classification > 0:
-                start_blink(idx)
-            elif state == "blink started" and classification == -1:
-                state = "blink ending"
-            elif state == "blink ending" and classification >= 0:
-                blink_finished(idx - 1)  # blink ended previously
-                if classification > 0:
-                    start_blink(0)
-                else:
-                    blink = None
-                    state = "no blink"
-
-        if state == "blink ending":
-            # only finish blink if it was already ending
-            blink_finished(idx)  # idx is the last possible idx
-
-        self.g_pool.blinks = pm.Affiliator(blink_data, blink_start_ts, blink_stop_ts)
+        self.g_pool.blinks = consolidate_blink_classifications(
+            self._pupil_data(),
+            self.filter_response,
+            self.response_classification,
+            self.g_pool.timestamps,
+        )
         self.notify_all({"subject": "blinks_changed", "delay": 0.2})
 
     def cache_activation(self):
@@ -455,12 +324,13 @@ class Offline_Blink_Detection(Observable, Blink_Detection):
             (t1, -self.offset_confidence_threshold),
         )
 
-        self.cache["response_points"] = tuple(
-            zip(self.timestamps, self.filter_response)
-        )
-        if len(self.cache["response_points"]) == 0:
+        if len(self.timestamps) == 0:
+            self.cache["response"] = None
             self.cache["class_points"] = ()
             return
+        self.cache["response"] = Timeline_Pyramid.from_samples(
+            self.timestamps, self.filter_response
+        )
 
         class_points = deque([(t0, -0.9)])
         for b in self.g_pool.blinks:
@@ -474,12 +344,15 @@ class Offline_Blink_Detection(Observable, Blink_Detection):
     def draw_activation(self, width, height, scale):
         t0, t1 = self.g_pool.timestamps[0], self.g_pool.timestamps[-1]
         with gl_utils.Coord_System(t0, t1, -1, 1):
-            cygl_utils.draw_polyline(
-                self.cache["response_points"],
-                color=activity_color,
-                line_type=gl.GL_LINE_STRIP,
-                thickness=scale,
-            )
+            if self.cache["response"] is not None:
+                # One bin per pixel, independent of the number of samples
+                bins = self.cache["response"].query(t0, t1, int(width))
+                cygl_utils.draw_polyline(
+                    min_max_polyline(bins),
+                    color=activity_color,
+                    line_type=gl.GL_LINE_STRIP,
+                    thickness=scale,
+                )
             cygl_utils.draw_polyline(
                 self.cache["class_points"],
                 color=blink_color,
@@ -573,16 +446,184 @@ class Offline_Blink_Detection(Observable, Blink_Detection):
             )
         self._offset_confidence_threshold = val
 
-    def csv_representation_for_blink(self, b, header):
-        data = [b[k] for k in header if k not in ("filter_response", "base_data")]
-        try:
-            resp = " ".join(["{}".format(val) for val in b["filter_response"]])
-            data.insert(header.index("filter_response"), resp)
-        except IndexError:
-            pass
-        try:
-            base = " ".join(["{}".format(pp["timestamp"]) for pp in b["base_data"]])
-            data.insert(header.index("base_data"), base)
-        except IndexError:
-            pass
-        return data
+
+BLINK_CSV_HEADER = (
+    "id",
+    "start_timestamp",
+    "duration",
+    "end_timestamp",
+    "start_frame_index",
+    "index",
+    "end_frame_index",
+    "confidence",
+    "filter_response",
+    "base_data",
+)
+
+
+def blink_pupil_data(pupil_positions):
+    """Pupil data that blinks are detected in: 2d data, or 3d data if there is none"""
+    data = pupil_positions[..., "2d"]
+    if not data:
+        # Fall back to 3d data
+        data = pupil_positions[..., "3d"]
+    return data
+
+
+def blink_filter_response(pupil_data, history_length):
+    """Response of the blink filter to the confidence of `pupil_data`"""
+    if not pupil_data:
+        return []
+
+    activity = pupil_data.column("confidence").astype(float)
+    total_time = pupil_data[-1]["timestamp"] - pupil_data[0]["timestamp"]
+    filter_size = 2 * round(len(pupil_data) * history_length / total_time / 2.0)
+    blink_filter = np.ones(filter_size) / filter_size
+
+    # This is different from the online filter. Convolution will flip
+    # the filter and result in a reverse filter response. Therefore
+    # we set the first half of the filter to -1 instead of the second
+    # half such that we get the expected result.
+    blink_filter[: filter_size // 2] *= -1
+
+    # The theoretical response maximum is +-0.5
+    # Response of +-0.45 seems sufficient for a confidence of 1.
+    return fftconvolve(activity, blink_filter, "same") / 0.45
+
+
+def classify_blink_response(
+    filter_response, onset_confidence_threshold, offset_confidence_threshold
+):
+    """Classifies the filter response as onset (1.0), offset (-1.0) or neither"""
+    filter_response = np.asarray(filter_response)
+    onsets = filter_response > onset_confidence_threshold
+    offsets = filter_response < -offset_confidence_threshold
+
+    response_classification = np.zeros(filter_response.shape)
+    response_classification[onsets] = 1.0
+    response_classification[offsets] = -1.0
+    return response_classification
+
+
+def consolidate_blink_classifications(
+    pupil_data, filter_response, response_classification, world_timestamps
+) -> pm.Affiliator:
+    """Blinks from consecutive onset and offset classifications of `pupil_data`"""
+    blink = None
+    state = "no blink"  # others: 'blink started' | 'blink ending'
+    blink_data = deque()
+    blink_start_ts = deque()
+    blink_stop_ts = deque()
+    counter = 1
+
+    def start_blink(idx):
+        nonlocal blink
+        nonlocal state
+        nonlocal counter
+        blink = {
+            "topic": "blink",
+            "__start_response_index__": idx,
+            "start_timestamp": pupil_data.timestamps[idx],
+            "id": counter,
+        }
+        state = "blink started"
+        counter += 1
+
+    def blink_finished(idx):
+        nonlocal blink
+
+        # get tmp pupil idx
+        start_idx = blink["__start_response_index__"]
+        del blink["__start_response_index__"]
+
+        blink["end_timestamp"] = pupil_data.timestamps[idx]
+        blink["timestamp"] = (blink["end_timestamp"] + blink["start_timestamp"]) / 2
+        blink["duration"] = blink["end_timestamp"] - blink["start_timestamp"]
+        blink["base_data"] = pupil_data[start_idx:idx].tolist()
+        blink["filter_response"] = filter_response[start_idx:idx].tolist()
+        # blink confidence is the mean of the absolute filter response
+        # during the blink event, clamped at 1.
+        blink["confidence"] = min(float(np.abs(blink["filter_response"]).mean()), 1.0)
+
+        # correlate world indices
+        ts_start, ts_end = blink["start_timestamp"], blink["end_timestamp"]
+
+        idx_start, idx_end = np.searchsorted(world_timestamps, [ts_start, ts_end])
+        # fix `list index out of range` error
+        idx_end = min(idx_end, len(world_timestamps) - 1)
+        blink["start_frame_index"] = int(idx_start)
+        blink["end_frame_index"] = int(idx_end)
+        blink["index"] = int((idx_start + idx_end) // 2)
+
+        blink_data.append(fm.Serialized_Dict(python_dict=blink))
+        blink_start_ts.append(ts_start)
+        blink_stop_ts.append(ts_end)
+
+    for idx, classification in enumerate(response_classification):
+        if state == "no blink" and classification > 0:
+            start_blink(idx)
+        elif state == "blink started" and classification == -1:
+            state = "blink ending"
+        elif state == "blink ending" and classification >= 0:
+            blink_finished(idx - 1)  # blink ended previously
+            if classification > 0:
+                start_blink(0)
+            else:
+                blink = None
+                state = "no blink"
+
+    if state == "blink ending":
+        # only finish blink if it was already ending
+        blink_finished(idx)  # idx is the last possible idx
+
+    return pm.Affiliator(blink_data, blink_start_ts, blink_stop_ts)
+
+
+def export_blinks_to_csv(
+    blinks_in_section,
+    export_dir,
+    history_length,
+    onset_confidence_threshold,
+    offset_confidence_threshold,
+):
+    """Writes blinks.csv and blink_detection_report.csv to `export_dir`"""
+    with open(
+        os.path.join(export_dir, "blinks.csv"), "w", encoding="utf-8", newline=""
+    ) as csvfile:
+        csv_writer = csv.writer(csvfile)
+        csv_writer.writerow(BLINK_CSV_HEADER)
+        for b in blinks_in_section:
+            csv_writer.writerow(csv_representation_for_blink(b, BLINK_CSV_HEADER))
+        logger.info("Created 'blinks.csv' file.")
+
+    with open(
+        os.path.join(export_dir, "blink_detection_report.csv"),
+        "w",
+        encoding="utf-8",
+        newline="",
+    ) as csvfile:
+        csv_utils.write_key_value_file(
+            csvfile,
+            {
+                "history_length": history_length,
+                "onset_confidence_threshold": onset_confidence_threshold,
+                "offset_confidence_threshold": offset_confidence_threshold,
+                "blinks_exported": len(blinks_in_section),
+            },
+        )
+        logger.info("Created 'blink_detection_report.csv' file.")
+
+
+def csv_representation_for_blink(b, header):
+    data = [b[k] for k in header if k not in ("filter_response", "base_data")]
+    try:
+        resp = " ".join(["{}".format(val) for val in b["filter_response"]])
+        data.insert(header.index("filter_response"), resp)
+    except IndexError:
+        pass
+    try:
+        base = " ".join(["{}".format(pp["timestamp"]) for pp in b["base_data"]])
+        data.insert(header.index("base_data"), base)
+    except IndexError:
+        pass
+    return data
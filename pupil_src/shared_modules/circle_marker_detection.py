@@ -0,0 +1,128 @@
+"""
+(*)~---------------------------------------------------------------------------
+Pupil - eye tracking platform
+Copyright (C) 2012-2020 Pupil Labs
+
+Distributed under the terms of the GNU
+Lesser General Public License (LGPL v3.0).
+See COPYING and COPYING.LESSER for license details.
+---------------------------------------------------------------------------~(*)
+"""
+import bisect
+import logging
+import typing as T
+
+import numpy as np
+
+from circle_detector import CircleTracker
+from video_capture.file_backend import FrameRangeDecoder, OnDemandDecoder
+from video_capture.utils import InvalidContainerError, VideoSet
+
+logger = logging.getLogger(__name__)
+
+# Minimum number of frames per detection task, such that setting up a decoder
+# for each task is negligible
+MIN_FRAMES_PER_TASK = 300
+
+
+def split_frame_indices(
+    frame_indices: T.Sequence[int],
+    keyframe_indices: T.Sequence[int],
+    min_frames: int = MIN_FRAMES_PER_TASK,
+) -> T.List[T.List[int]]:
+    """Splits sorted frame indices into tasks of at least `min_frames` frames
+
+    Tasks are only split at keyframes, such that no group of pictures needs to be
+    decoded by more than one task. The last task might contain fewer frames.
+    """
+    tasks = []
+    task = []
+    task_group = None
+    for frame_index in frame_indices:
+        group = bisect.bisect_right(keyframe_indices, frame_index)
+        if group != task_group and len(task) >= min_frames:
+            tasks.append(task)
+            task = []
+        task_group = group
+        task.append(frame_index)
+    if task:
+        tasks.append(task)
+    return tasks
+
+
+def contiguous_ranges(frame_indices: T.Sequence[int]) -> T.List[T.Tuple[int, int]]:
+    """(start, stop) of all runs of consecutive indices in sorted frame indices"""
+    ranges = []
+    for frame_index in frame_indices:
+        if ranges and ranges[-1][1] == frame_index:
+            ranges[-1][1] = frame_index + 1
+        else:
+            ranges.append([frame_index, frame_index + 1])
+    return [tuple(frame_range) for frame_range in ranges]
+
+
+def keyframe_indices(videoset: VideoSet) -> T.List[int]:
+    """Lookup indices of all frames that start a group of pictures
+
+    Only demuxes the videos, without decoding them.
+    """
+    lookup = videoset.lookup
+    keyframes = []
+    for container_idx, video in enumerate(videoset.videos):
+        frame_idc = np.flatnonzero(lookup.container_idx == container_idx)
+        if frame_idc.size == 0:
+            continue
+        try:
+            container = video.load_container()
+        except InvalidContainerError:
+            continue
+        stream = container.streams.video[0]
+        keyframe_pts = [
+            packet.pts
+            for packet in container.demux(stream)
+            if packet.is_keyframe and packet.pts is not None
+        ]
+        container.close()
+        is_keyframe = np.isin(lookup.pts[frame_idc], keyframe_pts)
+        is_keyframe[0] = True
+        keyframes.extend(frame_idc[is_keyframe].tolist())
+    return sorted(keyframes)
+
+
+def _open_decoder(container):
+    return OnDemandDecoder(container, container.streams.video[0])
+
+
+def detect_circle_markers(
+    rec_dir: str, set_name: str, frame_indices: T.Sequence[int]
+) -> T.List[T.Tuple[int, float, T.List[dict]]]:
+    """(frame index, timestamp, markers) of the given frames of a video set
+
+    Only decodes the given frames, which should not include gap frames. The
+    tracker restarts at the first frame of each run of consecutive frame indices.
+    """
+    videoset = VideoSet(rec_dir, set_name, fill_gaps=True)
+    videoset.load_or_build_lookup()
+    decoder = FrameRangeDecoder(videoset, _open_decoder)
+    results = []
+    try:
+        for start, stop in contiguous_ranges(frame_indices):
+            circle_tracker = CircleTracker()
+            for frame in decoder.decode(start, stop):
+                markers = [
+                    {
+                        "marker_type": marker["marker_type"],
+                        "img_pos": tuple(map(float, marker["img_pos"])),
+                        "norm_pos": tuple(map(float, marker["norm_pos"])),
+                    }
+                    for marker in circle_tracker.update(frame.gray)
+                ]
+                results.append((frame.index, float(frame.timestamp), markers))
+    finally:
+        decoder.cleanup()
+    return results
+
+
+def detect_circle_markers_task(args):
+    """Unpacks `detect_circle_markers()` arguments for `Pool.imap_unordered()`"""
+    return detect_circle_markers(*args)
@@ -67,6 +67,11 @@ class Announcer:
         self._current_token = None
         plugin.add_observer("on_notify", self._on_notify)
 
+    @property
+    def current_token(self):
+        """Token of the most recently announced data, None if nothing was announced"""
+        return self._current_token
+
     def announce_new(self, delay=None, token_data=None):
         """
         Announce that new data is available for the topic. New means that is has
@@ -17,6 +17,7 @@ import os
 import pickle
 import traceback as tb
 import types
+import weakref
 from glob import iglob
 from pathlib import Path
 
@@ -137,37 +138,312 @@ class Incremental_Legacy_Pupil_Data_Loader(object):
 
 def load_pldata_file(directory, topic):
     ts_file = os.path.join(directory, topic + "_timestamps.npy")
-    msgpack_file = os.path.join(directory, topic + ".pldata")
     try:
-        data = collections.deque()
-        topics = collections.deque()
         data_ts = np.load(ts_file)
-        with open(msgpack_file, "rb") as fh:
-            for topic, payload in msgpack.Unpacker(fh, raw=False, use_list=False):
-                data.append(Serialized_Dict(msgpack_bytes=payload))
-                topics.append(topic)
+        columns = PLData_Columns.load(directory, topic)
     except FileNotFoundError:
         data = []
         data_ts = []
         topics = []
+    else:
+        data = Serialized_Dict_View(columns)
+        topics = columns.topics().tolist()
 
     return PLData(data, data_ts, topics)
 
 
+class PLData_Columns(object):
+    """Columnar index of a `<topic>.pldata` file
+
+    Scalar fields (e.g. `confidence`, `timestamp`, `id`), fixed-size numeric
+    fields (e.g. `norm_pos`) and string fields (e.g. `method`) of all data are
+    stored as one structured numpy array in `<topic>_columns.npy`, next to the
+    pldata file. The array is memory-mapped on load and additionally holds the
+    position of each msgpack payload within the pldata file. Nested fields
+    (e.g. `ellipse`, `base_data`) are deserialized from these payloads on demand.
+
+    The index is built on first load and rebuilt whenever the pldata file changes.
+    """
+
+    version = 1
+
+    _OFFSET = "__payload_offset__"
+    _SIZE = "__payload_size__"
+    _TOPIC = "__topic__"
+    _RESERVED = (_OFFSET, _SIZE, _TOPIC)
+
+    # Used to detach all columns from a pldata file before it is overwritten
+    _instances = weakref.WeakSet()
+
+    def __init__(self, pldata_path, table, labels):
+        self.pldata_path = pldata_path
+        self._table = table
+        self._labels = labels
+        self._payload_buffer = None
+        PLData_Columns._instances.add(self)
+
+    @staticmethod
+    def table_path(directory, topic):
+        return os.path.join(directory, topic + "_columns.npy")
+
+    @staticmethod
+    def meta_path(directory, topic):
+        return os.path.join(directory, topic + "_columns.meta")
+
+    @classmethod
+    def load(cls, directory, topic):
+        """Loads the columnar index of a pldata file, building it if required
+
+        Raises FileNotFoundError if the pldata file does not exist.
+        """
+        pldata_path = os.path.join(directory, topic + ".pldata")
+        signature = cls._signature(pldata_path)
+        table_path = cls.table_path(directory, topic)
+        meta_path = cls.meta_path(directory, topic)
+        try:
+            meta = load_object(meta_path, allow_legacy=False)
+            if meta["version"] != cls.version or meta["signature"] != signature:
+                raise ValueError("Outdated pldata columns")
+            table = np.load(table_path, mmap_mode="r")
+        except Exception:
+            logger.debug(f"Building columnar index for {pldata_path}")
+            table, labels = cls._build(pldata_path)
+            meta = {"version": cls.version, "signature": signature, "labels": labels}
+            try:
+                cls._save(table, meta, table_path, meta_path)
+            except OSError:
+                logger.debug(f"Could not save columnar index for {pldata_path}")
+                logger.debug(tb.format_exc())
+        return cls(pldata_path, table, meta["labels"])
+
+    @classmethod
+    def detach_file(cls, pldata_path):
+        """Moves all data loaded from `pldata_path` into memory
+
+        Required before the pldata file is overwritten, moved, or deleted.
+        """
+        pldata_path = os.path.abspath(pldata_path)
+        for columns in list(cls._instances):
+            if os.path.abspath(columns.pldata_path) == pldata_path:
+                columns.detach()
+
+    def detach(self):
+        if self._payload_buffer is not None:
+            return
+        self._table = np.array(self._table)
+        with open(self.pldata_path, "rb") as fh:
+            self._payload_buffer = fh.read()
+
+    def __len__(self):
+        return len(self._table)
+
+    @property
+    def fields(self):
+        return tuple(n for n in self._table.dtype.names if n not in self._RESERVED)
+
+    def column(self, key, idc=slice(None)):
+        values = self._table[key][idc]
+        if key in self._labels:
+            values = np.asarray(self._labels[key], dtype=object)[values]
+        return values
+
+    def topics(self, idc=slice(None)):
+        return self.column(self._TOPIC, idc)
+
+    def payloads(self, idc):
+        offsets = self._table[self._OFFSET][idc].tolist()
+        sizes = self._table[self._SIZE][idc].tolist()
+        if not offsets:
+            return []
+        if self._payload_buffer is not None:
+            buffer, start = self._payload_buffer, 0
+        else:
+            start = min(offsets)
+            stop = max(o + s for o, s in zip(offsets, sizes))
+            with open(self.pldata_path, "rb") as fh:
+                if stop - start > 2 * sum(sizes) + 2 ** 20:
+                    # sparse selection, avoid reading everything in between
+                    payloads = []
+                    for offset, size in zip(offsets, sizes):
+                        fh.seek(offset)
+                        payloads.append(fh.read(size))
+                    return payloads
+                fh.seek(start)
+                buffer = fh.read(stop - start)
+        return [
+            buffer[offset - start : offset - start + size]
+            for offset, size in zip(offsets, sizes)
+        ]
+
+    @staticmethod
+    def _signature(pldata_path):
+        stat = os.stat(pldata_path)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    @staticmethod
+    def _save(table, meta, table_path, meta_path):
+        tmp_path = table_path + ".tmp"
+        with open(tmp_path, "wb") as fh:
+            np.save(fh, table)
+        os.replace(tmp_path, table_path)
+        save_object(meta, meta_path)
+
+    @classmethod
+    def _build(cls, pldata_path):
+        offsets, sizes, topics = [], [], []
+        values = None
+        with open(pldata_path, "rb") as fh:
+            unpacker = msgpack.Unpacker(fh, raw=False, use_list=False)
+            for topic, payload in unpacker:
+                offsets.append(unpacker.tell() - len(payload))
+                sizes.append(len(payload))
+                topics.append(topic)
+                datum = msgpack.unpackb(payload, raw=False, use_list=False)
+                if values is None:
+                    items = datum.items() if isinstance(datum, dict) else ()
+                    values = {
+                        key: [] for key, value in items if cls._is_columnar_value(value)
+                    }
+                for key, column_values in list(values.items()):
+                    try:
+                        column_values.append(datum[key])
+                    except (KeyError, TypeError):
+                        del values[key]
+
+        columns = {
+            cls._OFFSET: np.array(offsets, dtype=np.int64),
+            cls._SIZE: np.array(sizes, dtype=np.int64),
+        }
+        labels = {}
+        for key, column_values in [(cls._TOPIC, topics), *(values or {}).items()]:
+            try:
+                if all(type(value) is str for value in column_values):
+                    labels[key], column = np.unique(column_values, return_inverse=True)
+                    labels[key] = labels[key].tolist()
+                    column = column.astype(np.int32)
+                else:
+                    column = np.array(column_values)
+                    if column.dtype.kind not in "biuf":
+                        continue
+            except ValueError:  # inhomogeneous shapes
+                continue
+            columns[key] = column
+
+        dtype = [(key, col.dtype, col.shape[1:]) for key, col in columns.items()]
+        table = np.empty(len(offsets), dtype=dtype)
+        for key, column in columns.items():
+            table[key] = column
+        return table, labels
+
+    @staticmethod
+    def _is_columnar_value(value):
+        if type(value) in (bool, int, float, str):
+            return True
+        return (
+            type(value) is tuple
+            and len(value) > 0
+            and all(type(v) in (bool, int, float) for v in value)
+        )
+
+
+class Serialized_Dict_View(object):
+    """Lazy sequence of `Serialized_Dict` backed by `PLData_Columns`
+
+    Indexing with slices or index arrays returns new views without reading any
+    payloads. Use `column()` to access columnar fields as numpy arrays.
+    """
+
+    _ITER_CHUNK_SIZE = 10_000
+
+    def __init__(self, columns, idc=None):
+        self._columns = columns
+        if idc is None:
+            idc = np.arange(len(columns))
+        self._idc = np.asarray(idc, dtype=np.int64)
+
+    @staticmethod
+    def concatenate(sequences):
+        """Concatenates views of the same columns, returns None if not possible"""
+        sequences = [seq for seq in sequences if len(seq)]
+        if not sequences or not all(
+            isinstance(seq, Serialized_Dict_View)
+            and seq._columns is sequences[0]._columns
+            for seq in sequences
+        ):
+            return None
+        idc = np.concatenate([seq._idc for seq in sequences])
+        return Serialized_Dict_View(sequences[0]._columns, idc)
+
+    def has_column(self, key):
+        return key in self._columns.fields
+
+    def column(self, key):
+        return self._columns.column(key, self._idc)
+
+    def __len__(self):
+        return len(self._idc)
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            (payload,) = self._columns.payloads(self._idc[[key]])
+            return Serialized_Dict(msgpack_bytes=payload)
+        return Serialized_Dict_View(self._columns, self._idc[key])
+
+    def __iter__(self):
+        for start in range(0, len(self._idc), self._ITER_CHUNK_SIZE):
+            chunk = self._idc[start : start + self._ITER_CHUNK_SIZE]
+            for payload in self._columns.payloads(chunk):
+                yield Serialized_Dict(msgpack_bytes=payload)
+
+    def __reduce__(self):
+        # Background processes receive plain data, independent of the pldata file
+        return _object_array, (self.tolist(),)
+
+    def tolist(self):
+        return list(self)
+
+    def copy(self):
+        return Serialized_Dict_View(self._columns, self._idc.copy())
+
+
+def _object_array(items):
+    return np.asarray(items, dtype=object)
+
+
+def extract_column(data, key):
+    """Returns `key` of each datum in `data` as numpy array
+
+    Uses the columnar index for `Serialized_Dict_View` data if possible, and falls
+    back to accessing each datum otherwise.
+    """
+    if isinstance(data, Serialized_Dict_View) and data.has_column(key):
+        return data.column(key)
+    return np.array([datum[key] for datum in data])
+
+
 class PLData_Writer(object):
     """docstring for PLData_Writer"""
 
+    # writes are collected into large chunks before hitting the disk
+    BUFFER_SIZE = 2 ** 20
+
     def __init__(self, directory, name):
         super().__init__()
         self.directory = directory
         self.name = name
         self.ts_queue = collections.deque()
-        file_name = name + ".pldata"
-        self.file_handle = open(os.path.join(directory, file_name), "wb")
+        file_path = os.path.join(directory, name + ".pldata")
+        PLData_Columns.detach_file(file_path)
+        self.file_handle = open(file_path, "wb", buffering=self.BUFFER_SIZE)
 
-    def append(self, datum):
+    @staticmethod
+    def serialize(datum):
+        """Returns the `append_serialized` arguments for `datum`"""
         datum_serialized = msgpack.packb(datum, use_bin_type=True)
-        self.append_serialized(datum["timestamp"], datum["topic"], datum_serialized)
+        return datum["timestamp"], datum["topic"], datum_serialized
+
+    def append(self, datum):
+        self.append_serialized(*self.serialize(datum))
 
     def append_serialized(self, timestamp, topic, datum_serialized):
         self.ts_queue.append(timestamp)
@@ -178,6 +454,12 @@ class PLData_Writer(object):
         for datum in data:
             self.append(datum)
 
+    def flush(self, fsync=False):
+        """Writes buffered data to the file, and to disk if `fsync` is set"""
+        self.file_handle.flush()
+        if fsync:
+            os.fsync(self.file_handle.fileno())
+
     def close(self):
         self.file_handle.close()
         self.file_handle = None
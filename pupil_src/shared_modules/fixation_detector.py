@@ -29,6 +29,7 @@ Terms
 import csv
 import enum
 import logging
+import multiprocessing as mp
 import os
 import typing as T
 from bisect import bisect_left, bisect_right
@@ -115,6 +116,19 @@ class Fixation_Result_Factory(object):
         datum = self._serialize(datum)
         return (datum, fixation_start, fixation_stop)
 
+    def renumber(self, fixation_result):
+        """Assign the next id to a result created by a different factory"""
+        serialized, fixation_start, fixation_stop = fixation_result
+        datum = msgpack.unpackb(
+            serialized,
+            raw=False,
+            use_list=False,
+            ext_hook=fm.Serialized_Dict.unpacking_ext_hook,
+        )
+        self._set_fixation_id(datum)
+        datum = self._serialize(datum)
+        return (datum, fixation_start, fixation_stop)
+
     def _set_fixation_id(self, fixation):
         fixation["id"] = self._id_counter
         self._id_counter += 1
@@ -133,120 +147,316 @@ def vector_dispersion(vectors):
     return dispersion
 
 
-def gaze_dispersion(capture, gaze_subset, method: FixationDetectionMethod) -> float:
+def gaze_vectors(capture, gaze_subset, method: FixationDetectionMethod) -> np.ndarray:
     if method is FixationDetectionMethod.GAZE_3D:
         vectors = np.array([gp["gaze_point_3d"] for gp in gaze_subset])
     elif method is FixationDetectionMethod.GAZE_2D:
         locations = np.array([gp["norm_pos"] for gp in gaze_subset])
-
-        # denormalize
-        width, height = capture.frame_size
-        locations[:, 0] *= width
-        locations[:, 1] = (1.0 - locations[:, 1]) * height
-
-        # undistort onto 3d plane
-        vectors = capture.intrinsics.unprojectPoints(locations)
+        vectors = norm_pos_to_vectors(capture, locations)
     else:
         raise ValueError(f"Unknown method '{method}'")
+    return vectors
+
+
+def norm_pos_to_vectors(capture, locations: np.ndarray) -> np.ndarray:
+    # denormalize
+    width, height = capture.frame_size
+    locations[:, 0] *= width
+    locations[:, 1] = (1.0 - locations[:, 1]) * height
 
+    # undistort onto 3d plane
+    return capture.intrinsics.unprojectPoints(locations)
+
+
+def gaze_dispersion(capture, gaze_subset, method: FixationDetectionMethod) -> float:
+    vectors = gaze_vectors(capture, gaze_subset, method)
     dist = vector_dispersion(vectors)
     return dist
 
 
+class Sliding_Dispersion_Window(object):
+    """Dispersion of a sliding window over precomputed gaze vectors.
+
+    The window covers the vectors `[start, stop)`. For each vector in the window,
+    the smallest cosine to any *later* vector in the window is kept. Appending a
+    vector updates these values in O(window size), removing vectors from the
+    front of the window does not invalidate them. The dispersion, i.e. the
+    maximum pairwise angle, corresponds to the smallest of these cosines.
+
+    Dispersions are estimates based on normalized vectors. Decisions close to a
+    threshold should be verified with `vector_dispersion()`.
+    """
+
+    def __init__(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float64)
+        self._unit = vectors / np.linalg.norm(vectors, axis=1)[:, np.newaxis]
+        self._min_cos = np.full(len(vectors), np.inf)
+        self.start = 0
+        self.stop = 0
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def reset(self, start):
+        self.start = self.stop = start
+
+    def popleft(self):
+        self.start += 1
+
+    def append(self):
+        old = slice(self.start, self.stop)
+        cos = self._unit[old] @ self._unit[self.stop]
+        np.minimum(self._min_cos[old], cos, out=self._min_cos[old])
+        self._min_cos[self.stop] = np.inf
+        self.stop += 1
+
+    def extend(self, stop):
+        if stop <= self.stop:
+            return
+        num_old = self.stop - self.start
+        num_new = stop - self.stop
+        cos = self._unit[self.start : stop] @ self._unit[self.stop : stop].T
+        # only pairs (i, j) with i < j contribute to the minimum of vector i
+        later = np.arange(num_old + num_new)[:, np.newaxis] < (
+            num_old + np.arange(num_new)
+        )
+        self._min_cos[self.stop : stop] = np.inf
+        window = slice(self.start, stop)
+        self._min_cos[window] = np.minimum(
+            self._min_cos[window], np.where(later, cos, np.inf).min(axis=1)
+        )
+        self.stop = stop
+
+    def dispersion(self) -> float:
+        if len(self) < 2:
+            return 0.0
+        min_cos = self._min_cos[self.start : self.stop].min()
+        return float(np.arccos(np.clip(min_cos, -1.0, 1.0)))
+
+    def prefix_dispersions(self) -> np.ndarray:
+        """Dispersions of the windows `[start, start + k]` for `k < len(self)`"""
+        unit = self._unit[self.start : self.stop]
+        cos = unit @ unit.T
+        cos[np.tril_indices(len(unit))] = np.inf
+        min_cos = np.minimum.accumulate(cos.min(axis=0))
+        return np.arccos(np.clip(min_cos, -1.0, 1.0))
+
+
+# Dispersion estimates closer than this to the threshold [rad] are verified exactly
+DISPERSION_ESTIMATE_TOLERANCE = 1e-6
+
+
 def can_use_3d_gaze_mapping(gaze_data) -> bool:
     return all("gaze_point_3d" in gp for gp in gaze_data)
 
 
+def _skip_ext_type(code, data):
+    return None
+
+
+def _gaze_fields(gaze_data, min_data_confidence):
+    """Collect the fields required for fixation detection in a single pass
+
+    Each datum is deserialized only once. Nested base data is not required and
+    skipped. Returns the indices of the data passing the confidence threshold,
+    as well as their timestamps, norm_pos, and gaze_point_3d (or None).
+    """
+    indices, timestamps, norm_pos, gaze_points_3d = [], [], [], []
+    for idx, serialized in enumerate(gaze_data):
+        datum = msgpack.unpackb(
+            serialized, raw=False, use_list=False, ext_hook=_skip_ext_type
+        )
+        if datum["confidence"] > min_data_confidence:
+            indices.append(idx)
+            timestamps.append(datum["timestamp"])
+            norm_pos.append(datum["norm_pos"])
+            gaze_points_3d.append(datum.get("gaze_point_3d", None))
+    return indices, timestamps, norm_pos, gaze_points_3d
+
+
+def _detection_method(gaze_points_3d) -> FixationDetectionMethod:
+    if all(point is not None for point in gaze_points_3d):
+        return FixationDetectionMethod.GAZE_3D
+    return FixationDetectionMethod.GAZE_2D
+
+
+def _detection_vectors(capture, method, norm_pos, gaze_points_3d) -> np.ndarray:
+    if method is FixationDetectionMethod.GAZE_3D:
+        return np.array(gaze_points_3d)
+    return norm_pos_to_vectors(capture, np.array(norm_pos))
+
+
+def split_gaze_data(
+    capture,
+    gaze_data,
+    max_dispersion,
+    min_duration,
+    max_duration,
+    min_data_confidence,
+    chunk_count,
+):
+    """Split gaze data into chunks that can be classified independently
+
+    Chunks start after gaps that are longer than both duration thresholds and
+    that separate two gaze data further apart than the maximum dispersion.
+    `detect_fixations()` never classifies a window across such a boundary as
+    fixation and arrives at the same state as a fresh run on the next chunk.
+    Each chunk includes the first datum of the next chunk, since the working
+    queue of the previous chunk is only discarded once this datum is appended.
+
+    Yields the detection method and the chunks as slices into `gaze_data`.
+    Chunks must be classified with this method to match the serial result.
+    """
+    yield "Splitting gaze data...", ()
+    indices, timestamps, norm_pos, gaze_points_3d = _gaze_fields(
+        gaze_data, min_data_confidence
+    )
+    if len(indices) < 2:
+        yield "Splitting gaze data...", (None, [slice(0, len(gaze_data))])
+        return
+
+    method = _detection_method(gaze_points_3d)
+    vectors = _detection_vectors(capture, method, norm_pos, gaze_points_3d)
+    unit = vectors / np.linalg.norm(vectors, axis=1)[:, np.newaxis]
+    cosines = np.clip(np.sum(unit[:-1] * unit[1:], axis=1), -1.0, 1.0)
+    timestamps = np.array(timestamps)
+
+    is_boundary = (
+        (timestamps[1:] > timestamps[:-1] + max_duration)
+        & (np.diff(timestamps) >= min_duration)
+        & (np.arccos(cosines) > max_dispersion + DISPERSION_ESTIMATE_TOLERANCE)
+    )
+    candidates = np.flatnonzero(is_boundary) + 1
+
+    # choose the candidates closest to an even split
+    boundaries = []
+    if candidates.size:
+        targets = np.arange(1, chunk_count) * len(timestamps) / chunk_count
+        closest = np.searchsorted(candidates, targets).clip(0, candidates.size - 1)
+        boundaries = np.unique(candidates[closest]).tolist()
+
+    chunks = []
+    start = 0
+    for boundary in boundaries:
+        stop = indices[boundary] + 1
+        chunks.append(slice(start, stop))
+        start = indices[boundary]
+    chunks.append(slice(start, len(gaze_data)))
+    logger.debug(f"Split gaze data into {len(chunks)} chunks")
+    yield "Splitting gaze data...", (method, chunks)
+
+
 def detect_fixations(
-    capture, gaze_data, max_dispersion, min_duration, max_duration, min_data_confidence
+    capture,
+    gaze_data,
+    max_dispersion,
+    min_duration,
+    max_duration,
+    min_data_confidence,
+    method: T.Optional[FixationDetectionMethod] = None,
 ):
     yield "Detecting fixations...", ()
-    gaze_data = (
-        fm.Serialized_Dict(msgpack_bytes=serialized) for serialized in gaze_data
+    indices, timestamps, norm_pos, gaze_points_3d = _gaze_fields(
+        gaze_data, min_data_confidence
     )
-    gaze_data = [
-        datum for datum in gaze_data if datum["confidence"] > min_data_confidence
-    ]
+    gaze_data = [fm.Serialized_Dict(msgpack_bytes=gaze_data[idx]) for idx in indices]
     if not gaze_data:
         logger.warning("No data available to find fixations")
         return "Fixation detection failed", ()
 
-    method = (
-        FixationDetectionMethod.GAZE_3D
-        if can_use_3d_gaze_mapping(gaze_data)
-        else FixationDetectionMethod.GAZE_2D
-    )
+    if method is None:
+        method = _detection_method(gaze_points_3d)
+    vectors = _detection_vectors(capture, method, norm_pos, gaze_points_3d)
     logger.info(f"Starting fixation detection using {method.value} data...")
     fixation_result = Fixation_Result_Factory()
 
-    working_queue = deque()
-    remaining_gaze = deque(gaze_data)
+    sorted_timestamps = np.array(timestamps)
+    window = Sliding_Dispersion_Window(vectors)
 
-    while remaining_gaze:
-        # check if working_queue contains enough data
+    def exact_dispersion(start, stop):
+        # Same computation as gaze_dispersion(capture, gaze_data[start:stop], method)
+        if method is FixationDetectionMethod.GAZE_3D:
+            vectors = np.array(gaze_points_3d[start:stop])
+        else:
+            vectors = norm_pos_to_vectors(capture, np.array(norm_pos[start:stop]))
+        return vector_dispersion(vectors)
+
+    def exceeds_max_dispersion(estimate, start, stop):
+        if abs(estimate - max_dispersion) > DISPERSION_ESTIMATE_TOLERANCE:
+            return estimate > max_dispersion
+        return exact_dispersion(start, stop) > max_dispersion
+
+    # The window corresponds to the working queue, all data after it remains.
+    while window.stop < len(gaze_data):
+        # check if working queue contains enough data
         if (
-            len(working_queue) < 2
-            or (working_queue[-1]["timestamp"] - working_queue[0]["timestamp"])
-            < min_duration
+            len(window) < 2
+            or (timestamps[window.stop - 1] - timestamps[window.start]) < min_duration
         ):
-            datum = remaining_gaze.popleft()
-            working_queue.append(datum)
+            window.append()
             continue
 
         # min duration reached, check for fixation
-        dispersion = gaze_dispersion(capture, working_queue, method)
-        if dispersion > max_dispersion:
+        if exceeds_max_dispersion(window.dispersion(), window.start, window.stop):
             # not a fixation, move forward
-            working_queue.popleft()
+            window.popleft()
             continue
 
-        left_idx = len(working_queue)
+        start = window.start
+        left_idx = len(window)
 
         # minimal fixation found. collect maximal data
         # to perform binary search for fixation end
-        while remaining_gaze:
-            datum = remaining_gaze[0]
-            if datum["timestamp"] > working_queue[0]["timestamp"] + max_duration:
-                break  # maximum data found
-            working_queue.append(remaining_gaze.popleft())
+        max_stop = np.searchsorted(
+            sorted_timestamps, timestamps[start] + max_duration, side="right"
+        )
+        window.extend(max(window.stop, max_stop))
 
         # check for fixation with maximum duration
-        dispersion = gaze_dispersion(capture, working_queue, method)
-        if dispersion <= max_dispersion:
+        if not exceeds_max_dispersion(window.dispersion(), start, window.stop):
+            base_data = gaze_data[start : window.stop]
+            dispersion = exact_dispersion(start, window.stop)
             fixation = fixation_result.from_data(
-                dispersion, method, working_queue, capture.timestamps
+                dispersion, method, base_data, capture.timestamps
             )
             yield "Detecting fixations...", fixation
-            working_queue.clear()  # discard old Q
+            window.reset(window.stop)  # discard old Q
             continue
 
-        slicable = list(working_queue)  # deque does not support slicing
-        right_idx = len(working_queue)
+        prefix_dispersions = window.prefix_dispersions()
+        right_idx = len(window)
 
         # binary search
         while left_idx < right_idx - 1:
             middle_idx = (left_idx + right_idx) // 2
-            dispersion = gaze_dispersion(capture, slicable[: middle_idx + 1], method,)
-            if dispersion <= max_dispersion:
+            if not exceeds_max_dispersion(
+                prefix_dispersions[middle_idx], start, start + middle_idx + 1
+            ):
                 left_idx = middle_idx
             else:
                 right_idx = middle_idx
 
         # left_idx-1 is last valid base datum
-        final_base_data = slicable[:left_idx]
-        to_be_placed_back = slicable[left_idx:]
-        dispersion_result = gaze_dispersion(capture, final_base_data, method)
+        final_base_data = gaze_data[start : start + left_idx]
+        dispersion_result = exact_dispersion(start, start + left_idx)
 
         fixation = fixation_result.from_data(
             dispersion_result, method, final_base_data, capture.timestamps
         )
         yield "Detecting fixations...", fixation
-        working_queue.clear()  # clear queue
-        remaining_gaze.extendleft(reversed(to_be_placed_back))
+        window.reset(start + left_idx)  # place back remaining data
 
     yield "Fixation detection complete", ()
 
 
+def merge_chunk_fixations(chunk_fixations):
+    """Merge fixation results of consecutive chunks, renumbering their ids"""
+    fixation_result = Fixation_Result_Factory()
+    for fixations in chunk_fixations:
+        for fixation in fixations:
+            yield fixation_result.renumber(fixation)
+
+
 class Offline_Fixation_Detector(Observable, Fixation_Detector_Base):
     """Dispersion-duration-based fixation detector.
 
@@ -282,6 +492,9 @@ class Offline_Fixation_Detector(Observable, Fixation_Detector_Base):
         self.fixation_data = deque()
         self.prev_index = -1
         self.bg_task = None
+        self.chunk_tasks = []
+        self.chunk_fixations = []
+        self._generator_args = None
         self.status = ""
         self._gaze_changed_listener = data_changed.Listener(
             "gaze_positions", g_pool.rec_dir, plugin=self
@@ -423,9 +636,17 @@ class Offline_Fixation_Detector(Observable, Fixation_Detector_Base):
         self.prev_fix_button = None
 
     def cleanup(self):
+        self._cancel_tasks()
+
+    def _cancel_tasks(self):
         if self.bg_task:
             self.bg_task.cancel()
             self.bg_task = None
+        for task in self.chunk_tasks:
+            task.cancel()
+        self.chunk_tasks = []
+        self.chunk_fixations = []
+        self._generator_args = None
 
     def get_init_dict(self):
         return {
@@ -451,8 +672,7 @@ class Offline_Fixation_Detector(Observable, Fixation_Detector_Base):
         if self.g_pool.app == "exporter":
             return
 
-        if self.bg_task:
-            self.bg_task.cancel()
+        self._cancel_tasks()
 
         gaze_data = [gp.serialized for gp in self.g_pool.gaze_positions]
 
@@ -472,12 +692,69 @@ class Offline_Fixation_Detector(Observable, Fixation_Detector_Base):
         self.fixation_data = deque()
         self.fixation_start_ts = deque()
         self.fixation_stop_ts = deque()
-        self.bg_task = bh.IPC_Logging_Task_Proxy(
-            "Fixation detection", detect_fixations, args=generator_args
-        )
+
+        chunk_count = max(1, mp.cpu_count() - 1)
+        if chunk_count > 1:
+            self._generator_args = generator_args
+            self.bg_task = bh.IPC_Logging_Task_Proxy(
+                "Fixation detection (split)",
+                split_gaze_data,
+                args=(*generator_args, chunk_count),
+            )
+        else:
+            self.bg_task = bh.IPC_Logging_Task_Proxy(
+                "Fixation detection", detect_fixations, args=generator_args
+            )
+
+    def _start_chunk_tasks(self, method, chunks):
+        cap, gaze_data, *thresholds = self._generator_args
+        self._generator_args = None
+        self.chunk_fixations = [[] for _ in chunks]
+        self.chunk_tasks = [
+            bh.IPC_Logging_Task_Proxy(
+                f"Fixation detection ({idx + 1}/{len(chunks)})",
+                detect_fixations,
+                args=(cap, gaze_data[chunk], *thresholds),
+                kwargs={"method": method},
+            )
+            for idx, chunk in enumerate(chunks)
+        ]
+
+    def _fetch_chunk_tasks(self):
+        for task, fixations in zip(self.chunk_tasks, self.chunk_fixations):
+            for progress, fixation_result in task.fetch():
+                if fixation_result:
+                    fixations.append(fixation_result)
+
+        completed = sum(task.completed for task in self.chunk_tasks)
+        self.status = f"Detecting fixations... ({completed}/{len(self.chunk_tasks)})"
+        self.menu_icon.indicator_stop = completed / len(self.chunk_tasks)
+        if completed < len(self.chunk_tasks):
+            return
+
+        for fixation_result in merge_chunk_fixations(self.chunk_fixations):
+            serialized, start_ts, stop_ts = fixation_result
+            self.fixation_data.append(fm.Serialized_Dict(msgpack_bytes=serialized))
+            self.fixation_start_ts.append(start_ts)
+            self.fixation_stop_ts.append(stop_ts)
+        self.status = "{} fixations detected".format(len(self.fixation_data))
+        self.correlate_and_publish()
+        self.chunk_tasks = []
+        self.chunk_fixations = []
+        self.menu_icon.indicator_stop = 0.0
 
     def recent_events(self, events):
-        if self.bg_task:
+        if self.chunk_tasks:
+            self._fetch_chunk_tasks()
+        elif self.bg_task and self._generator_args:
+            for progress, split_result in self.bg_task.fetch():
+                self.status = progress
+                if split_result:
+                    self.bg_task.cancel()
+                    self.bg_task = None
+                    self._start_chunk_tasks(*split_result)
+                    break
+        elif self.bg_task:
             for progress, fixation_result in self.bg_task.fetch():
                 self.status = progress
                 if fixation_result:
@@ -633,33 +910,44 @@ class Offline_Fixation_Detector(Observable, Fixation_Detector_Base):
             logger.warning("No fixations in this recording nothing to export")
             return
 
-        fixations_in_section = self.g_pool.fixations.by_ts_window(export_window)
-
-        with open(
-            os.path.join(export_dir, "fixations.csv"), "w", encoding="utf-8", newline=""
-        ) as csvfile:
-            csv_writer = csv.writer(csvfile)
-            csv_writer.writerow(self.csv_representation_keys())
-            for f in fixations_in_section:
-                csv_writer.writerow(self.csv_representation_for_fixation(f))
-            logger.info("Created 'fixations.csv' file.")
-
-        with open(
-            os.path.join(export_dir, "fixation_report.csv"),
-            "w",
-            encoding="utf-8",
-            newline="",
-        ) as csvfile:
-            csv_writer = csv.writer(csvfile)
-            csv_writer.writerow(("fixation classifier", "Dispersion_Duration"))
+        export_fixations_to_csv(
+            self.g_pool.fixations.by_ts_window(export_window),
+            export_dir,
+            max_dispersion=self.max_dispersion,
+            min_duration=self.min_duration,
+            max_duration=self.max_duration,
+        )
+
+
+def export_fixations_to_csv(
+    fixations_in_section, export_dir, max_dispersion, min_duration, max_duration
+):
+    """Writes fixations.csv and fixation_report.csv to `export_dir`"""
+    with open(
+        os.path.join(export_dir, "fixations.csv"), "w", encoding="utf-8", newline=""
+    ) as csvfile:
+        csv_writer = csv.writer(csvfile)
+        csv_writer.writerow(Offline_Fixation_Detector.csv_representation_keys())
+        for f in fixations_in_section:
             csv_writer.writerow(
-                ("max_dispersion", "{:0.3f} deg".format(self.max_dispersion))
+                Offline_Fixation_Detector.csv_representation_for_fixation(f)
             )
-            csv_writer.writerow(("min_duration", "{:.0f} ms".format(self.min_duration)))
-            csv_writer.writerow(("max_duration", "{:.0f} ms".format(self.max_duration)))
-            csv_writer.writerow((""))
-            csv_writer.writerow(("fixation_count", len(fixations_in_section)))
-            logger.info("Created 'fixation_report.csv' file.")
+        logger.info("Created 'fixations.csv' file.")
+
+    with open(
+        os.path.join(export_dir, "fixation_report.csv"),
+        "w",
+        encoding="utf-8",
+        newline="",
+    ) as csvfile:
+        csv_writer = csv.writer(csvfile)
+        csv_writer.writerow(("fixation classifier", "Dispersion_Duration"))
+        csv_writer.writerow(("max_dispersion", "{:0.3f} deg".format(max_dispersion)))
+        csv_writer.writerow(("min_duration", "{:.0f} ms".format(min_duration)))
+        csv_writer.writerow(("max_duration", "{:.0f} ms".format(max_duration)))
+        csv_writer.writerow((""))
+        csv_writer.writerow(("fixation_count", len(fixations_in_section)))
+        logger.info("Created 'fixation_report.csv' file.")
 
 
 class Fixation_Detector(Fixation_Detector_Base):
@@ -247,6 +247,40 @@ class Gazer2D(GazerBase):
                 }
                 yield gaze_datum
 
+    def predict_batch(
+        self, matched_pupil_data: T.Iterable[T.List["Pupil"]]
+    ) -> T.List["Gaze"]:
+        matched_pupil_data = list(matched_pupil_data)
+        matches = self._group_matches(matched_pupil_data)
+        models = (
+            (self.binocular_model, matches.binocular, "binocular", "gaze.2d.01."),
+            (self.right_model, matches.right, "right", "gaze.2d.0."),
+            (self.left_model, matches.left, "left", "gaze.2d.1."),
+        )
+        gaze_data = []
+        for model, indices, name, topic in models:
+            if not indices:
+                continue
+            if not model.is_fitted:
+                logger.debug(f"Prediction failed because {name} model is not fitted")
+                continue
+            pupil_matches = [matched_pupil_data[idx] for idx in indices]
+            X = self._extract_features_from_pupil_matches(pupil_matches)
+            gaze_positions = model.predict(X).tolist()
+            confidence, timestamp = self._mean_confidence_and_timestamp(pupil_matches)
+            for gaze_pos, conf, ts, pupil_match in zip(
+                gaze_positions, confidence, timestamp, pupil_matches
+            ):
+                gaze_datum = {
+                    "topic": topic,
+                    "norm_pos": gaze_pos,
+                    "confidence": conf,
+                    "timestamp": ts,
+                    "base_data": pupil_match,
+                }
+                gaze_data.append(gaze_datum)
+        return gaze_data
+
     def filter_pupil_data(
         self, pupil_data: T.Iterable, confidence_threshold: T.Optional[float] = None
     ) -> T.Iterable:
@@ -53,6 +53,18 @@ _BINOCULAR_SPHERE_CENTER = slice(8, 11)
 _BINOCULAR_PUPIL_NORMAL = slice(11, 14)
 
 
+def _transform_points(matrix, points):
+    """Applies a 4x4 transformation matrix to points of shape (n, 3)"""
+    return points @ matrix[:3, :3].T + matrix[:3, 3]
+
+
+def _image_points_to_norm_pos(image_points, resolution) -> T.List[T.Tuple]:
+    norm_pos = image_points.reshape(-1, 2) / np.asarray(resolution, dtype=float)
+    norm_pos[:, 1] = 1.0 - norm_pos[:, 1]
+    norm_pos = np.clip(norm_pos, -100.0, 100.0)
+    return [tuple(pos) for pos in norm_pos.tolist()]
+
+
 class Model3D(Model):
     @abc.abstractmethod
     def _fit(self, *args, **kwargs):
@@ -176,6 +188,46 @@ class Model3D_Monocular(Model3D):
 
         return g
 
+    def predict_batch(self, X, gaze_distances=None):
+        """Vectorized `predict()`
+
+        `gaze_distances` replaces `gaze_distance` with one value per sample.
+        """
+        assert X.ndim == 2, X
+        assert X.shape[1] == _MONOCULAR_FEATURE_COUNT, X
+        if gaze_distances is None:
+            gaze_distances = np.full(X.shape[0], self.gaze_distance)
+        pupil_normals = X[:, _MONOCULAR_PUPIL_NORMAL]
+        sphere_centers = X[:, _MONOCULAR_SPHERE_CENTER]
+        gaze_points = pupil_normals * gaze_distances[:, np.newaxis] + sphere_centers
+
+        eye_centers = _transform_points(self.eye_camera_to_world_matrix, sphere_centers)
+        gaze_3d = _transform_points(self.eye_camera_to_world_matrix, gaze_points)
+        normals_3d = pupil_normals @ self.rotation_matrix.T
+
+        predictions = [
+            {
+                "eye_center_3d": eye_center,
+                "gaze_normal_3d": normal_3d,
+                "gaze_point_3d": gaze_point_3d,
+            }
+            for eye_center, normal_3d, gaze_point_3d in zip(
+                eye_centers.tolist(), normals_3d.tolist(), gaze_3d.tolist()
+            )
+        ]
+
+        if self.intrinsics is not None and predictions:
+            image_points = self.intrinsics.projectPoints(
+                gaze_points, self.rotation_vector, self.translation_vector
+            )
+            norm_pos = _image_points_to_norm_pos(
+                image_points, self.intrinsics.resolution
+            )
+            for g, image_point in zip(predictions, norm_pos):
+                g["norm_pos"] = image_point
+
+        return predictions
+
     def _toWorld(self, p):
         point = np.ones(4)
         point[:3] = p[:3]
@@ -305,6 +357,69 @@ class Model3D_Binocular(Model3D):
 
         return g
 
+    def predict_batch(self, X):
+        """Vectorized `predict()`
+
+        Returns the predictions and the cyclopean gaze distance of each sample,
+        which `predict()` would have stored in `last_gaze_distance`. Distances
+        are None if no intrinsics are available.
+        """
+        assert X.ndim == 2, X
+        assert X.shape[1] == _BINOCULAR_FEATURE_COUNT, X
+        matrix0, matrix1 = self.eye_camera_to_world_matricies
+        rotation0, rotation1 = self.rotation_matricies
+        # eye ball centers and lines of sight in world coords
+        s1_center = _transform_points(matrix1, X[:, _MONOCULAR_SPHERE_CENTER])
+        s0_center = _transform_points(matrix0, X[:, _BINOCULAR_SPHERE_CENTER])
+        s1_normal = X[:, _MONOCULAR_PUPIL_NORMAL] @ rotation1.T
+        s0_normal = X[:, _BINOCULAR_PUPIL_NORMAL] @ rotation0.T
+
+        # see `_predict_single()`
+        cyclop_normal = (s0_normal + s1_normal) / 2.0
+        cyclop_center = (s0_center + s1_center) / 2.0
+
+        gaze_plane = np.cross(cyclop_normal, s1_center - s0_center)
+        gaze_plane /= np.linalg.norm(gaze_plane, axis=1)[:, np.newaxis]
+
+        s0_on_normal = np.sum(gaze_plane * s0_normal, axis=1)[:, np.newaxis]
+        s0_norm_on_plane = s0_normal - s0_on_normal * gaze_plane
+        s1_on_normal = np.sum(gaze_plane * s1_normal, axis=1)[:, np.newaxis]
+        s1_norm_on_plane = s1_normal - s1_on_normal * gaze_plane
+
+        gaze_lines0 = [s0_center, s0_center + s0_norm_on_plane]
+        gaze_lines1 = [s1_center, s1_center + s1_norm_on_plane]
+        intersection_points, _ = math_helper.nearest_intersections(
+            gaze_lines0, gaze_lines1
+        )
+
+        predictions = [
+            {
+                "eye_centers_3d": {0: s0, 1: s1},
+                "gaze_normals_3d": {0: n0, 1: n1},
+                "gaze_point_3d": gaze_point_3d,
+            }
+            for s0, s1, n0, n1, gaze_point_3d in zip(
+                s0_center.tolist(),
+                s1_center.tolist(),
+                s0_normal.tolist(),
+                s1_normal.tolist(),
+                intersection_points.tolist(),
+            )
+        ]
+
+        gaze_distances = None
+        if self.intrinsics is not None and predictions:
+            gaze_distances = np.linalg.norm(intersection_points - cyclop_center, axis=1)
+            self.last_gaze_distance = gaze_distances[-1]
+            image_points = self.intrinsics.projectPoints(intersection_points)
+            norm_pos = _image_points_to_norm_pos(
+                image_points, self.intrinsics.resolution
+            )
+            for g, image_point in zip(predictions, norm_pos):
+                g["norm_pos"] = image_point
+
+        return predictions, gaze_distances
+
     def _eye0_to_World(self, p):
         point = np.ones(4)
         point[:3] = p[:3]
@@ -413,6 +528,68 @@ class Gazer3D(GazerBase):
                 )
                 yield gaze_pos
 
+    def predict_batch(
+        self, matched_pupil_data: T.Iterable[T.List["Pupil"]]
+    ) -> T.List["Gaze"]:
+        matched_pupil_data = list(matched_pupil_data)
+        matches = self._group_matches(matched_pupil_data)
+        gaze_data = []
+
+        # Monocular models read the gaze distance of the latest binocular
+        # prediction. Replay it per monocular match based on the match order.
+        binocular_distances = None
+        last_gaze_distance = getattr(self.binocular_model, "last_gaze_distance", None)
+        if matches.binocular:
+            if self.binocular_model.is_fitted:
+                pupil_matches = [matched_pupil_data[i] for i in matches.binocular]
+                X = self._extract_features_from_pupil_matches(pupil_matches)
+                predictions, binocular_distances = self.binocular_model.predict_batch(X)
+                self._extend_gaze_data(
+                    gaze_data, predictions, pupil_matches, "gaze.3d.01."
+                )
+            else:
+                logger.debug("Prediction failed because binocular model is not fitted")
+
+        models = (
+            (self.right_model, matches.right, "right", "gaze.3d.0."),
+            (self.left_model, matches.left, "left", "gaze.3d.1."),
+        )
+        for model, indices, name, topic in models:
+            if not indices:
+                continue
+            if not model.is_fitted:
+                logger.debug(f"Prediction failed because {name} model is not fitted")
+                continue
+            gaze_distances = None
+            uses_binocular_distance = (
+                model.binocular_model is not None and model.binocular_model.is_fitted
+            )
+            if uses_binocular_distance and binocular_distances is not None:
+                latest = np.searchsorted(matches.binocular, indices) - 1
+                gaze_distances = np.where(
+                    latest >= 0, binocular_distances[latest], last_gaze_distance
+                )
+            pupil_matches = [matched_pupil_data[i] for i in indices]
+            X = self._extract_features_from_pupil_matches(pupil_matches)
+            predictions = model.predict_batch(X, gaze_distances)
+            self._extend_gaze_data(gaze_data, predictions, pupil_matches, topic)
+        return gaze_data
+
+    def _extend_gaze_data(self, gaze_data, predictions, pupil_matches, topic):
+        confidence, timestamp = self._mean_confidence_and_timestamp(pupil_matches)
+        for gaze_pos, conf, ts, pupil_match in zip(
+            predictions, confidence, timestamp, pupil_matches
+        ):
+            gaze_pos.update(
+                {
+                    "topic": topic,
+                    "confidence": conf,
+                    "timestamp": ts,
+                    "base_data": pupil_match,
+                }
+            )
+            gaze_data.append(gaze_pos)
+
     def filter_pupil_data(
         self, pupil_data: T.Iterable, confidence_threshold: T.Optional[float] = None
     ) -> T.Iterable:
@@ -155,9 +155,9 @@ class GazerHMD3D(Gazer3D):
             pupil_data, self.g_pool.min_calibration_confidence
         )
         # match pupil to reference data (left, right, and binocular)
-        matches = self.match_pupil_to_ref(pupil_data, ref_data)
-        if matches.binocular[0]:
-            self._fit_binocular_model(self.binocular_model, matches.binocular)
+        matches = self.match_features_to_ref(pupil_data, ref_data)
+        if matches.binocular is not None:
+            self.binocular_model.fit(*matches.binocular)
             params = self.binocular_model.get_params()
             self.left_model.set_params(
                 eye_camera_to_world_matrix=params["eye_camera_to_world_matrix1"],
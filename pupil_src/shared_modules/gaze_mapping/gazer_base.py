@@ -20,7 +20,7 @@ import numpy as np
 from plugin import Plugin
 import file_methods as fm
 
-from .matching import RealtimeMatcher
+from .matching import BatchMatcher, RealtimeMatcher
 from .notifications import (
     CalibrationSuccessNotification,
     CalibrationFailureNotification,
@@ -30,6 +30,7 @@ from .notifications import (
 from .utils import (
     _filter_pupil_list_by_confidence,
     _match_data_batch,
+    _match_indices_batch,
 )
 
 
@@ -127,6 +128,16 @@ class GazerBase(abc.ABC, Plugin):
     ) -> T.Iterator["Gaze"]:
         pass
 
+    def predict_batch(
+        self, matched_pupil_data: T.Iterable[T.List["Pupil"]]
+    ) -> T.List["Gaze"]:
+        """Predicts gaze for all pupil matches at once
+
+        Overwrite with a vectorized implementation. The result corresponds to
+        `predict()`, but is not required to be in the order of the matches.
+        """
+        return list(self.predict(matched_pupil_data))
+
     def filter_pupil_data(
         self, pupil_data: T.Iterable, confidence_threshold: T.Optional[float] = None
     ) -> T.Iterable:
@@ -263,6 +274,7 @@ class GazerBase(abc.ABC, Plugin):
 
     def init_matcher(self):
         self.matcher = RealtimeMatcher()
+        self.batch_matcher = BatchMatcher()
 
     def fit_on_calib_data(self, calib_data):
         # extract reference data
@@ -277,15 +289,15 @@ class GazerBase(abc.ABC, Plugin):
         if not ref_data:
             raise NotEnoughReferenceDataError
         # match pupil to reference data (left, right, and binocular)
-        matches = self.match_pupil_to_ref(pupil_data, ref_data)
-        if matches.binocular[0]:
-            self._fit_binocular_model(self.binocular_model, matches.binocular)
-            self._fit_monocular_model(self.right_model, matches.right)
-            self._fit_monocular_model(self.left_model, matches.left)
-        elif matches.right[0]:
-            self._fit_monocular_model(self.right_model, matches.right)
-        elif matches.left[0]:
-            self._fit_monocular_model(self.left_model, matches.left)
+        matches = self.match_features_to_ref(pupil_data, ref_data)
+        if matches.binocular is not None:
+            self.binocular_model.fit(*matches.binocular)
+            self.right_model.fit(*matches.right)
+            self.left_model.fit(*matches.left)
+        elif matches.right is not None:
+            self.right_model.fit(*matches.right)
+        elif matches.left is not None:
+            self.left_model.fit(*matches.left)
         else:
             raise NotEnoughDataError
 
@@ -349,6 +361,36 @@ class GazerBase(abc.ABC, Plugin):
         matches = Matches(left, right, bino)
         return matches
 
+    def match_features_to_ref(self, pupil_data, ref_data) -> "Matches":
+        """Matches pupil to reference data, returning the model input of the matches
+
+        Each field is either None, if there are no matches, or a tuple (X, Y) of
+        pupil and reference features with one row per match. Features are
+        extracted once per matched datum, even if it is part of several matches.
+        """
+        pupil0, pupil1, matches = _match_indices_batch(pupil_data, ref_data)
+        bino_ref, bino_p0, bino_p1 = matches[0]
+        (right_ref, right_p0), (left_ref, left_p1) = matches[1:]
+
+        Y_bino, Y_right, Y_left = _extract_features_by_index(
+            self._extract_reference_features, ref_data, bino_ref, right_ref, left_ref
+        )
+        X_bino_right, X_right = _extract_features_by_index(
+            self._extract_pupil_features, pupil0, bino_p0, right_p0
+        )
+        X_bino_left, X_left = _extract_features_by_index(
+            self._extract_pupil_features, pupil1, bino_p1, left_p1
+        )
+
+        binocular = None
+        if len(bino_ref):
+            binocular = np.hstack([X_bino_left, X_bino_right]), Y_bino
+        return Matches(
+            left=(X_left, Y_left) if len(left_ref) else None,
+            right=(X_right, Y_right) if len(right_ref) else None,
+            binocular=binocular,
+        )
+
     def extract_features_from_matches_binocular(self, binocular_matches):
         ref, pupil_right, pupil_left = binocular_matches
         Y = self._extract_reference_features(ref)
@@ -373,6 +415,80 @@ class GazerBase(abc.ABC, Plugin):
 
         yield from self.predict(matches)
 
+    def map_pupil_to_gaze_batch(self, pupil_data, sort_by_creation_time=True):
+        """Maps all pupil data at once, returns gaze data sorted by timestamp
+
+        Pupil data is matched by `BatchMatcher` instead of `RealtimeMatcher`.
+        """
+        pupil_data = self.filter_pupil_data(pupil_data)
+        if sort_by_creation_time:
+            pupil_data.sort(key=lambda p: p["timestamp"])
+
+        first, second = self.batch_matcher.match(
+            timestamps=[p["timestamp"] for p in pupil_data],
+            confidences=[p["confidence"] for p in pupil_data],
+            eye_ids=[p["id"] for p in pupil_data],
+        )
+        matches = [
+            [pupil_data[idx0], pupil_data[idx1]] if idx1 >= 0 else [pupil_data[idx0]]
+            for idx0, idx1 in zip(first.tolist(), second.tolist())
+        ]
+
+        gaze_data = self.predict_batch(matches)
+        gaze_data.sort(key=lambda g: g["timestamp"])
+        return gaze_data
+
+    def _group_matches(self, matched_pupil_data) -> "Matches":
+        """Groups pupil matches by the model that maps them
+
+        Returns the indices of the matches in `matched_pupil_data`.
+        """
+        left, right, binocular = [], [], []
+        for idx, pupil_match in enumerate(matched_pupil_data):
+            num_matched = len(pupil_match)
+            if num_matched == 2:
+                binocular.append(idx)
+            elif num_matched == 1:
+                if pupil_match[0]["id"] == 0:
+                    right.append(idx)
+                elif pupil_match[0]["id"] == 1:
+                    left.append(idx)
+            else:
+                raise ValueError(
+                    f"Unexpected number of matched pupil_data: {num_matched}"
+                )
+        return Matches(left, right, binocular)
+
+    def _extract_features_from_pupil_matches(self, pupil_matches) -> np.ndarray:
+        """Model input for pupil matches of the same kind, one row per match"""
+        if len(pupil_matches[0]) == 2:
+            right = self._extract_pupil_features([match[0] for match in pupil_matches])
+            left = self._extract_pupil_features([match[1] for match in pupil_matches])
+            return np.hstack([left, right])
+        return self._extract_pupil_features([match[0] for match in pupil_matches])
+
+    @staticmethod
+    def _mean_confidence_and_timestamp(pupil_matches):
+        """Gaze confidence and timestamp of each pupil match, as arrays"""
+        confidence = np.array([[p["confidence"] for p in m] for m in pupil_matches])
+        timestamp = np.array([[p["timestamp"] for p in m] for m in pupil_matches])
+        return confidence.mean(axis=1), timestamp.mean(axis=1)
+
+
+def _extract_features_by_index(extract_features, data, *indices):
+    """Features of the data at each of the index arrays, one array per argument
+
+    Features of data referenced by several index arrays are extracted once.
+    Returns None instead of arrays if all index arrays are empty.
+    """
+    all_indices = np.concatenate(indices)
+    if not len(all_indices):
+        return [None] * len(indices)
+    unique, inverse = np.unique(all_indices, return_inverse=True)
+    features = extract_features([data[idx] for idx in unique.tolist()])
+    split_at = np.cumsum([len(idc) for idc in indices])[:-1]
+    return np.split(features[inverse.ravel()], split_at)
+
 
 class Matches(T.NamedTuple):
     left: object
@@ -12,6 +12,7 @@ import typing as T
 from collections import deque
 
 import numpy as np
+from scipy.signal import lfilter
 
 
 class RealtimeMatcher:
@@ -100,3 +101,118 @@ class RealtimeMatcher:
         elif len(self._caches[1]) > self.sample_cutoff:
             p = self._caches[1].popleft()
             yield [p]
+
+
+class BatchMatcher:
+    """Offline counterpart to `RealtimeMatcher`
+
+    Matches all pupil data at once instead of one datum at a time. Low
+    confidence data is mapped monocularly. High confidence data is paired with
+    the next high confidence datum of the other eye, if they are closer in time
+    than twice the estimated frame period. Otherwise it is mapped monocularly.
+
+    The frame period is smoothed like `RealtimeMatcher.estimate_framerate_smoothed`,
+    as exponential moving average of the larger raw estimate of both eyes. The
+    raw estimates are taken over the last `sample_cutoff` samples of each eye,
+    while `RealtimeMatcher` takes them over its pending caches, which depend on
+    the matching history. Pairs close to the temporal cutoff can therefore
+    differ. Unlike `RealtimeMatcher.map_batch`, no data is left unmatched at the
+    end.
+    """
+
+    def __init__(self):
+        self.min_pupil_confidence = 0.6
+        self.initial_frame_period = 1 / 120
+        self.frame_period_smoothing_factor = 1 / 50
+        self.sample_cutoff = 10
+
+    def match(
+        self, timestamps, confidences, eye_ids
+    ) -> T.Tuple[np.ndarray, np.ndarray]:
+        """Returns the indices of the matched pupil data, in the order of matching
+
+        Arguments:
+            timestamps {array-like} -- of shape (n_samples,), sorted
+            confidences {array-like} -- of shape (n_samples,)
+            eye_ids {array-like} -- of shape (n_samples,)
+
+        Returns:
+            Two index arrays of equal length. The first contains the eye 0 datum
+            of binocular matches and the datum of monocular matches. The second
+            contains the eye 1 datum of binocular matches and -1 otherwise.
+        """
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        confidences = np.asarray(confidences, dtype=np.float64)
+        eye_ids = np.asarray(eye_ids)
+
+        frame_periods = self._smoothed_frame_periods(timestamps, eye_ids)
+        high_confidence = confidences >= self.min_pupil_confidence
+        high_conf_idc = []
+        for eye_id in (0, 1):
+            eye_idc = np.flatnonzero(eye_ids == eye_id)
+            high_conf_idc.append(eye_idc[high_confidence[eye_idc]])
+
+        # Pupil data is matched when it is older than the next datum of the other
+        # eye. On equal timestamps, eye 1 is matched first.
+        partners = np.full(timestamps.shape, -1)
+        for eye_id, side in ((0, "right"), (1, "left")):
+            own, other = high_conf_idc[eye_id], high_conf_idc[1 - eye_id]
+            if not (own.size and other.size):
+                continue
+            next_idx = np.searchsorted(timestamps[other], timestamps[own], side=side)
+            has_next = next_idx < other.size
+            own, candidates = own[has_next], other[next_idx[has_next]]
+            # the pair is decided once the newer datum arrived
+            temporal_cutoff = 2 * frame_periods[np.maximum(own, candidates)]
+            is_match = (
+                np.abs(timestamps[own] - timestamps[candidates]) < temporal_cutoff
+            )
+            partners[own[is_match]] = candidates[is_match]
+
+        order = np.lexsort((1 - eye_ids, timestamps))
+        partners = partners[order]
+        is_binocular = partners >= 0
+        first = np.where(is_binocular & (eye_ids[order] == 1), partners, order)
+        second = np.where(
+            is_binocular, np.where(eye_ids[order] == 1, order, partners), -1
+        )
+        return first, second
+
+    def _smoothed_frame_periods(self, timestamps, eye_ids):
+        """Smoothed frame period estimate after each datum, see class docstring"""
+        raw_periods = np.full(timestamps.shape, -np.inf)
+        for eye_id in (0, 1):
+            is_eye = eye_ids == eye_id
+            eye_periods = self._estimate_frame_periods(timestamps[is_eye])
+            # raw estimate of the eye after each datum, once it has two samples
+            eye_count = np.cumsum(is_eye)
+            valid = eye_count >= 2
+            raw_periods[valid] = np.maximum(
+                raw_periods[valid], eye_periods[eye_count[valid] - 1]
+            )
+
+        # The estimate is updated for each datum after the first valid one
+        frame_periods = np.full(timestamps.shape, self.initial_frame_period)
+        updated = np.isfinite(raw_periods)
+        if updated.any():
+            alpha = self.frame_period_smoothing_factor
+            smoothed, _ = lfilter(
+                [alpha],
+                [1.0, alpha - 1.0],
+                raw_periods[updated],
+                zi=[(1.0 - alpha) * self.initial_frame_period],
+            )
+            frame_periods[updated] = smoothed
+        return frame_periods
+
+    def _estimate_frame_periods(self, timestamps):
+        """Mean timestamp difference over the last `sample_cutoff` samples"""
+        frame_periods = np.full(timestamps.shape, self.initial_frame_period)
+        if timestamps.size < 2:
+            return frame_periods
+        positions = np.arange(timestamps.size)
+        window_start = np.maximum(positions - self.sample_cutoff, 0)
+        frame_periods[1:] = (timestamps[1:] - timestamps[window_start[1:]]) / (
+            positions[1:] - window_start[1:]
+        )
+        return frame_periods
@@ -32,28 +32,52 @@ def _filter_pupil_list_by_confidence(pupil_list, threshold):
 
 
 def _match_data_batch(pupil_list, ref_list):
+    pupil0, pupil1, matches = _match_indices_batch(pupil_list, ref_list)
+    (bino_ref, bino_p0, bino_p1), (right_ref, right_p0), (left_ref, left_p1) = matches
+
+    matched_binocular_data = [
+        _take(ref_list, bino_ref),
+        _take(pupil0, bino_p0),
+        _take(pupil1, bino_p1),
+    ]
+    matched_pupil0_data = [_take(ref_list, right_ref), _take(pupil0, right_p0)]
+    matched_pupil1_data = [_take(ref_list, left_ref), _take(pupil1, left_p1)]
+    return (
+        matched_binocular_data,
+        matched_pupil0_data,
+        matched_pupil1_data,
+    )
+
+
+def _match_indices_batch(pupil_list, ref_list):
+    """Matches reference data to the pupil data of each eye, returning indices
+
+    Returns the pupil data of eye 0 and eye 1, and the index arrays of the
+    binocular (ref, pupil0, pupil1), right eye (ref, pupil0) and left eye
+    (ref, pupil1) matches into `ref_list` and the pupil data of the eyes.
+    """
     assert pupil_list, "No pupil data to match"
     assert ref_list, "No reference data to match"
     pupil0 = [p for p in pupil_list if p["id"] == 0]
     pupil1 = [p for p in pupil_list if p["id"] == 1]
 
-    matched_binocular_data = closest_matches_binocular_batch(ref_list, pupil0, pupil1)
-    matched_pupil0_data = closest_matches_monocular_batch(ref_list, pupil0)
-    matched_pupil1_data = closest_matches_monocular_batch(ref_list, pupil1)
+    ref_ts = _timestamps(ref_list)
+    pupil0_ts = _timestamps(pupil0)
+    pupil1_ts = _timestamps(pupil1)
 
-    num_bino = len(matched_binocular_data[0])
-    num_mono_right = len(matched_pupil0_data[0])
-    num_mono_left = len(matched_pupil1_data[0])
+    matched_binocular = closest_matches_binocular_indices(ref_ts, pupil0_ts, pupil1_ts)
+    matched_pupil0 = closest_matches_monocular_indices(ref_ts, pupil0_ts)
+    matched_pupil1 = closest_matches_monocular_indices(ref_ts, pupil1_ts)
+
+    num_bino = len(matched_binocular[0])
+    num_mono_right = len(matched_pupil0[0])
+    num_mono_left = len(matched_pupil1[0])
 
     logger.debug(f"Collected {num_bino} binocular references.")
     logger.debug(f"Collected {num_mono_right} right eye monocular references.")
     logger.debug(f"Collected {num_mono_left} left eye monocular references.")
 
-    return (
-        matched_binocular_data,
-        matched_pupil0_data,
-        matched_pupil1_data,
-    )
+    return pupil0, pupil1, (matched_binocular, matched_pupil0, matched_pupil1)
 
 
 def closest_matches_binocular_batch(ref_pts, pupil0, pupil1, max_dispersion=1 / 15.0):
@@ -61,29 +85,14 @@ def closest_matches_binocular_batch(ref_pts, pupil0, pupil1, max_dispersion=1 /
     Return list of dict with matching ref, pupil0 and pupil1 data triplets.
     """
 
-    matched = [[], [], []]
-    if not (ref_pts and pupil0 and pupil1):
-        return matched
-
-    pupil0_ts = np.array([p["timestamp"] for p in pupil0])
-    pupil1_ts = np.array([p["timestamp"] for p in pupil1])
-
-    for r in ref_pts:
-        closest_p0_idx = _find_nearest_idx(pupil0_ts, r["timestamp"])
-        closest_p0 = pupil0[closest_p0_idx]
-        closest_p1_idx = _find_nearest_idx(pupil1_ts, r["timestamp"])
-        closest_p1 = pupil1[closest_p1_idx]
-
-        dispersion = max(
-            closest_p0["timestamp"], closest_p1["timestamp"], r["timestamp"]
-        ) - min(closest_p0["timestamp"], closest_p1["timestamp"], r["timestamp"])
-        if dispersion < max_dispersion:
-            matched[0].append(r)
-            matched[1].append(closest_p0)
-            matched[2].append(closest_p1)
-        else:
-            logger.debug("Binocular match rejected due to time dispersion criterion")
-    return matched
+    ref_idc, pupil0_idc, pupil1_idc = closest_matches_binocular_indices(
+        _timestamps(ref_pts), _timestamps(pupil0), _timestamps(pupil1), max_dispersion
+    )
+    return [
+        _take(ref_pts, ref_idc),
+        _take(pupil0, pupil0_idc),
+        _take(pupil1, pupil1_idc),
+    ]
 
 
 def closest_matches_binocular(ref_pts, pupil0, pupil1, max_dispersion=1 / 15.0):
@@ -91,27 +100,8 @@ def closest_matches_binocular(ref_pts, pupil0, pupil1, max_dispersion=1 / 15.0):
     Return list of dict with matching ref, pupil0 and pupil1 data triplets.
     """
 
-    if not (ref_pts and pupil0 and pupil1):
-        return []
-
-    pupil0_ts = np.array([p["timestamp"] for p in pupil0])
-    pupil1_ts = np.array([p["timestamp"] for p in pupil1])
-
-    matched = []
-    for r in ref_pts:
-        closest_p0_idx = _find_nearest_idx(pupil0_ts, r["timestamp"])
-        closest_p0 = pupil0[closest_p0_idx]
-        closest_p1_idx = _find_nearest_idx(pupil1_ts, r["timestamp"])
-        closest_p1 = pupil1[closest_p1_idx]
-
-        dispersion = max(
-            closest_p0["timestamp"], closest_p1["timestamp"], r["timestamp"]
-        ) - min(closest_p0["timestamp"], closest_p1["timestamp"], r["timestamp"])
-        if dispersion < max_dispersion:
-            matched.append({"ref": r, "pupil": closest_p0, "pupil1": closest_p1})
-        else:
-            logger.debug("Binocular match rejected due to time dispersion criterion")
-    return matched
+    matched = closest_matches_binocular_batch(ref_pts, pupil0, pupil1, max_dispersion)
+    return [{"ref": r, "pupil": p0, "pupil1": p1} for r, p0, p1 in zip(*matched)]
 
 
 def closest_matches_monocular(ref_pts, pupil, max_dispersion=1 / 15.0):
@@ -119,21 +109,8 @@ def closest_matches_monocular(ref_pts, pupil, max_dispersion=1 / 15.0):
     Return list of dict with matching ref and pupil datum.
     """
 
-    if not (ref_pts and pupil):
-        return []
-
-    pupil_ts = np.array([p["timestamp"] for p in pupil])
-
-    matched = []
-    for r in ref_pts:
-        closest_p_idx = _find_nearest_idx(pupil_ts, r["timestamp"])
-        closest_p = pupil[closest_p_idx]
-        dispersion = max(closest_p["timestamp"], r["timestamp"]) - min(
-            closest_p["timestamp"], r["timestamp"]
-        )
-        if dispersion < max_dispersion:
-            matched.append({"ref": r, "pupil": closest_p})
-    return matched
+    matched = closest_matches_monocular_batch(ref_pts, pupil, max_dispersion)
+    return [{"ref": r, "pupil": p} for r, p in zip(*matched)]
 
 
 def closest_matches_monocular_batch(ref_pts, pupil, max_dispersion=1 / 15.0):
@@ -141,22 +118,60 @@ def closest_matches_monocular_batch(ref_pts, pupil, max_dispersion=1 / 15.0):
     Return list of dict with matching ref and pupil datum.
     """
 
-    matched = [[], []]
-    if not (ref_pts and pupil):
-        return matched
+    ref_idc, pupil_idc = closest_matches_monocular_indices(
+        _timestamps(ref_pts), _timestamps(pupil), max_dispersion
+    )
+    return [_take(ref_pts, ref_idc), _take(pupil, pupil_idc)]
+
 
-    pupil_ts = np.array([p["timestamp"] for p in pupil])
+def closest_matches_binocular_indices(
+    ref_ts, pupil0_ts, pupil1_ts, max_dispersion=1 / 15.0
+):
+    """Indices of the pupil timestamps of each eye closest to the ref timestamps.
 
-    for r in ref_pts:
-        closest_p_idx = _find_nearest_idx(pupil_ts, r["timestamp"])
-        closest_p = pupil[closest_p_idx]
-        dispersion = max(closest_p["timestamp"], r["timestamp"]) - min(
-            closest_p["timestamp"], r["timestamp"]
+    Pupil timestamps need to be sorted. A match is kept if the timestamps of the
+    reference and both pupil data are closer than `max_dispersion`. Returns
+    index arrays (ref_idc, pupil0_idc, pupil1_idc), in the order of `ref_ts`.
+    """
+    ref_ts = np.asarray(ref_ts, dtype=np.float64)
+    pupil0_ts = np.asarray(pupil0_ts, dtype=np.float64)
+    pupil1_ts = np.asarray(pupil1_ts, dtype=np.float64)
+    if not (len(ref_ts) and len(pupil0_ts) and len(pupil1_ts)):
+        return _empty_indices(), _empty_indices(), _empty_indices()
+
+    pupil0_idc = _find_nearest_idc(pupil0_ts, ref_ts)
+    pupil1_idc = _find_nearest_idc(pupil1_ts, ref_ts)
+    matched_ts = (pupil0_ts[pupil0_idc], pupil1_ts[pupil1_idc], ref_ts)
+    dispersion = np.maximum.reduce(matched_ts) - np.minimum.reduce(matched_ts)
+
+    ref_idc = np.flatnonzero(dispersion < max_dispersion)
+    num_rejected = len(ref_ts) - len(ref_idc)
+    if num_rejected:
+        logger.debug(
+            f"{num_rejected} binocular matches rejected due to time dispersion "
+            "criterion"
         )
-        if dispersion < max_dispersion:
-            matched[0].append(r)
-            matched[1].append(closest_p)
-    return matched
+    return ref_idc, pupil0_idc[ref_idc], pupil1_idc[ref_idc]
+
+
+def closest_matches_monocular_indices(ref_ts, pupil_ts, max_dispersion=1 / 15.0):
+    """Indices of the pupil timestamps closest to the ref timestamps.
+
+    Pupil timestamps need to be sorted. A match is kept if the reference and
+    pupil timestamp are closer than `max_dispersion`. Returns index arrays
+    (ref_idc, pupil_idc), in the order of `ref_ts`.
+    """
+    ref_ts = np.asarray(ref_ts, dtype=np.float64)
+    pupil_ts = np.asarray(pupil_ts, dtype=np.float64)
+    if not (len(ref_ts) and len(pupil_ts)):
+        return _empty_indices(), _empty_indices()
+
+    pupil_idc = _find_nearest_idc(pupil_ts, ref_ts)
+    closest_ts = pupil_ts[pupil_idc]
+    dispersion = np.maximum(closest_ts, ref_ts) - np.minimum(closest_ts, ref_ts)
+
+    ref_idc = np.flatnonzero(dispersion < max_dispersion)
+    return ref_idc, pupil_idc[ref_idc]
 
 
 def _find_nearest_idx(array, value):
@@ -170,3 +185,26 @@ def _find_nearest_idx(array, value):
             return idx
     except IndexError:
         return idx - 1
+
+
+def _find_nearest_idc(array, values):
+    """Vectorized `_find_nearest_idx()` for a sorted, non-empty array"""
+
+    idc = np.searchsorted(array, values, side="left")
+    before = np.maximum(idc - 1, 0)
+    after = np.minimum(idc, len(array) - 1)
+    before_is_closer = np.abs(values - array[before]) < np.abs(values - array[after])
+    return np.where(before_is_closer, before, after)
+
+
+def _timestamps(data):
+    timestamps = (d["timestamp"] for d in data)
+    return np.fromiter(timestamps, dtype=np.float64, count=len(data))
+
+
+def _take(data, indices):
+    return [data[idx] for idx in indices.tolist()]
+
+
+def _empty_indices():
+    return np.empty(0, dtype=np.intp)
@@ -77,9 +77,12 @@ class GazeMapperStorage(SingleFileStorage, Observable):
 
     def _delete_mapping_file(self, gaze_mapper):
         mapping_file_path = self._gaze_mapping_file_path(gaze_mapper)
+        fm.PLData_Columns.detach_file(mapping_file_path + ".pldata")
         try:
             os.remove(mapping_file_path + ".pldata")
             os.remove(mapping_file_path + "_timestamps.npy")
+            os.remove(mapping_file_path + "_columns.npy")
+            os.remove(mapping_file_path + "_columns.meta")
         except FileNotFoundError:
             pass
 
@@ -90,6 +93,7 @@ class GazeMapperStorage(SingleFileStorage, Observable):
         self._rename_mapping_file(old_mapping_file_path, new_mapping_file_path)
 
     def _rename_mapping_file(self, old_mapping_file_path, new_mapping_file_path):
+        fm.PLData_Columns.detach_file(old_mapping_file_path + ".pldata")
         try:
             os.rename(
                 old_mapping_file_path + ".pldata", new_mapping_file_path + ".pldata"
@@ -98,6 +102,14 @@ class GazeMapperStorage(SingleFileStorage, Observable):
                 old_mapping_file_path + "_timestamps.npy",
                 new_mapping_file_path + "_timestamps.npy",
             )
+            os.rename(
+                old_mapping_file_path + "_columns.npy",
+                new_mapping_file_path + "_columns.npy",
+            )
+            os.rename(
+                old_mapping_file_path + "_columns.meta",
+                new_mapping_file_path + "_columns.meta",
+            )
         except FileNotFoundError:
             pass
 
@@ -18,6 +18,8 @@ from .fake_gpool import FakeGPool
 
 g_pool = None  # set by the plugin
 
+_RESULT_BATCH_SIZE = 1000
+
 
 class NotEnoughPupilData(ValueError):
     pass
@@ -67,20 +69,19 @@ def _map_gaze(
     first_ts = pupil_pos_in_mapping_range[0]["timestamp"]
     last_ts = pupil_pos_in_mapping_range[-1]["timestamp"]
     ts_span = last_ts - first_ts
-    curr_ts = first_ts
-
-    for gaze_datum in gazer.map_pupil_to_gaze(pupil_pos_in_mapping_range):
-        _apply_manual_correction(gaze_datum, manual_correction_x, manual_correction_y)
-
-        # gazer.map_pupil_to_gaze does not yield gaze with monotonic timestamps.
-        # Binocular pupil matches are delayed internally. To avoid non-monotonic
-        # progress updates, we use the largest timestamp that has been returned up to
-        # the current point in time.
-        curr_ts = max(curr_ts, gaze_datum["timestamp"])
-        shared_memory.progress = (curr_ts - first_ts) / ts_span
 
-        result = (curr_ts, fm.Serialized_Dict(gaze_datum))
-        yield [result]
+    # gazer.map_pupil_to_gaze_batch maps all pupil data at once and returns gaze
+    # sorted by timestamp, which allows sending the results in batches.
+    gaze_data = gazer.map_pupil_to_gaze_batch(pupil_pos_in_mapping_range)
+    for start in range(0, len(gaze_data), _RESULT_BATCH_SIZE):
+        results = []
+        for gaze_datum in gaze_data[start : start + _RESULT_BATCH_SIZE]:
+            _apply_manual_correction(
+                gaze_datum, manual_correction_x, manual_correction_y
+            )
+            results.append((gaze_datum["timestamp"], fm.Serialized_Dict(gaze_datum)))
+        shared_memory.progress = (results[-1][0] - first_ts) / ts_span
+        yield results
 
 
 def _apply_manual_correction(gaze_datum, manual_correction_x, manual_correction_y):
@@ -23,6 +23,7 @@ class OfflineDetectionController(Observable):
         self,
         general_settings,
         detection_storage,
+        marker_detection_store,
         task_manager,
         get_current_trim_mark_range,
         all_timestamps,
@@ -30,6 +31,7 @@ class OfflineDetectionController(Observable):
     ):
         self._general_settings = general_settings
         self._detection_storage = detection_storage
+        self._marker_detection_store = marker_detection_store
         self._task_manager = task_manager
         self._get_current_trim_mark_range = get_current_trim_mark_range
         self._all_timestamps = all_timestamps
@@ -49,11 +51,13 @@ class OfflineDetectionController(Observable):
 
         def on_completed(_):
             self._detection_storage.save_pldata_to_disk()
+            self._marker_detection_store.save_to_disk()
             logger.info("marker detection completed")
             self.on_detection_ended()
 
         def on_canceled_or_killed():
             self._detection_storage.save_pldata_to_disk()
+            self._marker_detection_store.save_to_disk()
             logger.info("marker detection canceled")
             self.on_detection_ended()
 
@@ -66,11 +70,22 @@ class OfflineDetectionController(Observable):
         logger.info("Start marker detection")
 
     def _create_task(self):
+        frame_index_range = self._general_settings.detection_frame_index_range
+        calculated_frame_indices = set(
+            self._detection_storage.frame_index_to_num_markers.keys()
+        )
+        # frames detected before, e.g. by the surface tracker, are not decoded again
+        stored_detections = self._marker_detection_store.get_range(
+            frame_index
+            for frame_index in range(frame_index_range[0], frame_index_range[1] + 1)
+            if frame_index not in calculated_frame_indices
+        )
         args = (
             self._source_path,
             self._all_timestamps,
-            self._general_settings.detection_frame_index_range,
-            set(self._detection_storage.frame_index_to_num_markers.keys()),
+            frame_index_range,
+            calculated_frame_indices,
+            stored_detections,
         )
         return self._task_manager.create_background_task(
             name="marker detection",
@@ -80,7 +95,11 @@ class OfflineDetectionController(Observable):
         )
 
     def _insert_markers_bisector(self, data_pairs):
-        for timestamp, markers, frame_index in data_pairs:
+        for timestamp, markers, frame_index, new_detections in data_pairs:
+            if new_detections is not None:
+                self._marker_detection_store.update(
+                    frame_index, timestamp, new_detections
+                )
             for marker in markers:
                 self._detection_storage.markers_bisector.insert(timestamp, marker)
             self._detection_storage.frame_index_to_num_markers[frame_index] = len(
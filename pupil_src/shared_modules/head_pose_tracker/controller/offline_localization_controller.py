@@ -10,6 +10,7 @@ See COPYING and COPYING.LESSER for license details.
 """
 
 import logging
+import multiprocessing as mp
 
 import tasklib
 from head_pose_tracker import worker
@@ -17,6 +18,9 @@ from observable import Observable
 
 logger = logging.getLogger(__name__)
 
+# Shards smaller than this are not worth the startup cost of a background process
+_min_frames_per_shard = 300
+
 
 class OfflineLocalizationController(Observable):
     def __init__(
@@ -40,7 +44,8 @@ class OfflineLocalizationController(Observable):
         self._get_current_trim_mark_range = get_current_trim_mark_range
         self._all_timestamps = all_timestamps
 
-        self._task = None
+        self._tasks = []
+        self._shard_ranges = []
 
         if self._localization_storage.calculated:
             self.status = "calculated"
@@ -100,62 +105,121 @@ class OfflineLocalizationController(Observable):
         self.status = self._default_status
 
     def _create_localization_task(self):
-        def on_yield(data_pairs):
+        def on_yield(yield_value):
+            data_pairs, frame_results = yield_value
+            self._localization_storage.pose_cache.update(frame_results)
             self._insert_pose_bisector(data_pairs)
-            self.status = "{:.0f}% completed".format(self._task.progress * 100)
+            self.status = "{:.0f}% completed".format(self.progress * 100)
 
         def on_completed(_):
+            if not self._all_tasks_ended():
+                return
             self.status = "successfully completed"
             self._localization_storage.save_pldata_to_disk()
             logger.info("camera localization completed")
             self.on_localization_ended()
 
         def on_canceled_or_killed():
+            if not self._all_tasks_ended():
+                return
             self._localization_storage.save_pldata_to_disk()
             logger.info("camera localization canceled")
             self.on_localization_ended()
 
-        self._task = self._create_task()
-        self._task.add_observer("on_yield", on_yield)
-        self._task.add_observer("on_completed", on_completed)
-        self._task.add_observer("on_canceled_or_killed", on_canceled_or_killed)
-        self._task.add_observer("on_exception", tasklib.raise_exception)
-        self._task.add_observer("on_started", self.on_localization_started)
+        self._localization_storage.pose_cache.set_model(
+            self._optimization_storage.marker_id_to_extrinsics, self._camera_intrinsics
+        )
+        self._shard_ranges = self._get_shard_ranges()
+        self._tasks = [
+            self._create_task(shard_range, shard_idx, len(self._shard_ranges))
+            for shard_idx, shard_range in enumerate(self._shard_ranges)
+        ]
+        for idx, task in enumerate(self._tasks):
+            task.add_observer("on_yield", on_yield)
+            task.add_observer("on_completed", on_completed)
+            task.add_observer("on_canceled_or_killed", on_canceled_or_killed)
+            task.add_observer("on_exception", tasklib.raise_exception)
+            if idx == 0:
+                task.add_observer("on_started", self.on_localization_started)
         logger.info("Start camera localization")
         self.status = "0% completed"
 
-    def _create_task(self):
+    def _get_shard_ranges(self):
+        """Splits the localization range into contiguous frame ranges
+
+        Each range contains about the same number of frames with markers, since
+        only these need to be localized.
+        """
+        frame_start, frame_end = self._general_settings.localization_frame_index_range
+        frame_indices = sorted(
+            frame_index
+            for frame_index, num_markers in (
+                self._detection_storage.frame_index_to_num_markers.items()
+            )
+            if num_markers and frame_start <= frame_index <= frame_end
+        )
+        shard_count = min(
+            max(1, mp.cpu_count() - 1),
+            max(1, len(frame_indices) // _min_frames_per_shard),
+        )
+        if shard_count == 1:
+            return [(frame_start, frame_end)]
+
+        shard_size = -(-len(frame_indices) // shard_count)
+        shard_starts = [frame_start] + frame_indices[shard_size::shard_size]
+        shard_ends = [start - 1 for start in shard_starts[1:]] + [frame_end]
+        return list(zip(shard_starts, shard_ends))
+
+    def _all_tasks_ended(self):
+        return all(task.ended for task in self._tasks)
+
+    def _create_task(self, frame_index_range, shard_idx, shard_count):
         args = (
             self._all_timestamps,
-            self._general_settings.localization_frame_index_range,
+            frame_index_range,
             self._detection_storage.markers_bisector,
             self._detection_storage.frame_index_to_num_markers,
             self._optimization_storage.marker_id_to_extrinsics,
             self._camera_intrinsics,
+            self._localization_storage.pose_cache.get_range(frame_index_range),
         )
+        name = "camera localization"
+        if shard_count > 1:
+            name += " {}/{}".format(shard_idx + 1, shard_count)
         return self._task_manager.create_background_task(
-            name="camera localization",
+            name=name,
             routine_or_generator_function=worker.offline_localization,
             pass_shared_memory=True,
             args=args,
         )
 
     def _insert_pose_bisector(self, data_pairs):
-        for timestamp, pose in data_pairs:
-            self._localization_storage.pose_bisector.insert(timestamp, pose)
+        if data_pairs:
+            timestamps, poses = zip(*data_pairs)
+            self._localization_storage.pose_bisector.insert_many(timestamps, poses)
         self.on_localization_yield()
 
     def cancel_task(self):
-        if self.is_running_task:
-            self._task.kill(None)
+        for task in self._tasks:
+            if task.running:
+                task.kill(None)
 
     @property
     def is_running_task(self):
-        return self._task is not None and self._task.running
+        return any(task.running for task in self._tasks)
 
     @property
     def progress(self):
-        return self._task.progress if self.is_running_task else 0.0
+        if not self.is_running_task:
+            return 0.0
+        frame_counts = [
+            frame_end - frame_start + 1 for frame_start, frame_end in self._shard_ranges
+        ]
+        done = sum(
+            (1.0 if task.ended else task.progress) * frame_count
+            for task, frame_count in zip(self._tasks, frame_counts)
+        )
+        return done / sum(frame_counts)
 
     def set_range_from_current_trim_marks(self):
         self._general_settings.localization_frame_index_range = (
@@ -15,5 +15,6 @@ from head_pose_tracker.function import (
     triangulate_marker,
     get_initial_guess,
     pick_key_markers,
+    projection,
 )
 from head_pose_tracker.function.bundle_adjustment import BundleAdjustment
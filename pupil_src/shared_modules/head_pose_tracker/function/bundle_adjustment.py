@@ -17,7 +17,7 @@ import numpy as np
 from scipy import optimize as scipy_optimize
 from scipy import sparse as scipy_sparse
 
-from head_pose_tracker.function import utils
+from head_pose_tracker.function import projection, utils
 
 logger = logging.getLogger(__name__)
 
@@ -37,28 +37,49 @@ class BundleAdjustment:
         self._enough_samples = False
         self._camera_intrinsics_params_size = 4 + camera_intrinsics.D.size
 
+        # For supported camera models, all markers in all frames are projected at
+        # once and the Jacobian is computed analytically. Otherwise markers are
+        # projected one by one with cv2 and the Jacobian is estimated by finite
+        # differences.
+        self._analytic_jacobian = projection.is_supported(camera_intrinsics)
+        self._marker_points_3d_origin = utils.get_marker_points_3d_origin().astype(
+            np.float64
+        )
+
         self._tol = 1e-8
         self._diff_step = 1e-3
 
         self._marker_ids = []
         self._frame_ids = []
 
-    def calculate(self, initial_guess_result):
+    def calculate(self, initial_guess_result, max_key_frames=None):
         """ run bundle adjustment given the initial guess and then check the result of
         markers_3d_model
+
+        If max_key_frames is given, only the key markers of about max_key_frames
+        frames are optimized and only the extrinsics of those frames are returned.
         """
 
-        self._enough_samples = bool(len(initial_guess_result.key_markers) >= 30)
+        key_markers = initial_guess_result.key_markers
+        frame_id_to_extrinsics = initial_guess_result.frame_id_to_extrinsics
+        if max_key_frames is not None:
+            key_markers = self._subsample_key_frames(key_markers, max_key_frames)
+            frame_ids = {marker.frame_id for marker in key_markers}
+            frame_id_to_extrinsics = {
+                frame_id: extrinsics
+                for frame_id, extrinsics in frame_id_to_extrinsics.items()
+                if frame_id in frame_ids
+            }
+
+        self._enough_samples = bool(len(key_markers) >= 30)
 
         self._marker_ids, self._frame_ids = self._set_ids(
-            initial_guess_result.frame_id_to_extrinsics,
-            initial_guess_result.marker_id_to_extrinsics,
+            frame_id_to_extrinsics, initial_guess_result.marker_id_to_extrinsics
         )
         camera_extrinsics_array, marker_extrinsics_array = self._set_init_array(
-            initial_guess_result.frame_id_to_extrinsics,
-            initial_guess_result.marker_id_to_extrinsics,
+            frame_id_to_extrinsics, initial_guess_result.marker_id_to_extrinsics
         )
-        self._prepare_basic_data(initial_guess_result.key_markers)
+        self._prepare_basic_data(key_markers)
 
         initial_guess_array, bounds, sparsity_matrix = self._prepare_parameters(
             camera_extrinsics_array, marker_extrinsics_array
@@ -76,6 +97,31 @@ class BundleAdjustment:
         else:
             return self._get_result(least_sq_result)
 
+    @staticmethod
+    def _subsample_key_frames(key_markers, max_key_frames):
+        """ pick the key markers of max_key_frames frames evenly spread over time,
+        plus the frames needed to observe every marker at least once
+        """
+
+        frame_id_to_marker_ids = collections.defaultdict(set)
+        for marker in key_markers:
+            frame_id_to_marker_ids[marker.frame_id].add(marker.marker_id)
+        frame_ids = sorted(frame_id_to_marker_ids)
+        if len(frame_ids) <= max_key_frames:
+            return key_markers
+
+        picked = np.linspace(0, len(frame_ids) - 1, max_key_frames).round()
+        frame_ids_picked = {frame_ids[int(idx)] for idx in picked}
+        marker_ids_observed = set().union(
+            *(frame_id_to_marker_ids[frame_id] for frame_id in frame_ids_picked)
+        )
+        for frame_id in frame_ids:
+            if not frame_id_to_marker_ids[frame_id] <= marker_ids_observed:
+                frame_ids_picked.add(frame_id)
+                marker_ids_observed |= frame_id_to_marker_ids[frame_id]
+
+        return [marker for marker in key_markers if marker.frame_id in frame_ids_picked]
+
     @staticmethod
     def _set_ids(frame_id_to_extrinsics, marker_id_to_extrinsics):
         origin_marker_id = utils.find_origin_marker_id(marker_id_to_extrinsics)
@@ -94,15 +140,19 @@ class BundleAdjustment:
         return camera_extrinsics_array, marker_extrinsics_array
 
     def _prepare_basic_data(self, key_markers):
+        frame_id_to_index = {frame_id: i for i, frame_id in enumerate(self._frame_ids)}
+        marker_id_to_index = {
+            marker_id: i for i, marker_id in enumerate(self._marker_ids)
+        }
         self._frame_indices = np.array(
-            [self._frame_ids.index(marker.frame_id) for marker in key_markers]
+            [frame_id_to_index[marker.frame_id] for marker in key_markers], dtype=int
         )
         self._marker_indices = np.array(
-            [self._marker_ids.index(marker.marker_id) for marker in key_markers]
+            [marker_id_to_index[marker.marker_id] for marker in key_markers], dtype=int
         )
         self._markers_points_2d_detected = np.array(
-            [marker.verts for marker in key_markers]
-        )
+            [marker.verts for marker in key_markers], dtype=np.float64
+        ).reshape(-1, 4, 2)
 
     def _prepare_parameters(self, camera_extrinsics_array, marker_extrinsics_array):
         self._camera_extrinsics_shape = camera_extrinsics_array.shape
@@ -111,21 +161,25 @@ class BundleAdjustment:
         initial_guess_array = np.vstack(
             (camera_extrinsics_array, marker_extrinsics_array)
         ).ravel()
+        self._camera_intrinsics_params = self._load_camera_intrinsics_params(
+            self._camera_intrinsics.K, self._camera_intrinsics.D
+        )
         if self._optimize_camera_intrinsics and self._enough_samples:
-            camera_intrinsics_params = self._load_camera_intrinsics_params(
-                self._camera_intrinsics.K, self._camera_intrinsics.D
-            )
             initial_guess_array = np.hstack(
-                (initial_guess_array, camera_intrinsics_params)
+                (initial_guess_array, self._camera_intrinsics_params)
             )
 
         bounds = self._calculate_bounds()
 
-        sparsity_matrix = self._construct_sparsity_matrix()
+        if self._analytic_jacobian:
+            self._jacobian_indices = self._construct_jacobian_indices()
+            sparsity_matrix = None
+        else:
+            sparsity_matrix = self._construct_sparsity_matrix()
 
         return initial_guess_array, bounds, sparsity_matrix
 
-    def _calculate_bounds(self, eps=np.finfo(np.float).eps, scale=np.inf):
+    def _calculate_bounds(self, eps=np.finfo(np.float64).eps, scale=np.inf):
         """ calculate the lower and upper bounds on independent variables
             fix the first marker at the origin of the coordinate system
         """
@@ -214,7 +268,48 @@ class BundleAdjustment:
         sparsity_matrix = scipy_sparse.lil_matrix(sparsity_matrix)
         return sparsity_matrix
 
+    def _construct_jacobian_indices(self):
+        """
+        Construct the row and column indices of the non-zero elements of the Jacobian
+        matrix, in the order of the data computed by _function_compute_jacobian.
+        Each residual depends on the extrinsics of one camera and one marker, and on
+        the camera intrinsics if they are optimized.
+
+        :return: rows and columns, both of shape (n_samples, 4, 2, n_columns)
+        """
+
+        n_samples = len(self._frame_indices)
+        n_camera_variables = np.prod(self._camera_extrinsics_shape)
+        n_extrinsics_variables = n_camera_variables + np.prod(
+            self._marker_extrinsics_shape
+        )
+
+        columns = [
+            self._frame_indices[:, np.newaxis] * 6 + np.arange(6),
+            self._marker_indices[:, np.newaxis] * 6 + np.arange(6) + n_camera_variables,
+        ]
+        if self._optimize_camera_intrinsics and self._enough_samples:
+            columns.append(
+                np.tile(
+                    np.arange(self._camera_intrinsics_params_size)
+                    + n_extrinsics_variables,
+                    (n_samples, 1),
+                )
+            )
+        columns = np.hstack(columns)[:, np.newaxis, np.newaxis, :]
+        rows = np.arange(n_samples * 8).reshape(n_samples, 4, 2, 1)
+
+        rows, columns = np.broadcast_arrays(rows, columns)
+        return rows.ravel(), columns.ravel()
+
     def _least_squares(self, initial_guess_array, bounds, sparsity_matrix):
+        if self._analytic_jacobian:
+            jacobian_kwargs = {"jac": self._function_compute_jacobian}
+        else:
+            jacobian_kwargs = {
+                "diff_step": self._diff_step,
+                "jac_sparsity": sparsity_matrix,
+            }
         result = scipy_optimize.least_squares(
             fun=self._function_compute_residuals,
             x0=initial_guess_array,
@@ -224,9 +319,8 @@ class BundleAdjustment:
             gtol=self._tol,
             x_scale="jac",
             loss="soft_l1",
-            diff_step=self._diff_step,
-            jac_sparsity=sparsity_matrix,
             max_nfev=100,
+            **jacobian_kwargs,
         )
         return result
 
@@ -237,6 +331,12 @@ class BundleAdjustment:
         frame_indices_failed, marker_indices_failed = self._find_failed_indices(
             least_sq_result.fun
         )
+        frame_indices_failed = set(frame_indices_failed)
+        marker_indices_failed = set(marker_indices_failed)
+        if self._optimize_camera_intrinsics and self._enough_samples:
+            self._unload_camera_intrinsics_params(
+                least_sq_result.x[-self._camera_intrinsics_params_size :]
+            )
 
         frame_id_to_extrinsics_opt = {
             self._frame_ids[frame_index]: extrinsics
@@ -262,17 +362,85 @@ class BundleAdjustment:
         camera_extrinsics_array, marker_extrinsics_array = self._get_extrinsics_arrays(
             variables
         )
-        if self._optimize_camera_intrinsics and self._enough_samples:
-            self._unload_camera_intrinsics_params(
-                variables[-self._camera_intrinsics_params_size :]
+        if self._analytic_jacobian:
+            markers_points_2d_projected, *_ = self._project_markers_vectorized(
+                camera_extrinsics_array,
+                marker_extrinsics_array,
+                self._get_camera_intrinsics_params(variables),
+            )
+        else:
+            if self._optimize_camera_intrinsics and self._enough_samples:
+                self._unload_camera_intrinsics_params(
+                    variables[-self._camera_intrinsics_params_size :]
+                )
+            markers_points_2d_projected = self._project_markers(
+                camera_extrinsics_array, marker_extrinsics_array
             )
-
-        markers_points_2d_projected = self._project_markers(
-            camera_extrinsics_array, marker_extrinsics_array
-        )
         residuals = markers_points_2d_projected - self._markers_points_2d_detected
         return residuals.ravel()
 
+    def _function_compute_jacobian(self, variables):
+        """ Function which computes the Jacobian matrix of the residuals analytically
+        """
+        camera_extrinsics_array, marker_extrinsics_array = self._get_extrinsics_arrays(
+            variables
+        )
+        (
+            _,
+            markers_points_3d,
+            camera_rotations,
+            marker_rotations,
+            jac_points,
+            jac_intrinsics,
+        ) = self._project_markers_vectorized(
+            camera_extrinsics_array,
+            marker_extrinsics_array,
+            self._get_camera_intrinsics_params(variables),
+        )
+
+        # derivatives of rotated points by the rotation vectors:
+        # d(R @ p) / d(rotation) = -R @ skew(p) @ G
+        camera_factors = projection.rotation_jacobian_factors(
+            camera_extrinsics_array[:, 0:3], camera_rotations
+        )
+        marker_factors = projection.rotation_jacobian_factors(
+            marker_extrinsics_array[:, 0:3], marker_rotations
+        )
+        rotations = camera_rotations[self._frame_indices][:, np.newaxis]
+        points_3d = markers_points_3d[self._marker_indices]
+        jac_camera_rotation = (
+            -rotations
+            @ projection.skew(points_3d)
+            @ camera_factors[self._frame_indices][:, np.newaxis]
+        )
+        jac_marker_rotation = (
+            -marker_rotations[:, np.newaxis]
+            @ projection.skew(self._marker_points_3d_origin)
+            @ marker_factors[:, np.newaxis]
+        )
+
+        # derivatives of the 2d points by the world coordinates of the marker points
+        jac_world_points = jac_points @ rotations
+        blocks = [
+            jac_points @ jac_camera_rotation,
+            jac_points,
+            jac_world_points @ jac_marker_rotation[self._marker_indices],
+            jac_world_points,
+        ]
+        if self._optimize_camera_intrinsics and self._enough_samples:
+            blocks.append(jac_intrinsics)
+        data = np.concatenate(blocks, axis=-1)
+
+        rows, columns = self._jacobian_indices
+        return scipy_sparse.csr_matrix(
+            (data.ravel(), (rows, columns)), shape=(data.shape[0] * 8, len(variables))
+        )
+
+    def _get_camera_intrinsics_params(self, variables):
+        if self._optimize_camera_intrinsics and self._enough_samples:
+            return variables[-self._camera_intrinsics_params_size :]
+        return self._camera_intrinsics_params
+
     def _get_extrinsics_arrays(self, variables):
         """ reshape 1-dimensional vector into the original shape of
         camera_extrinsics_array and marker_extrinsics_array
@@ -309,6 +477,46 @@ class BundleAdjustment:
         )
         return markers_points_2d_projected
 
+    def _project_markers_vectorized(
+        self, camera_extrinsics_array, marker_extrinsics_array, camera_intrinsics_params
+    ):
+        """ project the points of all key markers at once
+
+        :return: the projected 2d points of shape (n_samples, 4, 2), the 3d points
+        of each marker, the rotation matrices of the cameras and the markers, and the
+        derivatives of the 2d points by the 3d points in camera coordinates and by the
+        camera intrinsics parameters
+        """
+
+        camera_rotations = projection.rodrigues(camera_extrinsics_array[:, 0:3])
+        marker_rotations = projection.rodrigues(marker_extrinsics_array[:, 0:3])
+
+        markers_points_3d = np.einsum(
+            "mij,pj->mpi", marker_rotations, self._marker_points_3d_origin
+        )
+        markers_points_3d += marker_extrinsics_array[:, np.newaxis, 3:6]
+
+        points_3d_camera = np.einsum(
+            "sij,spj->spi",
+            camera_rotations[self._frame_indices],
+            markers_points_3d[self._marker_indices],
+        )
+        points_3d_camera += camera_extrinsics_array[
+            self._frame_indices, np.newaxis, 3:6
+        ]
+
+        points_2d, jac_points, jac_intrinsics = projection.project_points(
+            points_3d_camera, camera_intrinsics_params, self._camera_intrinsics.cam_type
+        )
+        return (
+            points_2d,
+            markers_points_3d,
+            camera_rotations,
+            marker_rotations,
+            jac_points,
+            jac_intrinsics,
+        )
+
     def _find_failed_indices(self, residuals, thres_frame=8, thres_marker=8):
         """ find out those frame_indices and marker_indices which cause large
         reprojection errors
@@ -317,18 +525,14 @@ class BundleAdjustment:
         residuals.shape = -1, 4, 2
         reprojection_errors = np.linalg.norm(residuals, axis=2).sum(axis=1)
 
-        frame_indices_failed = [
-            frame_indice
-            for frame_indice in set(self._frame_indices)
-            if np.min(reprojection_errors[self._frame_indices == frame_indice])
-            > thres_frame
-        ]
-        marker_indices_failed = [
-            marker_indice
-            for marker_indice in set(self._marker_indices)
-            if np.min(reprojection_errors[self._marker_indices == marker_indice])
-            > thres_marker
-        ]
+        def find_failed(indices, thres):
+            min_errors = np.full(indices.max() + 1, np.inf)
+            np.minimum.at(min_errors, indices, reprojection_errors)
+            observed = np.bincount(indices, minlength=len(min_errors)) > 0
+            return np.flatnonzero(observed & (min_errors > thres)).tolist()
+
+        frame_indices_failed = find_failed(self._frame_indices, thres_frame)
+        marker_indices_failed = find_failed(self._marker_indices, thres_marker)
         return frame_indices_failed, marker_indices_failed
 
     def _load_camera_intrinsics_params(self, camera_matrix, dist_coefs):
@@ -0,0 +1,180 @@
+"""
+(*)~---------------------------------------------------------------------------
+Pupil - eye tracking platform
+Copyright (C) 2012-2020 Pupil Labs
+
+Distributed under the terms of the GNU
+Lesser General Public License (LGPL v3.0).
+See COPYING and COPYING.LESSER for license details.
+---------------------------------------------------------------------------~(*)
+"""
+
+import numpy as np
+
+# Below this rotation angle, the derivative of a rotation is approximated by the
+# derivative at zero, since the exact formula becomes numerically unstable.
+_small_angle = 1e-5
+
+
+def skew(vectors):
+    """Cross product matrices of vectors of shape (..., 3), shape (..., 3, 3)"""
+    vectors = np.asarray(vectors, dtype=np.float64)
+    x, y, z = np.moveaxis(vectors, -1, 0)
+    zeros = np.zeros_like(x)
+    matrices = np.stack((zeros, -z, y, z, zeros, -x, -y, x, zeros), axis=-1)
+    return matrices.reshape(vectors.shape + (3,))
+
+
+def rodrigues(rvecs):
+    """Rotation matrices of rotation vectors of shape (N, 3), like cv2.Rodrigues"""
+    rvecs = np.asarray(rvecs, dtype=np.float64).reshape(-1, 3)
+    theta = np.linalg.norm(rvecs, axis=1)
+    safe_theta = np.where(theta > 0, theta, 1.0)
+    a = np.where(theta > 0, np.sin(theta) / safe_theta, 1.0)
+    b = np.where(theta > 0, 2 * (np.sin(theta / 2) / safe_theta) ** 2, 0.5)
+    K = skew(rvecs)
+    return (
+        np.eye(3)
+        + a[:, np.newaxis, np.newaxis] * K
+        + b[:, np.newaxis, np.newaxis] * (K @ K)
+    )
+
+
+def rotation_jacobian_factors(rvecs, rotations):
+    """Factors G of the derivative of rotated vectors by the rotation vector
+
+    The derivative of R(r) @ v by r is -R(r) @ skew(v) @ G(r), see Gallego and
+    Yezzi, "A compact formula for the derivative of a 3-D rotation in
+    exponential coordinates", 2015. Returns G of shape (N, 3, 3).
+    """
+    rvecs = np.asarray(rvecs, dtype=np.float64).reshape(-1, 3)
+    theta_sq = np.einsum("ni,ni->n", rvecs, rvecs)
+    small = theta_sq < _small_angle ** 2
+    safe_theta_sq = np.where(small, 1.0, theta_sq)[:, np.newaxis, np.newaxis]
+
+    outer = np.einsum("ni,nj->nij", rvecs, rvecs)
+    inverse_minus_identity = np.swapaxes(rotations, 1, 2) - np.eye(3)
+    factors = (outer + inverse_minus_identity @ skew(rvecs)) / safe_theta_sq
+    factors[small] = np.eye(3)
+    return factors
+
+
+def is_supported(camera_intrinsics):
+    """Whether `project_points()` supports the camera model and its distortion"""
+    n_dist_coefs = camera_intrinsics.D.size
+    if camera_intrinsics.cam_type == "fisheye":
+        return n_dist_coefs == 4
+    return camera_intrinsics.cam_type in ("radial", "dummy") and n_dist_coefs in (4, 5)
+
+
+def project_points(points_3d, camera_intrinsics_params, cam_type):
+    """Projects points in camera coordinates onto the image, including derivatives
+
+    :param points_3d: points in camera coordinates, shape (..., 3)
+    :param camera_intrinsics_params: fx, fy, cx, cy and the distortion coefficients
+    :param cam_type: "radial", "dummy" or "fisheye"
+    :return: image points, shape (..., 2); their derivatives by the points,
+        shape (..., 2, 3); and by the camera intrinsics parameters,
+        shape (..., 2, n_camera_intrinsics_params)
+    """
+    points_3d = np.asarray(points_3d, dtype=np.float64)
+    fx, fy, cx, cy = camera_intrinsics_params[:4]
+    dist_coefs = camera_intrinsics_params[4:]
+
+    X, Y, Z = np.moveaxis(points_3d, -1, 0)
+    inv_Z = 1.0 / Z
+    x, y = X * inv_Z, Y * inv_Z
+    if cam_type == "fisheye":
+        distorted, jac_distorted, jac_dist_coefs = _distort_fisheye(x, y, dist_coefs)
+    else:
+        distorted, jac_distorted, jac_dist_coefs = _distort_radial(x, y, dist_coefs)
+
+    focal = np.array([fx, fy])
+    image_points = distorted * focal + (cx, cy)
+
+    # derivatives of the normalized image coordinates by the 3d point
+    jac_normalized = np.zeros(points_3d.shape[:-1] + (2, 3))
+    jac_normalized[..., 0, 0] = inv_Z
+    jac_normalized[..., 1, 1] = inv_Z
+    jac_normalized[..., 0, 2] = -x * inv_Z
+    jac_normalized[..., 1, 2] = -y * inv_Z
+    jac_points = focal[:, np.newaxis] * (jac_distorted @ jac_normalized)
+
+    jac_intrinsics = np.zeros(points_3d.shape[:-1] + (2, 4 + dist_coefs.size))
+    jac_intrinsics[..., 0, 0] = distorted[..., 0]
+    jac_intrinsics[..., 1, 1] = distorted[..., 1]
+    jac_intrinsics[..., 0, 2] = 1.0
+    jac_intrinsics[..., 1, 3] = 1.0
+    jac_intrinsics[..., 4:] = focal[:, np.newaxis] * jac_dist_coefs
+
+    return image_points, jac_points, jac_intrinsics
+
+
+def _distort_radial(x, y, dist_coefs):
+    """Distortion of the OpenCV pinhole model with coefficients k1, k2, p1, p2[, k3]"""
+    k1, k2, p1, p2 = dist_coefs[:4]
+    k3 = dist_coefs[4] if dist_coefs.size > 4 else 0.0
+
+    r2 = x * x + y * y
+    r4 = r2 * r2
+    r6 = r4 * r2
+    radial = 1 + k1 * r2 + k2 * r4 + k3 * r6
+    d_radial = k1 + 2 * k2 * r2 + 3 * k3 * r4
+    xy = x * y
+
+    distorted = np.stack(
+        (
+            x * radial + 2 * p1 * xy + p2 * (r2 + 2 * x * x),
+            y * radial + p1 * (r2 + 2 * y * y) + 2 * p2 * xy,
+        ),
+        axis=-1,
+    )
+
+    jac_distorted = np.empty(x.shape + (2, 2))
+    jac_distorted[..., 0, 0] = radial + 2 * x * x * d_radial + 2 * p1 * y + 6 * p2 * x
+    jac_distorted[..., 0, 1] = 2 * xy * d_radial + 2 * p1 * x + 2 * p2 * y
+    jac_distorted[..., 1, 0] = 2 * xy * d_radial + 2 * p1 * x + 2 * p2 * y
+    jac_distorted[..., 1, 1] = radial + 2 * y * y * d_radial + 6 * p1 * y + 2 * p2 * x
+
+    jac_dist_coefs = [
+        (x * r2, y * r2),
+        (x * r4, y * r4),
+        (2 * xy, r2 + 2 * y * y),
+        (r2 + 2 * x * x, 2 * xy),
+        (x * r6, y * r6),
+    ][: dist_coefs.size]
+    jac_dist_coefs = np.moveaxis(np.array(jac_dist_coefs), (0, 1), (-1, -2))
+    return distorted, jac_distorted, jac_dist_coefs
+
+
+def _distort_fisheye(x, y, dist_coefs):
+    """Distortion of the OpenCV fisheye model with coefficients k1, k2, k3, k4"""
+    r = np.sqrt(x * x + y * y)
+    theta = np.arctan(r)
+    theta_powers = theta[..., np.newaxis] ** np.arange(1, 10, 2)
+    theta_d = theta_powers[..., 0] + theta_powers[..., 1:] @ dist_coefs
+    d_theta_d = 1 + (theta_powers[..., :4] * theta[..., np.newaxis]) @ (
+        np.arange(3, 10, 2) * dist_coefs
+    )
+
+    # OpenCV leaves points closer than 1e-8 to the optical axis undistorted
+    valid = r > 1e-8
+    inv_r = np.where(valid, 1.0 / np.where(valid, r, 1.0), 1.0)
+    scale = np.where(valid, theta_d * inv_r, 1.0)
+    d_scale = np.where(valid, (d_theta_d / (1 + r * r) - scale) * inv_r, 0.0)
+
+    xy = np.stack((x, y), axis=-1)
+    distorted = xy * scale[..., np.newaxis]
+
+    # d(scale * xy) / d(xy) = scale * I + d_scale / r * xy @ xy.T
+    jac_distorted = np.einsum("...i,...j->...ij", xy, xy)
+    jac_distorted *= (d_scale * inv_r)[..., np.newaxis, np.newaxis]
+    jac_distorted += scale[..., np.newaxis, np.newaxis] * np.eye(2)
+
+    jac_dist_coefs = np.where(
+        valid[..., np.newaxis, np.newaxis],
+        (xy * inv_r[..., np.newaxis])[..., np.newaxis]
+        * theta_powers[..., np.newaxis, 1:],
+        0.0,
+    )
+    return distorted, jac_distorted, jac_dist_coefs
@@ -12,6 +12,8 @@ See COPYING and COPYING.LESSER for license details.
 import player_methods as pm
 from head_pose_tracker import controller, storage
 from head_pose_tracker import ui as plugin_ui
+from head_pose_tracker import worker
+from marker_detection_store import Apriltag_Detection_Store
 from plugin_timeline import PluginTimeline
 from pupil_recording import PupilRecording
 from tasklib.manager import PluginTaskManager
@@ -52,6 +54,12 @@ class Offline_Head_Pose_Tracker(Head_Pose_Tracker_Base):
             get_current_frame_index=self.get_current_frame_index,
             get_current_frame_window=self.get_current_frame_window,
         )
+        self._marker_detection_store = Apriltag_Detection_Store.for_recording(
+            self.g_pool.rec_dir,
+            family=worker.APRILTAG_FAMILY,
+            quad_decimate=worker.APRILTAG_QUAD_DECIMATE,
+            decode_sharpening=worker.APRILTAG_DECODE_SHARPENING,
+        )
         self._optimization_storage = storage.OptimizationStorage(
             self.g_pool.rec_dir,
             plugin=self,
@@ -68,6 +76,7 @@ class Offline_Head_Pose_Tracker(Head_Pose_Tracker_Base):
         self._detection_controller = controller.OfflineDetectionController(
             self._offline_settings_storage,
             self._detection_storage,
+            self._marker_detection_store,
             task_manager=self._task_manager,
             get_current_trim_mark_range=self._current_trim_mark_range,
             all_timestamps=self.g_pool.timestamps,
@@ -10,6 +10,8 @@ See COPYING and COPYING.LESSER for license details.
 """
 
 import collections
+import hashlib
+import logging
 import os
 
 import numpy as np
@@ -18,6 +20,8 @@ import file_methods as fm
 import player_methods as pm
 from observable import Observable
 
+logger = logging.getLogger(__name__)
+
 
 class Localization:
     def __init__(self):
@@ -65,6 +69,94 @@ class OfflineCameraLocalization(Localization):
             return pose_data
 
 
+class CameraPoseCache:
+    """Camera poses of single frames, as calculated for one markers 3d model
+
+    Each entry stores the digest of the frame's marker detections next to the
+    camera extrinsics (or None if the camera could not be localized), such that
+    localizing a new frame range only needs to calculate frames that were not
+    covered before or whose detections changed. Changing the markers 3d model or
+    the camera intrinsics invalidates all entries.
+    """
+
+    version = 1
+
+    def __init__(self, file_path):
+        self._file_path = file_path
+        self._model_key = None
+        self._frame_index_to_pose = {}
+        self._load_from_file()
+
+    def set_model(self, marker_id_to_extrinsics, camera_intrinsics):
+        model_key = self._get_model_key(marker_id_to_extrinsics, camera_intrinsics)
+        if model_key != self._model_key:
+            self._model_key = model_key
+            self._frame_index_to_pose = {}
+
+    @staticmethod
+    def _get_model_key(marker_id_to_extrinsics, camera_intrinsics):
+        digest = hashlib.blake2b(digest_size=16)
+        for marker_id in sorted(marker_id_to_extrinsics):
+            extrinsics = marker_id_to_extrinsics[marker_id]
+            digest.update(str(marker_id).encode())
+            digest.update(np.asarray(extrinsics, dtype=np.float64).tobytes())
+        digest.update(np.asarray(camera_intrinsics.K, dtype=np.float64).tobytes())
+        digest.update(np.asarray(camera_intrinsics.D, dtype=np.float64).tobytes())
+        return digest.hexdigest()
+
+    def get_range(self, frame_index_range):
+        """Maps frame indices within the range to (digest, extrinsics or None)"""
+        frame_start, frame_end = frame_index_range
+        return {
+            frame_index: pose
+            for frame_index, pose in self._frame_index_to_pose.items()
+            if frame_start <= frame_index <= frame_end
+        }
+
+    def update(self, frame_results):
+        for frame_index, digest, camera_extrinsics in frame_results:
+            self._frame_index_to_pose[frame_index] = (digest, camera_extrinsics)
+
+    def __len__(self):
+        return len(self._frame_index_to_pose)
+
+    def save_to_disk(self):
+        if self._model_key is None:
+            return
+        frame_indices = sorted(self._frame_index_to_pose)
+        poses = [self._frame_index_to_pose[index] for index in frame_indices]
+        dict_representation = {
+            "version": self.version,
+            "model_key": self._model_key,
+            "frame_indices": frame_indices,
+            "digests": [digest for digest, _ in poses],
+            "extrinsics": [extrinsics for _, extrinsics in poses],
+        }
+        os.makedirs(os.path.dirname(self._file_path), exist_ok=True)
+        fm.save_object(dict_representation, self._file_path)
+
+    def _load_from_file(self):
+        try:
+            dict_representation = fm.load_object(self._file_path, allow_legacy=False)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError):
+            logger.debug("Could not load camera pose cache, recalculating poses")
+            return
+        if dict_representation.get("version", None) != self.version:
+            return
+
+        self._model_key = dict_representation["model_key"]
+        self._frame_index_to_pose = {
+            frame_index: (digest, extrinsics)
+            for frame_index, digest, extrinsics in zip(
+                dict_representation["frame_indices"],
+                dict_representation["digests"],
+                dict_representation["extrinsics"],
+            )
+        }
+
+
 class OfflineLocalizationStorage(Observable, OfflineCameraLocalization):
     def __init__(
         self, rec_dir, plugin, get_current_frame_index, get_current_frame_window
@@ -74,6 +166,9 @@ class OfflineLocalizationStorage(Observable, OfflineCameraLocalization):
         self._rec_dir = rec_dir
 
         self.load_pldata_from_disk()
+        self.pose_cache = CameraPoseCache(
+            os.path.join(self._offline_data_folder_path, "camera_pose_cache")
+        )
 
         plugin.add_observer("cleanup", self._on_cleanup)
 
@@ -82,6 +177,7 @@ class OfflineLocalizationStorage(Observable, OfflineCameraLocalization):
 
     def save_pldata_to_disk(self):
         self._save_to_file()
+        self.pose_cache.save_to_disk()
 
     def _save_to_file(self):
         directory = self._offline_data_folder_path
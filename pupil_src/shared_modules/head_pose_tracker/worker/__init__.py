@@ -10,6 +10,9 @@ See COPYING and COPYING.LESSER for license details.
 """
 
 from head_pose_tracker.worker.detection_worker import (
+    APRILTAG_DECODE_SHARPENING,
+    APRILTAG_FAMILY,
+    APRILTAG_QUAD_DECIMATE,
     offline_detection,
     online_detection,
 )
@@ -18,12 +18,24 @@ import pupil_apriltags
 
 import file_methods as fm
 import video_capture
+from marker_detection_store import Apriltag_Detection, apriltag_detection_to_dict
 from methods import normalize
 from stdlib_utils import unique
 
 logger = logging.getLogger(__name__)
 
-apriltag_detector = pupil_apriltags.Detector(nthreads=2)
+# Default parameters of the surface tracker, such that both plugins share the
+# detection store of a recording
+APRILTAG_FAMILY = "tag36h11"
+APRILTAG_QUAD_DECIMATE = 2.0
+APRILTAG_DECODE_SHARPENING = 1.0
+
+apriltag_detector = pupil_apriltags.Detector(
+    families=APRILTAG_FAMILY,
+    nthreads=2,
+    quad_decimate=APRILTAG_QUAD_DECIMATE,
+    decode_sharpening=APRILTAG_DECODE_SHARPENING,
+)
 
 
 def get_markers_data(detection, img_size, timestamp):
@@ -55,15 +67,18 @@ def dedupliciate_markers(marker_old, marker_new):
 def _detect(frame):
     image = frame.gray
     apriltag_detections = apriltag_detector.detect(image)
+    img_size = image.shape[::-1]
+    return _markers_data(apriltag_detections, img_size, frame.timestamp)
+
+
+def _markers_data(apriltag_detections, img_size, timestamp):
     apriltag_detections = unique(
         apriltag_detections,
         key=lambda marker: marker.tag_id,
         select=dedupliciate_markers,
     )
-
-    img_size = image.shape[::-1]
     return [
-        get_markers_data(detection, img_size, frame.timestamp)
+        get_markers_data(detection, img_size, timestamp)
         for detection in apriltag_detections
     ]
 
@@ -73,8 +88,15 @@ def offline_detection(
     all_timestamps,
     frame_index_range,
     calculated_frame_indices,
+    stored_detections,
     shared_memory,
 ):
+    """Detects markers in all frames within `frame_index_range` not calculated yet
+
+    Frames in `stored_detections` (frame index -> detection dicts) are not decoded.
+    Yields batches of (timestamp, markers, frame index, new detections), where
+    new detections are the raw detection dicts of decoded frames, None otherwise.
+    """
     batch_size = 30
     frame_start, frame_end = frame_index_range
     frame_indices = sorted(
@@ -94,19 +116,34 @@ def offline_detection(
     uncalculated_timestamps = all_timestamps[frame_indices]
     seek_poses = np.searchsorted(timestamps_no_gaps, uncalculated_timestamps)
 
+    img_size = src.frame_size
+
     queue = []
     for frame_index, timestamp, target_frame_idx in zip(
         frame_indices, uncalculated_timestamps, seek_poses
     ):
         detections = []
-        if timestamp in timestamps_no_gaps:
+        new_detections = None
+        if frame_index in stored_detections:
+            apriltag_detections = [
+                Apriltag_Detection.from_dict(d) for d in stored_detections[frame_index]
+            ]
+            detections = _markers_data(apriltag_detections, img_size, timestamp)
+        elif timestamp in timestamps_no_gaps:
             if target_frame_idx != src.target_frame_idx:
                 src.seek_to_frame(target_frame_idx)  # only seek frame if necessary
             frame = src.get_frame()
-            detections = _detect(frame)
+            apriltag_detections = apriltag_detector.detect(frame.gray)
+            new_detections = [
+                apriltag_detection_to_dict(d) for d in apriltag_detections
+            ]
+            img_size = frame.gray.shape[::-1]
+            detections = _markers_data(apriltag_detections, img_size, frame.timestamp)
+        else:
+            new_detections = []
 
         serialized_dicts = [fm.Serialized_Dict(d) for d in detections]
-        queue.append((timestamp, serialized_dicts, frame_index))
+        queue.append((timestamp, serialized_dicts, frame_index, new_detections))
 
         if len(queue) >= batch_size:
             shared_memory.progress = (frame_index - frame_start + 1) / frame_count
@@ -9,6 +9,8 @@ See COPYING and COPYING.LESSER for license details.
 ---------------------------------------------------------------------------~(*)
 """
 
+import hashlib
+
 import numpy as np
 
 import file_methods as fm
@@ -37,6 +39,19 @@ def get_pose_data(extrinsics, timestamp):
         }
 
 
+def detections_digest(markers_in_frame):
+    """Fingerprint of the marker detections of a frame
+
+    Frames with equal digests have the same markers at the same image positions,
+    so their camera pose does not need to be calculated again.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for marker in sorted(markers_in_frame, key=lambda marker: marker["id"]):
+        digest.update(str(marker["id"]).encode())
+        digest.update(np.asarray(marker["verts"], dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+
 def offline_localization(
     timestamps,
     frame_index_range,
@@ -44,15 +59,49 @@ def offline_localization(
     frame_index_to_num_markers,
     marker_id_to_extrinsics,
     camera_intrinsics,
+    frame_index_to_cached_pose,
     shared_memory,
 ):
+    """Localizes the camera in all frames of `frame_index_range` with markers
+
+    `frame_index_to_cached_pose` maps frame indices to (detections digest, camera
+    extrinsics or None) of an earlier run with the same markers 3d model. Yields
+    batches of (pose data pairs, frame results), where frame results are
+    (frame index, detections digest, camera extrinsics or None) to update the cache.
+    """
     batch_size = 300
 
     def find_markers_in_frame(index):
         window = pm.enclosing_window(timestamps, index)
         return markers_bisector.by_ts_window(window)
 
+    def localize(frame_index, digest, markers_in_frame):
+        try:
+            cached_digest, cached_extrinsics = frame_index_to_cached_pose[frame_index]
+        except KeyError:
+            pass
+        else:
+            if cached_digest == digest:
+                if cached_extrinsics is None:
+                    return None
+                return np.array(cached_extrinsics, dtype=np.float32)
+
+        if digest == digest_prv:
+            # same detections as in the previous frame, i.e. the camera stood still
+            return result_prv
+
+        return solvepnp.calculate(
+            camera_intrinsics,
+            markers_in_frame,
+            marker_id_to_extrinsics,
+            camera_extrinsics_prv=camera_extrinsics_prv,
+            min_n_markers_per_frame=1,
+        )
+
     camera_extrinsics_prv = None
+    # detections digest and camera extrinsics or None of the previous frame
+    digest_prv = None
+    result_prv = None
     not_localized_count = 0
 
     frame_start, frame_end = frame_index_range
@@ -62,38 +111,43 @@ def offline_localization(
     )
 
     queue = []
+    frame_results = []
     for frame_index in frame_indices:
         shared_memory.progress = (frame_index - frame_start + 1) / frame_count
+        camera_extrinsics = None
         if frame_index_to_num_markers[frame_index]:
             markers_in_frame = find_markers_in_frame(frame_index)
-            camera_extrinsics = solvepnp.calculate(
-                camera_intrinsics,
-                markers_in_frame,
-                marker_id_to_extrinsics,
-                camera_extrinsics_prv=camera_extrinsics_prv,
-                min_n_markers_per_frame=1,
+            digest = detections_digest(markers_in_frame)
+            camera_extrinsics = localize(frame_index, digest, markers_in_frame)
+            digest_prv, result_prv = digest, camera_extrinsics
+            frame_results.append(
+                (
+                    frame_index,
+                    digest,
+                    None if camera_extrinsics is None else camera_extrinsics.tolist(),
+                )
             )
-            if camera_extrinsics is not None:
-                camera_extrinsics_prv = camera_extrinsics
-                not_localized_count = 0
-
-                timestamp = timestamps[frame_index]
-                pose_data = get_pose_data(camera_extrinsics, timestamp)
-                serialized_dict = fm.Serialized_Dict(pose_data)
-                queue.append((timestamp, serialized_dict))
-
-                if len(queue) >= batch_size:
-                    data = queue[:batch_size]
-                    del queue[:batch_size]
-                    yield data
-
-                continue
-
-        not_localized_count += 1
-        if not_localized_count >= 5:
-            camera_extrinsics_prv = None
-
-    yield queue
+        else:
+            digest_prv = result_prv = None
+
+        if camera_extrinsics is not None:
+            camera_extrinsics_prv = camera_extrinsics
+            not_localized_count = 0
+
+            timestamp = timestamps[frame_index]
+            pose_data = get_pose_data(camera_extrinsics, timestamp)
+            serialized_dict = fm.Serialized_Dict(pose_data)
+            queue.append((timestamp, serialized_dict))
+        else:
+            not_localized_count += 1
+            if not_localized_count >= 5:
+                camera_extrinsics_prv = None
+
+        if len(frame_results) >= batch_size:
+            yield queue, frame_results
+            queue, frame_results = [], []
+
+    yield queue, frame_results
 
 
 def online_localization(
@@ -27,8 +27,14 @@ IntrinsicsTuple = collections.namedtuple(
 
 random.seed(0)
 
+# Number of frames the bundle adjustment is run on in intermediate rounds of the
+# offline optimization. The last round always runs on all key markers.
+max_key_frames_intermediate = 100
 
-def optimization_routine(bg_storage, camera_intrinsics, bundle_adjustment):
+
+def optimization_routine(
+    bg_storage, camera_intrinsics, bundle_adjustment, max_key_frames=None
+):
     try:
         bg_storage.marker_id_to_extrinsics[bg_storage.origin_marker_id]
     except KeyError:
@@ -43,10 +49,20 @@ def optimization_routine(bg_storage, camera_intrinsics, bundle_adjustment):
     if not initial_guess:
         return None
 
-    result = bundle_adjustment.calculate(initial_guess)
+    result = bundle_adjustment.calculate(initial_guess, max_key_frames)
     if not result:
         return None
 
+    # Frames left out of the bundle adjustment by max_key_frames keep their initial
+    # guess, such that the next round does not need to localize them again.
+    frame_ids_failed = set(result.frame_ids_failed)
+    frame_id_to_extrinsics = {
+        frame_id: extrinsics
+        for frame_id, extrinsics in initial_guess.frame_id_to_extrinsics.items()
+        if frame_id not in frame_ids_failed
+    }
+    frame_id_to_extrinsics.update(result.frame_id_to_extrinsics)
+
     marker_id_to_extrinsics = result.marker_id_to_extrinsics
     marker_id_to_points_3d = {
         marker_id: utils.convert_marker_extrinsics_to_points_3d(extrinsics)
@@ -60,7 +76,7 @@ def optimization_routine(bg_storage, camera_intrinsics, bundle_adjustment):
     intrinsics_tuple = IntrinsicsTuple(camera_intrinsics.K, camera_intrinsics.D)
     return (
         model_tuple,
-        result.frame_id_to_extrinsics,
+        frame_id_to_extrinsics,
         result.frame_ids_failed,
         intrinsics_tuple,
     )
@@ -111,18 +127,24 @@ def offline_optimization(
         bg_storage.all_key_markers += all_key_markers[:n_key_markers]
         del all_key_markers[:n_key_markers]
 
+        max_key_frames = max_key_frames_intermediate if t < opt_times - 1 else None
         try:
             (
                 model_tuple,
                 frame_id_to_extrinsics,
                 frame_ids_failed,
                 intrinsics_tuple,
-            ) = optimization_routine(bg_storage, camera_intrinsics, bundle_adjustment)
+            ) = optimization_routine(
+                bg_storage, camera_intrinsics, bundle_adjustment, max_key_frames
+            )
         except TypeError:
             pass
         else:
             bg_storage.update_model(*model_tuple)
-            bg_storage.frame_id_to_extrinsics = frame_id_to_extrinsics
+            # Keep the poses of frames that are not part of this round
+            bg_storage.frame_id_to_extrinsics.update(frame_id_to_extrinsics)
+            for frame_id in frame_ids_failed:
+                bg_storage.frame_id_to_extrinsics.pop(frame_id, None)
             bg_storage.discard_failed_key_markers(frame_ids_failed)
 
             shared_memory.progress = (t + 1) / opt_times
@@ -88,6 +88,11 @@ class PupilArgParser:
             parser.add_argument(
                 "--hide-ui", action="store_true", help="hide ui on startup"
             )
+            parser.add_argument(
+                "--shared-memory",
+                action="store_true",
+                help="use shared memory for local pupil data",
+            )
 
         if app == "player":
             parser.add_argument(
@@ -0,0 +1,247 @@
+"""
+(*)~---------------------------------------------------------------------------
+Pupil - eye tracking platform
+Copyright (C) 2012-2020 Pupil Labs
+
+Distributed under the terms of the GNU
+Lesser General Public License (LGPL v3.0).
+See COPYING and COPYING.LESSER for license details.
+---------------------------------------------------------------------------~(*)
+"""
+import logging
+import os
+import typing as T
+import weakref
+
+import numpy as np
+
+import file_methods as fm
+
+logger = logging.getLogger(__name__)
+
+
+class Apriltag_Detection(T.NamedTuple):
+    """Stored apriltag detection
+
+    Offers the attributes of `pupil_apriltags.Detection` used by the plugins, such
+    that stored and fresh detections can be processed the same way.
+    """
+
+    tag_family: bytes
+    tag_id: int
+    hamming: int
+    decision_margin: float
+    homography: np.ndarray
+    center: np.ndarray
+    corners: np.ndarray
+    pose_R: T.Any = None
+    pose_t: T.Any = None
+    pose_err: T.Any = None
+
+    @staticmethod
+    def from_dict(detection) -> "Apriltag_Detection":
+        return Apriltag_Detection(
+            tag_family=detection["tag_family"].encode("utf8"),
+            tag_id=detection["tag_id"],
+            hamming=detection["hamming"],
+            decision_margin=detection["decision_margin"],
+            homography=np.asarray(detection["homography"]),
+            center=np.asarray(detection["center"]),
+            corners=np.asarray(detection["corners"]),
+        )
+
+
+def apriltag_detection_to_dict(detection) -> dict:
+    """Serializable form of a `pupil_apriltags.Detection` or `Apriltag_Detection`"""
+    tag_family = detection.tag_family
+    if isinstance(tag_family, bytes):
+        tag_family = tag_family.decode("utf8")
+    return {
+        "tag_family": tag_family,
+        "tag_id": int(detection.tag_id),
+        "hamming": int(detection.hamming),
+        "decision_margin": float(detection.decision_margin),
+        "homography": np.asarray(detection.homography).tolist(),
+        "center": np.asarray(detection.center).tolist(),
+        "corners": np.asarray(detection.corners).tolist(),
+    }
+
+
+class _Frame_Datum_Store:
+    """Per frame data of the world video, persisted as pldata file
+
+    The data is loaded lazily: stored frames are only deserialized when requested.
+    """
+
+    def __init__(self, rec_dir, file_name):
+        self._directory = os.path.join(rec_dir, "offline_data", "marker_detections")
+        self._file_name = file_name
+        self._detections_by_frame = {}
+        self._has_unsaved_changes = False
+        self._load_from_disk()
+
+    def __contains__(self, frame_index: int) -> bool:
+        return frame_index in self._detections_by_frame
+
+    def __len__(self):
+        return len(self._detections_by_frame)
+
+    @property
+    def frame_indices(self) -> T.Set[int]:
+        return set(self._detections_by_frame.keys())
+
+    def save_to_disk(self):
+        if not self._has_unsaved_changes:
+            return
+        os.makedirs(self._directory, exist_ok=True)
+        with fm.PLData_Writer(self._directory, self._file_name) as writer:
+            for frame_index in sorted(self._detections_by_frame):
+                datum = self._detections_by_frame[frame_index]
+                if isinstance(datum, fm.Serialized_Dict):
+                    writer.append_serialized(
+                        datum["timestamp"], datum["topic"], datum.serialized
+                    )
+                else:
+                    writer.append(datum)
+        self._has_unsaved_changes = False
+        logger.debug(f"Saved {len(self)} frames to {self._file_name}")
+
+    def _load_from_disk(self):
+        pldata = fm.load_pldata_file(self._directory, self._file_name)
+        # Detections are only deserialized when requested
+        frame_indices = fm.extract_column(pldata.data, "frame_index")
+        self._detections_by_frame = {
+            int(frame_index): datum
+            for frame_index, datum in zip(frame_indices, pldata.data)
+        }
+
+
+class Apriltag_Detection_Store(_Frame_Datum_Store):
+    """Apriltag detections in the world video of a recording, per frame index
+
+    Detections depend on the tag family and the detector parameters, which
+    is why there is one store per combination. Plugins detecting markers in the
+    same recording with the same parameters share the store via `for_recording()`:
+    frames detected by one plugin do not need to be detected by another one.
+
+    The store is persisted as pldata file in the `offline_data` folder, with one
+    datum per visited frame. Frames without detections are stored as well.
+    """
+
+    _instances = weakref.WeakValueDictionary()
+
+    @classmethod
+    def for_recording(
+        cls, rec_dir, family: str, quad_decimate: float, decode_sharpening: float
+    ) -> "Apriltag_Detection_Store":
+        key = (os.path.abspath(rec_dir), family, quad_decimate, decode_sharpening)
+        try:
+            return cls._instances[key]
+        except KeyError:
+            store = cls(rec_dir, family, quad_decimate, decode_sharpening)
+            cls._instances[key] = store
+            return store
+
+    def __init__(
+        self, rec_dir, family: str, quad_decimate: float, decode_sharpening: float
+    ):
+        super().__init__(
+            rec_dir,
+            f"apriltag_{family}_decimate_{float(quad_decimate):g}"
+            f"_sharpening_{float(decode_sharpening):g}",
+        )
+
+    def get(self, frame_index: int) -> T.Optional[T.List[Apriltag_Detection]]:
+        """Stored detections of a frame, or None if the frame was not visited"""
+        try:
+            datum = self._detections_by_frame[frame_index]
+        except KeyError:
+            return None
+        return [Apriltag_Detection.from_dict(d) for d in datum["detections"]]
+
+    def get_range(self, frame_indices: T.Iterable[int]) -> T.Dict[int, T.List[dict]]:
+        """Serializable detections of all visited frames within `frame_indices`"""
+        return {
+            frame_index: [dict(d) for d in datum["detections"]]
+            for frame_index, datum in (
+                (idx, self._detections_by_frame.get(idx)) for idx in frame_indices
+            )
+            if datum is not None
+        }
+
+    def update(self, frame_index: int, timestamp: float, detections: T.Iterable):
+        """Stores detections of a frame, given as detection objects or dicts"""
+        detections = [
+            d if isinstance(d, dict) else apriltag_detection_to_dict(d)
+            for d in detections
+        ]
+        self._detections_by_frame[frame_index] = {
+            "topic": "apriltag_detections",
+            "timestamp": float(timestamp),
+            "frame_index": int(frame_index),
+            "detections": detections,
+        }
+        self._has_unsaved_changes = True
+
+
+# Increment when changes to the circle marker detection change its results
+CIRCLE_MARKER_DETECTOR_VERSION = 1
+
+
+class Circle_Marker_Detection_Store(_Frame_Datum_Store):
+    """Calibration marker detections in the world video of a recording, per frame
+
+    Stores all markers found by `CircleTracker` for each processed frame, including
+    frames without markers. The store is keyed by the detector version and the
+    world video files: it is empty if any of the videos changed since the
+    detections were stored.
+    """
+
+    def __init__(self, rec_dir, video_paths: T.Sequence[str]):
+        super().__init__(rec_dir, f"circle_markers_v{CIRCLE_MARKER_DETECTOR_VERSION}")
+        self._video_key = [
+            [os.path.basename(path), os.stat(path).st_size, os.stat(path).st_mtime_ns]
+            for path in sorted(video_paths)
+        ]
+        if self._load_video_key() != self._video_key:
+            self._detections_by_frame = {}
+
+    def get(self, frame_index: int) -> T.Optional[T.List[dict]]:
+        """Stored markers of a frame, or None if the frame was not processed"""
+        try:
+            datum = self._detections_by_frame[frame_index]
+        except KeyError:
+            return None
+        return [dict(marker) for marker in datum["markers"]]
+
+    def update(self, frame_index: int, timestamp: float, markers: T.Iterable[dict]):
+        self._detections_by_frame[frame_index] = {
+            "topic": "circle_markers",
+            "timestamp": float(timestamp),
+            "frame_index": int(frame_index),
+            "markers": [
+                {
+                    "marker_type": marker["marker_type"],
+                    "img_pos": [float(v) for v in marker["img_pos"]],
+                    "norm_pos": [float(v) for v in marker["norm_pos"]],
+                }
+                for marker in markers
+            ],
+        }
+        self._has_unsaved_changes = True
+
+    def save_to_disk(self):
+        if not self._has_unsaved_changes:
+            return
+        super().save_to_disk()
+        fm.save_object(self._video_key, self._video_key_path)
+
+    @property
+    def _video_key_path(self) -> str:
+        return os.path.join(self._directory, self._file_name + "_videos.meta")
+
+    def _load_video_key(self):
+        try:
+            return fm.load_object(self._video_key_path, allow_legacy=False)
+        except (OSError, ValueError):
+            return None
@@ -72,6 +72,43 @@ def nearest_intersection(line0, line1):
         return None, None  # parallel lines
 
 
+def nearest_intersections(lines0, lines1):
+    """ Vectorized `nearest_intersection()` for arrays of lines.
+
+    Each line is given by two arrays of points of shape (n, 3). Returns the
+    nearest intersection points, shape (n, 3), and the shortest distances of
+    the line pairs, shape (n,).
+    """
+    p1, p2 = lines0
+    p3, p4 = lines1
+
+    def normalise(p1, p2):
+        p = p2 - p1
+        m = np.linalg.norm(p, axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(m[:, np.newaxis] == 0, 0.0, p / m[:, np.newaxis])
+
+    d1 = normalise(p1, p2)
+    d2 = normalise(p3, p4)
+
+    diff = p1 - p3
+    a01 = -np.sum(d1 * d2, axis=1)
+    b0 = np.sum(diff * d1, axis=1)
+    b1 = -np.sum(diff * d2, axis=1)
+
+    # Parallel lines: select any pair of closest points.
+    parallel = np.abs(a01) >= 1.0
+    det = np.where(parallel, 1.0, 1.0 - a01 * a01)
+    s0 = np.where(parallel, -b0, (a01 * b1 - b0) / det)
+    s1 = np.where(parallel, 0.0, (a01 * b0 - b1) / det)
+
+    closest_points1 = p1 + s0[:, np.newaxis] * d1
+    closest_points2 = p3 + s1[:, np.newaxis] * d2
+    n_points = closest_points1 - closest_points2
+    dist = np.linalg.norm(n_points, axis=1)
+    return closest_points2 + n_points * 0.5, dist
+
+
 def nearest_linepoint_to_point(ref_point, line):
 
     p1 = line[0]
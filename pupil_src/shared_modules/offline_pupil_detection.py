@@ -0,0 +1,210 @@
+"""
+(*)~---------------------------------------------------------------------------
+Pupil - eye tracking platform
+Copyright (C) 2012-2020 Pupil Labs
+
+Distributed under the terms of the GNU
+Lesser General Public License (LGPL v3.0).
+See COPYING and COPYING.LESSER for license details.
+---------------------------------------------------------------------------~(*)
+"""
+import glob
+import logging
+import os
+import re
+import shutil
+import typing as T
+
+import msgpack
+import numpy as np
+
+import file_methods as fm
+
+logger = logging.getLogger(__name__)
+
+# Detected frames are written to disk in chunks of this many frames. Interrupted
+# detections resume after the last completed chunk.
+CHUNK_LENGTH = 2000
+# Progress is reported every this many frames, which is also how quickly a canceled
+# detection stops.
+PROGRESS_INTERVAL = 50
+
+_CHUNK_DIR_NAME = "offline_pupil_chunks"
+_CHUNK_NAME_PATTERN = re.compile(r"eye(\d)_(\d+)_(\d+)$")
+
+
+def _chunk_dir(data_dir) -> str:
+    return os.path.join(data_dir, _CHUNK_DIR_NAME)
+
+
+def _chunk_name(eye_id, start_frame, stop_frame) -> str:
+    return f"eye{eye_id}_{start_frame:08d}_{stop_frame:08d}"
+
+
+def detected_chunks(data_dir, eye_id) -> T.List[T.Tuple[int, int, str]]:
+    """Completed chunks of an eye as (start frame, stop frame, name), sorted"""
+    chunks = []
+    pattern = os.path.join(_chunk_dir(data_dir), f"eye{eye_id}_*_timestamps.npy")
+    for path in glob.glob(pattern):
+        name = os.path.basename(path)[: -len("_timestamps.npy")]
+        match = _CHUNK_NAME_PATTERN.match(name)
+        if match is not None:
+            chunks.append((int(match.group(2)), int(match.group(3)), name))
+    return sorted(chunks)
+
+
+def next_frame_to_detect(data_dir, eye_id) -> int:
+    """Index of the first frame not covered by consecutive chunks from frame 0"""
+    consecutive_chunks = _consecutive_chunks(data_dir, eye_id)
+    return consecutive_chunks[-1][1] if consecutive_chunks else 0
+
+
+def merge_detected_chunks(data_dir, name, eye_ids=(0, 1), keep_eye_ids=()):
+    """Writes the pupil data of all consecutive chunks to `<name>.pldata`
+
+    Data of `keep_eye_ids` is taken from the existing `<name>.pldata` instead, e.g.
+    for eyes that were detected before and whose chunks were already merged.
+    """
+    kept_data = _load_eye_data(data_dir, name, keep_eye_ids)
+    pldata_path = os.path.join(data_dir, name + ".pldata")
+    fm.PLData_Columns.detach_file(pldata_path)
+    timestamps = [np.array([timestamp for timestamp, _, _ in kept_data])]
+    with open(pldata_path, "wb") as pldata_file:
+        for _, topic, payload in kept_data:
+            pldata_file.write(msgpack.packb((topic, payload), use_bin_type=True))
+        for eye_id in eye_ids:
+            if eye_id in keep_eye_ids:
+                continue
+            for _, _, chunk_name in _consecutive_chunks(data_dir, eye_id):
+                chunk_path = os.path.join(_chunk_dir(data_dir), chunk_name)
+                # pldata files are plain sequences of msgpack-encoded data
+                with open(chunk_path + ".pldata", "rb") as chunk_file:
+                    shutil.copyfileobj(chunk_file, pldata_file)
+                timestamps.append(np.load(chunk_path + "_timestamps.npy"))
+    timestamps_path = os.path.join(data_dir, name + "_timestamps.npy")
+    np.save(timestamps_path, np.concatenate(timestamps))
+
+
+def _load_eye_data(data_dir, name, eye_ids) -> T.List[T.Tuple[float, str, bytes]]:
+    if not eye_ids:
+        return []
+    pldata = fm.load_pldata_file(data_dir, name)
+    if not len(pldata.timestamps):
+        return []
+    is_kept = np.isin(fm.extract_column(pldata.data, "id"), eye_ids)
+    return [
+        (timestamp, topic, datum.serialized)
+        for datum, topic, timestamp, kept in zip(
+            pldata.data, pldata.topics, pldata.timestamps, is_kept
+        )
+        if kept
+    ]
+
+
+def clear_detected_chunks(data_dir, eye_id):
+    pattern = os.path.join(_chunk_dir(data_dir), f"eye{eye_id}_*")
+    for path in glob.glob(pattern):
+        os.remove(path)
+
+
+def detect_pupils(video_path, data_dir, eye_id, roi_settings):
+    """Runs the default pupil detectors of the eye process over an eye video
+
+    Runs headless, i.e. without eye window and without publishing pupil data.
+    Detection results are written to chunk files in `data_dir` instead, starting
+    after the last completed chunk.
+
+    Yields (number of detected frames, total number of frames).
+
+    Args:
+        roi_settings: `Roi` plugin init dict, or None to detect in the full frame
+    """
+    import types
+
+    import video_capture
+    from pupil_detector_plugins import EVENT_KEY, available_detector_plugins
+    from roi import RoiModel
+
+    logger = logging.getLogger(__name__ + " with pid: " + str(os.getpid()))
+
+    cap = video_capture.File_Source(
+        types.SimpleNamespace(), source_path=video_path, fill_gaps=False, timing=None
+    )
+    frame_count = cap.get_frame_count()
+
+    roi_settings = roi_settings or {}
+    roi = RoiModel(roi_settings.get("frame_size", (0, 0)))
+    roi.bounds = roi_settings.get("bounds", (0, 0, 0, 0))
+    g_pool = types.SimpleNamespace(
+        eye_id=eye_id,
+        process=f"eye{eye_id}",
+        display_mode="camera_image",
+        roi=roi,
+    )
+    # same order as in the eye process: the 3d detector reuses the 2d results
+    default_2d, default_3d, _ = available_detector_plugins()
+    detectors = [default_2d(g_pool), default_3d(g_pool)]
+
+    start_frame = next_frame_to_detect(data_dir, eye_id)
+    if start_frame >= frame_count:
+        yield frame_count, frame_count
+        return
+    if start_frame > 0:
+        logger.info(f"Resuming eye{eye_id} pupil detection at frame {start_frame}")
+        cap.seek_to_frame(start_frame)
+
+    chunk_start = start_frame
+    chunk_data = []
+    yield start_frame, frame_count
+
+    while True:
+        try:
+            frame = cap.get_frame()
+        except video_capture.EndofVideoError:
+            break
+
+        roi.frame_size = (frame.width, frame.height)
+        event = {"frame": frame}
+        for detector in detectors:
+            detector.recent_events(event)
+        for result in event.get(EVENT_KEY, ()):
+            chunk_data.append(result)
+
+        detected_frames = frame.index + 1
+        if detected_frames - chunk_start >= CHUNK_LENGTH:
+            _save_chunk(data_dir, eye_id, chunk_start, detected_frames, chunk_data)
+            chunk_start, chunk_data = detected_frames, []
+        if detected_frames % PROGRESS_INTERVAL == 0:
+            yield detected_frames, frame_count
+
+    if chunk_start < frame_count:
+        _save_chunk(data_dir, eye_id, chunk_start, frame_count, chunk_data)
+    yield frame_count, frame_count
+
+
+def _consecutive_chunks(data_dir, eye_id) -> T.List[T.Tuple[int, int, str]]:
+    consecutive_chunks = []
+    next_frame = 0
+    for start_frame, stop_frame, name in detected_chunks(data_dir, eye_id):
+        if start_frame == next_frame:
+            consecutive_chunks.append((start_frame, stop_frame, name))
+            next_frame = stop_frame
+    return consecutive_chunks
+
+
+def _save_chunk(data_dir, eye_id, start_frame, stop_frame, data):
+    directory = _chunk_dir(data_dir)
+    os.makedirs(directory, exist_ok=True)
+    name = _chunk_name(eye_id, start_frame, stop_frame)
+    partial_name = name + "_partial"
+    with fm.PLData_Writer(directory, partial_name) as writer:
+        writer.extend(data)
+    # the chunk is complete once its timestamps file exists, which is moved last
+    os.replace(
+        os.path.join(directory, partial_name + ".pldata"),
+        os.path.join(directory, name + ".pldata"),
+    )
+    os.replace(
+        os.path.join(directory, partial_name + "_timestamps.npy"),
+        os.path.join(directory, name + "_timestamps.npy"),
+    )
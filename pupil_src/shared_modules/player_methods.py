@@ -53,13 +53,20 @@ class Bisector(object):
             self.sorted_idc = []
         else:
             self.data_ts = np.asarray(data_ts)
-            self.data = np.asarray(data, dtype=object)
+            self.data = self._data_array(data)
 
             # Find correct order once and reorder both lists in-place
             self.sorted_idc = np.argsort(self.data_ts)
             self.data_ts = self.data_ts[self.sorted_idc]
             self.data = self.data[self.sorted_idc]
 
+    @staticmethod
+    def _data_array(data):
+        # Columnar pldata stays lazy, see `file_methods.Serialized_Dict_View`
+        if isinstance(data, fm.Serialized_Dict_View):
+            return data
+        return np.asarray(data, dtype=object)
+
     def copy(self):
         copy = type(self)()
         copy.data = self.data.copy()
@@ -108,6 +115,10 @@ class Bisector(object):
     def timestamps(self):
         return self.data_ts
 
+    def column(self, key):
+        """Returns `key` of all data, sorted by timestamp, as numpy array."""
+        return fm.extract_column(self.data, key)
+
     def init_dict_for_window(self, ts_window):
         start_idx, stop_idx = self._start_stop_idc_for_window(ts_window)
         return {
@@ -117,11 +128,30 @@ class Bisector(object):
 
 
 class Mutable_Bisector(Bisector):
+    @staticmethod
+    def _data_array(data):
+        # Mutable data is usually written back to the file it was loaded from
+        if isinstance(data, fm.Serialized_Dict_View):
+            data = data.tolist()
+        return np.asarray(data, dtype=object)
+
     def insert(self, timestamp, datum):
         insert_idx = np.searchsorted(self.data_ts, timestamp)
         self.data_ts = np.insert(self.data_ts, insert_idx, timestamp)
         self.data = np.insert(self.data, insert_idx, datum)
 
+    def insert_many(self, timestamps, data):
+        """Inserts a batch of data at once, avoiding a full copy per datum"""
+        if not len(timestamps):
+            return
+        timestamps = np.asarray(timestamps)
+        data = self._data_array(data)
+        order = np.argsort(timestamps, kind="stable")
+        timestamps, data = timestamps[order], data[order]
+        insert_idc = np.searchsorted(self.data_ts, timestamps)
+        self.data_ts = np.insert(self.data_ts, insert_idc, timestamps)
+        self.data = np.insert(self.data, insert_idc, data)
+
 
 class Affiliator(Bisector):
     """docstring for ClassName"""
@@ -294,7 +324,10 @@ class PupilDataBisector:
 
     @staticmethod
     def combine_bisectors(bisectors: T.Iterable[pm.Bisector]) -> pm.Bisector:
-        data = list(chain.from_iterable(b.data for b in bisectors))
+        bisectors = list(bisectors)
+        data = fm.Serialized_Dict_View.concatenate([b.data for b in bisectors])
+        if data is None:
+            data = list(chain.from_iterable(b.data for b in bisectors))
         data_ts = list(chain.from_iterable(b.data_ts for b in bisectors))
         return pm.Bisector(data, data_ts)
 
@@ -314,6 +347,8 @@ class PupilDataBisector:
     @staticmethod
     def _group_data_by_pupil_topic(data: fm.PLData) -> T.Dict[str, fm.PLData]:
         assert len(data.topics) == len(data.data) == len(data.timestamps)
+        if isinstance(data.data, fm.Serialized_Dict_View):
+            return PupilDataBisector._group_columnar_data_by_pupil_topic(data)
         data_by_topic = collections.defaultdict(lambda: fm.PLData([], [], []))
         for raw_topic, datum, ts in zip(data.topics, data.data, data.timestamps):
             pupil_topic = PupilTopic.create(raw_topic, datum)
@@ -322,6 +357,33 @@ class PupilDataBisector:
             data_by_topic[pupil_topic].topics.append(raw_topic)
         return data_by_topic
 
+    @staticmethod
+    def _group_columnar_data_by_pupil_topic(
+        data: fm.PLData,
+    ) -> T.Dict[str, fm.PLData]:
+        raw_topics = np.asarray(data.topics, dtype=object)
+        timestamps = np.asarray(data.timestamps)
+        idc_by_topic = collections.defaultdict(list)
+        for raw_topic in np.unique(raw_topics):
+            raw_topic_idc = np.flatnonzero(raw_topics == raw_topic)
+            if not PupilTopic._match_regex_v1().match(raw_topic):
+                pupil_topic = PupilTopic.create(raw_topic, {})
+                idc_by_topic[pupil_topic].append(raw_topic_idc)
+                continue
+            # v1 topics require the detection method of each datum
+            methods = fm.extract_column(data.data[raw_topic_idc], "method")
+            for method in np.unique(methods):
+                pupil_topic = PupilTopic.create(raw_topic, {"method": method})
+                idc_by_topic[pupil_topic].append(raw_topic_idc[methods == method])
+
+        data_by_topic = {}
+        for pupil_topic, idc in idc_by_topic.items():
+            idc = np.concatenate(idc)
+            data_by_topic[pupil_topic] = fm.PLData(
+                data.data[idc], timestamps[idc], raw_topics[idc]
+            )
+        return data_by_topic
+
 
 class PupilDataCollector:
     def __init__(self):
@@ -0,0 +1,302 @@
+"""
+(*)~---------------------------------------------------------------------------
+Pupil - eye tracking platform
+Copyright (C) 2012-2020 Pupil Labs
+
+Distributed under the terms of the GNU
+Lesser General Public License (LGPL v3.0).
+See COPYING and COPYING.LESSER for license details.
+---------------------------------------------------------------------------~(*)
+"""
+import bisect
+import collections
+import json
+import logging
+import os
+import time
+import typing as T
+
+logger = logging.getLogger(__name__)
+
+# Upper bin edges of the duration histograms in seconds. The last bin collects
+# all durations above the last edge.
+HISTOGRAM_BIN_EDGES = (0.0001, 0.0003, 0.001, 0.003, 0.01, 0.03, 0.1, 0.3, 1.0)
+
+# Number of most recent measurements kept per plugin hook
+DEFAULT_WINDOW_SIZE = 300
+
+
+def capture_frame_interval(g_pool) -> T.Optional[float]:
+    """Loop budget of capture processes, which need to keep up with their camera"""
+    try:
+        return 1.0 / g_pool.capture.frame_rate
+    except (AttributeError, NotImplementedError, TypeError, ZeroDivisionError):
+        return None
+
+
+class Rolling_Durations:
+    """The most recent durations of a repeatedly measured piece of work"""
+
+    def __init__(self, window_size: int = DEFAULT_WINDOW_SIZE):
+        self._durations = collections.deque(maxlen=window_size)
+        self.total_count = 0
+
+    def __len__(self):
+        return len(self._durations)
+
+    def add(self, duration: float):
+        self._durations.append(duration)
+        self.total_count += 1
+
+    @property
+    def last(self) -> float:
+        return self._durations[-1] if self._durations else 0.0
+
+    @property
+    def mean(self) -> float:
+        return sum(self._durations) / len(self._durations) if self._durations else 0.0
+
+    def summary(self) -> dict:
+        durations = sorted(self._durations)
+        histogram = [0] * (len(HISTOGRAM_BIN_EDGES) + 1)
+        for duration in durations:
+            histogram[bisect.bisect_left(HISTOGRAM_BIN_EDGES, duration)] += 1
+        if not durations:
+            return {"count": 0, "total_count": self.total_count, "histogram": histogram}
+
+        def percentile_ms(percent):
+            idx = min(len(durations) - 1, int(len(durations) * percent / 100))
+            return durations[idx] * 1000
+
+        return {
+            "count": len(durations),
+            "total_count": self.total_count,
+            "mean_ms": self.mean * 1000,
+            "median_ms": percentile_ms(50),
+            "p95_ms": percentile_ms(95),
+            "max_ms": durations[-1] * 1000,
+            "histogram": histogram,
+        }
+
+
+class Chrome_Trace_Writer:
+    """Writes timing events as Chrome trace, viewable in chrome://tracing or Perfetto
+
+    Events are streamed into a JSON array. The array is terminated on `close()`,
+    but trace viewers also accept files of processes that did not shut down.
+    """
+
+    def __init__(self, path: str, process_name: str):
+        self.path = path
+        self._pid = os.getpid()
+        self._file = open(path, "w", encoding="utf-8")
+        self._file.write("[")
+        self._separator = "\n"
+        self._write(
+            {
+                "name": "process_name",
+                "ph": "M",
+                "pid": self._pid,
+                "args": {"name": process_name},
+            }
+        )
+
+    def add_duration(self, name: str, category: str, start: float, end: float):
+        self._write(
+            {
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": start * 1e6,
+                "dur": (end - start) * 1e6,
+                "pid": self._pid,
+                "tid": 0,
+            }
+        )
+
+    def add_counter(self, name: str, timestamp: float, values: T.Dict[str, int]):
+        self._write(
+            {
+                "name": name,
+                "ph": "C",
+                "ts": timestamp * 1e6,
+                "pid": self._pid,
+                "args": values,
+            }
+        )
+
+    def close(self):
+        self._file.write("\n]\n")
+        self._file.close()
+
+    def _write(self, event: dict):
+        self._file.write(self._separator + json.dumps(event))
+        self._separator = ",\n"
+
+
+class Plugin_Timer:
+    """Measures the time plugins spend in their hooks during a process' main loop
+
+    The main loop calls the plugin hooks through the timer instead of directly,
+    and `finish_iteration()` once per loop iteration. The timer keeps rolling
+    statistics of the hook durations per plugin, of the loop iteration durations
+    and of the number of items that plugins add to the events dict. Iterations that
+    exceed the loop budget are attributed to the plugin hook that took the longest.
+
+    The timer answers the following notifications, e.g. sent via Pupil Remote:
+        ``plugin_timing.should_report``: Responds with a ``plugin_timing.report``
+            notification that contains the report of this process. An optional
+            ``process`` field restricts the response to a single process.
+        ``plugin_timing.should_reset``: Clears all statistics.
+        ``plugin_timing.trace.should_start``: Writes all measurements to a Chrome
+            trace file in ``directory``, which defaults to the user directory.
+        ``plugin_timing.trace.should_stop``: Closes the trace file.
+    """
+
+    def __init__(
+        self,
+        process_name: str,
+        notify: T.Callable[[dict], None],
+        trace_dir: str,
+        get_budget: T.Optional[T.Callable[[], T.Optional[float]]] = None,
+        window_size: int = DEFAULT_WINDOW_SIZE,
+        clock: T.Callable[[], float] = time.perf_counter,
+    ):
+        self.process_name = process_name
+        self.trace_dir = trace_dir
+        self._notify = notify
+        self._get_budget = get_budget
+        self._window_size = window_size
+        self._clock = clock
+        self._trace = None
+        self.reset()
+
+    def reset(self):
+        self._hook_durations = collections.defaultdict(
+            lambda: Rolling_Durations(self._window_size)
+        )
+        self._event_sizes = collections.defaultdict(
+            lambda: collections.deque(maxlen=self._window_size)
+        )
+        self.iteration_durations = Rolling_Durations(self._window_size)
+        self.overrun_count = 0
+        self._overrun_culprits = collections.Counter()
+        self._iteration_start = None
+        self._iteration_costs = collections.Counter()
+
+    def on_notify(self, plugins, notification):
+        self._handle_notification(notification)
+        for plugin in plugins:
+            self._call(plugin, "on_notify", notification)
+
+    def recent_events(self, plugins, events):
+        for plugin in plugins:
+            self._call(plugin, "recent_events", events)
+
+        sizes = {
+            key: len(value)
+            for key, value in events.items()
+            if isinstance(value, (list, tuple))
+        }
+        for key, size in sizes.items():
+            self._event_sizes[key].append(size)
+        if self._trace and sizes:
+            self._trace.add_counter("events", self._clock(), sizes)
+
+    def gl_display(self, plugins):
+        for plugin in plugins:
+            self._call(plugin, "gl_display")
+
+    def finish_iteration(self):
+        now = self._clock()
+        if self._iteration_start is not None:
+            duration = now - self._iteration_start
+            self.iteration_durations.add(duration)
+            if self._trace:
+                self._trace.add_duration(
+                    "loop iteration", "loop", self._iteration_start, now
+                )
+            budget = self._get_budget() if self._get_budget else None
+            if budget and duration > budget:
+                self.overrun_count += 1
+                if self._iteration_costs:
+                    culprit, _ = self._iteration_costs.most_common(1)[0]
+                    self._overrun_culprits[culprit] += 1
+        self._iteration_costs.clear()
+        self._iteration_start = now
+
+    def slowest_hooks(self, count: int) -> T.List[T.Tuple[str, str, float]]:
+        """(plugin name, hook name, mean duration) with the highest mean durations"""
+        hooks = [
+            (plugin_name, hook_name, durations.mean)
+            for (plugin_name, hook_name), durations in self._hook_durations.items()
+        ]
+        hooks.sort(key=lambda hook: hook[2], reverse=True)
+        return hooks[:count]
+
+    def report(self) -> dict:
+        plugins = collections.defaultdict(dict)
+        for (plugin_name, hook_name), durations in self._hook_durations.items():
+            plugins[plugin_name][hook_name] = durations.summary()
+        budget = self._get_budget() if self._get_budget else None
+        return {
+            "process": self.process_name,
+            "histogram_bin_edges_ms": [edge * 1000 for edge in HISTOGRAM_BIN_EDGES],
+            "plugins": dict(plugins),
+            "loop": {
+                "budget_ms": budget * 1000 if budget else None,
+                "iterations": self.iteration_durations.summary(),
+                "overrun_count": self.overrun_count,
+                "overrun_culprits": dict(self._overrun_culprits),
+            },
+            "events": {
+                key: {"mean": sum(sizes) / len(sizes), "max": max(sizes)}
+                for key, sizes in self._event_sizes.items()
+                if sizes
+            },
+        }
+
+    def start_trace(self, directory: T.Optional[str] = None):
+        self.stop_trace()
+        path = os.path.join(
+            directory or self.trace_dir,
+            f"plugin_timing_{self.process_name}.trace.json",
+        )
+        try:
+            self._trace = Chrome_Trace_Writer(path, self.process_name)
+        except OSError as err:
+            logger.error(f"Could not start plugin timing trace: {err}")
+        else:
+            logger.info(f"Writing plugin timing trace to {path}")
+
+    def stop_trace(self):
+        if self._trace:
+            self._trace.close()
+            logger.info(f"Saved plugin timing trace to {self._trace.path}")
+            self._trace = None
+
+    def _call(self, plugin, hook_name, *args):
+        start = self._clock()
+        getattr(plugin, hook_name)(*args)
+        end = self._clock()
+
+        plugin_name = plugin.class_name
+        self._hook_durations[plugin_name, hook_name].add(end - start)
+        self._iteration_costs[plugin_name + "." + hook_name] += end - start
+        if self._trace:
+            self._trace.add_duration(plugin_name, hook_name, start, end)
+
+    def _handle_notification(self, notification):
+        subject = notification["subject"]
+        if not subject.startswith("plugin_timing."):
+            return
+        if notification.get("process", self.process_name) != self.process_name:
+            return
+        if subject == "plugin_timing.should_report":
+            self._notify({"subject": "plugin_timing.report", "report": self.report()})
+        elif subject == "plugin_timing.should_reset":
+            self.reset()
+        elif subject == "plugin_timing.trace.should_start":
+            self.start_trace(notification.get("directory"))
+        elif subject == "plugin_timing.trace.should_stop":
+            self.stop_trace()
@@ -23,7 +23,11 @@ class Pupil_Data_Relay(System_Plugin_Base):
         self.gaze_pub = zmq_tools.Msg_Streamer(
             self.g_pool.zmq_ctx, self.g_pool.ipc_pub_url
         )
-        self.pupil_sub = zmq_tools.Msg_Receiver(
+        if self.g_pool.shared_memory_transport:
+            receiver_cls = zmq_tools.Shared_Memory_Msg_Receiver
+        else:
+            receiver_cls = zmq_tools.Msg_Receiver
+        self.pupil_sub = receiver_cls(
             self.g_pool.zmq_ctx, self.g_pool.ipc_sub_url, topics=("pupil",)
         )
 
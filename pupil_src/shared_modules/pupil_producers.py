@@ -13,22 +13,22 @@ import logging
 import os
 import typing as T
 from contextlib import contextmanager
-from itertools import chain
 
 import numpy as np
 import OpenGL.GL as gl
-import zmq
 
+import background_helper as bh
 import data_changed
 import file_methods as fm
 import gl_utils
+import offline_pupil_detection as opd
 import player_methods as pm
 import pyglui.cygl.utils as cygl_utils
-import zmq_tools
 from observable import Observable
 from plugin import System_Plugin_Base
 from pyglui import ui
 from pyglui.pyfontstash import fontstash as fs
+from timeline_pyramid import Timeline_Pyramid_Store, min_max_points
 from video_capture.utils import VideoSet
 
 logger = logging.getLogger(__name__)
@@ -106,6 +106,7 @@ class Pupil_Producer_Base(Observable, System_Plugin_Base):
         )
 
         self.cache = {}
+        self._timeline_pyramids = Timeline_Pyramid_Store(self.g_pool.rec_dir)
         self.cache_pupil_timeline_data(DATA_KEY_DIAMETER, detector_tag="3d")
         self.cache_pupil_timeline_data(
             DATA_KEY_CONFIDENCE,
@@ -162,63 +163,46 @@ class Pupil_Producer_Base(Observable, System_Plugin_Base):
         fallback_detector_tag: T.Optional[str] = None,
     ):
         world_start_stop_ts = [self.g_pool.timestamps[0], self.g_pool.timestamps[-1]]
-        if not self.g_pool.pupil_positions:
-            self.cache[key] = {
-                "left": [],
-                "right": [],
-                "xlim": world_start_stop_ts,
-                "ylim": [0, 1],
-            }
-        else:
-            ts_data_pairs_right_left = [], []
-            for eye_id in (0, 1):
-                pupil_positions = self.g_pool.pupil_positions[eye_id, detector_tag]
-                if not pupil_positions and fallback_detector_tag is not None:
-                    pupil_positions = self.g_pool.pupil_positions[
-                        eye_id, fallback_detector_tag
-                    ]
-                if pupil_positions:
-                    t0, t1 = (
-                        pupil_positions.timestamps[0],
-                        pupil_positions.timestamps[-1],
-                    )
-                    timestamps_target = np.linspace(
-                        t0, t1, NUMBER_SAMPLES_TIMELINE, dtype=np.float32
-                    )
-
-                    data_indeces = pm.find_closest(
-                        pupil_positions.timestamps, timestamps_target
-                    )
-                    data_indeces = np.unique(data_indeces)
-                    for idx in data_indeces:
-                        ts_data_pair = (
-                            pupil_positions.timestamps[idx],
-                            pupil_positions[idx][key],
-                        )
-                        ts_data_pairs_right_left[eye_id].append(ts_data_pair)
-
-            if ylim is None:
-                # max_val must not be 0, else gl will crash
-                all_pupil_data_chained = chain.from_iterable(ts_data_pairs_right_left)
-                try:
-                    # Outlier removal based on:
-                    # https://en.wikipedia.org/wiki/Outlier#Tukey's_fences
-                    min_val, max_val = np.quantile(
-                        [pd[1] for pd in all_pupil_data_chained], [0.25, 0.75]
-                    )
-                    iqr = max_val - min_val
-                    min_val -= 1.5 * iqr
-                    max_val += 1.5 * iqr
-                    ylim = min_val, max_val
-                except IndexError:  # no pupil data available
-                    ylim = 0.0, 1.0
-
-            self.cache[key] = {
-                "right": ts_data_pairs_right_left[0],
-                "left": ts_data_pairs_right_left[1],
-                "xlim": world_start_stop_ts,
-                "ylim": ylim,
-            }
+        pyramids_right_left = [None, None]
+        for eye_id in (0, 1):
+            tag = detector_tag
+            pupil_positions = self.g_pool.pupil_positions[eye_id, tag]
+            if not pupil_positions and fallback_detector_tag is not None:
+                tag = fallback_detector_tag
+                pupil_positions = self.g_pool.pupil_positions[eye_id, tag]
+            if pupil_positions:
+                pyramids_right_left[eye_id] = self._timeline_pyramids.get(
+                    f"pupil_{key}_eye{eye_id}_{type(self).__name__}_{tag}",
+                    pupil_positions.timestamps,
+                    lambda samples: fm.extract_column(pupil_positions[samples], key),
+                )
+
+        if ylim is None:
+            # Statistics of bin means, as the previous per-sample estimate was
+            # based on a fixed number of samples as well
+            values = [
+                pyramid.query(*world_start_stop_ts, NUMBER_SAMPLES_TIMELINE).mean
+                for pyramid in pyramids_right_left
+                if pyramid is not None
+            ]
+            values = np.concatenate(values) if values else np.empty(0)
+            if values.size:
+                # Outlier removal based on:
+                # https://en.wikipedia.org/wiki/Outlier#Tukey's_fences
+                min_val, max_val = np.quantile(values, [0.25, 0.75])
+                iqr = max_val - min_val
+                min_val -= 1.5 * iqr
+                max_val += 1.5 * iqr
+                ylim = min_val, max_val
+            else:  # no pupil data available
+                ylim = 0.0, 1.0
+
+        self.cache[key] = {
+            "right": pyramids_right_left[0],
+            "left": pyramids_right_left[1],
+            "xlim": world_start_stop_ts,
+            "ylim": ylim,
+        }
 
     def draw_pupil_diameter(self, width, height, scale):
         self.draw_pupil_data(DATA_KEY_DIAMETER, width, height, scale)
@@ -227,14 +211,20 @@ class Pupil_Producer_Base(Observable, System_Plugin_Base):
         self.draw_pupil_data(DATA_KEY_CONFIDENCE, width, height, scale)
 
     def draw_pupil_data(self, key, width, height, scale):
-        right = self.cache[key]["right"]
-        left = self.cache[key]["left"]
-
-        with gl_utils.Coord_System(*self.cache[key]["xlim"], *self.cache[key]["ylim"]):
-            cygl_utils.draw_points(
-                right, size=2.0 * scale, color=COLOR_LEGEND_EYE_RIGHT
-            )
-            cygl_utils.draw_points(left, size=2.0 * scale, color=COLOR_LEGEND_EYE_LEFT)
+        xlim = self.cache[key]["xlim"]
+        with gl_utils.Coord_System(*xlim, *self.cache[key]["ylim"]):
+            for side, color in (
+                ("right", COLOR_LEGEND_EYE_RIGHT),
+                ("left", COLOR_LEGEND_EYE_LEFT),
+            ):
+                pyramid = self.cache[key][side]
+                if pyramid is None:
+                    continue
+                # One bin per pixel, independent of the number of samples
+                bins = pyramid.query(*xlim, int(width))
+                cygl_utils.draw_points(
+                    min_max_points(bins), size=2.0 * scale, color=color
+                )
 
     def draw_dia_legend(self, width, height, scale):
         self.draw_legend(self.dia_timeline.label, width, height, scale)
@@ -307,7 +297,12 @@ class Pupil_From_Recording(Pupil_Producer_Base):
 
 
 class Offline_Pupil_Detection(Pupil_Producer_Base):
-    """docstring for Offline_Pupil_Detection"""
+    """Detects pupil positions in the eye videos with background workers
+
+    Each eye video is processed by a headless worker running the default pupil
+    detectors of the eye process. Detected data is written to chunk files, such that
+    paused or interrupted detections resume after the last completed chunk.
+    """
 
     session_data_version = 4
     session_data_name = "offline_pupil"
@@ -324,14 +319,6 @@ class Offline_Pupil_Detection(Pupil_Producer_Base):
         super().__init__(g_pool)
         self._detection_paused = False
 
-        zmq_ctx = zmq.Context()
-        self.data_sub = zmq_tools.Msg_Receiver(
-            zmq_ctx,
-            g_pool.ipc_sub_url,
-            topics=("pupil", "notify.file_source.video_finished"),
-            hwm=100_000,
-        )
-
         self.data_dir = os.path.join(g_pool.rec_dir, "offline_data")
         os.makedirs(self.data_dir, exist_ok=True)
         try:
@@ -345,7 +332,6 @@ class Offline_Pupil_Detection(Pupil_Producer_Base):
 
         self.detection_status = session_meta_data["detection_status"]
 
-        self._pupil_data_store = pm.PupilDataCollector()
         pupil_data_from_cache = pm.PupilDataBisector.load_from_file(
             self.data_dir, self.session_data_name
         )
@@ -354,13 +340,14 @@ class Offline_Pupil_Detection(Pupil_Producer_Base):
         # Start offline pupil detection if not complete yet:
         self.eye_video_loc = [None, None]
         self.eye_frame_num = [0, 0]
+        self.eye_detected_frame_num = [0, 0]
+        self.detection_tasks = [None, None]
 
-        # start processes
         for eye_id in range(2):
             if self.detection_status[eye_id] != "complete":
-                self.start_eye_process(eye_id)
+                self.start_detection_task(eye_id)
 
-    def start_eye_process(self, eye_id):
+    def start_detection_task(self, eye_id):
         potential_locs = [
             os.path.join(self.g_pool.rec_dir, "eye{}{}".format(eye_id, ext))
             for ext in (".mjpeg", ".mp4", ".mkv")
@@ -381,59 +368,84 @@ class Offline_Pupil_Detection(Pupil_Producer_Base):
         video_loc = existing_locs[0]
         n_valid_frames = np.count_nonzero(self.videoset.lookup.container_idx > -1)
         self.eye_frame_num[eye_id] = n_valid_frames
+        self.eye_detected_frame_num[eye_id] = opd.next_frame_to_detect(
+            self.data_dir, eye_id
+        )
 
-        capure_settings = "File_Source", {"source_path": video_loc, "timing": None}
-        self.notify_all(
-            {
-                "subject": "eye_process.should_start",
-                "eye_id": eye_id,
-                "overwrite_cap_settings": capure_settings,
-            }
+        self.detection_tasks[eye_id] = bh.IPC_Logging_Task_Proxy(
+            f"Pupil detection eye{eye_id}",
+            opd.detect_pupils,
+            args=(video_loc, self.data_dir, eye_id, self._roi_settings(eye_id)),
         )
         self.eye_video_loc[eye_id] = video_loc
         self.detection_status[eye_id] = "Detecting..."
 
+    def _roi_settings(self, eye_id):
+        """Roi of the eye process that would have run the detection in Player"""
+        session_settings = fm.Persistent_Dict(
+            os.path.join(self.g_pool.user_dir, f"user_settings_eye{eye_id}")
+        )
+        for name, init_dict in session_settings.get("loaded_plugins", ()):
+            if name == "Roi":
+                return init_dict
+        return None
+
     @property
     def detection_progress(self) -> float:
         total = sum(self.eye_frame_num)
-        # TODO: Figure out the number of frames independent of 3d detection
-        detected = self._pupil_data_store.count_collected(detector_tag="3d")
+        detected = sum(self.eye_detected_frame_num)
         if total:
             return min(detected / total, 1.0,)
         else:
             return 0.0
 
-    def stop_eye_process(self, eye_id):
-        self.notify_all({"subject": "eye_process.should_stop", "eye_id": eye_id})
+    def stop_detection_task(self, eye_id):
+        if self.detection_tasks[eye_id] is not None:
+            self.detection_tasks[eye_id].cancel()
+            self.detection_tasks[eye_id] = None
         self.eye_video_loc[eye_id] = None
 
     def recent_events(self, events):
         super().recent_events(events)
-        while self.data_sub.new_data:
-            topic = self.data_sub.recv_topic()
-            remaining_frames = self.data_sub.recv_remaining_frames()
-            if topic.startswith("pupil."):
-                # pupil data only has one remaining frame
-                payload_serialized = next(remaining_frames)
-                pupil_datum = fm.Serialized_Dict(msgpack_bytes=payload_serialized)
-                assert pm.PupilTopic.match(topic, eye_id=pupil_datum["id"])
-                timestamp = pupil_datum["timestamp"]
-                self._pupil_data_store.append(topic, pupil_datum, timestamp)
-            else:
-                payload = self.data_sub.deserialize_payload(*remaining_frames)
-                if payload["subject"] == "file_source.video_finished":
-                    for eyeid in (0, 1):
-                        if self.eye_video_loc[eyeid] == payload["source_path"]:
-                            logger.debug("eye {} process complete".format(eyeid))
-                            self.detection_status[eyeid] = "complete"
-                            self.stop_eye_process(eyeid)
-                            break
-                    if self.eye_video_loc == [None, None]:
-                        data = self._pupil_data_store.as_pupil_data_bisector()
-                        self.publish_new(pupil_data_bisector=data)
+        for eye_id, task in enumerate(self.detection_tasks):
+            if task is None:
+                continue
+            for detected, total in task.fetch():
+                self.eye_detected_frame_num[eye_id] = detected
+            if task.completed:
+                logger.debug("eye {} detection complete".format(eye_id))
+                self.eye_detected_frame_num[eye_id] = self.eye_frame_num[eye_id]
+                self.detection_status[eye_id] = "complete"
+                self.detection_tasks[eye_id] = None
+                self.eye_video_loc[eye_id] = None
+                if self.eye_video_loc == [None, None]:
+                    self.publish_detected_chunks()
 
         self.menu_icon.indicator_stop = self.detection_progress
 
+    def publish_detected_chunks(self):
+        # Chunks are cleared once merged. Eyes that were complete without chunks
+        # keep their previously detected data, including detections of older
+        # versions that did not write chunks.
+        previously_detected = [
+            eye_id
+            for eye_id in range(2)
+            if self.detection_status[eye_id] == "complete"
+            and not opd.detected_chunks(self.data_dir, eye_id)
+        ]
+        opd.merge_detected_chunks(
+            self.data_dir, self.session_data_name, keep_eye_ids=previously_detected
+        )
+        pupil_data = pm.PupilDataBisector.load_from_file(
+            self.data_dir, self.session_data_name
+        )
+        self.g_pool.pupil_positions = pupil_data
+        self._pupil_changed_announcer.announce_new()
+        logger.debug("pupil positions changed")
+        self.save_offline_meta_data()
+        for eye_id in range(2):
+            opd.clear_detected_chunks(self.data_dir, eye_id)
+
     def publish_existing(self, pupil_data_bisector):
         self.g_pool.pupil_positions = pupil_data_bisector
         self._pupil_changed_announcer.announce_existing()
@@ -444,22 +456,16 @@ class Offline_Pupil_Detection(Pupil_Producer_Base):
         logger.debug("pupil positions changed")
         self.save_offline_data()
 
-    def on_notify(self, notification):
-        super().on_notify(notification)
-        if notification["subject"] == "eye_process.started":
-            pass
-        elif notification["subject"] == "eye_process.stopped":
-            self.eye_video_loc[notification["eye_id"]] = None
-
     def cleanup(self):
-        self.stop_eye_process(0)
-        self.stop_eye_process(1)
-        # close sockets before context is terminated
-        self.data_sub = None
-        self.save_offline_data()
+        self.stop_detection_task(0)
+        self.stop_detection_task(1)
+        self.save_offline_meta_data()
 
     def save_offline_data(self):
         self.g_pool.pupil_positions.save_to_file(self.data_dir, "offline_pupil")
+        self.save_offline_meta_data()
+
+    def save_offline_meta_data(self):
         session_data = {}
         session_data["detection_status"] = self.detection_status
         session_data["version"] = self.session_data_version
@@ -468,22 +474,13 @@ class Offline_Pupil_Detection(Pupil_Producer_Base):
         logger.info("Cached detected pupil data to {}".format(cache_path))
 
     def redetect(self):
-        self._pupil_data_store.clear()
-        self.g_pool.pupil_positions = self._pupil_data_store.as_pupil_data_bisector()
-        self._pupil_changed_announcer.announce_new()
-        self.detection_finished_flag = False
-        self.detection_paused = False
         for eye_id in range(2):
-            if self.eye_video_loc[eye_id] is None:
-                self.start_eye_process(eye_id)
-            else:
-                self.notify_all(
-                    {
-                        "subject": "file_source.seek",
-                        "frame_index": 0,
-                        "source_path": self.eye_video_loc[eye_id],
-                    }
-                )
+            self.stop_detection_task(eye_id)
+            opd.clear_detected_chunks(self.data_dir, eye_id)
+        self.publish_new(pupil_data_bisector=pm.PupilDataBisector())
+        self._detection_paused = False
+        for eye_id in range(2):
+            self.start_detection_task(eye_id)
 
     def init_ui(self):
         super().init_ui()
@@ -522,12 +519,13 @@ class Offline_Pupil_Detection(Pupil_Producer_Base):
 
     @detection_paused.setter
     def detection_paused(self, should_pause):
+        if should_pause == self._detection_paused:
+            return
         self._detection_paused = should_pause
+        # paused detections are canceled and resume from their last completed chunk
         for eye_id in range(2):
-            if self.eye_video_loc[eye_id] is not None:
-                subject = "file_source." + (
-                    "should_pause" if should_pause else "should_play"
-                )
-                self.notify_all(
-                    {"subject": subject, "source_path": self.eye_video_loc[eye_id]}
-                )
+            if should_pause and self.detection_tasks[eye_id] is not None:
+                self.stop_detection_task(eye_id)
+                self.detection_status[eye_id] = "Paused"
+            elif not should_pause and self.detection_status[eye_id] == "Paused":
+                self.start_detection_task(eye_id)
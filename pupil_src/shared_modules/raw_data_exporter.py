@@ -15,15 +15,31 @@ import logging
 import os
 import typing
 
+import numpy as np
 from pyglui import ui
 
 import csv_utils
+import file_methods as fm
 import player_methods as pm
 from plugin import Plugin
 
 # logging
 logger = logging.getLogger(__name__)
 
+# Formats that pupil and gaze positions can be exported in, in addition to csv
+BINARY_EXPORT_FORMATS = {"npy": "NumPy (.npy)", "parquet": "Parquet (.parquet)"}
+
+
+def available_binary_export_formats() -> typing.List[str]:
+    formats = ["npy"]
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        pass
+    else:
+        formats.append("parquet")
+    return formats
+
 
 class Raw_Data_Exporter(Plugin):
     """
@@ -103,6 +119,15 @@ class Raw_Data_Exporter(Plugin):
         gaze_normal1_x - x normal of the visual axis for eye 1 in the world camera coordinate system (not avaible for monocular setups.). The visual axis goes through the eye ball center and the object thats looked at.
         gaze_normal1_y - y normal of the visual axis for eye 1
         gaze_normal1_z - z normal of the visual axis for eye 1
+
+
+    pupil_positions.npy, gaze_positions.npy (optional)
+        Same columns as the csv files, as structured numpy array. Load with
+        `numpy.load(path, mmap_mode="r")` to memory-map the file. Missing numeric
+        values are NaN.
+
+    pupil_positions.parquet, gaze_positions.parquet (optional)
+        Same columns as the csv files, as Apache Parquet table.
         """
 
     icon_chr = chr(0xE873)
@@ -114,11 +139,15 @@ class Raw_Data_Exporter(Plugin):
         should_export_pupil_positions=True,
         should_export_field_info=True,
         should_export_gaze_positions=True,
+        binary_export_format=None,
     ):
         super().__init__(g_pool)
         self.should_export_pupil_positions = should_export_pupil_positions
         self.should_export_field_info = should_export_field_info
         self.should_export_gaze_positions = should_export_gaze_positions
+        if binary_export_format not in available_binary_export_formats():
+            binary_export_format = None
+        self.binary_export_format = binary_export_format
 
     def init_ui(self):
         self.add_menu()
@@ -146,6 +175,16 @@ class Raw_Data_Exporter(Plugin):
                 "should_export_gaze_positions", self, label="Export Gaze Positions"
             )
         )
+        binary_formats = [None, *available_binary_export_formats()]
+        self.menu.append(
+            ui.Selector(
+                "binary_export_format",
+                self,
+                selection=binary_formats,
+                labels=[BINARY_EXPORT_FORMATS.get(f, "None") for f in binary_formats],
+                label="Binary Format",
+            )
+        )
         self.menu.append(
             ui.Info_Text("Press the export button or type 'e' to start the export.")
         )
@@ -165,6 +204,7 @@ class Raw_Data_Exporter(Plugin):
                 timestamps=self.g_pool.timestamps,
                 export_window=export_window,
                 export_dir=export_dir,
+                binary_format=self.binary_export_format,
             )
 
         if self.should_export_gaze_positions:
@@ -174,6 +214,7 @@ class Raw_Data_Exporter(Plugin):
                 timestamps=self.g_pool.timestamps,
                 export_window=export_window,
                 export_dir=export_dir,
+                binary_format=self.binary_export_format,
             )
 
         if self.should_export_field_info:
@@ -183,7 +224,57 @@ class Raw_Data_Exporter(Plugin):
                 info_file.write(self.__doc__)
 
 
+def _float_columns(
+    data, fields: typing.Dict[str, typing.Tuple]
+) -> typing.Dict[str, np.ndarray]:
+    """Extracts numeric fields of all data as float arrays, NaN where missing
+
+    `fields` maps labels to key paths into the datum, e.g. `("ellipse", "axes", 0)`.
+    Fields of the columnar pldata index are read without deserializing the data;
+    all other fields are collected in a single pass over the data.
+    """
+    columns = {}
+    nested_fields = {}
+    for label, path in fields.items():
+        key, components = path[0], path[1:]
+        if (
+            isinstance(data, fm.Serialized_Dict_View)
+            and data.has_column(key)
+            and all(isinstance(component, int) for component in components)
+        ):
+            column = data.column(key)
+            columns[label] = column[(slice(None), *components)].astype(np.float64)
+        else:
+            nested_fields[label] = path
+
+    if nested_fields:
+        values = {label: [] for label in nested_fields}
+        for datum in data:
+            for label, path in nested_fields.items():
+                try:
+                    value = datum
+                    for key in path:
+                        value = value[key]
+                    value = float(value)
+                except (KeyError, IndexError, TypeError, ValueError):
+                    value = np.nan
+                values[label].append(value)
+        for label, column_values in values.items():
+            columns[label] = np.array(column_values, dtype=np.float64)
+    return columns
+
+
+def _object_column(data, key) -> np.ndarray:
+    """`key` of all data as object array, None where missing"""
+    if isinstance(data, fm.Serialized_Dict_View) and data.has_column(key):
+        return data.column(key)
+    return np.array([datum.get(key, None) for datum in data], dtype=object)
+
+
 class _Base_Positions_Exporter(abc.ABC):
+    # Numeric columns that are exported as integers if they have no missing values
+    _integer_labels = ("world_index",)
+
     @classmethod
     @abc.abstractmethod
     def csv_export_filename(cls) -> str:
@@ -201,28 +292,140 @@ class _Base_Positions_Exporter(abc.ABC):
     ) -> dict:
         pass
 
+    @classmethod
+    @abc.abstractmethod
+    def column_export(
+        cls, data, world_indices: np.ndarray
+    ) -> typing.Dict[str, np.ndarray]:
+        """Same values as `dict_export()` for all data, as columns per label
+
+        Missing numeric values are NaN, missing strings are None.
+        """
+        pass
+
     def csv_export_write(
-        self, positions_bisector, timestamps, export_window, export_dir
+        self,
+        positions_bisector,
+        timestamps,
+        export_window,
+        export_dir,
+        binary_format: typing.Optional[str] = None,
     ):
         export_file = type(self).csv_export_filename()
         export_path = os.path.join(export_dir, export_file)
 
         export_section = positions_bisector.init_dict_for_window(export_window)
         export_world_idc = pm.find_closest(timestamps, export_section["data_ts"])
-
+        columns = type(self).column_export(export_section["data"], export_world_idc)
+        for label in type(self)._integer_labels:
+            column = columns[label]
+            if column.dtype.kind == "f" and not np.isnan(column).any():
+                columns[label] = column.astype(np.int64)
+
+        csv_header = type(self).csv_export_labels()
+        csv_columns = [self._csv_column(label, columns[label]) for label in csv_header]
         with open(export_path, "w", encoding="utf-8", newline="") as csvfile:
-            csv_header = type(self).csv_export_labels()
-            dict_writer = csv.DictWriter(csvfile, fieldnames=csv_header)
-            dict_writer.writeheader()
+            csv_writer = csv.writer(csvfile)
+            csv_writer.writerow(csv_header)
+            csv_writer.writerows(zip(*csv_columns))
+
+        logger.info(f"Created '{export_file}' file.")
+
+        if binary_format is not None:
+            self.binary_export_write(columns, export_dir, binary_format)
 
-            for g, idx in zip(export_section["data"], export_world_idc):
-                dict_row = type(self).dict_export(raw_value=g, world_index=idx)
-                dict_writer.writerow(dict_row)
+    def binary_export_write(
+        self, columns: typing.Dict[str, np.ndarray], export_dir, binary_format: str
+    ):
+        labels = type(self).csv_export_labels()
+        export_name = os.path.splitext(type(self).csv_export_filename())[0]
+        if binary_format == "npy":
+            export_file = export_name + ".npy"
+            table = self._structured_array(labels, columns)
+            np.save(os.path.join(export_dir, export_file), table)
+        elif binary_format == "parquet":
+            import pyarrow
+            import pyarrow.parquet
+
+            export_file = export_name + ".parquet"
+            table = pyarrow.table({label: columns[label] for label in labels})
+            pyarrow.parquet.write_table(table, os.path.join(export_dir, export_file))
+        else:
+            raise ValueError(f"Unknown binary export format: {binary_format}")
 
         logger.info(f"Created '{export_file}' file.")
 
+    @classmethod
+    def _csv_column(cls, label, column: np.ndarray) -> list:
+        # csv.writer formats floats like `str()`, and None as empty cell
+        values = column.tolist()
+        if column.dtype.kind != "f":
+            return values
+        if label in cls._integer_labels:
+            return [None if value != value else int(value) for value in values]
+        return [None if value != value else value for value in values]
+
+    @staticmethod
+    def _structured_array(labels, columns: typing.Dict[str, np.ndarray]):
+        # Strings are stored with fixed width, such that the file can be memory-mapped
+        columns = {
+            label: np.array(
+                ["" if v is None else str(v) for v in columns[label].tolist()],
+                dtype=str,
+            )
+            if columns[label].dtype == object
+            else columns[label]
+            for label in labels
+        }
+        dtype = [(label, columns[label].dtype) for label in labels]
+        length = len(columns[labels[0]]) if labels else 0
+        table = np.empty(length, dtype=dtype)
+        for label in labels:
+            table[label] = columns[label]
+        return table
+
 
 class Pupil_Positions_Exporter(_Base_Positions_Exporter):
+    _integer_labels = ("world_index", "eye_id", "model_id")
+
+    _float_fields = {
+        # 2d data
+        "pupil_timestamp": ("timestamp",),
+        "eye_id": ("id",),
+        "confidence": ("confidence",),
+        "norm_pos_x": ("norm_pos", 0),
+        "norm_pos_y": ("norm_pos", 1),
+        "diameter": ("diameter",),
+        # ellipse data
+        "ellipse_center_x": ("ellipse", "center", 0),
+        "ellipse_center_y": ("ellipse", "center", 1),
+        "ellipse_axis_a": ("ellipse", "axes", 0),
+        "ellipse_axis_b": ("ellipse", "axes", 1),
+        "ellipse_angle": ("ellipse", "angle"),
+        # 3d data
+        "diameter_3d": ("diameter_3d",),
+        "model_confidence": ("model_confidence",),
+        "model_id": ("model_id",),
+        "sphere_center_x": ("sphere", "center", 0),
+        "sphere_center_y": ("sphere", "center", 1),
+        "sphere_center_z": ("sphere", "center", 2),
+        "sphere_radius": ("sphere", "radius"),
+        "circle_3d_center_x": ("circle_3d", "center", 0),
+        "circle_3d_center_y": ("circle_3d", "center", 1),
+        "circle_3d_center_z": ("circle_3d", "center", 2),
+        "circle_3d_normal_x": ("circle_3d", "normal", 0),
+        "circle_3d_normal_y": ("circle_3d", "normal", 1),
+        "circle_3d_normal_z": ("circle_3d", "normal", 2),
+        "circle_3d_radius": ("circle_3d", "radius"),
+        "theta": ("theta",),
+        "phi": ("phi",),
+        "projected_sphere_center_x": ("projected_sphere", "center", 0),
+        "projected_sphere_center_y": ("projected_sphere", "center", 1),
+        "projected_sphere_axis_a": ("projected_sphere", "axes", 0),
+        "projected_sphere_axis_b": ("projected_sphere", "axes", 1),
+        "projected_sphere_angle": ("projected_sphere", "angle"),
+    }
+
     @classmethod
     def csv_export_filename(cls) -> str:
         return "pupil_positions.csv"
@@ -362,8 +565,42 @@ class Pupil_Positions_Exporter(_Base_Positions_Exporter):
             "projected_sphere_angle": projected_sphere_angle,
         }
 
+    @classmethod
+    def column_export(
+        cls, data, world_indices: np.ndarray
+    ) -> typing.Dict[str, np.ndarray]:
+        columns = _float_columns(data, cls._float_fields)
+        columns["world_index"] = np.asarray(world_indices)
+        columns["method"] = _object_column(data, "method")
+        return columns
+
 
 class Gaze_Positions_Exporter(_Base_Positions_Exporter):
+    _float_fields = {
+        "gaze_timestamp": ("timestamp",),
+        "confidence": ("confidence",),
+        "norm_pos_x": ("norm_pos", 0),
+        "norm_pos_y": ("norm_pos", 1),
+        "gaze_point_3d_x": ("gaze_point_3d", 0),
+        "gaze_point_3d_y": ("gaze_point_3d", 1),
+        "gaze_point_3d_z": ("gaze_point_3d", 2),
+    }
+
+    _eye_vector_labels = (
+        "eye_center0_3d_x",
+        "eye_center0_3d_y",
+        "eye_center0_3d_z",
+        "gaze_normal0_x",
+        "gaze_normal0_y",
+        "gaze_normal0_z",
+        "eye_center1_3d_x",
+        "eye_center1_3d_y",
+        "eye_center1_3d_z",
+        "gaze_normal1_x",
+        "gaze_normal1_y",
+        "gaze_normal1_z",
+    )
+
     @classmethod
     def csv_export_filename(cls) -> str:
         return "gaze_positions.csv"
@@ -402,49 +639,22 @@ class Gaze_Positions_Exporter(_Base_Positions_Exporter):
         gaze_timestamp = str(raw_value["timestamp"])
         confidence = raw_value["confidence"]
         norm_pos = raw_value["norm_pos"]
-        base_data = None
+        base_data = cls._base_data_export(raw_value)
         gaze_points_3d = [None, None, None]
         eye_centers0_3d = [None, None, None]
         eye_centers1_3d = [None, None, None]
         gaze_normals0_3d = [None, None, None]
         gaze_normals1_3d = [None, None, None]
 
-        if raw_value.get("base_data", None) is not None:
-            base_data = raw_value["base_data"]
-            base_data = " ".join(
-                "{}-{}".format(b["timestamp"], b["id"]) for b in base_data
-            )
-
         # add 3d data if avaiblable
         if raw_value.get("gaze_point_3d", None) is not None:
             gaze_points_3d = raw_value["gaze_point_3d"]
-            # binocular
-            if raw_value.get("eye_centers_3d", None) is not None:
-                eye_centers0_3d = raw_value["eye_centers_3d"].get(0, [None, None, None])
-                eye_centers1_3d = raw_value["eye_centers_3d"].get(1, [None, None, None])
-                #
-                gaze_normals0_3d = raw_value["gaze_normals_3d"].get(
-                    0, [None, None, None]
-                )
-                gaze_normals1_3d = raw_value["gaze_normals_3d"].get(
-                    1, [None, None, None]
-                )
-            # monocular
-            elif raw_value.get("eye_center_3d", None) is not None:
-                try:
-                    eye_id = raw_value["base_data"][0]["id"]
-                except (KeyError, IndexError):
-                    logger.warning(
-                        f"Unexpected raw base_data for monocular gaze!"
-                        f" Data: {raw_value.get('base_data', None)}"
-                    )
-                else:
-                    if str(eye_id) == "0":
-                        eye_centers0_3d = raw_value["eye_center_3d"]
-                        gaze_normals0_3d = raw_value["gaze_normal_3d"]
-                    elif str(eye_id) == "1":
-                        eye_centers1_3d = raw_value["eye_center_3d"]
-                        gaze_normals1_3d = raw_value["gaze_normal_3d"]
+            (
+                eye_centers0_3d,
+                gaze_normals0_3d,
+                eye_centers1_3d,
+                gaze_normals1_3d,
+            ) = cls._eye_vectors_export(raw_value)
 
         return {
             "gaze_timestamp": gaze_timestamp,
@@ -469,3 +679,72 @@ class Gaze_Positions_Exporter(_Base_Positions_Exporter):
             "gaze_normal1_y": gaze_normals1_3d[1],
             "gaze_normal1_z": gaze_normals1_3d[2],
         }
+
+    @classmethod
+    def column_export(
+        cls, data, world_indices: np.ndarray
+    ) -> typing.Dict[str, np.ndarray]:
+        columns = _float_columns(data, cls._float_fields)
+        columns["world_index"] = np.asarray(world_indices)
+
+        # Nested fields are not part of the columnar pldata index
+        base_data = []
+        eye_vectors = []
+        for raw_value in data:
+            base_data.append(cls._base_data_export(raw_value))
+            if raw_value.get("gaze_point_3d", None) is not None:
+                eye_vectors.append(
+                    [v for vector in cls._eye_vectors_export(raw_value) for v in vector]
+                )
+            else:
+                eye_vectors.append([None] * len(cls._eye_vector_labels))
+        columns["base_data"] = np.array(base_data, dtype=object)
+        # None is converted to NaN
+        eye_vectors = np.array(eye_vectors, dtype=np.float64).reshape(
+            -1, len(cls._eye_vector_labels)
+        )
+        for label, column in zip(cls._eye_vector_labels, eye_vectors.T):
+            columns[label] = column
+        return columns
+
+    @staticmethod
+    def _base_data_export(raw_value) -> typing.Optional[str]:
+        if raw_value.get("base_data", None) is None:
+            return None
+        return " ".join(
+            "{}-{}".format(b["timestamp"], b["id"]) for b in raw_value["base_data"]
+        )
+
+    @staticmethod
+    def _eye_vectors_export(raw_value) -> typing.Tuple[typing.Sequence, ...]:
+        """Eye center 0, gaze normal 0, eye center 1 and gaze normal 1 of 3d gaze"""
+        eye_centers0_3d = [None, None, None]
+        eye_centers1_3d = [None, None, None]
+        gaze_normals0_3d = [None, None, None]
+        gaze_normals1_3d = [None, None, None]
+
+        # binocular
+        if raw_value.get("eye_centers_3d", None) is not None:
+            eye_centers0_3d = raw_value["eye_centers_3d"].get(0, [None, None, None])
+            eye_centers1_3d = raw_value["eye_centers_3d"].get(1, [None, None, None])
+            #
+            gaze_normals0_3d = raw_value["gaze_normals_3d"].get(0, [None, None, None])
+            gaze_normals1_3d = raw_value["gaze_normals_3d"].get(1, [None, None, None])
+        # monocular
+        elif raw_value.get("eye_center_3d", None) is not None:
+            try:
+                eye_id = raw_value["base_data"][0]["id"]
+            except (KeyError, IndexError):
+                logger.warning(
+                    f"Unexpected raw base_data for monocular gaze!"
+                    f" Data: {raw_value.get('base_data', None)}"
+                )
+            else:
+                if str(eye_id) == "0":
+                    eye_centers0_3d = raw_value["eye_center_3d"]
+                    gaze_normals0_3d = raw_value["gaze_normal_3d"]
+                elif str(eye_id) == "1":
+                    eye_centers1_3d = raw_value["eye_center_3d"]
+                    gaze_normals1_3d = raw_value["gaze_normal_3d"]
+
+        return eye_centers0_3d, gaze_normals0_3d, eye_centers1_3d, gaze_normals1_3d
@@ -26,6 +26,7 @@ import csv_utils
 from av_writer import MPEG_Writer, JPEG_Writer, NonMonotonicTimestampError
 from file_methods import PLData_Writer, load_object
 from methods import get_system_info, timer
+from threaded_writer import Threaded_Writer
 from video_capture.ndsi_backend import NDSI_Source
 
 from pupil_recording.info import Version
@@ -59,6 +60,12 @@ class Recorder(System_Plugin_Base):
     icon_font = "pupil_icons"
     warning_low_disk_space_th = 5.0  # threshold in GB
     stop_rec_low_disk_space_th = 1.0  # threshold in GB
+    # pldata is never dropped, the world process blocks if the pldata queue is full
+    pldata_queue_size = 1000
+    # world frames are dropped if the video queue is full
+    video_queue_size = 120
+    fsync_interval = 5.0  # seconds
+    writer_stats_interval = 5.0  # seconds
 
     def __init__(
         self,
@@ -247,12 +254,9 @@ class Recorder(System_Plugin_Base):
                 notification["timestamp"] = self.g_pool.get_timestamp()
             # else:
             notification["topic"] = "notify." + notification["subject"]
-            try:
-                writer = self.pldata_writers["notify"]
-            except KeyError:
-                writer = PLData_Writer(self.rec_path, "notify")
-                self.pldata_writers["notify"] = writer
-            writer.append(notification)
+            self.pldata_writer_thread.put(
+                ("notify", [PLData_Writer.serialize(notification)])
+            )
 
         elif notification["subject"] == "recording.should_start":
             if self.running:
@@ -311,6 +315,7 @@ class Recorder(System_Plugin_Base):
             return
 
         self.pldata_writers = {}
+        # number of world frames written, only updated by the video writer thread
         self.frame_count = 0
         self.running = True
         self.menu.read_only = True
@@ -373,6 +378,25 @@ class Recorder(System_Plugin_Base):
 
         self.pldata_writers["notify"] = writer
 
+        # self.pldata_writers and self.writer are only used by the writer threads
+        # until the recording is stopped
+        self.pldata_writer_thread = Threaded_Writer(
+            "pldata writer",
+            self._write_pldata,
+            max_queue_size=self.pldata_queue_size,
+            flush=self._flush_pldata,
+            flush_interval=self.fsync_interval,
+        )
+        self.video_writer_thread = Threaded_Writer(
+            "world video writer",
+            self._write_video_frame,
+            max_queue_size=self.video_queue_size,
+            drop_when_full=True,
+        )
+        writer_stats_timer = timer(self.writer_stats_interval)
+        self.check_writer_stats = lambda: next(writer_stats_timer)
+        self.reported_dropped_frames = 0
+
         if self.show_info_menu:
             self.open_info_menu()
         logger.info("Started Recording.")
@@ -441,34 +465,93 @@ class Recorder(System_Plugin_Base):
         if self.running:
             for key, data in events.items():
                 if key not in ("dt", "depth_frame") and not key.startswith("frame"):
-                    try:
-                        writer = self.pldata_writers[key]
-                    except KeyError:
-                        writer = PLData_Writer(self.rec_path, key)
-                        self.pldata_writers[key] = writer
-                    writer.extend(data)
+                    # serialize here, plugins may modify the data after this call
+                    serialized = [PLData_Writer.serialize(datum) for datum in data]
+                    self.pldata_writer_thread.put((key, serialized))
             if "frame" in events:
-                frame = events["frame"]
-                try:
-                    self.writer.write_video_frame(frame)
-                    self.frame_count += 1
-                except NonMonotonicTimestampError as e:
-                    logger.error(
-                        "Recorder received non-monotonic timestamp!"
-                        " Stopping the recording!"
-                    )
-                    logger.debug(str(e))
-                    self.notify_all({"subject": "recording.should_stop"})
-                    self.notify_all(
-                        {"subject": "recording.should_stop", "remote_notify": "all"}
-                    )
+                self.video_writer_thread.put(events["frame"])
+            self._check_writer_threads()
             # # cv2.putText(frame.img, "Frame %s"%self.frame_count,(200,200), cv2.FONT_HERSHEY_SIMPLEX,1,(255,100,100))
 
             self.button.status_text = self.get_rec_time_str()
 
+    def _write_pldata(self, item):
+        key, serialized = item
+        try:
+            writer = self.pldata_writers[key]
+        except KeyError:
+            writer = PLData_Writer(self.rec_path, key)
+            self.pldata_writers[key] = writer
+        for args in serialized:
+            writer.append_serialized(*args)
+
+    def _write_video_frame(self, frame):
+        self.writer.write_video_frame(frame)
+        self.frame_count += 1
+
+    def _flush_pldata(self):
+        for writer in self.pldata_writers.values():
+            writer.flush(fsync=True)
+
+    def _check_writer_threads(self):
+        error = self.video_writer_thread.pop_error()
+        if isinstance(error, NonMonotonicTimestampError):
+            logger.error(
+                "Recorder received non-monotonic timestamp! Stopping the recording!"
+            )
+            logger.debug(str(error))
+            self.notify_all({"subject": "recording.should_stop"})
+            self.notify_all(
+                {"subject": "recording.should_stop", "remote_notify": "all"}
+            )
+        elif error is not None:
+            raise error
+
+        error = self.pldata_writer_thread.pop_error()
+        if error is not None:
+            raise error
+
+        if self.check_writer_stats():
+            self._notify_writer_stats()
+
+    def _notify_writer_stats(self):
+        """Reports I/O pressure of the writer threads
+
+        Emits notifications:
+            ``recording.writer_stats``: queue depth, write latency (seconds), number
+            of written and dropped items, and time spent blocked on a full queue
+            (seconds) of the `pldata` and `world_video` writer threads.
+        """
+        pldata_stats = self.pldata_writer_thread.stats()
+        video_stats = self.video_writer_thread.stats()
+        if video_stats.dropped > self.reported_dropped_frames:
+            logger.warning(
+                "Disk too slow for recording, dropped "
+                f"{video_stats.dropped - self.reported_dropped_frames} world frames"
+            )
+            self.reported_dropped_frames = video_stats.dropped
+        self.notify_all(
+            {
+                "subject": "recording.writer_stats",
+                "pldata": pldata_stats.as_dict(),
+                "world_video": video_stats.as_dict(),
+            }
+        )
+
     def stop(self):
         duration_s = self.g_pool.get_timestamp() - self.meta_info.start_time_synced_s
 
+        # write everything queued before closing the writers
+        self.video_writer_thread.close()
+        self.pldata_writer_thread.close()
+        for writer_thread in (self.video_writer_thread, self.pldata_writer_thread):
+            error = writer_thread.pop_error()
+            if error is not None:
+                logger.error(f"{writer_thread.name} failed: {error!r}")
+        dropped_frames = self.video_writer_thread.stats().dropped
+        if dropped_frames:
+            logger.warning(f"Dropped {dropped_frames} world frames during recording")
+
         # explicit release of VideoWriter
         try:
             self.writer.release()
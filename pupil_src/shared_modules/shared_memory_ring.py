@@ -0,0 +1,149 @@
+"""
+(*)~---------------------------------------------------------------------------
+Pupil - eye tracking platform
+Copyright (C) 2012-2020 Pupil Labs
+
+Distributed under the terms of the GNU
+Lesser General Public License (LGPL v3.0).
+See COPYING and COPYING.LESSER for license details.
+---------------------------------------------------------------------------~(*)
+"""
+import collections
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import typing as T
+
+logger = logging.getLogger(__name__)
+
+# Sequence number and frame count of a record. Sequence number 0 marks records
+# that are being written or were overwritten.
+RECORD_HEADER = struct.Struct("<QI")
+FRAME_LENGTH = struct.Struct("<Q")
+
+DEFAULT_CAPACITY = 64 * 1024 ** 2
+
+_Record = collections.namedtuple("_Record", ["offset", "size"])
+
+
+def default_directory() -> str:
+    """Directory of the ring files, memory backed on Linux"""
+    if os.path.isdir("/dev/shm"):
+        return "/dev/shm"
+    return tempfile.gettempdir()
+
+
+def _byte_view(frame) -> memoryview:
+    view = memoryview(frame)
+    if not view.c_contiguous:
+        view = memoryview(view.tobytes())
+    return view.cast("B")
+
+
+class Shared_Memory_Ring_Writer:
+    """Writes multi-frame records into a memory mapped ring buffer
+
+    Records are identified by their offset and sequence number. Readers in other
+    processes can access a record until the writer wraps around and overwrites it.
+    The headers of records are invalidated before their memory is reused, such that
+    readers can detect overwritten records.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, directory=None, prefix="pupil"):
+        fd, self.path = tempfile.mkstemp(
+            prefix=prefix + "_", suffix=".ring", dir=directory or default_directory()
+        )
+        try:
+            os.ftruncate(fd, capacity)
+            self._mmap = mmap.mmap(fd, capacity)
+        finally:
+            os.close(fd)
+        self.capacity = capacity
+        # Larger records are sent inline to avoid evicting many small records
+        self.max_record_size = capacity // 4
+        self._head = 0
+        self._sequence = 0
+        self._records = collections.deque()
+
+    def write(self, frames) -> T.Optional[T.Tuple[int, int]]:
+        """Stores frames and returns (offset, sequence) or None if they do not fit"""
+        views = [_byte_view(frame) for frame in frames]
+        size = RECORD_HEADER.size + sum(FRAME_LENGTH.size + len(v) for v in views)
+        if size > self.max_record_size:
+            return None
+
+        if self._head + size > self.capacity:
+            # Records of the tail of the buffer are older than the ones at its start
+            while self._records and self._records[0].offset >= self._head:
+                self._invalidate(self._records.popleft())
+            self._head = 0
+        offset = self._head
+        # The oldest records start at the head, unless the buffer did not wrap yet
+        while self._records and offset <= self._records[0].offset < offset + size:
+            self._invalidate(self._records.popleft())
+
+        RECORD_HEADER.pack_into(self._mmap, offset, 0, len(views))
+        position = offset + RECORD_HEADER.size
+        for view in views:
+            FRAME_LENGTH.pack_into(self._mmap, position, len(view))
+            position += FRAME_LENGTH.size
+            self._mmap[position : position + len(view)] = view
+            position += len(view)
+        self._sequence += 1
+        RECORD_HEADER.pack_into(self._mmap, offset, self._sequence, len(views))
+
+        self._records.append(_Record(offset, size))
+        self._head = offset + size
+        return offset, self._sequence
+
+    def close(self):
+        self._mmap.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            logger.debug(f"Could not remove {self.path}")
+
+    def _invalidate(self, record):
+        RECORD_HEADER.pack_into(self._mmap, record.offset, 0, 0)
+
+
+class Shared_Memory_Ring_Reader:
+    """Reads records of a ring buffer written by another process without copying"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as ring_file:
+            self._mmap = mmap.mmap(ring_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+
+    def read(self, offset, sequence) -> T.Optional[T.List[memoryview]]:
+        """Views of the frames of a record or None if it was overwritten already
+
+        The views stay valid until the writer overwrites the record, which can be
+        checked with `is_valid()`.
+        """
+        if not self.is_valid(offset, sequence):
+            return None
+        _, frame_count = RECORD_HEADER.unpack_from(self._mmap, offset)
+        frames = []
+        position = offset + RECORD_HEADER.size
+        for _ in range(frame_count):
+            (length,) = FRAME_LENGTH.unpack_from(self._mmap, position)
+            position += FRAME_LENGTH.size
+            frames.append(self._view[position : position + length])
+            position += length
+        return frames
+
+    def is_valid(self, offset, sequence) -> bool:
+        return RECORD_HEADER.unpack_from(self._mmap, offset)[0] == sequence
+
+    def close(self):
+        self._view.release()
+        try:
+            self._mmap.close()
+        except BufferError:
+            # Frames that were handed out still reference the buffer. It is
+            # released once they are garbage collected.
+            pass
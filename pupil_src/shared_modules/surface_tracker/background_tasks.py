@@ -9,8 +9,8 @@ See COPYING and COPYING.LESSER for license details.
 ---------------------------------------------------------------------------~(*)
 """
 
+import bisect
 import csv
-import itertools
 import logging
 import os
 import types
@@ -20,12 +20,16 @@ import cv2
 import background_helper
 import player_methods
 
+from .heatmap_accumulator import Heatmap_Accumulator
+
 logger = logging.getLogger(__name__)
 
 
 def background_video_processor(
     video_file_path, callable, visited_list, seek_idx, mp_context
 ):
+    # Only send whether frames were visited, not the cached results themselves
+    visited_list = [x is not None for x in visited_list]
     return background_helper.IPC_Logging_Task_Proxy(
         "Background Video Processor",
         video_processing_generator,
@@ -34,6 +38,86 @@ def background_video_processor(
     )
 
 
+def sharded_background_video_processor(
+    video_file_path, callable, visited_list, seek_idx, mp_context, shard_count
+):
+    return Sharded_Video_Processor(
+        video_file_path, callable, visited_list, seek_idx, mp_context, shard_count
+    )
+
+
+class Sharded_Video_Processor:
+    """Processes a video in parallel, split into consecutive frame ranges
+
+    Each shard runs `video_processing_generator()` in its own process, skipping
+    all frames outside of its range. Results are returned in any order.
+
+    Offers the same interface as `background_helper.Task_Proxy`. Seek requests
+    via `seek_idx` are forwarded to the shard that contains the requested frame
+    on every `fetch()`.
+    """
+
+    def __init__(
+        self, video_file_path, callable, visited_list, seek_idx, mp_context, shard_count
+    ):
+        visited_list = [x is not None for x in visited_list]
+        frame_count = len(visited_list)
+        shard_count = max(1, min(shard_count, frame_count))
+
+        self._seek_idx = seek_idx
+        self._shard_starts = [
+            frame_count * shard // shard_count for shard in range(shard_count)
+        ]
+        self._shard_seek_idc = []
+        self._shards = []
+        for shard, start in enumerate(self._shard_starts):
+            stop = frame_count * (shard + 1) // shard_count
+            shard_visited_list = [True] * frame_count
+            shard_visited_list[start:stop] = visited_list[start:stop]
+            if all(shard_visited_list[start:stop]):
+                self._shard_seek_idc.append(None)
+                self._shards.append(None)
+                continue
+            shard_seek_idx = mp_context.Value("i", start)
+            self._shard_seek_idc.append(shard_seek_idx)
+            self._shards.append(
+                background_helper.IPC_Logging_Task_Proxy(
+                    f"Background Video Processor {shard + 1}/{shard_count}",
+                    video_processing_generator,
+                    (video_file_path, callable, shard_seek_idx, shard_visited_list),
+                    context=mp_context,
+                )
+            )
+
+    def _forward_seek_request(self):
+        seek_idx = self._seek_idx.value
+        if seek_idx == -1:
+            return
+        self._seek_idx.value = -1
+        shard = max(bisect.bisect_right(self._shard_starts, seek_idx) - 1, 0)
+        if self._shards[shard] is not None and not self._shards[shard].completed:
+            self._shard_seek_idc[shard].value = seek_idx
+
+    def fetch(self):
+        self._forward_seek_request()
+        for shard in self._shards:
+            if shard is not None:
+                yield from shard.fetch()
+
+    def cancel(self, timeout=1):
+        for shard in self._shards:
+            if shard is not None:
+                shard.cancel(timeout)
+
+    @property
+    def completed(self):
+        return all(shard is None or shard.completed for shard in self._shards)
+
+    @property
+    def canceled(self):
+        return any(shard is not None and shard.canceled for shard in self._shards)
+
+
 def video_processing_generator(video_file_path, callable, seek_idx, visited_list):
     import os
     import logging
@@ -53,8 +137,6 @@ def video_processing_generator(video_file_path, callable, seek_idx, visited_list
     frame_count = cap.get_frame_count()
     visited_list = visited_list[:frame_count]
 
-    visited_list = [x is not None for x in visited_list]
-
     def next_unvisited_idx(frame_idx):
         """
         Starting from the given index, find the next frame that has not been
@@ -87,8 +169,12 @@ def video_processing_generator(video_file_path, callable, seek_idx, visited_list
                     next_unvisited = None
         return next_unvisited
 
+    # Index of the frame that `cap.get_frame()` returns next without seeking
+    next_decoded_idx = 0
+
     def handle_frame(frame_idx):
-        if frame_idx != cap.get_frame_index() + 1:
+        nonlocal next_decoded_idx
+        if frame_idx != next_decoded_idx:
             # we need to seek:
             logger.debug("Seeking to Frame {}".format(frame_idx))
             try:
@@ -96,6 +182,7 @@ def video_processing_generator(video_file_path, callable, seek_idx, visited_list
             except video_capture.FileSeekError:
                 logger.warning("Could not evaluate frame: {}.".format(frame_idx))
                 visited_list[frame_idx] = True  # this frame is now visited.
+                next_decoded_idx = -1
                 return []
 
         try:
@@ -103,7 +190,9 @@ def video_processing_generator(video_file_path, callable, seek_idx, visited_list
         except video_capture.EndofVideoError:
             logger.warning("Could not evaluate frame: {}.".format(frame_idx))
             visited_list[frame_idx] = True
+            next_decoded_idx = -1
             return []
+        next_decoded_idx = frame.index + 1
         return callable(frame)
 
     while True:
@@ -221,6 +310,7 @@ def get_export_proxy(
     gaze_positions,
     fixations,
     camera_model,
+    min_data_confidence,
     mp_context,
 ):
     exporter = Exporter(
@@ -231,6 +321,7 @@ def get_export_proxy(
         gaze_positions,
         fixations,
         camera_model,
+        min_data_confidence,
     )
     proxy = background_helper.IPC_Logging_Task_Proxy(
         "Offline Surface Tracker Exporter",
@@ -250,6 +341,7 @@ class Exporter:
         gaze_positions,
         fixations,
         camera_model,
+        min_data_confidence,
     ):
         self.export_range = export_range
         self.metrics_dir = os.path.join(export_dir, "surfaces")
@@ -258,6 +350,7 @@ class Exporter:
         self.gaze_positions = gaze_positions
         self.fixations = fixations
         self.camera_model = camera_model
+        self.min_data_confidence = min_data_confidence
         self.gaze_on_surfaces = None
         self.fixations_on_surfaces = None
 
@@ -292,7 +385,9 @@ class Exporter:
             self._export_fixations_on_surface(
                 self.fixations_on_surfaces[surf_idx], surface, surface_name
             )
-            self._export_surface_heatmap(surface, surface_name)
+            self._export_surface_heatmap(
+                self.gaze_on_surfaces[surf_idx], surface, surface_name
+            )
 
             logger.info(
                 "Saved surface gaze and fixation data for '{}'".format(surface.name)
@@ -309,11 +404,9 @@ class Exporter:
         """
         Result: Tuple[events_per_surface, events_per_surface]
         events_per_surface = List[events_surface_0, ..., events_surface_N]
-        events_surface_i = List[events_world_frame_0, ..., events_world_frame_M]
-        events_world_frame_j: List[event, ...]
+        events_surface_i: Surface_Mapped_Events of all world frames
 
         N: Number of surfaces
-        M: Number of world frames
         """
         section = slice(*self.export_range)
         gaze_on_surface = list(
@@ -385,9 +478,8 @@ class Exporter:
 
             for surf_idx, surface in enumerate(self.surfaces):
                 gaze_on_surf = self.gaze_on_surfaces[surf_idx]
-                gaze_on_surf = list(itertools.chain.from_iterable(gaze_on_surf))
                 gaze_on_surf_ts = set(
-                    [gp["base_data"][1] for gp in gaze_on_surf if gp["on_surf"]]
+                    gaze_on_surf.timestamp[gaze_on_surf.on_surf].tolist()
                 )
                 not_on_any_surf_ts -= gaze_on_surf_ts
                 csv_writer.writerow((surface.name, len(gaze_on_surf_ts)))
@@ -441,7 +533,18 @@ class Exporter:
                 )
             logger.info("Created 'surface_events.csv' file")
 
-    def _export_surface_heatmap(self, surface, surface_name):
+    def _export_surface_heatmap(self, gaze_on_surf, surface, surface_name):
+        if surface.heatmap_accumulator is None:
+            surface.heatmap_accumulator = Heatmap_Accumulator(
+                gaze_on_surf,
+                len(self.world_timestamps),
+                surface.heatmap_grid,
+                self.min_data_confidence,
+            )
+        surface.update_heatmap_from_accumulator(
+            slice(*self.export_range), self.min_data_confidence
+        )
+
         if surface.within_surface_heatmap is not None:
             logger.info("Saved Heatmap as .png file.")
             heatmap_file_name = "heatmap" + surface_name + ".png"
@@ -527,27 +630,24 @@ class Exporter:
                     "confidence",
                 )
             )
-            for idx, gaze_on_surf in enumerate(gazes_on_surface):
-                idx += self.export_range[0]
-                if gaze_on_surf:
-                    for gp in gaze_on_surf:
-                        csv_writer.writerow(
-                            (
-                                self.world_timestamps[idx],
-                                idx,
-                                gp["timestamp"],
-                                gp["norm_pos"][0],
-                                gp["norm_pos"][1],
-                                gp["norm_pos"][0] * surface.real_world_size["x"],
-                                gp["norm_pos"][1] * surface.real_world_size["y"],
-                                gp["on_surf"],
-                                gp["confidence"],
-                            )
-                        )
+            # gaze is exported from columns, without creating a dict per gaze point
+            csv_writer.writerows(
+                zip(
+                    self.world_timestamps[gazes_on_surface.world_index],
+                    gazes_on_surface.world_index,
+                    gazes_on_surface.timestamp,
+                    gazes_on_surface.norm_pos[:, 0],
+                    gazes_on_surface.norm_pos[:, 1],
+                    gazes_on_surface.norm_pos[:, 0] * surface.real_world_size["x"],
+                    gazes_on_surface.norm_pos[:, 1] * surface.real_world_size["y"],
+                    gazes_on_surface.on_surf,
+                    gazes_on_surface.confidence,
+                )
+            )
 
     def _export_fixations_on_surface(self, fixations_on_surf, surface, surface_name):
         """
-        fixations_on_surf structure: fixations_on_surf[world_frame_idx][event_idx]
+        fixations_on_surf: Surface_Mapped_Events of self.fixations
         """
         with open(
             os.path.join(
@@ -573,22 +673,21 @@ class Exporter:
                     "on_surf",
                 )
             )
-            for world_idx, fixs_for_frame in enumerate(fixations_on_surf):
-                world_idx += self.export_range[0]
-                if fixs_for_frame:
-                    for fix in fixs_for_frame:
-                        csv_writer.writerow(
-                            (
-                                self.world_timestamps[world_idx],
-                                world_idx,
-                                fix["id"],
-                                fix["timestamp"],
-                                fix["duration"],
-                                fix["dispersion"],
-                                fix["norm_pos"][0],
-                                fix["norm_pos"][1],
-                                fix["norm_pos"][0] * surface.real_world_size["x"],
-                                fix["norm_pos"][1] * surface.real_world_size["y"],
-                                fix["on_surf"],
-                            )
-                        )
+            world_idc = fixations_on_surf.world_index.tolist()
+            fixations = fixations_on_surf.to_dicts(self.fixations)
+            for world_idx, fix in zip(world_idc, fixations):
+                csv_writer.writerow(
+                    (
+                        self.world_timestamps[world_idx],
+                        world_idx,
+                        fix["id"],
+                        fix["timestamp"],
+                        fix["duration"],
+                        fix["dispersion"],
+                        fix["norm_pos"][0],
+                        fix["norm_pos"][1],
+                        fix["norm_pos"][0] * surface.real_world_size["x"],
+                        fix["norm_pos"][1] * surface.real_world_size["y"],
+                        fix["on_surf"],
+                    )
+                )
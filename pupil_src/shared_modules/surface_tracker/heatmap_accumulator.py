@@ -0,0 +1,201 @@
+"""
+(*)~---------------------------------------------------------------------------
+Pupil - eye tracking platform
+Copyright (C) 2012-2020 Pupil Labs
+
+Distributed under the terms of the GNU
+Lesser General Public License (LGPL v3.0).
+See COPYING and COPYING.LESSER for license details.
+---------------------------------------------------------------------------~(*)
+"""
+import typing as T
+
+import numpy as np
+
+from .surface import Surface_Mapped_Events
+
+# Upper bound for the memory of the cumulative histograms of one surface. High
+# heatmap resolutions are stored in longer blocks instead.
+_max_cumulative_hists_bytes = 64 * 1024 ** 2
+
+
+class Heatmap_Accumulator:
+    """Gaze counts of a surface per heatmap bin, summed up in blocks of world frames.
+
+    Keeps cumulative histograms at every `block_length`-th world frame, such that
+    the histogram of any range of world frames is the difference of two cumulative
+    histograms plus the rows of at most two partial blocks at the range borders.
+    Changing the confidence threshold adds or subtracts only the rows with
+    confidence between the old and the new threshold.
+
+    `block_length` is the minimal block length. It is increased for fine grids,
+    such that the cumulative histograms stay within `_max_cumulative_hists_bytes`.
+    """
+
+    def __init__(
+        self,
+        gaze_on_surf: Surface_Mapped_Events,
+        frame_count: int,
+        grid: T.Tuple[int, int],
+        min_confidence: float,
+        block_length: int = 256,
+    ):
+        on_surf = gaze_on_surf.on_surf
+        self._world_index = gaze_on_surf.world_index[on_surf]
+        self._confidence = gaze_on_surf.confidence[on_surf]
+        self._norm_pos = gaze_on_surf.norm_pos[on_surf]
+        self._confidence_order = np.argsort(self._confidence, kind="stable")
+        self._sorted_confidence = self._confidence[self._confidence_order]
+        self._frame_count = frame_count
+        self._min_block_length = block_length
+        self._block_length = None
+
+        self._grid = None
+        self._min_confidence = min_confidence
+        self.set_grid(grid)
+
+    @property
+    def grid(self) -> T.Tuple[int, int]:
+        return self._grid
+
+    @property
+    def min_confidence(self) -> float:
+        return self._min_confidence
+
+    @property
+    def block_length(self) -> int:
+        return self._block_length
+
+    def set_grid(self, grid: T.Tuple[int, int]):
+        """Re-bins all rows if the grid changed"""
+        grid = tuple(grid)
+        if grid == self._grid:
+            return
+        self._grid = grid
+        self._set_block_length(self._block_length_for_bin_count(grid[0] * grid[1]))
+        self._bin_idc = _bin_indices(self._norm_pos, grid)
+        self._cumulative_hists = np.zeros(
+            (self._block_count + 1, grid[0] * grid[1]), dtype=np.int64
+        )
+        included = self._confidence >= self._min_confidence
+        self._add_to_cumulative_hists(np.flatnonzero(included), 1)
+
+    def set_min_confidence(self, min_confidence: float):
+        """Adds or subtracts rows with confidence between old and new threshold"""
+        if min_confidence == self._min_confidence:
+            return
+        low, high = sorted((min_confidence, self._min_confidence))
+        affected_start, affected_stop = np.searchsorted(
+            self._sorted_confidence, (low, high), side="left"
+        )
+        affected = self._confidence_order[affected_start:affected_stop]
+        sign = 1 if min_confidence < self._min_confidence else -1
+        self._min_confidence = min_confidence
+        self._add_to_cumulative_hists(affected, sign)
+
+    def histogram(self, section: slice) -> np.ndarray:
+        """Gaze counts of world frames in `section` with shape `grid`
+
+        Only gaze with at least `min_confidence` is counted.
+        """
+        start, stop = self._frame_range(section)
+        hist = np.zeros(self._grid[0] * self._grid[1], dtype=np.int64)
+        if start >= stop:
+            return hist.reshape(self._grid)
+
+        first_block, last_block = self._full_blocks(start, stop)
+        if first_block < last_block:
+            hist += self._cumulative_hists[last_block]
+            hist -= self._cumulative_hists[first_block]
+            border_ranges = (
+                (start, first_block * self._block_length),
+                (last_block * self._block_length, stop),
+            )
+        else:
+            border_ranges = ((start, stop),)
+
+        for border_start, border_stop in border_ranges:
+            rows = self._rows_of_frames(border_start, border_stop)
+            rows = rows[self._confidence[rows] >= self._min_confidence]
+            hist += np.bincount(self._bin_idc[rows], minlength=hist.size)
+        return hist.reshape(self._grid)
+
+    def gaze_count(self, section: slice) -> int:
+        """Number of on-surface gaze of world frames in `section`, of any confidence"""
+        start, stop = self._frame_range(section)
+        if start >= stop:
+            return 0
+
+        first_block, last_block = self._full_blocks(start, stop)
+        if first_block >= last_block:
+            return len(self._rows_of_frames(start, stop))
+        count = (
+            self._cumulative_gaze_counts[last_block]
+            - self._cumulative_gaze_counts[first_block]
+        )
+        count += len(self._rows_of_frames(start, first_block * self._block_length))
+        count += len(self._rows_of_frames(last_block * self._block_length, stop))
+        return int(count)
+
+    def _block_length_for_bin_count(self, bin_count: int) -> int:
+        # the cumulative histograms have frame_count // block_length + 2 rows
+        max_rows = max(3, _max_cumulative_hists_bytes // (bin_count * 8))
+        needed = -(-(self._frame_count + 1) // (max_rows - 2))
+        return max(self._min_block_length, needed)
+
+    def _set_block_length(self, block_length: int):
+        if block_length == self._block_length:
+            return
+        self._block_length = block_length
+        self._block_idc = self._world_index // block_length
+        self._block_count = self._frame_count // block_length + 1
+
+        # cumulative on-surface gaze counts per block, independent of confidence
+        block_gaze_counts = np.bincount(self._block_idc, minlength=self._block_count)
+        self._cumulative_gaze_counts = np.zeros(self._block_count + 1, dtype=np.int64)
+        np.cumsum(block_gaze_counts, out=self._cumulative_gaze_counts[1:])
+
+    def _frame_range(self, section: slice) -> T.Tuple[int, int]:
+        start = 0 if section.start is None else max(section.start, 0)
+        stop = self._block_count * self._block_length
+        if section.stop is not None:
+            stop = min(section.stop, stop)
+        return start, stop
+
+    def _full_blocks(self, start: int, stop: int) -> T.Tuple[int, int]:
+        """Blocks completely within [start, stop) as [first block, last block)"""
+        return -(-start // self._block_length), stop // self._block_length
+
+    def _rows_of_frames(self, start: int, stop: int) -> np.ndarray:
+        # rows are sorted by world frame index
+        row_start, row_stop = np.searchsorted(self._world_index, (start, stop))
+        return np.arange(row_start, row_stop)
+
+    def _add_to_cumulative_hists(self, rows: np.ndarray, sign: int):
+        if not len(rows):
+            return
+        bin_count = self._cumulative_hists.shape[1]
+        block_hists = np.bincount(
+            self._block_idc[rows] * bin_count + self._bin_idc[rows],
+            minlength=self._block_count * bin_count,
+        ).reshape(self._block_count, bin_count)
+        np.cumsum(block_hists, axis=0, out=block_hists)
+        if sign < 0:
+            self._cumulative_hists[1:] -= block_hists
+        else:
+            self._cumulative_hists[1:] += block_hists
+
+
+def _bin_indices(norm_pos: np.ndarray, grid: T.Tuple[int, int]) -> np.ndarray:
+    """Flat heatmap bin index per position, binned like `Surface.update_heatmap()`"""
+    rows = _uniform_bin_indices(1.0 - norm_pos[:, 1], grid[0])
+    cols = _uniform_bin_indices(norm_pos[:, 0], grid[1])
+    return rows * grid[1] + cols
+
+
+def _uniform_bin_indices(values: np.ndarray, bin_count: int) -> np.ndarray:
+    # same edges and edge handling as np.histogram2d()
+    edges = np.linspace(0.0, 1.0, bin_count + 1)
+    bin_idc = np.searchsorted(edges, values, side="right") - 1
+    bin_idc[values == edges[-1]] = bin_count - 1
+    return np.clip(bin_idc, 0, bin_count - 1)
@@ -257,20 +257,7 @@ class Surface(abc.ABC):
                 trans_matrix=trans_matrix,
             )
             on_srf = bool((0 <= surf_norm_pos[0] <= 1) and (0 <= surf_norm_pos[1] <= 1))
-
-            mapped_datum = {
-                "topic": f"{event['topic']}_on_surface",
-                "norm_pos": surf_norm_pos.tolist(),
-                "confidence": event["confidence"],
-                "on_surf": on_srf,
-                "base_data": (event["topic"], event["timestamp"]),
-                "timestamp": event["timestamp"],
-            }
-            if event["topic"] == "fixations":
-                mapped_datum["id"] = event["id"]
-                mapped_datum["duration"] = event["duration"]
-                mapped_datum["dispersion"] = event["dispersion"]
-            results.append(mapped_datum)
+            results.append(mapped_event_dict(event, surf_norm_pos.tolist(), on_srf))
         return results
 
     @abc.abstractmethod
@@ -597,29 +584,55 @@ class Surface(abc.ABC):
         """Compute the gaze distribution heatmap based on given gaze events."""
 
         heatmap_data = [g["norm_pos"] for g in gaze_on_surf if g["on_surf"]]
+        self.update_heatmap_from_norm_pos(np.array(heatmap_data).reshape(-1, 2))
+
+    def update_heatmap_from_norm_pos(self, norm_pos):
+        """Compute the gaze distribution heatmap based on on-surface positions.
+
+        Args:
+            norm_pos (ndarray): Normalized surface positions with shape (N, 2).
+        """
+        hist, *edges = np.histogram2d(
+            1.0 - norm_pos[:, 1],
+            norm_pos[:, 0],
+            bins=self.heatmap_grid,
+            range=[[0, 1.0], [0, 1.0]],
+            normed=False,
+        )
+        self.update_heatmap_from_histogram(hist)
+
+    @property
+    def heatmap_grid(self) -> typing.Tuple[int, int]:
+        """Number of heatmap bins as (rows, columns)"""
         aspect_ratio = self.real_world_size["y"] / self.real_world_size["x"]
-        grid = (
+        return (
             max(1, int(self._heatmap_resolution * aspect_ratio)),
             int(self._heatmap_resolution),
         )
-        if heatmap_data:
-            xvals, yvals = zip(*((x, 1.0 - y) for x, y in heatmap_data))
-            hist, *edges = np.histogram2d(
-                yvals, xvals, bins=grid, range=[[0, 1.0], [0, 1.0]], normed=False
-            )
-            filter_h = 19 + self._heatmap_blur_factor * 15
-            filter_w = filter_h * aspect_ratio
-            filter_h = int(filter_h) // 2 * 2 + 1
-            filter_w = int(filter_w) // 2 * 2 + 1
-
-            hist = cv2.GaussianBlur(hist, (filter_h, filter_w), 0)
-            hist_max = hist.max()
-            hist *= (255.0 / hist_max) if hist_max else 0.0
-            hist = hist.astype(np.uint8)
-        else:
+
+    def update_heatmap_from_histogram(self, hist):
+        """Compute the gaze distribution heatmap based on binned gaze counts.
+
+        Args:
+            hist (ndarray): Gaze counts with shape `heatmap_grid`. The first row
+                corresponds to the top of the surface.
+        """
+        grid = self.heatmap_grid
+        if not hist.any():
             self.within_surface_heatmap = self.get_uniform_heatmap(grid)
             return
 
+        aspect_ratio = self.real_world_size["y"] / self.real_world_size["x"]
+        filter_h = 19 + self._heatmap_blur_factor * 15
+        filter_w = filter_h * aspect_ratio
+        filter_h = int(filter_h) // 2 * 2 + 1
+        filter_w = int(filter_w) // 2 * 2 + 1
+
+        hist = cv2.GaussianBlur(hist.astype(np.float64), (filter_h, filter_w), 0)
+        hist_max = hist.max()
+        hist *= (255.0 / hist_max) if hist_max else 0.0
+        hist = hist.astype(np.uint8)
+
         color_map = cv2.applyColorMap(hist, cv2.COLORMAP_JET)
         # reuse allocated memory if possible
         if self.within_surface_heatmap.shape != (*grid, 4):
@@ -643,6 +656,69 @@ class Surface(abc.ABC):
         return hm
 
 
+def mapped_event_dict(event, surf_norm_pos, on_surf) -> dict:
+    """Gaze or fixation on surface datum for `event`"""
+    mapped_datum = {
+        "topic": f"{event['topic']}_on_surface",
+        "norm_pos": surf_norm_pos,
+        "confidence": event["confidence"],
+        "on_surf": on_surf,
+        "base_data": (event["topic"], event["timestamp"]),
+        "timestamp": event["timestamp"],
+    }
+    if event["topic"] == "fixations":
+        mapped_datum["id"] = event["id"]
+        mapped_datum["duration"] = event["duration"]
+        mapped_datum["dispersion"] = event["dispersion"]
+    return mapped_datum
+
+
+class Surface_Mapped_Events(typing.NamedTuple):
+    """Gaze or fixation events mapped onto a surface, stored as columns.
+
+    Rows are sorted by world frame index. Events overlapping several world frames,
+    e.g. fixations, have one row per frame. `source_index` is the index of the
+    mapped event within the data it was mapped from.
+    """
+
+    world_index: np.ndarray
+    source_index: np.ndarray
+    timestamp: np.ndarray
+    confidence: np.ndarray
+    norm_pos: np.ndarray
+    on_surf: np.ndarray
+
+    @staticmethod
+    def empty() -> "Surface_Mapped_Events":
+        return Surface_Mapped_Events(
+            world_index=np.empty(0, dtype=np.int64),
+            source_index=np.empty(0, dtype=np.int64),
+            timestamp=np.empty(0),
+            confidence=np.empty(0),
+            norm_pos=np.empty((0, 2)),
+            on_surf=np.empty(0, dtype=bool),
+        )
+
+    @property
+    def count(self) -> int:
+        return len(self.world_index)
+
+    def to_dicts(self, events) -> typing.List[dict]:
+        """Materializes the rows as gaze/fixation on surface data.
+
+        Args:
+            events: The data the rows were mapped from, indexed by `source_index`.
+        """
+        return [
+            mapped_event_dict(events[source_idx], norm_pos, on_surf)
+            for source_idx, norm_pos, on_surf in zip(
+                self.source_index.tolist(),
+                self.norm_pos.tolist(),
+                self.on_surf.tolist(),
+            )
+        ]
+
+
 class Surface_Location:
     def __init__(
         self,
@@ -13,11 +13,14 @@ import logging
 import multiprocessing
 import platform
 
+import numpy as np
+
+import file_methods as fm
 import player_methods
 
 from . import background_tasks, offline_utils
 from .cache import Cache
-from .surface import Surface, Surface_Location
+from .surface import Surface, Surface_Location, Surface_Mapped_Events
 
 logger = logging.getLogger(__name__)
 
@@ -44,38 +47,113 @@ class Surface_Offline(Surface):
         self.observations_frame_idxs = []
         self.on_surface_change = None
         self.start_idx = None
+        self.heatmap_accumulator = None
 
     def __getstate__(self):
         state = self.__dict__.copy()
         # Remove the unpicklable entries.
         del state["on_surface_change"]
+        # Can be large, the exporter rebuilds it from the gaze on the surface
+        state["heatmap_accumulator"] = None
         return state
 
     def __setstate__(self, state):
         self.__dict__.update(state)
 
-    def map_section(self, section, all_world_timestamps, all_gaze_events, camera_model):
-        try:
-            location_cache = self.location_cache[section]
-        except TypeError:
-            return []
-
-        section_gaze_on_surf = []
-        for frame_idx, location in enumerate(location_cache):
-            frame_idx += section.start
-            if location and location.detected:
-                frame_window = player_methods.enclosing_window(
-                    all_world_timestamps, frame_idx
-                )
-                gaze_events = all_gaze_events.by_ts_window(frame_window)
+    def update_heatmap_from_accumulator(self, section, min_confidence):
+        """Compute the gaze distribution heatmap of the world frames in `section`.
 
-                gaze_on_surf = self.map_gaze_and_fixation_events(
-                    gaze_events, camera_model, trans_matrix=location.img_to_surf_trans
-                )
-            else:
-                gaze_on_surf = []
-            section_gaze_on_surf.append(gaze_on_surf)
-        return section_gaze_on_surf
+        Uses the gaze counts of `heatmap_accumulator`, which has to be set.
+        """
+        self.heatmap_accumulator.set_grid(self.heatmap_grid)
+        self.heatmap_accumulator.set_min_confidence(min_confidence)
+        self.update_heatmap_from_histogram(self.heatmap_accumulator.histogram(section))
+
+    def map_section(
+        self, section, all_world_timestamps, all_gaze_events, camera_model
+    ) -> Surface_Mapped_Events:
+        """Maps gaze or fixation events of all world frames in `section` at once.
+
+        Events are assigned to each world frame whose enclosing window (see
+        `player_methods.enclosing_window()`) they overlap, and are mapped with the
+        surface location of that frame.
+
+        Args:
+            all_gaze_events: `player_methods.Bisector` of gaze, or
+                `player_methods.Affiliator` of fixations.
+        """
+        if self.location_cache is None:
+            return Surface_Mapped_Events.empty()
+        section = range(len(all_world_timestamps))[section]
+        if not section:
+            return Surface_Mapped_Events.empty()
+
+        locations = self.location_cache[section.start : section.stop]
+        detected = np.array([bool(loc and loc.detected) for loc in locations])
+        if not detected.any():
+            return Surface_Mapped_Events.empty()
+        trans_matrices = np.zeros((len(locations), 3, 3))
+        for idx in np.flatnonzero(detected):
+            trans_matrices[idx] = locations[idx].img_to_surf_trans
+
+        # Events overlapping the section, as selected by `Bisector.by_ts_window()`
+        world_timestamps = np.asarray(all_world_timestamps)
+        start_ts = np.asarray(all_gaze_events.data_ts)
+        stop_ts = np.asarray(getattr(all_gaze_events, "stop_ts", start_ts))
+        section_window = (
+            player_methods.enclosing_window(world_timestamps, section.start)[0],
+            player_methods.enclosing_window(world_timestamps, section.stop - 1)[1],
+        )
+        start_idx = np.searchsorted(stop_ts, section_window[0])
+        stop_idx = np.searchsorted(start_ts, section_window[1])
+        if start_idx >= stop_idx:
+            return Surface_Mapped_Events.empty()
+
+        # Frame i encloses [boundaries[i - 1], boundaries[i])
+        boundaries = (world_timestamps[:-1] + world_timestamps[1:]) / 2.0
+        first_frame = np.searchsorted(boundaries, start_ts[start_idx:stop_idx], "right")
+        last_frame = np.searchsorted(boundaries, stop_ts[start_idx:stop_idx], "right")
+        first_frame = np.maximum(first_frame, section.start)
+        last_frame = np.minimum(last_frame, section.stop - 1)
+        frame_counts = np.maximum(last_frame - first_frame + 1, 0)
+
+        # One row per overlapped frame, sorted by frame
+        event_idc = np.repeat(np.arange(stop_idx - start_idx), frame_counts)
+        row_offsets = np.arange(len(event_idc)) - np.repeat(
+            np.cumsum(frame_counts) - frame_counts, frame_counts
+        )
+        section_frame_idc = np.repeat(first_frame, frame_counts) + row_offsets
+        section_frame_idc -= section.start
+        rows = np.flatnonzero(detected[section_frame_idc])
+        rows = rows[np.argsort(section_frame_idc[rows], kind="stable")]
+        event_idc = event_idc[rows]
+        section_frame_idc = section_frame_idc[rows]
+        if not len(rows):
+            return Surface_Mapped_Events.empty()
+
+        events = all_gaze_events.data[start_idx:stop_idx]
+        norm_pos = fm.extract_column(events, "norm_pos").reshape(-1, 2)
+        confidence = fm.extract_column(events, "confidence")
+
+        width, height = camera_model.resolution
+        img_points = np.column_stack(
+            (norm_pos[:, 0] * width, (1.0 - norm_pos[:, 1]) * height)
+        )
+        img_points = camera_model.undistort_points_on_image_plane(img_points)
+        img_points = np.asarray(img_points, dtype=np.float64).reshape(-1, 2)
+
+        surf_norm_pos = _perspective_transform_rows(
+            img_points, event_idc, trans_matrices, section_frame_idc
+        )
+        on_surf = np.all((surf_norm_pos >= 0.0) & (surf_norm_pos <= 1.0), axis=1)
+        return Surface_Mapped_Events(
+            world_index=section_frame_idc + section.start,
+            source_index=event_idc + start_idx,
+            timestamp=start_ts[start_idx:stop_idx][event_idc],
+            confidence=confidence[event_idc],
+            norm_pos=surf_norm_pos,
+            on_surf=on_surf,
+        )
 
     def update_location(self, frame_idx, marker_cache, camera_model):
         if not self.defined:
@@ -266,3 +344,27 @@ class Surface_Offline(Surface):
             return 0
         section_cache = self.location_cache[section]
         return sum(map(bool, section_cache))
+
+
+def _perspective_transform_rows(
+    points, point_idc, trans_matrices, trans_idc, batch_size=2 ** 16
+):
+    """Applies `trans_matrices[trans_idc[i]]` to `points[point_idc[i]]` for each row i
+
+    Equivalent to `cv2.perspectiveTransform()` for each row. Rows are transformed in
+    batches to bound the memory of the gathered matrices.
+    """
+    result = np.empty((len(point_idc), 2))
+    for start in range(0, len(point_idc), batch_size):
+        batch = slice(start, start + batch_size)
+        batch_points = points[point_idc[batch]]
+        batch_trans = trans_matrices[trans_idc[batch]]
+        transformed = np.einsum("nij,nj->ni", batch_trans[:, :, :2], batch_points)
+        transformed += batch_trans[:, :, 2]
+        w = transformed[:, 2:]
+        # like cv2.perspectiveTransform(), points at infinity are mapped to 0
+        batch_result = result[batch]
+        batch_result[:] = 0.0
+        valid = np.abs(w) > np.finfo(np.float32).eps
+        np.divide(transformed[:, :2], w, out=batch_result, where=valid)
+    return result
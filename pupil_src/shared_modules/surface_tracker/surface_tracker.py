@@ -443,17 +443,7 @@ class Surface_Tracker(Plugin, metaclass=ABCMeta):
         self.markers = self._remove_duplicate_markers(markers)
 
     def _remove_duplicate_markers(self, markers):
-        # if an id shows twice use the bigger marker (usually this is a screen camera
-        # echo artifact.)
-        marker_by_uid = {}
-        for m in markers:
-            if (
-                m.uid not in marker_by_uid
-                or m.perimeter > marker_by_uid[m.uid].perimeter
-            ):
-                marker_by_uid[m.uid] = m
-
-        return list(marker_by_uid.values())
+        return remove_duplicate_markers(markers)
 
     @abstractmethod
     def _update_surface_locations(self, frame_index):
@@ -562,3 +552,14 @@ class Surface_Tracker(Plugin, metaclass=ABCMeta):
     def cleanup(self):
         self._ui_heatmap_mode_selector = None
         self.save_surface_definitions_to_file()
+
+
+def remove_duplicate_markers(markers):
+    # if an id shows twice use the bigger marker (usually this is a screen camera
+    # echo artifact.)
+    marker_by_uid = {}
+    for m in markers:
+        if m.uid not in marker_by_uid or m.perimeter > marker_by_uid[m.uid].perimeter:
+            marker_by_uid[m.uid] = m
+
+    return list(marker_by_uid.values())
@@ -25,12 +25,14 @@ import pyglui.cygl.utils as pyglui_utils
 import data_changed
 import file_methods
 import gl_utils
+from marker_detection_store import Apriltag_Detection_Store
 from observable import Observable
 from plugin import Plugin
 
 from . import background_tasks, offline_utils
 from .cache import Cache
 from .gui import Heatmap_Mode
+from .heatmap_accumulator import Heatmap_Accumulator
 from .surface_marker import Surface_Marker
 from .surface_marker_detector import MarkerDetectorMode, MarkerType
 from .surface_offline import Surface_Offline
@@ -60,16 +62,17 @@ class Surface_Tracker_Offline(Observable, Surface_Tracker, Plugin):
 
     order = 0.2
     TIMELINE_LINE_HEIGHT = 16
+    MARKER_CACHE_VERSION = 3
+    # Also add very small detected markers to cache and filter cache afterwards
+    CACHE_MIN_MARKER_PERIMETER = 20
 
     def __init__(self, g_pool, *args, **kwargs):
         super().__init__(g_pool, *args, use_online_detection=False, **kwargs)
 
-        self.MARKER_CACHE_VERSION = 3
-        # Also add very small detected markers to cache and filter cache afterwards
-        self.CACHE_MIN_MARKER_PERIMETER = 20
         self.cache_seek_idx = mp_context.Value("i", 0)
         self.marker_cache = None
         self.marker_cache_unfiltered = None
+        self.marker_detection_store = None
         self.cache_filler = None
         self._init_marker_cache()
         self.last_cache_update_ts = time.perf_counter()
@@ -80,7 +83,6 @@ class Surface_Tracker_Offline(Observable, Surface_Tracker, Plugin):
         self.gaze_on_surf_buffer = None
         self.gaze_on_surf_buffer_filler = None
 
-        self._heatmap_update_requests = set()
         self.export_proxies = set()
 
         self._gaze_changed_listener = data_changed.Listener(
@@ -179,12 +181,16 @@ class Surface_Tracker_Offline(Observable, Surface_Tracker, Plugin):
             for surface in self.surfaces:
                 surface.location_cache = None
 
+        self.marker_detection_store = self._get_marker_detection_store()
+        if self.marker_detection_store is not None:
+            previous_state = self._fill_from_marker_detection_store(previous_state)
+
         self.marker_cache_unfiltered = Cache(previous_state)
         self.marker_cache = self._filter_marker_cache(self.marker_cache_unfiltered)
 
         if self.cache_filler is not None:
             self.cache_filler.cancel()
-        self.cache_filler = background_tasks.background_video_processor(
+        self.cache_filler = background_tasks.sharded_background_video_processor(
             self.g_pool.capture.source_path,
             offline_utils.marker_detection_callable(
                 marker_detector_mode=self.marker_detector.marker_detector_mode,
@@ -197,8 +203,33 @@ class Surface_Tracker_Offline(Observable, Surface_Tracker, Plugin):
             list(self.marker_cache),
             self.cache_seek_idx,
             mp_context,
+            shard_count=max(1, mp_context.cpu_count() - 1),
+        )
+
+    def _get_marker_detection_store(self):
+        marker_detector_mode = self.marker_detector.marker_detector_mode
+        if marker_detector_mode.marker_type != MarkerType.APRILTAG_MARKER:
+            return None
+        return Apriltag_Detection_Store.for_recording(
+            self.g_pool.rec_dir,
+            family=marker_detector_mode.family.value,
+            quad_decimate=self.quad_decimate,
+            decode_sharpening=self.sharpening,
         )
 
+    def _fill_from_marker_detection_store(self, marker_cache):
+        """Fills frames not cached yet with detections of other plugins"""
+        marker_cache = list(marker_cache)
+        for frame_index in self.marker_detection_store.frame_indices:
+            if frame_index >= len(marker_cache) or marker_cache[frame_index]:
+                continue
+            markers = [
+                Surface_Marker.from_apriltag_v3_detection(detection)
+                for detection in self.marker_detection_store.get(frame_index)
+            ]
+            marker_cache[frame_index] = self._remove_duplicate_markers(markers)
+        return marker_cache
+
     def _filter_marker_cache(self, cache_to_filter):
         marker_type = self.marker_detector.marker_detector_mode.marker_type
         if marker_type != MarkerType.SQUARE_MARKER:
@@ -256,6 +287,7 @@ class Surface_Tracker_Offline(Observable, Surface_Tracker, Plugin):
 
             if self.gaze_on_surf_buffer_filler.completed and not did_timeout:
                 self.gaze_on_surf_buffer_filler = None
+                self._update_heatmap_accumulators()
                 self._update_surface_heatmaps()
                 self.gaze_on_surf_buffer = None
 
@@ -286,6 +318,12 @@ class Surface_Tracker_Offline(Observable, Surface_Tracker, Plugin):
 
         for frame_index, markers in self.cache_filler.fetch():
             if frame_index is not None:
+                if self.marker_detection_store is not None:
+                    self.marker_detection_store.update(
+                        frame_index,
+                        self.g_pool.timestamps[frame_index],
+                        map(_apriltag_detection_dict, markers),
+                    )
                 markers = self._remove_duplicate_markers(markers)
                 self.marker_cache_unfiltered.update(frame_index, markers)
                 marker_type = self.marker_detector.marker_detector_mode.marker_type
@@ -305,8 +343,6 @@ class Surface_Tracker_Offline(Observable, Surface_Tracker, Plugin):
 
         if self.cache_filler.completed and not did_timeout:
             self.cache_filler = None
-            for surface in self.surfaces:
-                self._heatmap_update_requests.add(surface)
             self._fill_gaze_on_surf_buffer()
             self._save_marker_cache()
             self.save_surface_definitions_to_file()
@@ -333,29 +369,44 @@ class Surface_Tracker_Offline(Observable, Surface_Tracker, Plugin):
                     self.camera_model,
                 )
 
+    def _update_heatmap_accumulators(self):
+        for surface, gaze_on_surf in zip(self.surfaces, self.gaze_on_surf_buffer):
+            surface.heatmap_accumulator = Heatmap_Accumulator(
+                gaze_on_surf,
+                len(self.g_pool.timestamps),
+                surface.heatmap_grid,
+                self.g_pool.min_data_confidence,
+            )
+
+    @property
+    def _trim_section(self):
+        in_mark = self.g_pool.seek_control.trim_left
+        out_mark = self.g_pool.seek_control.trim_right
+        return slice(in_mark, out_mark)
+
     def _update_surface_heatmaps(self):
         self._compute_across_surfaces_heatmap()
+        for surface in self.surfaces:
+            self._update_surface_heatmap(surface)
 
-        for surface in self._heatmap_update_requests:
-            surf_idx = self.surfaces.index(surface)
-            gaze_on_surf = self.gaze_on_surf_buffer[surf_idx]
-            gaze_on_surf = itertools.chain.from_iterable(gaze_on_surf)
-            gaze_on_surf = (
-                g
-                for g in gaze_on_surf
-                if g["confidence"] >= self.g_pool.min_data_confidence
-            )
-            gaze_on_surf = list(gaze_on_surf)
-            surface.update_heatmap(gaze_on_surf)
-
-        self._heatmap_update_requests.clear()
+    def _update_surface_heatmap(self, surface):
+        if surface.heatmap_accumulator is None:
+            # gaze is not mapped onto the surface yet
+            return
+        surface.update_heatmap_from_accumulator(
+            self._trim_section, self.g_pool.min_data_confidence
+        )
 
     def _compute_across_surfaces_heatmap(self):
+        section = self._trim_section
         gaze_counts_per_surf = []
-        for gaze in self.gaze_on_surf_buffer:
-            gaze = list(itertools.chain.from_iterable(gaze))
-            gaze = [g for g in gaze if g["on_surf"]]
-            gaze_counts_per_surf.append(len(gaze))
+        for surface in self.surfaces:
+            if surface.heatmap_accumulator is None:
+                gaze_counts_per_surf.append(0)
+            else:
+                gaze_counts_per_surf.append(
+                    surface.heatmap_accumulator.gaze_count(section)
+                )
 
         if gaze_counts_per_surf:
             max_count = max(gaze_counts_per_surf)
@@ -374,9 +425,9 @@ class Surface_Tracker_Offline(Observable, Surface_Tracker, Plugin):
                 surface.across_surface_heatmap = surface.get_uniform_heatmap((1, 1))
 
     def _fill_gaze_on_surf_buffer(self):
-        in_mark = self.g_pool.seek_control.trim_left
-        out_mark = self.g_pool.seek_control.trim_right
-        section = slice(in_mark, out_mark)
+        # Gaze is mapped for the whole recording, such that heatmaps of other trim
+        # ranges can be computed from the heatmap accumulators without remapping.
+        section = slice(None)
 
         all_world_timestamps = self.g_pool.timestamps
         all_gaze_events = self.g_pool.gaze_positions
@@ -471,10 +522,6 @@ class Surface_Tracker_Offline(Observable, Surface_Tracker, Plugin):
 
     def remove_surface(self, surface):
         super().remove_surface(surface)
-        try:
-            self._heatmap_update_requests.remove(surface)
-        except KeyError:
-            pass
         self.timeline.content_height -= self.TIMELINE_LINE_HEIGHT
         self._set_timeline_refresh_needed()
 
@@ -496,23 +543,21 @@ class Surface_Tracker_Offline(Observable, Surface_Tracker, Plugin):
         elif notification["subject"] == "surface_tracker.heatmap_params_changed":
             for surface in self.surfaces:
                 if surface.name == notification["name"]:
-                    self._heatmap_update_requests.add(surface)
-                    surface.within_surface_heatmap = surface.get_placeholder_heatmap()
+                    self._update_surface_heatmap(surface)
                     break
-            self._fill_gaze_on_surf_buffer()
 
         elif notification["subject"].startswith("seek_control.trim_indices_changed"):
-            for surface in self.surfaces:
-                surface.within_surface_heatmap = surface.get_placeholder_heatmap()
-                self._heatmap_update_requests.add(surface)
-            self._fill_gaze_on_surf_buffer()
+            self._update_surface_heatmaps()
+
+        elif notification["subject"] == "min_data_confidence_changed":
+            self._update_surface_heatmaps()
 
         elif notification["subject"] == "surface_tracker.surfaces_changed":
             for surface in self.surfaces:
                 if surface.name == notification["name"]:
                     surface.location_cache = None
+                    surface.heatmap_accumulator = None
                     surface.within_surface_heatmap = surface.get_placeholder_heatmap()
-                    self._heatmap_update_requests.add(surface)
                     break
 
         elif notification["subject"] == "should_export":
@@ -524,6 +569,7 @@ class Surface_Tracker_Offline(Observable, Surface_Tracker, Plugin):
                 self.g_pool.gaze_positions,
                 self.g_pool.fixations,
                 self.camera_model,
+                self.g_pool.min_data_confidence,
                 mp_context,
             )
             self.export_proxies.add(proxy)
@@ -536,13 +582,13 @@ class Surface_Tracker_Offline(Observable, Surface_Tracker, Plugin):
 
     def _on_gaze_positions_changed(self):
         for surface in self.surfaces:
-            self._heatmap_update_requests.add(surface)
+            surface.heatmap_accumulator = None
             surface.within_surface_heatmap = surface.get_placeholder_heatmap()
         self._fill_gaze_on_surf_buffer()
 
     def on_surface_change(self, surface):
         self.save_surface_definitions_to_file()
-        self._heatmap_update_requests.add(surface)
+        surface.heatmap_accumulator = None
         self._debounced_fill_gaze_on_surf_buffer()
 
     def _debounced_fill_gaze_on_surf_buffer(self):
@@ -579,3 +625,18 @@ class Surface_Tracker_Offline(Observable, Surface_Tracker, Plugin):
         marker_cache_file["quad_decimate"] = self.quad_decimate
         marker_cache_file["sharpening"] = self.sharpening
         marker_cache_file.save()
+        if self.marker_detection_store is not None:
+            self.marker_detection_store.save_to_disk()
+
+
+def _apriltag_detection_dict(marker: Surface_Marker) -> dict:
+    raw_marker = marker.raw_marker
+    return {
+        "tag_family": raw_marker.tag_family,
+        "tag_id": int(raw_marker.raw_id),
+        "hamming": int(raw_marker.hamming),
+        "decision_margin": float(raw_marker.decision_margin),
+        "homography": raw_marker.homography,
+        "center": raw_marker.center,
+        "corners": raw_marker.corners,
+    }
@@ -13,11 +13,22 @@ import os
 import psutil
 import glfw
 from pyglui import ui, graph
-from pyglui.cygl.utils import RGBA, mix_smooth
+from pyglui.cygl.utils import RGBA, mix_smooth, push_ortho, pop_ortho
+from pyglui.pyfontstash import fontstash
 from plugin import System_Plugin_Base
 
+# Number of plugin hooks listed in the plugin timing overlay
+SLOWEST_HOOKS_SHOWN = 5
+
 
 class System_Graphs(System_Plugin_Base):
+    """Performance graphs
+
+    The plugin timing overlay shows the duration of the main loop iterations and
+    the slowest plugin hooks. It can be toggled with a
+    ``plugin_timing.set_overlay_visible`` notification and a boolean ``value``.
+    """
+
     icon_chr = chr(0xE01D)
     icon_font = "pupil_icons"
 
@@ -28,6 +39,7 @@ class System_Graphs(System_Plugin_Base):
         show_fps=True,
         show_conf0=True,
         show_conf1=True,
+        show_plugin_timing=False,
         **kwargs,
     ):
         super().__init__(g_pool)
@@ -35,6 +47,7 @@ class System_Graphs(System_Plugin_Base):
         self.show_fps = show_fps
         self.show_conf0 = show_conf0
         self.show_conf1 = show_conf1
+        self.show_plugin_timing = show_plugin_timing
         self.conf_grad_limits = 0.0, 1.0
         self.ts = None
         self.idx = None
@@ -64,6 +77,15 @@ class System_Graphs(System_Plugin_Base):
         self.conf1_graph.update_rate = 5
         self.conf1_graph.label = "id1 conf: %0.2f"
 
+        self.loop_graph = graph.Bar_Graph(max_val=50.0)
+        self.loop_graph.pos = (500, 50)
+        self.loop_graph.update_rate = 5
+        self.loop_graph.label = "loop %0.1f ms"
+
+        self.glfont = fontstash.Context()
+        self.glfont.add_font("opensans", ui.get_opensans_font_path())
+        self.glfont.set_color_float((1.0, 1.0, 1.0, 0.8))
+
         self.conf_grad = (
             RGBA(1.0, 0.0, 0.0, self.conf0_graph.color[3]),
             self.conf0_graph.color,
@@ -79,11 +101,17 @@ class System_Graphs(System_Plugin_Base):
         self.fps_graph.scale = content_scale
         self.conf0_graph.scale = content_scale
         self.conf1_graph.scale = content_scale
+        self.loop_graph.scale = content_scale
 
         self.cpu_graph.adjust_window_size(*fb_size)
         self.fps_graph.adjust_window_size(*fb_size)
         self.conf0_graph.adjust_window_size(*fb_size)
         self.conf1_graph.adjust_window_size(*fb_size)
+        self.loop_graph.adjust_window_size(*fb_size)
+
+        self.window_size = fb_size
+        self.content_scale = content_scale
+        self.glfont.set_size(16 * content_scale)
 
     def gl_display(self):
         if self.show_cpu:
@@ -108,11 +136,34 @@ class System_Graphs(System_Plugin_Base):
                 self.conf_grad_limits[1],
             )
             self.conf1_graph.draw()
+        if self.show_plugin_timing:
+            self.loop_graph.draw()
+            self.draw_slowest_hooks()
+
+    def draw_slowest_hooks(self):
+        slowest_hooks = self.g_pool.plugin_timing.slowest_hooks(SLOWEST_HOOKS_SHOWN)
+        lines = [
+            f"{plugin_name}.{hook_name}: {duration * 1000:.2f} ms"
+            for plugin_name, hook_name, duration in slowest_hooks
+        ]
+        push_ortho(*self.window_size)
+        self.glfont.draw_multi_line_text(
+            20 * self.content_scale, 110 * self.content_scale, "\n".join(lines)
+        )
+        pop_ortho()
+
+    def on_notify(self, notification):
+        if notification["subject"] == "plugin_timing.set_overlay_visible":
+            self.show_plugin_timing = notification["value"]
 
     def recent_events(self, events):
         # update cpu graph
         self.cpu_graph.update()
 
+        if self.show_plugin_timing:
+            iteration_durations = self.g_pool.plugin_timing.iteration_durations
+            self.loop_graph.add(iteration_durations.last * 1000)
+
         # update pupil graphs
         if "frame" not in events or self.idx != events["frame"].index:
             for p in events["pupil"]:
@@ -141,6 +192,8 @@ class System_Graphs(System_Plugin_Base):
         self.fps_graph = None
         self.conf0_graph = None
         self.conf1_graph = None
+        self.loop_graph = None
+        self.glfont = None
 
     def get_init_dict(self):
         return {
@@ -148,4 +201,5 @@ class System_Graphs(System_Plugin_Base):
             "show_fps": self.show_fps,
             "show_conf0": self.show_conf0,
             "show_conf1": self.show_conf1,
+            "show_plugin_timing": self.show_plugin_timing,
         }
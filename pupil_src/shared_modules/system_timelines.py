@@ -18,6 +18,7 @@ import data_changed
 import gl_utils
 from observable import Observable
 from plugin import System_Plugin_Base
+from timeline_pyramid import Timeline_Pyramid_Store, min_max_points
 
 COLOR_LEGEND_WORLD = cygl_utils.RGBA(0.66, 0.86, 0.461, 1.0)
 COLOR_LEGEND_EYE_RIGHT = cygl_utils.RGBA(0.9844, 0.5938, 0.4023, 1.0)
@@ -30,6 +31,7 @@ class System_Timelines(Observable, System_Plugin_Base):
         super().__init__(g_pool)
         self.show_world_fps = show_world_fps
         self.show_eye_fps = show_eye_fps
+        self._timeline_pyramids = Timeline_Pyramid_Store(g_pool.rec_dir)
         self.cache_fps_data()
         self.pupil_positions_listener = data_changed.Listener(
             "pupil_positions", g_pool.rec_dir, plugin=self
@@ -53,9 +55,13 @@ class System_Timelines(Observable, System_Plugin_Base):
         self.fps_timeline = None
 
     def cache_fps_data(self):
-        fps_world = self.calculate_fps(self.g_pool.timestamps)
-        fps_eye0 = self.calculate_fps(self.g_pool.pupil_positions[0, ...].timestamps)
-        fps_eye1 = self.calculate_fps(self.g_pool.pupil_positions[1, ...].timestamps)
+        fps_world = self.fps_pyramid("world", self.g_pool.timestamps)
+        fps_eye0 = self.fps_pyramid(
+            "eye0", self.g_pool.pupil_positions[0, ...].timestamps
+        )
+        fps_eye1 = self.fps_pyramid(
+            "eye1", self.g_pool.pupil_positions[1, ...].timestamps
+        )
 
         t0, t1 = self.g_pool.timestamps[0], self.g_pool.timestamps[-1]
         self.cache = {
@@ -70,21 +76,31 @@ class System_Timelines(Observable, System_Plugin_Base):
         if len(timestamps) > 1:
             timestamps = np.unique(timestamps)
             fps = 1.0 / np.diff(timestamps)
-            return tuple(zip(timestamps, fps))
-        return ()
+            return timestamps[:-1], fps
+        return np.empty(0), np.empty(0)
+
+    def fps_pyramid(self, name, timestamps):
+        # The pyramid only depends on the timestamps, which key the stored pyramid
+        timestamps, fps = self.calculate_fps(timestamps)
+        return self._timeline_pyramids.get(
+            f"fps_{name}", timestamps, lambda samples: fps[samples]
+        )
 
     def draw_fps(self, width, height, scale):
-        with gl_utils.Coord_System(*self.cache["xlim"], *self.cache["ylim"]):
-            if self.show_world_fps:
-                cygl_utils.draw_points(
-                    self.cache["world"], size=2 * scale, color=COLOR_LEGEND_WORLD
-                )
-            if self.show_eye_fps:
-                cygl_utils.draw_points(
-                    self.cache["eye0"], size=2 * scale, color=COLOR_LEGEND_EYE_RIGHT
-                )
+        rows = []
+        if self.show_world_fps:
+            rows.append(("world", COLOR_LEGEND_WORLD))
+        if self.show_eye_fps:
+            rows.append(("eye0", COLOR_LEGEND_EYE_RIGHT))
+            rows.append(("eye1", COLOR_LEGEND_EYE_LEFT))
+
+        xlim = self.cache["xlim"]
+        with gl_utils.Coord_System(*xlim, *self.cache["ylim"]):
+            for name, color in rows:
+                # One bin per pixel, independent of the number of samples
+                bins = self.cache[name].query(*xlim, int(width))
                 cygl_utils.draw_points(
-                    self.cache["eye1"], size=2 * scale, color=COLOR_LEGEND_EYE_LEFT
+                    min_max_points(bins), size=2 * scale, color=color
                 )
 
     def draw_fps_legend(self, width, height, scale):
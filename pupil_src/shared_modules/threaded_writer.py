@@ -0,0 +1,165 @@
+"""
+(*)~---------------------------------------------------------------------------
+Pupil - eye tracking platform
+Copyright (C) 2012-2020 Pupil Labs
+
+Distributed under the terms of the GNU
+Lesser General Public License (LGPL v3.0).
+See COPYING and COPYING.LESSER for license details.
+---------------------------------------------------------------------------~(*)
+"""
+import logging
+import queue
+import threading
+import time
+import typing as T
+
+logger = logging.getLogger(__name__)
+
+
+class Writer_Stats(T.NamedTuple):
+    """Snapshot of a `Threaded_Writer`, latencies are in seconds"""
+
+    queue_depth: int
+    max_queue_depth: int
+    written: int
+    dropped: int
+    mean_latency: float
+    max_latency: float
+    blocked: float
+
+    def as_dict(self) -> dict:
+        return self._asdict()
+
+
+class Threaded_Writer:
+    """Calls `write` for each item put into the writer from a dedicated thread
+
+    Items are handed over through a bounded queue, such that slow writes do not
+    block the caller until the queue is full. Then, `put()` either blocks until the
+    writer thread catches up (backpressure), or drops the item if `drop_when_full`
+    is set. `flush` is called from the writer thread every `flush_interval` seconds.
+
+    Exceptions raised by `write` or `flush` stop all further writes. The first one
+    is kept and returned once by `pop_error()`.
+    """
+
+    _STOP = object()
+
+    def __init__(
+        self,
+        name: str,
+        write: T.Callable[[T.Any], None],
+        max_queue_size: int,
+        drop_when_full: bool = False,
+        flush: T.Optional[T.Callable[[], None]] = None,
+        flush_interval: T.Optional[float] = None,
+    ):
+        self.name = name
+        self._write = write
+        self._flush = flush
+        self._flush_interval = flush_interval if flush is not None else None
+        self._drop_when_full = drop_when_full
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._failed = False
+        self._error = None
+
+        self._lock = threading.Lock()
+        self._written = 0
+        self._dropped = 0
+        self._blocked = 0.0
+        self._reset_interval_stats()
+
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def put(self, item) -> bool:
+        """Hands `item` to the writer thread, returns False if it was dropped"""
+        enqueued_at = time.perf_counter()
+        try:
+            self._queue.put_nowait((enqueued_at, item))
+        except queue.Full:
+            if self._drop_when_full:
+                with self._lock:
+                    self._dropped += 1
+                return False
+            self._queue.put((enqueued_at, item))
+            with self._lock:
+                self._blocked += time.perf_counter() - enqueued_at
+        with self._lock:
+            self._max_queue_depth = max(self._max_queue_depth, self._queue.qsize())
+        return True
+
+    def pop_error(self) -> T.Optional[Exception]:
+        error, self._error = self._error, None
+        return error
+
+    def stats(self, reset: bool = True) -> Writer_Stats:
+        """Current stats; queue depth and latencies since the last reset"""
+        with self._lock:
+            stats = Writer_Stats(
+                queue_depth=self._queue.qsize(),
+                max_queue_depth=self._max_queue_depth,
+                written=self._written,
+                dropped=self._dropped,
+                mean_latency=(
+                    self._latency_sum / self._latency_count
+                    if self._latency_count
+                    else 0.0
+                ),
+                max_latency=self._max_latency,
+                blocked=self._blocked,
+            )
+            if reset:
+                self._reset_interval_stats()
+        return stats
+
+    def close(self):
+        """Writes all queued items and stops the writer thread"""
+        if self._thread is None:
+            return
+        self._queue.put((time.perf_counter(), self._STOP))
+        self._thread.join()
+        self._thread = None
+
+    def _reset_interval_stats(self):
+        self._max_queue_depth = self._queue.qsize()
+        self._latency_sum = 0.0
+        self._latency_count = 0
+        self._max_latency = 0.0
+
+    def _run(self):
+        last_flush = time.perf_counter()
+        while True:
+            try:
+                enqueued_at, item = self._queue.get(timeout=self._flush_interval)
+            except queue.Empty:
+                pass
+            else:
+                if item is self._STOP:
+                    break
+                written = self._call(self._write, item)
+                latency = time.perf_counter() - enqueued_at
+                with self._lock:
+                    self._written += int(written)
+                    self._latency_sum += latency
+                    self._latency_count += 1
+                    self._max_latency = max(self._max_latency, latency)
+
+            now = time.perf_counter()
+            if self._flush_interval is not None:
+                if now - last_flush >= self._flush_interval:
+                    self._call(self._flush)
+                    last_flush = now
+
+    def _call(self, fn, *args) -> bool:
+        if self._failed:
+            return False
+        try:
+            fn(*args)
+        except Exception as err:
+            logger.debug(f"{self.name} stopped writing: {err!r}")
+            self._failed = True
+            self._error = err
+            return False
+        return True
@@ -0,0 +1,261 @@
+"""
+(*)~---------------------------------------------------------------------------
+Pupil - eye tracking platform
+Copyright (C) 2012-2020 Pupil Labs
+
+Distributed under the terms of the GNU
+Lesser General Public License (LGPL v3.0).
+See COPYING and COPYING.LESSER for license details.
+---------------------------------------------------------------------------~(*)
+"""
+import hashlib
+import logging
+import math
+import os
+import typing as T
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Upper bound for the number of bins of the finest level. Finer levels would not
+# be visible on screen, even when zoomed in.
+MAX_BASE_BIN_COUNT = 2 ** 20
+
+
+class Timeline_Bins(T.NamedTuple):
+    """Statistics of all non-empty bins in a time range, sorted by time"""
+
+    timestamps: np.ndarray
+    minimum: np.ndarray
+    maximum: np.ndarray
+    mean: np.ndarray
+
+
+class _Level(T.NamedTuple):
+    bins: np.ndarray
+    count: np.ndarray
+    total: np.ndarray
+    minimum: np.ndarray
+    maximum: np.ndarray
+
+    @staticmethod
+    def reduced(bins, count, total, minimum, maximum) -> "_Level":
+        """Combines all entries of equal bins, which do not need to be sorted"""
+        order = np.argsort(bins, kind="stable")
+        bins = bins[order]
+        if not len(bins):
+            return _Level(bins, count, total, minimum, maximum)
+        starts = np.flatnonzero(np.concatenate(([True], bins[1:] != bins[:-1])))
+        return _Level(
+            bins[starts],
+            np.add.reduceat(count[order], starts),
+            np.add.reduceat(total[order], starts),
+            np.minimum.reduceat(minimum[order], starts),
+            np.maximum.reduceat(maximum[order], starts),
+        )
+
+    def coarser(self) -> "_Level":
+        return _Level.reduced(self.bins >> 1, *self[1:])
+
+
+class Timeline_Pyramid:
+    """Min/max/mean of a timeline stream in power-of-two bins over timestamps
+
+    Level 0 bins samples by `base_bin_width` seconds, every further level merges two
+    bins of the level below, until a single bin covers the whole stream. Only
+    non-empty bins are stored. Drawing a time range at any resolution reads the
+    level with the closest bin width, which costs O(pixels) instead of O(samples).
+    """
+
+    def __init__(self, origin: float, base_bin_width: float, levels=()):
+        self.origin = origin
+        self.base_bin_width = base_bin_width
+        self._levels = list(levels)
+
+    @classmethod
+    def from_samples(cls, timestamps, values) -> "Timeline_Pyramid":
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        if len(timestamps) > 1:
+            duration = timestamps.max() - timestamps.min()
+            interval = max(
+                np.median(np.diff(timestamps)), duration / MAX_BASE_BIN_COUNT
+            )
+        else:
+            interval = 0.0
+        # Smallest power of two that bins consecutive samples separately
+        exponent = math.floor(math.log2(interval)) if interval > 0 else -10
+        origin = float(timestamps[0]) if len(timestamps) else 0.0
+        pyramid = cls(origin, 2.0 ** exponent)
+        pyramid.extend(timestamps, values)
+        return pyramid
+
+    @property
+    def level_count(self) -> int:
+        return len(self._levels)
+
+    @property
+    def sample_count(self) -> int:
+        return int(self._levels[-1].count.sum()) if self._levels else 0
+
+    def bin_width(self, level_idx: int) -> float:
+        return self.base_bin_width * 2 ** level_idx
+
+    def extend(self, timestamps, values):
+        """Adds samples, e.g. of newly detected data, without rebinning old ones"""
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float64)
+        valid = np.isfinite(values) & np.isfinite(timestamps)
+        timestamps, values = timestamps[valid], values[valid]
+        if not len(values) and self._levels:
+            return
+
+        bins = np.floor((timestamps - self.origin) / self.base_bin_width)
+        counts = np.ones(len(values), dtype=np.int64)
+        samples = _Level(bins.astype(np.int64), counts, values, values, values)
+        if self._levels:
+            samples = _Level(*map(np.concatenate, zip(self._levels[0], samples)))
+        level = _Level.reduced(*samples)
+
+        self._levels = [level]
+        while len(level.bins) > 1:
+            level = level.coarser()
+            self._levels.append(level)
+
+    def query(self, start: float, stop: float, bin_count: int) -> Timeline_Bins:
+        """Bins within [start, stop] of the level with the closest bin width"""
+        if not self._levels or stop <= start:
+            empty = np.empty(0)
+            return Timeline_Bins(empty, empty, empty, empty)
+
+        target_width = (stop - start) / max(bin_count, 1)
+        level_idx = math.floor(math.log2(target_width / self.base_bin_width))
+        level_idx = min(max(level_idx, 0), len(self._levels) - 1)
+        level = self._levels[level_idx]
+        bin_width = self.bin_width(level_idx)
+
+        first, last = np.floor((np.array([start, stop]) - self.origin) / bin_width)
+        lo = np.searchsorted(level.bins, first, side="left")
+        hi = np.searchsorted(level.bins, last, side="right")
+        section = _Level(*(field[lo:hi] for field in level))
+        return Timeline_Bins(
+            timestamps=self.origin + (section.bins + 0.5) * bin_width,
+            minimum=section.minimum,
+            maximum=section.maximum,
+            mean=section.total / section.count,
+        )
+
+    def save(self, path: str, key: str):
+        arrays = {
+            f"level_{level_idx}_{field}": values
+            for level_idx, level in enumerate(self._levels)
+            for field, values in zip(_Level._fields, level)
+        }
+        tmp_path = path + ".tmp.npz"
+        np.savez(
+            tmp_path,
+            key=np.array(key),
+            origin=np.array(self.origin),
+            base_bin_width=np.array(self.base_bin_width),
+            level_count=np.array(len(self._levels)),
+            **arrays,
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> T.Tuple["Timeline_Pyramid", str]:
+        with np.load(path, allow_pickle=False) as data:
+            levels = [
+                _Level(*(data[f"level_{idx}_{field}"] for field in _Level._fields))
+                for idx in range(int(data["level_count"]))
+            ]
+            pyramid = cls(float(data["origin"]), float(data["base_bin_width"]), levels)
+            return pyramid, str(data["key"])
+
+
+def _digest(samples) -> str:
+    samples = np.ascontiguousarray(samples, dtype=np.float64)
+    return hashlib.blake2b(samples.tobytes(), digest_size=16).hexdigest()
+
+
+class Timeline_Pyramid_Store:
+    """Timeline pyramids of a recording, stored in `offline_data/timelines`
+
+    A stored pyramid is reused while the stream still starts with the samples that
+    the pyramid was built from, i.e. with the same timestamps and values. Samples
+    appended to the stream since are merged in.
+    """
+
+    def __init__(self, rec_dir: str):
+        self._directory = os.path.join(rec_dir, "offline_data", "timelines")
+
+    def get(
+        self,
+        name: str,
+        timestamps: np.ndarray,
+        get_values: T.Callable[[slice], np.ndarray],
+    ) -> Timeline_Pyramid:
+        """Pyramid of a stream, where `get_values` returns values of sample slices
+
+        `name` identifies the stream, e.g. by its producer and detector tag.
+        """
+        path = os.path.join(self._directory, name + ".npz")
+        stored = self._load_valid(path, timestamps, get_values)
+        if stored is None:
+            values = get_values(slice(None))
+            pyramid = Timeline_Pyramid.from_samples(timestamps, values)
+        else:
+            pyramid, values = stored
+            covered_count = len(values)
+            if covered_count == len(timestamps):
+                return pyramid
+            new_samples = slice(covered_count, None)
+            new_values = get_values(new_samples)
+            pyramid.extend(timestamps[new_samples], new_values)
+            values = np.concatenate((values, new_values))
+
+        key = self._key(timestamps, values)
+        try:
+            os.makedirs(self._directory, exist_ok=True)
+            pyramid.save(path, key)
+        except OSError:
+            logger.debug(f"Could not save timeline pyramid to {path}", exc_info=True)
+        return pyramid
+
+    def _load_valid(self, path, timestamps, get_values):
+        """Stored pyramid and the values of the samples it covers, if still valid"""
+        try:
+            pyramid, key = Timeline_Pyramid.load(path)
+            covered_count, timestamps_digest, values_digest = key.split("|")
+            covered_count = int(covered_count)
+        except (OSError, ValueError, KeyError):
+            return None
+        covered_samples = slice(covered_count)
+        if covered_count > len(timestamps) or timestamps_digest != _digest(
+            timestamps[covered_samples]
+        ):
+            return None
+        values = np.asarray(get_values(covered_samples), dtype=np.float64)
+        if values_digest != _digest(values):
+            return None
+        return pyramid, values
+
+    @staticmethod
+    def _key(timestamps, values) -> str:
+        return f"{len(timestamps)}|{_digest(timestamps)}|{_digest(values)}"
+
+
+def min_max_points(bins: Timeline_Bins) -> T.List[T.Tuple[float, float]]:
+    """Points at the minimum and maximum of each bin, e.g. for `draw_points()`"""
+    timestamps = bins.timestamps.tolist()
+    return [
+        *zip(timestamps, bins.minimum.tolist()),
+        *zip(timestamps, bins.maximum.tolist()),
+    ]
+
+
+def min_max_polyline(bins: Timeline_Bins) -> T.List[T.Tuple[float, float]]:
+    """Line strip through the minimum and maximum of each bin, in time order"""
+    timestamps = np.repeat(bins.timestamps, 2)
+    values = np.column_stack((bins.minimum, bins.maximum)).ravel()
+    return list(zip(timestamps.tolist(), values.tolist()))
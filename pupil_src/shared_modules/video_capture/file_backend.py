@@ -26,6 +26,7 @@ from camera_models import Camera_Model
 from pupil_recording import PupilRecording
 
 from .base_backend import Base_Manager, Base_Source, EndofVideoError, Playback_Source
+from .frame_cache import FrameCache, FrameReadAhead
 from .utils import VideoSet, InvalidContainerError
 
 logger = logging.getLogger(__name__)
@@ -58,6 +59,11 @@ class Frame:
     def copy(self):
         return Frame(self.timestamp, self._av_frame, self.index)
 
+    @property
+    def nbytes(self):
+        """Size of the decoded frame data, excluding converted images"""
+        return sum(plane.buffer_size for plane in self._av_frame.planes)
+
     @property
     def img(self):
         if self._img is None:
@@ -191,6 +197,76 @@ class OnDemandDecoder(Decoder):
                     yield frame
 
 
+class FrameRangeDecoder:
+    """Decodes ranges of frames of a video set, independently of `File_Source`
+
+    Used by `FrameReadAhead`, which decodes from a background thread and therefore
+    needs its own containers.
+    """
+
+    def __init__(self, videoset, open_decoder):
+        self.lookup = videoset.lookup
+        self._videoset = videoset
+        self._open_decoder = open_decoder
+        self._decoder = None
+        self._container_idx = None
+        self._av_frames = None
+        self._next_index = None
+        self._index_by_pts = {}
+
+    def is_decodable(self, index) -> bool:
+        return self.lookup.container_idx[index] > -1
+
+    def decode(self, start, stop) -> T.Iterator[Frame]:
+        """Yields all decodable frames with `start <= frame.index < stop`"""
+        index = start
+        while index < stop:
+            entry = self.lookup[index]
+            if entry.container_idx == -1:
+                index += 1
+                continue
+            if entry.container_idx != self._container_idx:
+                self._open_container(entry.container_idx)
+            if self._next_index != index:
+                self._decoder.seek(int(entry.pts))
+                self._av_frames = self._decoder.get_frame_iterator()
+            for av_frame in self._av_frames:
+                frame_index = self._index_by_pts.get(av_frame.pts)
+                # seeking starts decoding at the previous keyframe
+                if frame_index is None or frame_index < index:
+                    continue
+                self._next_index = index = frame_index + 1
+                if frame_index < stop:
+                    timestamp = self.lookup[frame_index].timestamp
+                    yield Frame(timestamp, av_frame, frame_index)
+                break
+            else:
+                self._next_index = None
+                return
+
+    def cleanup(self):
+        if self._decoder is not None:
+            self._decoder.cleanup()
+            self._decoder = None
+
+    def _open_container(self, container_idx):
+        self.cleanup()
+        try:
+            container = self._videoset.get_container(container_idx)
+            self._decoder = self._open_decoder(container)
+        except InvalidContainerError:
+            self._decoder = BrokenStream()
+        self._container_idx = container_idx
+        self._next_index = None
+        container_frame_idc = np.flatnonzero(self.lookup.container_idx == container_idx)
+        self._index_by_pts = dict(
+            zip(
+                self.lookup.pts[container_frame_idc].tolist(),
+                container_frame_idc.tolist(),
+            )
+        )
+
+
 # NOTE:Base_Source is included as base class for uniqueness:by_base_class to work
 # correctly with other Source plugins.
 class File_Source(Playback_Source, Base_Source):
@@ -208,8 +284,19 @@ class File_Source(Playback_Source, Base_Source):
         buffered_decoding (bool): use buffered decode
         fill_gaps (bool): fill gaps with static frames
         show_plugin_menu (bool): enable to show regular capture UI with source selection
+
+    Decoded frames are kept in a memory-bounded LRU cache of `frame_cache_bytes`.
+    A background thread decodes up to `read_ahead_frames` frames ahead of the last
+    returned frame, in the direction the source is being read. Seeking to and
+    reading cached frames does not touch the decoder.
     """
 
+    frame_cache_bytes = 128 * 1024 ** 2
+    read_ahead_frames = 30
+    # Reading a frame this many frames after the current decoder position decodes
+    # the frames in between instead of seeking.
+    max_decode_gap = 2
+
     def __init__(
         self,
         g_pool,
@@ -243,6 +330,16 @@ class File_Source(Playback_Source, Base_Source):
             # TODO: where does the fallback framerate of 1/20 come from?
             self._frame_rate = 20
         self.buffering = buffered_decoding
+        self._frame_cache = FrameCache(self.frame_cache_bytes)
+        self._read_ahead = FrameReadAhead(
+            self._frame_cache,
+            create_decoder=lambda: FrameRangeDecoder(
+                self.videoset, lambda c: self._get_streams(c, should_buffer=False)
+            ),
+            total_frame_count=self.get_frame_count(),
+            frame_count=self.read_ahead_frames,
+        )
+        self._last_frame_idx = None
         # Load video split for first frame
         self.reset_video()
         self._intrinsics = Camera_Model.from_file(rec, set_name, self.frame_size)
@@ -309,6 +406,12 @@ class File_Source(Playback_Source, Base_Source):
         self.video_stream.seek(0)
         self.current_container_index = container_index
         self.frame_iterator = self.video_stream.get_frame_iterator()
+        # index of the next frame of frame_iterator, None if unknown
+        if container_index < 0:
+            self._decoder_frame_idx = None
+        else:
+            container_idc = self.videoset.lookup.container_idx
+            self._decoder_frame_idx = int(np.argmax(container_idc == container_index))
 
     def _get_streams(self, container, should_buffer):
         """Get Video stream from containers."""
@@ -384,10 +487,37 @@ class File_Source(Playback_Source, Base_Source):
         if target_entry.container_idx == -1:
             return self._get_fake_frame_and_advance(target_entry)
 
+        frame = self._frame_cache.get(self.target_frame_idx)
+        if frame is None and self._read_ahead.is_pending(self.target_frame_idx):
+            target_idx = self.target_frame_idx
+            frame = self._frame_cache.wait_for(
+                target_idx, lambda: self._read_ahead.is_pending(target_idx), 1.0
+            )
+        if frame is None:
+            frame = self._decode_frame(target_entry)
+            self._frame_cache.put(frame)
+
+        if self._last_frame_idx is not None and frame.index < self._last_frame_idx:
+            direction = -1
+        else:
+            direction = 1
+        self._read_ahead.request(frame.index, direction)
+        self._last_frame_idx = frame.index
+        self.current_frame_idx = frame.index
+        self.target_frame_idx = frame.index + 1
+        # Callers might modify the frame's image in place, keep the cached one clean
+        return frame.copy()
+
+    def _decode_frame(self, target_entry):
         if target_entry.container_idx != self.current_container_index:
             # Contained index changed, need to load other video split
             self._setup_video(target_entry.container_idx)
 
+        if self._decoder_frame_idx is None or not (
+            0 <= self.target_frame_idx - self._decoder_frame_idx <= self.max_decode_gap
+        ):
+            self._seek_decoder(target_entry)
+
         # advance frame iterator until we hit the target frame
         for av_frame in self.frame_iterator:
             if not av_frame:
@@ -413,13 +543,12 @@ class File_Source(Playback_Source, Base_Source):
                 self.target_frame_idx = pts_indices[0]
                 break
 
-        # update indices, we know that we advanced until target_frame_index!
-        self.current_frame_idx = self.target_frame_idx
-        self.target_frame_idx += 1
+        # we know that we advanced until target_frame_index!
+        self._decoder_frame_idx = self.target_frame_idx + 1
         return Frame(
             timestamp=target_entry.timestamp,
             av_frame=av_frame,
-            index=self.current_frame_idx,
+            index=self.target_frame_idx,
         )
 
     def _get_fake_frame_and_advance(self, target_entry):
@@ -496,22 +625,32 @@ class File_Source(Playback_Source, Base_Source):
         except IndexError:
             logger.warning("Seeking to invalid position!")
             return
+        self.finished_sleep = 0
+        self.target_frame_idx = seek_pos
+        if seek_pos in self._frame_cache:
+            # the decoder is only repositioned if a frame is not cached
+            return
         if target_entry.container_idx > -1:
             if target_entry.container_idx != self.current_container_index:
                 self._setup_video(target_entry.container_idx)
-            try:
-                # explicit conversion to python int required, else:
-                # TypeError: ('Container.seek only accepts integer offset.')
-                self.video_stream.seek(int(target_entry.pts))
-            except av.AVError as e:
-                raise FileSeekError() from e
+            self._seek_decoder(target_entry)
         else:
             # TODO: Why seek here? Might be inefficient.
             self.video_stream.seek(0)
+            # need to re-initialize frame_iterator at the new seek position
+            self.frame_iterator = self.video_stream.get_frame_iterator()
+            self._decoder_frame_idx = None
+
+    def _seek_decoder(self, target_entry):
+        try:
+            # explicit conversion to python int required, else:
+            # TypeError: ('Container.seek only accepts integer offset.')
+            self.video_stream.seek(int(target_entry.pts))
+        except av.AVError as e:
+            raise FileSeekError() from e
         # need to re-initialize frame_iterator at the new seek position
         self.frame_iterator = self.video_stream.get_frame_iterator()
-        self.finished_sleep = 0
-        self.target_frame_idx = seek_pos
+        self._decoder_frame_idx = self.target_frame_idx
 
     def on_notify(self, notification):
         super().on_notify(notification)
@@ -586,6 +725,8 @@ class File_Source(Playback_Source, Base_Source):
         return ui_elements
 
     def cleanup(self):
+        self._read_ahead.stop()
+        self._frame_cache.clear()
         try:
             self.video_stream.cleanup()
         except AttributeError:
@@ -0,0 +1,198 @@
+"""
+(*)~---------------------------------------------------------------------------
+Pupil - eye tracking platform
+Copyright (C) 2012-2020 Pupil Labs
+
+Distributed under the terms of the GNU
+Lesser General Public License (LGPL v3.0).
+See COPYING and COPYING.LESSER for license details.
+---------------------------------------------------------------------------~(*)
+"""
+import collections
+import logging
+import threading
+import time
+import typing as T
+
+logger = logging.getLogger(__name__)
+
+
+class FrameCache:
+    """Memory-bounded LRU cache of decoded frames, keyed by frame index
+
+    Frames need to provide `index` and `nbytes`. The least recently used frames are
+    evicted once the cached frames hold more than `max_bytes`. Thread-safe.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._frames = collections.OrderedDict()
+        self._nbytes = 0
+        self._changed = threading.Condition()
+
+    def __len__(self):
+        return len(self._frames)
+
+    def __contains__(self, index):
+        return index in self._frames
+
+    @property
+    def nbytes(self) -> int:
+        return self._nbytes
+
+    def get(self, index):
+        with self._changed:
+            frame = self._frames.get(index)
+            if frame is None:
+                self.misses += 1
+                return None
+            self._frames.move_to_end(index)
+            self.hits += 1
+            return frame
+
+    def put(self, frame):
+        if frame.nbytes > self.max_bytes:
+            return
+        with self._changed:
+            replaced = self._frames.pop(frame.index, None)
+            if replaced is not None:
+                self._nbytes -= replaced.nbytes
+            self._frames[frame.index] = frame
+            self._nbytes += frame.nbytes
+            while self._nbytes > self.max_bytes:
+                _, evicted = self._frames.popitem(last=False)
+                self._nbytes -= evicted.nbytes
+            self._changed.notify_all()
+
+    def wait_for(self, index, is_pending: T.Callable[[], bool], timeout: float):
+        """Waits for frame `index` to be cached while `is_pending()` returns True
+
+        Returns the frame, or None if it is not pending anymore or on timeout.
+        """
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while index not in self._frames:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0.0 or not is_pending():
+                    return None
+                # re-check `is_pending()` regularly, it might change without a put
+                self._changed.wait(min(remaining, 0.05))
+        return self.get(index)
+
+    def clear(self):
+        with self._changed:
+            self._frames.clear()
+            self._nbytes = 0
+
+
+class FrameReadAhead:
+    """Decodes frames next to the playhead into a `FrameCache` in the background
+
+    Each `request()` moves the playhead. Depending on the play direction, up to
+    `frame_count` frames after or before it are decoded, unless they are cached
+    already. Decoding stops early once half of the cache budget was decoded, such
+    that read-ahead does not evict the frames it is reading ahead for.
+
+    The thread decodes with its own decoder, created by `create_decoder()`, and
+    exits after being idle for `idle_timeout` seconds. It is restarted on the next
+    request.
+    """
+
+    def __init__(
+        self,
+        cache: FrameCache,
+        create_decoder: T.Callable[[], T.Any],
+        total_frame_count: int,
+        frame_count: int,
+        idle_timeout: float = 2.0,
+    ):
+        self._cache = cache
+        self._create_decoder = create_decoder
+        self._total_frame_count = total_frame_count
+        self._frame_count = frame_count
+        self._idle_timeout = idle_timeout
+        self._requested = threading.Condition()
+        self._request = None
+        self._pending = None
+        self._should_stop = False
+        self._thread = None
+
+    def request(self, frame_index: int, direction: int):
+        if self._frame_count <= 0:
+            return
+        with self._requested:
+            self._request = frame_index, direction
+            if self._thread is None:
+                self._should_stop = False
+                self._thread = threading.Thread(
+                    target=self._run, name="FrameReadAhead", daemon=True
+                )
+                self._thread.start()
+            self._requested.notify()
+
+    def is_pending(self, frame_index: int) -> bool:
+        """True if `frame_index` will be decoded by the current read-ahead"""
+        pending = self._pending
+        return pending is not None and pending[0] <= frame_index < pending[1]
+
+    def stop(self):
+        with self._requested:
+            self._should_stop = True
+            thread = self._thread
+            self._requested.notify()
+        if thread is not None:
+            thread.join()
+
+    def _run(self):
+        decoder = self._create_decoder()
+        try:
+            while True:
+                with self._requested:
+                    if self._request is None and not self._should_stop:
+                        self._requested.wait(self._idle_timeout)
+                    request, self._request = self._request, None
+                    if request is None or self._should_stop:
+                        self._thread = None
+                        return
+                self._read_ahead(decoder, *request)
+        except Exception:
+            logger.debug("Read-ahead failed", exc_info=True)
+            with self._requested:
+                self._thread = None
+        finally:
+            self._pending = None
+            decoder.cleanup()
+
+    def _read_ahead(self, decoder, frame_index, direction):
+        if direction >= 0:
+            start = frame_index + 1
+            stop = min(frame_index + 1 + self._frame_count, self._total_frame_count)
+        else:
+            start = max(frame_index - self._frame_count, 0)
+            stop = frame_index
+        missing = [
+            idx
+            for idx in range(start, stop)
+            if idx not in self._cache and decoder.is_decodable(idx)
+        ]
+        if not missing:
+            return
+        start = missing[0]
+        if direction < 0:
+            stop = missing[-1] + 1
+
+        self._pending = start, stop
+        decoded_bytes = 0
+        try:
+            for frame in decoder.decode(start, stop):
+                self._pending = frame.index + 1, stop
+                self._cache.put(frame)
+                decoded_bytes += frame.nbytes
+                if self._request is not None or self._should_stop:
+                    break
+                if decoded_bytes > self._cache.max_bytes // 2:
+                    break
+        finally:
+            self._pending = None
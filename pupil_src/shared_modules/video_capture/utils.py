@@ -218,12 +218,61 @@ class Video:
             return
         self.ts = self._fix_negative_time_jumps(self.ts)
 
-    def load_pts(self, container):
-        packets = container.demux(video=0)
-        # last pts is invalid
-        self._pts = np.array([packet.pts for packet in packets][:-1])
+    def load_pts(self, container=None, cache=False):
+        """Loads the PTS of all video packets
+
+        With `cache`, the PTS are cached next to the video, keyed by file size and
+        modification time, such that unchanged videos are only scanned once. Only
+        use it for videos of recordings, not for exported videos. Raises
+        `InvalidContainerError` if the PTS need to be read from a broken video.
+        """
+        self._pts = self._load_cached_pts() if cache else None
+        if self._pts is None:
+            if container is None:
+                container = self.load_container()
+            self._pts = self._read_pts(container)
+            if cache:
+                self._save_cached_pts(self._pts)
         return self._pts
 
+    @staticmethod
+    def _read_pts(container) -> np.ndarray:
+        stream = container.streams.video[0]
+        # stream.frames is 0 if unknown, the buffer grows as needed
+        pts = np.empty(max(stream.frames + 1, 1024), dtype=np.int64)
+        count = 0
+        for packet in container.demux(stream):
+            if count == pts.size:
+                pts = np.resize(pts, 2 * pts.size)
+            pts[count] = packet.pts if packet.pts is not None else -1
+            count += 1
+        # last pts is invalid
+        return pts[: max(count - 1, 0)].copy()
+
+    @property
+    def pts_cache_loc(self) -> str:
+        return os.path.join(self.base, f"{self.name}_pts_cache.npz")
+
+    def _file_key(self) -> np.ndarray:
+        stat = os.stat(self.path)
+        return np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+    def _load_cached_pts(self) -> T.Optional[np.ndarray]:
+        try:
+            with np.load(self.pts_cache_loc) as cache:
+                if np.array_equal(cache["file_key"], self._file_key()):
+                    return cache["pts"]
+        except (OSError, KeyError, ValueError):
+            pass
+        return None
+
+    def _save_cached_pts(self, pts: np.ndarray):
+        try:
+            with open(self.pts_cache_loc, "wb") as cache_file:
+                np.savez(cache_file, pts=pts, file_key=self._file_key())
+        except OSError:
+            logger.debug(f"Could not cache PTS of {self.path}", exc_info=True)
+
     @property
     def name(self) -> str:
         file_ = os.path.split(self.path)[1]
@@ -351,14 +400,12 @@ class VideoSet:
         lookup = self._setup_lookup(loaded_ts)
         for container_idx, vid in enumerate(self.videos):
             try:
-                container = vid.load_container()
-
                 # NOTE: For unknown reasons we sometimes have more timestamps than
                 # frames. We don't know how to match non-matching timestamps and
                 # pts, so we might introduce a systematic bias when fixing this! The
                 # idea is to keep only data for timestamps that were recorded, but
                 # leave frames blank if we don't have frame information.
-                vid_pts = vid.load_pts(container)
+                vid_pts = vid.load_pts(cache=True)
                 npts = vid_pts.size
                 ntime = vid.timestamps.size
                 if npts < ntime:
@@ -375,15 +422,19 @@ class VideoSet:
                 vid_timestamps = vid.timestamps[:data_size]
                 vid_pts = vid_pts[:data_size]
 
-                lookup_mask = np.isin(lookup.timestamp, vid_timestamps)
-                lookup.container_frame_idx[lookup_mask] = np.arange(vid_timestamps.size)
-                lookup.container_idx[lookup_mask] = container_idx
-                lookup.pts[lookup_mask] = vid_pts
+                lookup_idc, frame_idc = self._match_sorted(
+                    lookup.timestamp, vid_timestamps
+                )
+                lookup.container_frame_idx[lookup_idc] = frame_idc
+                lookup.container_idx[lookup_idc] = container_idx
+                lookup.pts[lookup_idc] = vid_pts[frame_idc]
 
             except InvalidContainerError:
                 # For invalid videos, we still try to load the timestamps (might be empty)
-                lookup_mask = np.isin(lookup.timestamp, vid.timestamps)
-                lookup.container_frame_idx[lookup_mask] = np.arange(vid.timestamps.size)
+                lookup_idc, frame_idc = self._match_sorted(
+                    lookup.timestamp, vid.timestamps
+                )
+                lookup.container_frame_idx[lookup_idc] = frame_idc
 
         self.lookup = lookup
         np.save(self.lookup_loc, self.lookup)
@@ -409,6 +460,22 @@ class VideoSet:
         all_ts = np.concatenate(loaded_ts)
         return all_ts
 
+    @staticmethod
+    def _match_sorted(
+        sorted_timestamps: np.ndarray, timestamps: np.ndarray
+    ) -> T.Tuple[np.ndarray, np.ndarray]:
+        """Indices of `timestamps` found in `sorted_timestamps`, in both arrays
+
+        Replaces `np.isin`, which sorts both arrays on every call.
+        """
+        if sorted_timestamps.size == 0 or timestamps.size == 0:
+            empty = np.array([], dtype=np.int64)
+            return empty, empty
+        idc = np.searchsorted(sorted_timestamps, timestamps)
+        found = idc < sorted_timestamps.size
+        found[found] = sorted_timestamps[idc[found]] == timestamps[found]
+        return idc[found], np.flatnonzero(found)
+
     def _remove_filled_gaps(self):
         cont_idc = self.lookup.container_idx
         self.lookup = self.lookup[cont_idc > -1]
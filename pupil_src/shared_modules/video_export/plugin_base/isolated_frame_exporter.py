@@ -10,21 +10,32 @@ See COPYING and COPYING.LESSER for license details.
 """
 
 import abc
+import logging
 import os
+from fractions import Fraction
 from glob import glob
 from types import SimpleNamespace
 
+import av
+
 import player_methods as pm
-from av_writer import MPEG_Writer
+from av_writer import MPEG_Writer, write_timestamps
 from task_manager import ManagedTask
 from video_capture import File_Source, EndofVideoError
+from video_capture.utils import Video
 from video_export.plugin_base.video_exporter import VideoExporter
 
+logger = logging.getLogger(__name__)
+
+# same time base as used by av_writer.AV_Writer
+_REMUX_TIME_BASE = Fraction(1, 65535)
+
 
 class IsolatedFrameExporter(VideoExporter, abc.ABC):
     """
     A VideoExporter that exports a part or all of some video file and applies
-    a function process_frame to every frame.
+    a function process_frame to every frame. If process_frame is None, the
+    compressed frames are copied to the export without decoding them.
     """
 
     def add_export_job(
@@ -41,16 +52,27 @@ class IsolatedFrameExporter(VideoExporter, abc.ABC):
 
         input_video_file = _find_video_file(self.g_pool.rec_dir, input_name)
         output_video_file = os.path.join(export_dir, output_name + ".mp4")
-        task_args = (
-            input_video_file,
-            output_video_file,
-            export_range,
-            self.g_pool.timestamps,
-            process_frame,
-            timestamp_export_format,
-        )
+        if process_frame is None:
+            export_function = _remux_video_file
+            task_args = (
+                input_video_file,
+                output_video_file,
+                export_range,
+                self.g_pool.timestamps,
+                timestamp_export_format,
+            )
+        else:
+            export_function = _convert_video_file
+            task_args = (
+                input_video_file,
+                output_video_file,
+                export_range,
+                self.g_pool.timestamps,
+                process_frame,
+                timestamp_export_format,
+            )
         task = ManagedTask(
-            _convert_video_file,
+            export_function,
             args=task_args,
             heading="Export {} Video".format(input_name),
             min_progress=0.0,
@@ -127,3 +149,110 @@ def _convert_video_file(
     writer.close(timestamp_export_format)
     input_source.cleanup()
     yield "Exporting video completed", 100.0
+
+
+def _no_change(_, frame):
+    """
+    Processing function for IsolatedFrameExporter.
+    Just leaves all frames unchanged.
+    """
+    return frame.img
+
+
+def _remux_video_file(
+    input_file, output_file, export_range, world_timestamps, timestamp_export_format
+):
+    """Copies the compressed frames within `export_range` into the export.
+
+    Falls back to decoding and re-encoding if the export range does not start
+    at a keyframe or the video cannot be copied into an mp4 container.
+    """
+    yield "Export video", 0.0
+    try:
+        remuxed = yield from _copy_video_packets(
+            input_file,
+            output_file,
+            export_range,
+            world_timestamps,
+            timestamp_export_format,
+        )
+    except av.AVError:
+        logger.debug(f"Could not copy frames of {input_file}", exc_info=True)
+        remuxed = False
+
+    if not remuxed:
+        logger.debug(f"Re-encoding {input_file} for export")
+        yield from _convert_video_file(
+            input_file,
+            output_file,
+            export_range,
+            world_timestamps,
+            _no_change,
+            timestamp_export_format,
+        )
+
+
+def _copy_video_packets(
+    input_file, output_file, export_range, world_timestamps, timestamp_export_format
+):
+    """Returns False without writing anything if copying is not possible"""
+    # Like the video lookup, assumes that the n-th packet holds the n-th frame
+    timestamps = Video(input_file).timestamps
+    if not len(timestamps):
+        return False
+
+    export_start, export_stop = export_range  # export_stop is exclusive
+    export_window = pm.exact_window(world_timestamps, (export_start, export_stop - 1))
+    (export_from_index, export_to_index) = pm.find_closest(timestamps, export_window)
+    # synced with the world video export, see _convert_video_file()
+    start_time = export_window[0]
+
+    # yield progress results about two hundred times per export
+    update_interval = max(1, (export_to_index - export_from_index) // 200)
+
+    exported_timestamps = []
+    last_pts = float("-inf")
+    output_container = None
+    input_container = av.open(input_file)
+    try:
+        input_stream = input_container.streams.video[0]
+        for index, packet in enumerate(input_container.demux(input_stream)):
+            if index >= min(export_to_index, len(timestamps)) or packet.size == 0:
+                break
+            ts = timestamps[index]
+            if index < export_from_index or ts < start_time:
+                continue
+
+            if output_container is None:
+                # Frames before the first keyframe cannot be decoded
+                if not packet.is_keyframe:
+                    return False
+                output_container = av.open(output_file, "w")
+                output_stream = output_container.add_stream(template=input_stream)
+
+            # ensure strong monotonic pts
+            pts = max(int((ts - start_time) / _REMUX_TIME_BASE), last_pts + 1)
+            packet.stream = output_stream
+            packet.time_base = _REMUX_TIME_BASE
+            packet.pts = pts
+            packet.dts = pts
+            output_container.mux(packet)
+            last_pts = pts
+            exported_timestamps.append(ts)
+
+            if len(exported_timestamps) % update_interval == 0:
+                progress = (index - export_from_index) / (
+                    export_to_index - export_from_index
+                )
+                yield "Exporting video", progress * 100.0
+    finally:
+        input_container.close()
+        if output_container is not None:
+            output_container.close()
+
+    if output_container is None:
+        return False
+    if timestamp_export_format is not None:
+        write_timestamps(output_file, exported_timestamps, timestamp_export_format)
+    yield "Exporting video completed", 100.0
+    return True
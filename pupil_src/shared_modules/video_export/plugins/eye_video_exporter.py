@@ -48,7 +48,8 @@ class Eye_Video_Exporter(IsolatedFrameExporter):
                 self.g_pool.pupil_positions[eye_id, "3d"],
             )
         else:
-            process_frame = _no_change
+            # copies the compressed frames without decoding them
+            process_frame = None
         eye_name = "eye" + str(eye_id)
         try:
             self.add_export_job(
@@ -68,14 +69,6 @@ class Eye_Video_Exporter(IsolatedFrameExporter):
         self._export_eye_video(export_range, export_dir, eye_id=1)
 
 
-def _no_change(_, frame):
-    """
-    Processing function for IsolatedFrameExporter.
-    Just leaves all frames unchanged.
-    """
-    return frame.img
-
-
 class _add_pupil_ellipse:
     """
     Acts as a processing function for IsolatedFrameExporter.
@@ -10,8 +10,12 @@ See COPYING and COPYING.LESSER for license details.
 """
 
 import logging
+import multiprocessing as mp
 import os
+import shutil
+import tempfile
 
+import background_helper as bh
 import player_methods as pm
 from task_manager import ManagedTask
 from video_export.plugin_base.video_exporter import VideoExporter
@@ -19,6 +23,24 @@ from pupil_recording import PupilRecording
 
 logger = logging.getLogger(__name__)
 
+# Exports are only split into segments of at least this many frames
+MIN_SEGMENT_LENGTH = 300
+
+
+def export_segment_count():
+    return max(1, mp.cpu_count() - 1)
+
+
+def split_export_range(start_frame, end_frame, segment_count):
+    """Splits [start_frame, end_frame) into consecutive segments of similar length"""
+    frame_count = end_frame - start_frame
+    segment_count = max(1, min(segment_count, frame_count // MIN_SEGMENT_LENGTH))
+    bounds = [
+        start_frame + frame_count * segment // segment_count
+        for segment in range(segment_count + 1)
+    ]
+    return list(zip(bounds[:-1], bounds[1:]))
+
 
 class World_Video_Exporter(VideoExporter):
     """
@@ -48,6 +70,35 @@ class World_Video_Exporter(VideoExporter):
         plugins = self.g_pool.plugins.get_initializers()
 
         out_file_path = os.path.join(export_dir, self.rec_name)
+
+        segments = split_export_range(start_frame, end_frame, export_segment_count())
+        if len(segments) > 1:
+            # include the data of the frame before each segment, which is needed to
+            # find the data of the first segment frame
+            pre_computed_eye_data = [self._precomputed_eye_data_for_range(segments[0])]
+            pre_computed_eye_data.extend(
+                self._precomputed_eye_data_for_range((start - 1, end))
+                for start, end in segments[1:]
+            )
+            args = (
+                rec_dir,
+                user_dir,
+                self.g_pool.min_data_confidence,
+                segments,
+                plugins,
+                out_file_path,
+                pre_computed_eye_data,
+            )
+            task = Segmented_Export_Task(
+                Segmented_World_Video_Export,
+                args=args,
+                heading="Export World Video",
+                min_progress=0.0,
+                max_progress=end_frame - start_frame,
+            )
+            self.add_task(task)
+            return
+
         pre_computed_eye_data = self._precomputed_eye_data_for_range(export_range)
 
         args = (
@@ -85,6 +136,159 @@ class World_Video_Exporter(VideoExporter):
         return pre_computed
 
 
+class Segmented_World_Video_Export:
+    """Exports the world video in parallel segments, concatenated afterwards
+
+    Each segment is rendered and encoded in its own process with its own plugin
+    instances. All segments share the same sync time, such that they can be
+    concatenated into the output video without re-encoding. Audio is muxed once
+    during concatenation.
+
+    Offers the same interface as `background_helper.Task_Proxy`, yielding
+    (status, number of exported frames) while the segments are exported.
+    """
+
+    def __init__(
+        self,
+        name,
+        rec_dir,
+        user_dir,
+        min_data_confidence,
+        segments,
+        plugin_initializers,
+        out_file_path,
+        pre_computed_eye_data,
+    ):
+        self._name = name
+        self._rec_dir = rec_dir
+        self._out_file_path = out_file_path
+        self._segment_dir = tempfile.mkdtemp(
+            prefix=".world_video_segments_", dir=os.path.dirname(out_file_path)
+        )
+        self._segment_paths = [
+            os.path.join(self._segment_dir, f"segment_{segment:03d}.mp4")
+            for segment in range(len(segments))
+        ]
+        self._progress = [0] * len(segments)
+        self._canceled = False
+        self._concatenation = None
+
+        sync_frame = segments[0][0]
+        self._segment_exports = [
+            bh.IPC_Logging_Task_Proxy(
+                f"{name} {segment + 1}/{len(segments)}",
+                _export_world_video,
+                args=(
+                    rec_dir,
+                    user_dir,
+                    min_data_confidence,
+                    start_frame,
+                    end_frame,
+                    plugin_initializers,
+                    segment_path,
+                    segment_eye_data,
+                ),
+                kwargs={
+                    "sync_frame": sync_frame,
+                    "with_audio": False,
+                    "timestamp_export_format": "npy",
+                },
+            )
+            for segment, ((start_frame, end_frame), segment_path, segment_eye_data) in (
+                enumerate(zip(segments, self._segment_paths, pre_computed_eye_data))
+            )
+        ]
+
+    def fetch(self):
+        if self.completed or self.canceled:
+            return
+
+        if self._concatenation is None:
+            try:
+                for segment, export in enumerate(self._segment_exports):
+                    for _, progress in export.fetch():
+                        self._progress[segment] = progress
+            except Exception:
+                # do not leave the other segments running and their files behind
+                self.cancel()
+                raise
+            if self.canceled:
+                self.cancel()
+                return
+            if all(export.completed for export in self._segment_exports):
+                self._concatenation = bh.IPC_Logging_Task_Proxy(
+                    f"{self._name} concatenation",
+                    _concatenate_world_video_segments,
+                    args=(self._rec_dir, self._segment_paths, self._out_file_path),
+                )
+            status = "Exporting {} segments".format(len(self._segment_exports))
+            yield status, sum(self._progress)
+            return
+
+        try:
+            for status in self._concatenation.fetch():
+                yield status, sum(self._progress)
+        except Exception:
+            self.cancel()
+            raise
+        if self._concatenation.completed or self._concatenation.canceled:
+            shutil.rmtree(self._segment_dir, ignore_errors=True)
+
+    def cancel(self, timeout=1):
+        self._canceled = True
+        tasks = list(self._segment_exports)
+        if self._concatenation is not None:
+            tasks.append(self._concatenation)
+        try:
+            for task in tasks:
+                try:
+                    task.cancel(timeout)
+                except Exception:
+                    # a failed task reports its exception when being flushed
+                    logger.debug(f"Error while canceling {task}", exc_info=True)
+        finally:
+            shutil.rmtree(self._segment_dir, ignore_errors=True)
+
+    @property
+    def completed(self):
+        return self._concatenation is not None and self._concatenation.completed
+
+    @property
+    def canceled(self):
+        return (
+            self._canceled
+            or any(export.canceled for export in self._segment_exports)
+            or (self._concatenation is not None and self._concatenation.canceled)
+        )
+
+
+class Segmented_Export_Task(ManagedTask):
+    """ManagedTask running a `Segmented_World_Video_Export` instead of a process"""
+
+    def start(self):
+        assert self.task_proxy is None
+        self.task_proxy = self.task(self.heading, *self.args)
+
+
+def _concatenate_world_video_segments(rec_dir, segment_paths, out_file_path):
+    from av_writer import concatenate_video_segments
+    from video_capture.utils import Video
+
+    yield "Concatenating segments"
+    if os.path.isfile(out_file_path):
+        logger.warning("Video out file already exsists. I will overwrite!")
+        os.remove(out_file_path)
+    concatenate_video_segments(
+        segment_paths,
+        out_file_path,
+        start_time_synced=Video(segment_paths[0]).timestamps[0],
+        audio_dir=rec_dir,
+        timestamp_export_format="all",
+    )
+    logger.info("Export done: Concatenated video segments to {}".format(out_file_path))
+    yield "Export done"
+
+
 class GlobalContainer(object):
     pass
 
@@ -98,17 +302,23 @@ def _export_world_video(
     plugin_initializers,
     out_file_path,
     pre_computed_eye_data,
+    sync_frame=None,
+    with_audio=True,
+    timestamp_export_format="all",
 ):
     """
     Simulates the generation for the world video and saves a certain time range as a video.
     It simulates a whole g_pool such that all plugins run as normal.
+
+    Video pts are relative to the timestamp of `sync_frame`, the start frame by
+    default. Segments of the same export share the same `sync_frame`.
     """
     from glob import glob
     from time import time
 
     import file_methods as fm
     import player_methods as pm
-    from av_writer import MPEG_Audio_Writer
+    from av_writer import MPEG_Audio_Writer, MPEG_Writer
 
     # we are not importing manual gaze correction. In Player corrections have already been applied.
     # in batch exporter this plugin makes little sense.
@@ -209,9 +419,16 @@ def _export_world_video(
         )
 
         # setup of writer
-        writer = MPEG_Audio_Writer(
-            out_file_path, start_time_synced=trimmed_timestamps[0], audio_dir=rec_dir
-        )
+        if sync_frame is None:
+            start_time_synced = trimmed_timestamps[0]
+        else:
+            start_time_synced = timestamps[sync_frame]
+        if with_audio:
+            writer = MPEG_Audio_Writer(
+                out_file_path, start_time_synced=start_time_synced, audio_dir=rec_dir
+            )
+        else:
+            writer = MPEG_Writer(out_file_path, start_time_synced=start_time_synced)
 
         cap.seek_to_frame(start_frame)
 
@@ -226,6 +443,9 @@ def _export_world_video(
         g_pool.delayed_notifications = {}
         g_pool.notifications = []
 
+        if not pre_computed_eye_data:
+            pre_computed_eye_data = _load_recorded_eye_data(rec_dir)
+
         for initializers in pre_computed_eye_data.values():
             initializers["data"] = [
                 fm.Serialized_Dict(msgpack_bytes=serialized)
@@ -274,7 +494,7 @@ def _export_world_video(
             current_frame += 1
             yield "Exporting with pid {}".format(PID), current_frame
 
-        writer.close(timestamp_export_format="all")
+        writer.close(timestamp_export_format=timestamp_export_format)
 
         duration = time() - start_time
         effective_fps = float(current_frame) / duration
@@ -287,3 +507,23 @@ def _export_world_video(
 
     except GeneratorExit:
         logger.warning("Video export with pid {} was canceled.".format(os.getpid()))
+
+
+def _load_recorded_eye_data(rec_dir):
+    """Eye data init dicts of the recorded pupil and gaze data, without fixations"""
+    import file_methods as fm
+
+    pupil = fm.load_pldata_file(rec_dir, "pupil")
+    gaze = fm.load_pldata_file(rec_dir, "gaze")
+    return {
+        "pupil": {
+            "data": [datum.serialized for datum in pupil.data],
+            "data_ts": pupil.timestamps,
+            "topics": pupil.topics,
+        },
+        "gaze": {
+            "data": [datum.serialized for datum in gaze.data],
+            "data_ts": gaze.timestamps,
+        },
+        "fixations": {"data": [], "start_ts": [], "stop_ts": []},
+    }
@@ -17,15 +17,25 @@ See the pupil helpers for example scripts that interface remotely:
 https://github.com/pupil-labs/pupil-helpers/tree/master/pupil_remote
 """
 
+import collections
 import logging
+import time
+
 import msgpack as serializer
 import zmq
 from zmq.utils.monitor import recv_monitor_message
 
+from shared_memory_ring import Shared_Memory_Ring_Reader, Shared_Memory_Ring_Writer
+
 # import ujson as serializer # uncomment for json serialization
 
 assert zmq.__version__ > "15.1"
 
+logger = logging.getLogger(__name__)
+
+# Topic prefix of messages sent via the shared memory transport
+SHARED_MEMORY_TOPIC_PREFIX = "shm."
+
 
 class ZMQ_handler(logging.Handler):
     """
@@ -158,21 +168,155 @@ class Msg_Streamer(ZMQ_Socket):
         assert deprecated == (), "Depracted use of send()"
         assert "topic" in payload, "`topic` field required in {}".format(payload)
 
-        if "__raw_data__" not in payload:
-            # IMPORTANT: serialize first! Else if there is an exception
-            # the next message will have an extra prepended frame
-            serialized_payload = serializer.packb(payload, use_bin_type=True)
-            self.socket.send_string(payload["topic"], flags=zmq.SNDMORE)
-            self.socket.send(serialized_payload)
+        extra_frames = payload.pop("__raw_data__", ())
+        assert isinstance(extra_frames, (list, tuple))
+        # IMPORTANT: serialize first! Else if there is an exception
+        # the next message will have an extra prepended frame
+        serialized_payload = serializer.packb(payload, use_bin_type=True)
+        self.send_frames(payload["topic"], [serialized_payload, *extra_frames])
+
+    def send_frames(self, topic, frames):
+        """Send a topic and already serialized message frames"""
+        self.socket.send_string(topic, flags=zmq.SNDMORE)
+        for frame in frames[:-1]:
+            self.socket.send(frame, flags=zmq.SNDMORE, copy=True)
+        self.socket.send(frames[-1], copy=True)
+
+
+class Shared_Memory_Msg_Streamer(Msg_Streamer):
+    """
+    Send messages to local processes via a shared memory ring buffer.
+
+    Message frames are written to the ring buffer and a small control message
+    with their location is sent with the topic prefixed by
+    SHARED_MEMORY_TOPIC_PREFIX. Messages that are too large for the ring buffer
+    are sent with the prefixed topic as a whole. Use Shared_Memory_Msg_Receiver
+    to receive both kinds.
+
+    Each message is also sent as usual for remote clients and plugins that use
+    Msg_Receiver. PUB sockets drop messages without subscribers, such that this
+    is cheap if nobody subscribed to the original topic.
+    Not threadsave. Make a new one for each thread
+    """
+
+    def __init__(self, ctx, url, hwm=None, topics=("",), **ring_kwargs):
+        super().__init__(ctx, url, hwm)
+        self.topics = tuple(topics)
+        self.ring = Shared_Memory_Ring_Writer(**ring_kwargs)
+
+    def send(self, payload, deprecated=()):
+        """Send a message with topic, payload
+
+        Only messages whose topic starts with one of `topics` are written to
+        shared memory. See Msg_Streamer.send() for the message format.
+        """
+        topic = payload.get("topic", "")
+        if not topic.startswith(self.topics):
+            super().send(payload, deprecated)
+            return
+        assert deprecated == (), "Depracted use of send()"
+
+        extra_frames = payload.pop("__raw_data__", ())
+        assert isinstance(extra_frames, (list, tuple))
+        serialized_payload = serializer.packb(payload, use_bin_type=True)
+        frames = [serialized_payload, *extra_frames]
+
+        location = self.ring.write(frames)
+        if location is None:
+            self.send_frames(SHARED_MEMORY_TOPIC_PREFIX + topic, frames)
         else:
-            extra_frames = payload.pop("__raw_data__")
-            assert isinstance(extra_frames, (list, tuple))
-            self.socket.send_string(payload["topic"], flags=zmq.SNDMORE)
-            serialized_payload = serializer.packb(payload, use_bin_type=True)
-            self.socket.send(serialized_payload, flags=zmq.SNDMORE)
-            for frame in extra_frames[:-1]:
-                self.socket.send(frame, flags=zmq.SNDMORE, copy=True)
-            self.socket.send(extra_frames[-1], copy=True)
+            control = {"topic": topic, "__shared_memory__": [self.ring.path, *location]}
+            self.send_frames(
+                SHARED_MEMORY_TOPIC_PREFIX + topic,
+                [serializer.packb(control, use_bin_type=True)],
+            )
+        self.send_frames(topic, frames)
+
+    def __del__(self):
+        self.ring.close()
+        super().__del__()
+
+
+class Shared_Memory_Msg_Receiver(Msg_Receiver):
+    """
+    Recv messages sent by Shared_Memory_Msg_Streamer in the same machine.
+    Not threadsafe. Make a new one for each thread
+
+    `recv()` returns the same topics and payloads as Msg_Receiver. The payload is
+    deserialized from shared memory, while '__raw_data__' frames are memoryviews
+    into shared memory that are valid until the sender overwrites them. Copy the
+    frames if they need to be kept for longer than the current loop iteration.
+
+    Messages that were overwritten before they were received are dropped. They
+    are counted in `dropped_count` and reported as warnings.
+    """
+
+    # Rings of restarted senders are closed after a while
+    max_open_rings = 8
+    # Minimal interval between two warnings about dropped messages in seconds
+    drop_warning_interval = 5.0
+
+    def __init__(self, *args, **kwargs):
+        self._rings = collections.OrderedDict()
+        self.dropped_count = 0
+        self._dropped_count_warned = 0
+        self._last_drop_warning = -float("inf")
+        super().__init__(*args, **kwargs)
+
+    def subscribe(self, topic):
+        super().subscribe(SHARED_MEMORY_TOPIC_PREFIX + topic)
+
+    def unsubscribe(self, topic):
+        super().unsubscribe(SHARED_MEMORY_TOPIC_PREFIX + topic)
+
+    def recv(self):
+        """Recv a message with topic, payload.
+
+        Blocks until a message that was not overwritten yet is available.
+        """
+        while True:
+            topic, payload = super().recv()
+            topic = topic[len(SHARED_MEMORY_TOPIC_PREFIX) :]
+            location = payload.get("__shared_memory__")
+            if location is None:
+                return topic, payload
+            path, offset, sequence = location
+            try:
+                ring = self._ring(path)
+            except OSError:
+                # The sender stopped and removed its ring buffer
+                frames = None
+            else:
+                frames = ring.read(offset, sequence)
+            if frames is not None:
+                payload = self.deserialize_payload(*frames)
+                if ring.is_valid(offset, sequence):
+                    return topic, payload
+            self.dropped_count += 1
+            self._warn_about_dropped_messages(topic)
+
+    def _warn_about_dropped_messages(self, topic):
+        now = time.monotonic()
+        if now - self._last_drop_warning < self.drop_warning_interval:
+            return
+        dropped = self.dropped_count - self._dropped_count_warned
+        logger.warning(
+            f"Dropped {dropped} shared memory message(s), e.g. '{topic}', that were"
+            " overwritten before they were received. The receiving process is"
+            " falling behind."
+        )
+        self._dropped_count_warned = self.dropped_count
+        self._last_drop_warning = now
+
+    def _ring(self, path):
+        try:
+            self._rings.move_to_end(path)
+        except KeyError:
+            self._rings[path] = Shared_Memory_Ring_Reader(path)
+            if len(self._rings) > self.max_open_rings:
+                _, oldest_ring = self._rings.popitem(last=False)
+                oldest_ring.close()
+        return self._rings[path]
 
 
 class Msg_Dispatcher(Msg_Streamer):
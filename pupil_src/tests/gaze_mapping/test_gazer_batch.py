@@ -0,0 +1,127 @@
+"""
+(*)~---------------------------------------------------------------------------
+Pupil - eye tracking platform
+Copyright (C) 2012-2020 Pupil Labs
+
+Distributed under the terms of the GNU
+Lesser General Public License (LGPL v3.0).
+See COPYING and COPYING.LESSER for license details.
+---------------------------------------------------------------------------~(*)
+"""
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from camera_models import Radial_Dist_Camera
+from gaze_mapping.gazer_2d import Gazer2D
+from gaze_mapping.gazer_3d.gazer_headset import Gazer3D
+
+
+@pytest.fixture
+def g_pool():
+    resolution = (1280, 720)
+    K = [[800.0, 0.0, 640.0], [0.0, 800.0, 360.0], [0.0, 0.0, 1.0]]
+    D = [[-0.4, 0.2, 0.0, 0.0, -0.05]]
+    capture = SimpleNamespace(
+        frame_size=resolution,
+        intrinsics=Radial_Dist_Camera(K, D, resolution, "synthetic"),
+    )
+    return SimpleNamespace(capture=capture)
+
+
+def _eye_camera_to_world_matrix(translation_x, angle):
+    matrix = np.eye(4)
+    c, s = np.cos(angle), np.sin(angle)
+    matrix[:3, :3] = [[c, 0.0, s], [0.0, 1.0, 0.0], [-s, 0.0, c]]
+    matrix[:3, 3] = (translation_x, 15.0, -20.0)
+    return matrix.tolist()
+
+
+def _pupil_matches(count=500, seed=0):
+    rng = np.random.default_rng(seed)
+    matches = []
+    for idx in range(count):
+        pupils = []
+        for eye_id in (0, 1):
+            normal = rng.normal(size=3) * 0.1 + (0.0, 0.0, -1.0)
+            normal /= np.linalg.norm(normal)
+            pupils.append(
+                {
+                    "id": eye_id,
+                    "norm_pos": tuple(rng.uniform(0.2, 0.8, size=2).tolist()),
+                    "sphere": {"center": tuple(rng.normal(size=3) + (0, 0, 35))},
+                    "circle_3d": {"normal": tuple(normal.tolist())},
+                    "confidence": float(rng.uniform(0.6, 1.0)),
+                    "timestamp": idx * 0.005 + eye_id * 0.001,
+                }
+            )
+        kind = rng.integers(3)
+        matches.append(pupils if kind == 2 else [pupils[kind]])
+    return matches
+
+
+def _assert_same_gaze(expected, actual):
+    assert len(actual) == len(expected)
+    actual_by_base_data = {id(g["base_data"]): g for g in actual}
+    for expected_gaze in expected:
+        actual_gaze = actual_by_base_data[id(expected_gaze["base_data"])]
+        assert actual_gaze.keys() == expected_gaze.keys()
+        for key, value in expected_gaze.items():
+            if key in ("topic", "base_data"):
+                assert actual_gaze[key] == value
+            elif isinstance(value, dict):
+                for eye_id in value:
+                    assert np.allclose(actual_gaze[key][eye_id], value[eye_id])
+            else:
+                assert np.allclose(actual_gaze[key], value)
+
+
+def test_gazer_2d_predict_batch(g_pool):
+    rng = np.random.default_rng(1)
+    params = {
+        "left_model": {"coef_": rng.normal(size=(2, 6)), "intercept_": [0.1, 0.2]},
+        "right_model": {"coef_": rng.normal(size=(2, 6)), "intercept_": [0.2, 0.1]},
+        "binocular_model": {
+            "coef_": rng.normal(size=(2, 12)),
+            "intercept_": [0.3, 0.3],
+        },
+    }
+    gazer = Gazer2D(g_pool, params=params)
+    matches = _pupil_matches()
+
+    expected = list(gazer.predict(matches))
+    actual = gazer.predict_batch(matches)
+    _assert_same_gaze(expected, actual)
+
+
+@pytest.mark.parametrize("link_binocular_model", [True, False])
+def test_gazer_3d_predict_batch(g_pool, link_binocular_model):
+    params = {
+        "left_model": {
+            "eye_camera_to_world_matrix": _eye_camera_to_world_matrix(30.0, 0.2),
+            "gaze_distance": 500,
+        },
+        "right_model": {
+            "eye_camera_to_world_matrix": _eye_camera_to_world_matrix(-30.0, -0.2),
+            "gaze_distance": 500,
+        },
+        "binocular_model": {
+            "eye_camera_to_world_matrix0": _eye_camera_to_world_matrix(-30.0, -0.2),
+            "eye_camera_to_world_matrix1": _eye_camera_to_world_matrix(30.0, 0.2),
+        },
+    }
+    serial_gazer = Gazer3D(g_pool, params=params)
+    batch_gazer = Gazer3D(g_pool, params=params)
+    if link_binocular_model:
+        for gazer in (serial_gazer, batch_gazer):
+            gazer.left_model.binocular_model = gazer.binocular_model
+            gazer.right_model.binocular_model = gazer.binocular_model
+    matches = _pupil_matches()
+
+    expected = list(serial_gazer.predict(matches))
+    actual = batch_gazer.predict_batch(matches)
+    _assert_same_gaze(expected, actual)
+    assert batch_gazer.binocular_model.last_gaze_distance == pytest.approx(
+        serial_gazer.binocular_model.last_gaze_distance
+    )
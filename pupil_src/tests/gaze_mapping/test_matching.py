@@ -0,0 +1,114 @@
+"""
+(*)~---------------------------------------------------------------------------
+Pupil - eye tracking platform
+Copyright (C) 2012-2020 Pupil Labs
+
+Distributed under the terms of the GNU
+Lesser General Public License (LGPL v3.0).
+See COPYING and COPYING.LESSER for license details.
+---------------------------------------------------------------------------~(*)
+"""
+import numpy as np
+
+from gaze_mapping.matching import BatchMatcher, RealtimeMatcher
+
+
+def _binocular_stream(duration=2.0, rate=200.0, offset=0.001):
+    ts0 = np.arange(0.0, duration, 1 / rate)
+    ts1 = ts0 + offset
+    timestamps = np.concatenate([ts0, ts1])
+    eye_ids = np.concatenate([np.zeros_like(ts0), np.ones_like(ts1)]).astype(int)
+    order = np.argsort(timestamps, kind="stable")
+    return timestamps[order], eye_ids[order]
+
+
+def test_batch_matcher_binocular():
+    timestamps, eye_ids = _binocular_stream()
+    confidences = np.ones_like(timestamps)
+
+    first, second = BatchMatcher().match(timestamps, confidences, eye_ids)
+
+    assert len(first) == len(timestamps)
+
+    # all but the last datum are matched binocularly
+    assert np.all(second[:-1] >= 0)
+    assert second[-1] == -1
+    assert np.all(eye_ids[first[second >= 0]] == 0)
+    assert np.all(eye_ids[second[second >= 0]] == 1)
+
+
+def test_batch_matcher_low_confidence_and_gaps():
+    timestamps, eye_ids = _binocular_stream()
+    confidences = np.ones_like(timestamps)
+    low_confidence = np.flatnonzero(eye_ids == 1)[::3]
+    confidences[low_confidence] = 0.1
+    # remove eye 1 data for half a second
+    keep = ~((eye_ids == 1) & (timestamps > 0.5) & (timestamps < 1.0))
+    timestamps, eye_ids, confidences = (
+        timestamps[keep],
+        eye_ids[keep],
+        confidences[keep],
+    )
+    low_confidence = np.flatnonzero(confidences < 0.6)
+
+    first, second = BatchMatcher().match(timestamps, confidences, eye_ids)
+
+    assert len(first) == len(timestamps)
+    binocular = second >= 0
+    # low confidence data is never matched binocularly
+    assert not np.isin(low_confidence, first[binocular]).any()
+    assert not np.isin(low_confidence, second[binocular]).any()
+    assert np.isin(low_confidence, first[~binocular]).all()
+    # binocular matches before the gap are close in time
+    before_gap = binocular & (timestamps[first] < 0.49)
+    dt = np.abs(timestamps[first[before_gap]] - timestamps[second[before_gap]])
+    assert np.all(dt < 2 / 200.0)
+    # eye 0 data within the gap is matched monocularly
+    in_gap = np.flatnonzero((timestamps > 0.52) & (timestamps < 0.9))
+    assert np.isin(in_gap, first[~binocular]).all()
+
+
+def _stream_with_dropped_frames(seed, rate=120.0, duration=5.0):
+    rng = np.random.default_rng(seed)
+    timestamps, eye_ids = [], []
+    for eye_id in (0, 1):
+        ts = np.arange(0.0, duration, 1 / rate) + eye_id * 0.002
+        ts += rng.normal(scale=0.0003, size=ts.size)
+        keep = rng.random(ts.size) > 0.1
+        if eye_id == 1:
+            keep &= (ts < 2.0) | (ts > 2.3)
+        timestamps.append(ts[keep])
+        eye_ids.append(np.full(np.count_nonzero(keep), eye_id))
+    timestamps, eye_ids = np.concatenate(timestamps), np.concatenate(eye_ids)
+    order = np.lexsort((1 - eye_ids, timestamps))
+    confidences = np.where(rng.random(order.size) < 0.1, 0.3, 0.9)
+    return timestamps[order], confidences, eye_ids[order]
+
+
+def test_batch_matcher_agrees_with_realtime_matcher():
+    for seed in range(3):
+        timestamps, confidences, eye_ids = _stream_with_dropped_frames(seed)
+        pupil_data = [
+            {"id": int(eye_id), "timestamp": ts, "confidence": conf, "index": idx}
+            for idx, (ts, conf, eye_id) in enumerate(
+                zip(timestamps.tolist(), confidences.tolist(), eye_ids.tolist())
+            )
+        ]
+        realtime = {
+            tuple(sorted(p["index"] for p in match))
+            for match in RealtimeMatcher().map_batch(pupil_data)
+        }
+
+        first, second = BatchMatcher().match(timestamps, confidences, eye_ids)
+        batch = {
+            tuple(sorted(idx for idx in match if idx >= 0))
+            for match in zip(first.tolist(), second.tolist())
+        }
+
+        # RealtimeMatcher leaves the data of its last calls in its caches
+        realtime_indices = {idx for match in realtime for idx in match}
+        batch = {
+            match for match in batch if all(i in realtime_indices for i in match)
+        }
+        # the estimated frame periods differ slightly, see BatchMatcher
+        assert len(realtime - batch) <= 0.01 * len(realtime)
@@ -0,0 +1,159 @@
+"""
+(*)~---------------------------------------------------------------------------
+Pupil - eye tracking platform
+Copyright (C) 2012-2020 Pupil Labs
+
+Distributed under the terms of the GNU
+Lesser General Public License (LGPL v3.0).
+See COPYING and COPYING.LESSER for license details.
+---------------------------------------------------------------------------~(*)
+"""
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from gaze_mapping.gazer_2d import Gazer2D
+from gaze_mapping.utils import (
+    _find_nearest_idx,
+    _match_data_batch,
+    closest_matches_binocular,
+    closest_matches_monocular,
+)
+
+
+def _reference_closest_matches_binocular(ref_pts, pupil0, pupil1, max_dispersion):
+    """Matching loop as it was before vectorization"""
+    matched = []
+    if not (ref_pts and pupil0 and pupil1):
+        return matched
+    pupil0_ts = np.array([p["timestamp"] for p in pupil0])
+    pupil1_ts = np.array([p["timestamp"] for p in pupil1])
+    for r in ref_pts:
+        closest_p0 = pupil0[_find_nearest_idx(pupil0_ts, r["timestamp"])]
+        closest_p1 = pupil1[_find_nearest_idx(pupil1_ts, r["timestamp"])]
+        timestamps = (closest_p0["timestamp"], closest_p1["timestamp"], r["timestamp"])
+        if max(timestamps) - min(timestamps) < max_dispersion:
+            matched.append({"ref": r, "pupil": closest_p0, "pupil1": closest_p1})
+    return matched
+
+
+def _reference_closest_matches_monocular(ref_pts, pupil, max_dispersion):
+    """Matching loop as it was before vectorization"""
+    matched = []
+    if not (ref_pts and pupil):
+        return matched
+    pupil_ts = np.array([p["timestamp"] for p in pupil])
+    for r in ref_pts:
+        closest_p = pupil[_find_nearest_idx(pupil_ts, r["timestamp"])]
+        timestamps = (closest_p["timestamp"], r["timestamp"])
+        if max(timestamps) - min(timestamps) < max_dispersion:
+            matched.append({"ref": r, "pupil": closest_p})
+    return matched
+
+
+def _calibration_data(duration=60.0, ref_rate=30.0, pupil_rate=200.0, seed=0):
+    rng = np.random.default_rng(seed)
+    ref_ts = np.sort(rng.uniform(-1.0, duration + 1.0, int(duration * ref_rate)))
+    # reference data on pupil timestamps and in the middle between two of them
+    ref_ts[:10] = np.arange(10) / pupil_rate
+    ref_ts[10:20] = (np.arange(10) + 0.5) / pupil_rate
+    ref_list = [
+        {"timestamp": float(ts), "norm_pos": tuple(rng.uniform(size=2).tolist())}
+        for ts in ref_ts
+    ]
+
+    pupil_list = []
+    for eye_id in (0, 1):
+        pupil_ts = np.arange(0.0, duration, 1 / pupil_rate) + eye_id * 0.002
+        pupil_ts += rng.normal(scale=0.0005, size=pupil_ts.shape)
+        # gaps of a few seconds without pupil data of this eye
+        gap_start = duration * (0.25 + 0.5 * eye_id)
+        pupil_ts = pupil_ts[(pupil_ts < gap_start) | (pupil_ts > gap_start + 3)]
+        pupil_list.extend(
+            {
+                "id": eye_id,
+                "timestamp": float(ts),
+                "norm_pos": tuple(rng.uniform(size=2).tolist()),
+                "confidence": 1.0,
+            }
+            for ts in np.sort(pupil_ts)
+        )
+    pupil_list.sort(key=lambda p: p["timestamp"])
+    return pupil_list, ref_list
+
+
+def _split_eyes(pupil_list):
+    return (
+        [p for p in pupil_list if p["id"] == 0],
+        [p for p in pupil_list if p["id"] == 1],
+    )
+
+
+def _assert_same_matches(expected, actual):
+    assert len(actual) == len(expected)
+    for expected_match, actual_match in zip(expected, actual):
+        assert actual_match.keys() == expected_match.keys()
+        for key, datum in expected_match.items():
+            assert actual_match[key] is datum
+
+
+@pytest.mark.parametrize("max_dispersion", [1 / 15.0, 0.002, 0.0])
+def test_closest_matches_are_identical_to_loop(max_dispersion):
+    pupil_list, ref_list = _calibration_data()
+    pupil0, pupil1 = _split_eyes(pupil_list)
+
+    _assert_same_matches(
+        _reference_closest_matches_binocular(ref_list, pupil0, pupil1, max_dispersion),
+        closest_matches_binocular(ref_list, pupil0, pupil1, max_dispersion),
+    )
+    for pupil in (pupil0, pupil1, pupil0[:1], []):
+        _assert_same_matches(
+            _reference_closest_matches_monocular(ref_list, pupil, max_dispersion),
+            closest_matches_monocular(ref_list, pupil, max_dispersion),
+        )
+
+
+def test_match_features_to_ref_equals_features_of_matches():
+    pupil_list, ref_list = _calibration_data(duration=10.0)
+    g_pool = SimpleNamespace(capture=SimpleNamespace(frame_size=(1280, 720)))
+    params = {
+        "left_model": {"coef_": np.zeros((2, 6)), "intercept_": [0.0, 0.0]},
+        "right_model": {"coef_": np.zeros((2, 6)), "intercept_": [0.0, 0.0]},
+        "binocular_model": {"coef_": np.zeros((2, 12)), "intercept_": [0.0, 0.0]},
+    }
+    gazer = Gazer2D(g_pool, params=params)
+
+    bino, right, left = _match_data_batch(pupil_list, ref_list)
+    features = gazer.match_features_to_ref(pupil_list, ref_list)
+
+    expected = gazer.extract_features_from_matches_binocular(bino)
+    for expected_array, actual_array in zip(expected, features.binocular):
+        np.testing.assert_array_equal(actual_array, expected_array)
+    for matches, actual in ((right, features.right), (left, features.left)):
+        expected = gazer.extract_features_from_matches_monocular(matches)
+        for expected_array, actual_array in zip(expected, actual):
+            np.testing.assert_array_equal(actual_array, expected_array)
+
+
+def bench_closest_matches(duration=60 * 60):
+    import time
+
+    pupil_list, ref_list = _calibration_data(duration=duration)
+    pupil0, pupil1 = _split_eyes(pupil_list)
+    print(f"Generated {len(ref_list)} reference and {len(pupil_list)} pupil data")
+
+    start = time.perf_counter()
+    actual = closest_matches_binocular(ref_list, pupil0, pupil1)
+    print(f"Vectorized: {len(actual)} matches in {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    expected = _reference_closest_matches_binocular(
+        ref_list, pupil0, pupil1, max_dispersion=1 / 15.0
+    )
+    print(f"Reference: {len(expected)} matches in {time.perf_counter() - start:.2f}s")
+    print("Identical matches:", actual == expected)
+
+
+if __name__ == "__main__":
+    bench_closest_matches()
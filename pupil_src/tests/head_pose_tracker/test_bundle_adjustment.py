@@ -0,0 +1,186 @@
+"""
+(*)~---------------------------------------------------------------------------
+Pupil - eye tracking platform
+Copyright (C) 2012-2020 Pupil Labs
+
+Distributed under the terms of the GNU
+Lesser General Public License (LGPL v3.0).
+See COPYING and COPYING.LESSER for license details.
+---------------------------------------------------------------------------~(*)
+"""
+import cv2
+import numpy as np
+import pytest
+
+from camera_models import Fisheye_Dist_Camera, Radial_Dist_Camera
+from head_pose_tracker.function import BundleAdjustment, projection, utils
+from head_pose_tracker.function.get_initial_guess import InitialGuess
+from head_pose_tracker.function.pick_key_markers import KeyMarker
+from head_pose_tracker.storage import Markers3DModel
+from head_pose_tracker.worker.optimization_worker import optimization_routine
+
+RESOLUTION = (1280, 720)
+K = [[800.0, 0.0, 640.0], [0.0, 810.0, 360.0], [0.0, 0.0, 1.0]]
+
+
+def _radial_camera():
+    D = [[-0.3, 0.1, 0.001, -0.002, -0.02]]
+    return Radial_Dist_Camera(K, D, RESOLUTION, "synthetic")
+
+
+def _fisheye_camera():
+    D = [[0.05, -0.01, 0.002, -0.001]]
+    return Fisheye_Dist_Camera(K, D, RESOLUTION, "synthetic")
+
+
+def _numeric_jacobian(function, x, step=1e-6):
+    columns = []
+    for idx in range(len(x)):
+        dx = np.zeros_like(x)
+        dx[idx] = step
+        columns.append((function(x + dx) - function(x - dx)) / (2 * step))
+    return np.stack(columns, axis=-1)
+
+
+def test_rodrigues_and_rotation_derivative():
+    rng = np.random.default_rng(0)
+    rvecs = np.vstack([rng.normal(size=(5, 3)), np.zeros((1, 3)), [[1e-7, 0, 0]]])
+    rotations = projection.rodrigues(rvecs)
+    for rvec, rotation in zip(rvecs, rotations):
+        np.testing.assert_allclose(rotation, cv2.Rodrigues(rvec)[0], atol=1e-12)
+
+    point = np.array([0.3, -1.2, 2.0])
+    factors = projection.rotation_jacobian_factors(rvecs, rotations)
+    for rvec, rotation, factor in zip(rvecs, rotations, factors):
+        expected = _numeric_jacobian(
+            lambda r: projection.rodrigues(r)[0] @ point, rvec
+        )
+        actual = -rotation @ projection.skew(point) @ factor
+        np.testing.assert_allclose(actual, expected, atol=1e-6)
+
+
+@pytest.mark.parametrize("camera", [_radial_camera(), _fisheye_camera()])
+def test_project_points_matches_camera_model(camera):
+    rng = np.random.default_rng(1)
+    points_3d = rng.uniform((-3, -2, 5), (3, 2, 10), size=(50, 3))
+    points_3d[0] = (0.0, 0.0, 5.0)
+    params = np.concatenate(([800.0, 810.0, 640.0, 360.0], camera.D.ravel()))
+
+    points_2d, jac_points, jac_intrinsics = projection.project_points(
+        points_3d, params, camera.cam_type
+    )
+    np.testing.assert_allclose(points_2d, camera.projectPoints(points_3d), atol=1e-6)
+
+    for point, jac_point, jac_intrinsic in zip(points_3d, jac_points, jac_intrinsics):
+        expected = _numeric_jacobian(
+            lambda p: projection.project_points(p, params, camera.cam_type)[0], point
+        )
+        np.testing.assert_allclose(jac_point, expected, rtol=1e-5, atol=1e-5)
+        expected = _numeric_jacobian(
+            lambda x: projection.project_points(point, x, camera.cam_type)[0], params
+        )
+        np.testing.assert_allclose(jac_intrinsic, expected, rtol=1e-5, atol=1e-5)
+
+
+def _synthetic_scene(camera, n_frames=40, seed=2):
+    rng = np.random.default_rng(seed)
+    marker_id_to_extrinsics = {0: utils.get_marker_extrinsics_origin()}
+    for marker_id in range(1, 6):
+        rotation = rng.normal(scale=0.2, size=3)
+        translation = (rng.uniform(-3, 3), rng.uniform(-2, 2), rng.normal(scale=0.2))
+        marker_id_to_extrinsics[marker_id] = np.concatenate((rotation, translation))
+
+    frame_id_to_extrinsics = {}
+    key_markers = []
+    for frame_idx in range(n_frames):
+        frame_id = frame_idx / 30.0
+        extrinsics = np.concatenate(
+            (rng.normal(scale=0.1, size=3), (rng.normal(), rng.normal(), 12.0))
+        )
+        frame_id_to_extrinsics[frame_id] = extrinsics
+        for marker_id, marker_extrinsics in marker_id_to_extrinsics.items():
+            points_3d = utils.convert_marker_extrinsics_to_points_3d(
+                marker_extrinsics
+            ).astype(np.float64)
+            verts = camera.projectPoints(points_3d, extrinsics[:3], extrinsics[3:])
+            verts += rng.normal(scale=0.1, size=verts.shape)
+            key_markers.append(KeyMarker(frame_id, marker_id, verts, (0, 0)))
+    return key_markers, frame_id_to_extrinsics, marker_id_to_extrinsics
+
+
+def _perturbed(id_to_extrinsics, rng, scale=0.02):
+    return {
+        key: extrinsics if key == 0 else extrinsics + rng.normal(scale=scale, size=6)
+        for key, extrinsics in id_to_extrinsics.items()
+    }
+
+
+@pytest.mark.parametrize("optimize_camera_intrinsics", [False, True])
+def test_analytic_jacobian_matches_finite_differences(optimize_camera_intrinsics):
+    camera = _radial_camera()
+    key_markers, frames, markers = _synthetic_scene(camera, n_frames=8)
+    rng = np.random.default_rng(3)
+    initial_guess = InitialGuess(
+        key_markers, _perturbed(frames, rng), _perturbed(markers, rng)
+    )
+
+    bundle_adjustment = BundleAdjustment(camera, optimize_camera_intrinsics)
+    assert bundle_adjustment._analytic_jacobian
+    bundle_adjustment._enough_samples = True
+    bundle_adjustment._marker_ids, bundle_adjustment._frame_ids = (
+        bundle_adjustment._set_ids(
+            initial_guess.frame_id_to_extrinsics,
+            initial_guess.marker_id_to_extrinsics,
+        )
+    )
+    bundle_adjustment._prepare_basic_data(key_markers)
+    variables, _, _ = bundle_adjustment._prepare_parameters(
+        *bundle_adjustment._set_init_array(
+            initial_guess.frame_id_to_extrinsics,
+            initial_guess.marker_id_to_extrinsics,
+        )
+    )
+
+    actual = bundle_adjustment._function_compute_jacobian(variables).toarray()
+    expected = _numeric_jacobian(
+        bundle_adjustment._function_compute_residuals, variables, step=1e-7
+    )
+    np.testing.assert_allclose(actual, expected, rtol=1e-4, atol=1e-3)
+
+
+@pytest.mark.parametrize("max_key_frames", [None, 10])
+def test_bundle_adjustment_recovers_marker_model(max_key_frames):
+    camera = _radial_camera()
+    key_markers, frames, markers = _synthetic_scene(camera)
+    rng = np.random.default_rng(4)
+    initial_guess = InitialGuess(
+        key_markers, _perturbed(frames, rng), _perturbed(markers, rng)
+    )
+
+    result = BundleAdjustment(camera, False).calculate(initial_guess, max_key_frames)
+
+    assert not result.frame_ids_failed
+    assert result.marker_id_to_extrinsics.keys() == markers.keys()
+    for marker_id, extrinsics in markers.items():
+        np.testing.assert_allclose(
+            result.marker_id_to_extrinsics[marker_id], extrinsics, atol=0.05
+        )
+    if max_key_frames is None:
+        assert result.frame_id_to_extrinsics.keys() == frames.keys()
+    else:
+        assert len(result.frame_id_to_extrinsics) == max_key_frames
+
+
+def test_optimization_routine_keeps_frames_left_out_of_subsample():
+    camera = _radial_camera()
+    key_markers, frames, _ = _synthetic_scene(camera)
+    bg_storage = Markers3DModel(user_defined_origin_marker_id=0)
+    bg_storage.all_key_markers = key_markers
+    bundle_adjustment = BundleAdjustment(camera, False)
+
+    _, frame_id_to_extrinsics, frame_ids_failed, _ = optimization_routine(
+        bg_storage, camera, bundle_adjustment, max_key_frames=10
+    )
+
+    assert not frame_ids_failed
+    assert frame_id_to_extrinsics.keys() == frames.keys()
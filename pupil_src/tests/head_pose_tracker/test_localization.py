@@ -0,0 +1,177 @@
+"""
+(*)~---------------------------------------------------------------------------
+Pupil - eye tracking platform
+Copyright (C) 2012-2020 Pupil Labs
+
+Distributed under the terms of the GNU
+Lesser General Public License (LGPL v3.0).
+See COPYING and COPYING.LESSER for license details.
+---------------------------------------------------------------------------~(*)
+"""
+import types
+
+import numpy as np
+import pytest
+
+import player_methods as pm
+from head_pose_tracker.controller import offline_localization_controller
+from head_pose_tracker.storage.localization_storage import CameraPoseCache
+from head_pose_tracker.worker import localization_worker
+from head_pose_tracker.worker.localization_worker import (
+    detections_digest,
+    offline_localization,
+)
+
+CAMERA = types.SimpleNamespace(K=np.eye(3), D=np.zeros((1, 5)))
+
+
+def _marker(marker_id, offset=0.0):
+    verts = np.array([[0, 0], [10, 0], [10, 10], [0, 10]], dtype=np.float32)
+    return {"id": marker_id, "verts": (verts + offset).tolist()}
+
+
+def test_detections_digest():
+    markers = [_marker(1), _marker(2)]
+    assert detections_digest(markers) == detections_digest(markers[::-1])
+    assert detections_digest(markers) != detections_digest([_marker(1)])
+    assert detections_digest(markers) != detections_digest(
+        [_marker(1), _marker(2, offset=0.5)]
+    )
+
+
+def test_pose_cache_is_keyed_by_markers_model(tmp_path):
+    file_path = str(tmp_path / "offline_data" / "camera_pose_cache")
+    model = {0: np.zeros(6), 1: np.ones(6)}
+
+    cache = CameraPoseCache(file_path)
+    cache.set_model(model, CAMERA)
+    cache.update([(3, "a", [0.0] * 6), (5, "b", None), (9, "c", [1.0] * 6)])
+    cache.save_to_disk()
+
+    loaded = CameraPoseCache(file_path)
+    loaded.set_model(model, CAMERA)
+    assert loaded.get_range((4, 9)) == {5: ("b", None), 9: ("c", [1.0] * 6)}
+
+    loaded.set_model({0: np.zeros(6)}, CAMERA)
+    assert len(loaded) == 0
+
+
+def test_mutable_bisector_insert_many():
+    bisector = pm.Mutable_Bisector([{"ts": 1.0}, {"ts": 3.0}], [1.0, 3.0])
+    bisector.insert_many([4.0, 0.5, 2.0], [{"ts": 4.0}, {"ts": 0.5}, {"ts": 2.0}])
+    np.testing.assert_array_equal(bisector.timestamps, [0.5, 1.0, 2.0, 3.0, 4.0])
+    assert [datum["ts"] for datum in bisector] == [0.5, 1.0, 2.0, 3.0, 4.0]
+
+
+def test_offline_localization_reuses_cached_and_previous_poses(monkeypatch):
+    # marker 7 cannot be localized
+    frame_markers = [
+        [_marker(1)],
+        [_marker(1)],  # same as previous frame
+        [_marker(7)],
+        [_marker(7)],  # same as previous frame, which was not localized
+        [],
+        [_marker(1)],
+        [_marker(2)],  # cached
+        [_marker(3)],  # cached with other detections
+    ]
+    timestamps = np.arange(len(frame_markers)) / 30
+    data = [
+        {**marker, "timestamp": timestamp}
+        for markers, timestamp in zip(frame_markers, timestamps)
+        for marker in markers
+    ]
+    markers_bisector = pm.Bisector(data, [datum["timestamp"] for datum in data])
+    frame_index_to_num_markers = {
+        frame_index: len(markers) for frame_index, markers in enumerate(frame_markers)
+    }
+    cached_pose = [2.0, 0.0, 0.0, 0.0, 0.0, 1.0]
+    frame_index_to_cached_pose = {
+        6: (detections_digest([_marker(2)]), cached_pose),
+        7: (detections_digest([_marker(2)]), cached_pose),
+    }
+
+    localized_marker_ids = []
+
+    def calculate(camera_intrinsics, markers_in_frame, *args, **kwargs):
+        marker_id = markers_in_frame[0]["id"]
+        localized_marker_ids.append(marker_id)
+        if marker_id == 7:
+            return None
+        return np.array([marker_id, 0, 0, 0, 0, 1], dtype=np.float32)
+
+    monkeypatch.setattr(localization_worker.solvepnp, "calculate", calculate)
+
+    batches = list(
+        offline_localization(
+            timestamps,
+            (0, len(frame_markers) - 1),
+            markers_bisector,
+            frame_index_to_num_markers,
+            {1: np.zeros(6), 2: np.zeros(6), 3: np.zeros(6)},
+            CAMERA,
+            frame_index_to_cached_pose,
+            types.SimpleNamespace(progress=0.0),
+        )
+    )
+    data_pairs = [pair for pairs, _ in batches for pair in pairs]
+    frame_results = [result for _, results in batches for result in results]
+
+    assert localized_marker_ids == [1, 7, 1, 3]
+    assert [
+        (frame_index, None if pose is None else pose[0])
+        for frame_index, _, pose in frame_results
+    ] == [(0, 1), (1, 1), (2, None), (3, None), (5, 1), (6, 2), (7, 3)]
+    assert [digest for _, digest, _ in frame_results] == [
+        detections_digest(frame_markers[frame_index])
+        for frame_index, _, _ in frame_results
+    ]
+    localized_frames = [0, 1, 5, 6, 7]
+    assert [ts for ts, _ in data_pairs] == list(timestamps[localized_frames])
+
+
+def _shard_ranges(frame_index_to_num_markers, frame_index_range):
+    controller = offline_localization_controller.OfflineLocalizationController.__new__(
+        offline_localization_controller.OfflineLocalizationController
+    )
+    controller._general_settings = types.SimpleNamespace(
+        localization_frame_index_range=frame_index_range
+    )
+    controller._detection_storage = types.SimpleNamespace(
+        frame_index_to_num_markers=frame_index_to_num_markers
+    )
+    return controller._get_shard_ranges()
+
+
+@pytest.mark.parametrize("cpu_count", [1, 2, 5, 16])
+def test_shard_ranges_cover_localization_range_once(monkeypatch, cpu_count):
+    monkeypatch.setattr(
+        offline_localization_controller.mp, "cpu_count", lambda: cpu_count
+    )
+    # markers in every other frame, none in a long gap
+    frame_index_to_num_markers = {
+        frame_index: int(frame_index % 2 == 0 and not 1000 <= frame_index < 2000)
+        for frame_index in range(5000)
+    }
+    frame_index_range = (101, 4900)
+
+    shard_ranges = _shard_ranges(frame_index_to_num_markers, frame_index_range)
+
+    n_frames_with_markers = sum(
+        frame_index_to_num_markers[idx]
+        for idx in range(frame_index_range[0], frame_index_range[1] + 1)
+    )
+    assert len(shard_ranges) == min(max(1, cpu_count - 1), n_frames_with_markers // 300)
+    covered = [idx for start, end in shard_ranges for idx in range(start, end + 1)]
+    assert covered == list(range(frame_index_range[0], frame_index_range[1] + 1))
+    frames_with_markers = [
+        sum(frame_index_to_num_markers[idx] for idx in range(start, end + 1))
+        for start, end in shard_ranges
+    ]
+    assert max(frames_with_markers) - min(frames_with_markers) <= len(shard_ranges)
+
+
+def test_few_frames_with_markers_are_not_sharded(monkeypatch):
+    monkeypatch.setattr(offline_localization_controller.mp, "cpu_count", lambda: 8)
+    frame_index_to_num_markers = {frame_index: 1 for frame_index in range(500)}
+    assert _shard_ranges(frame_index_to_num_markers, (10, 5000)) == [(10, 5000)]
@@ -0,0 +1,146 @@
+"""
+(*)~---------------------------------------------------------------------------
+Pupil - eye tracking platform
+Copyright (C) 2012-2020 Pupil Labs
+
+Distributed under the terms of the GNU
+Lesser General Public License (LGPL v3.0).
+See COPYING and COPYING.LESSER for license details.
+---------------------------------------------------------------------------~(*)
+"""
+import multiprocessing
+import types
+
+import numpy as np
+import pytest
+
+from av_writer import MPEG_Writer
+from surface_tracker import background_tasks
+
+FRAME_COUNT = 24
+
+
+class _Synchronous_Task:
+    """Runs a background generator in-process, a few results per fetch"""
+
+    def __init__(self, name, generator, args, context=None):
+        self.args = args
+        self._results = generator(*args)
+        self.completed = False
+        self.canceled = False
+
+    def fetch(self):
+        for _ in range(4):
+            try:
+                yield next(self._results)
+            except StopIteration:
+                self.completed = True
+                return
+
+    def cancel(self, timeout=None):
+        self.canceled = True
+
+
+@pytest.fixture
+def video_path(tmp_path):
+    path = tmp_path / "world.mp4"
+    writer = MPEG_Writer(str(path), 0.0)
+    for index in range(FRAME_COUNT):
+        img = np.full((48, 64, 3), index * 10 % 256, dtype=np.uint8)
+        frame = types.SimpleNamespace(
+            timestamp=index / 30,
+            index=index,
+            width=64,
+            height=48,
+            img=img,
+            yuv_buffer=None,
+        )
+        writer.write_video_frame(frame)
+    writer.close()
+    return str(path)
+
+
+@pytest.fixture
+def synchronous_tasks(monkeypatch):
+    monkeypatch.setattr(
+        background_tasks.background_helper,
+        "IPC_Logging_Task_Proxy",
+        _Synchronous_Task,
+    )
+
+
+def _frame_index(frame):
+    return frame.index
+
+
+def _process(video_path, visited_list, seek_idx, shard_count):
+    processor = background_tasks.sharded_background_video_processor(
+        video_path,
+        _frame_index,
+        visited_list,
+        seek_idx,
+        multiprocessing.get_context(),
+        shard_count,
+    )
+    processed = []
+    while not processor.completed:
+        processed.extend(processor.fetch())
+    return processor, processed
+
+
+@pytest.mark.parametrize("shard_count", [1, 3, 5, FRAME_COUNT + 3])
+def test_shards_process_every_frame_once(video_path, synchronous_tasks, shard_count):
+    visited_list = [None] * FRAME_COUNT
+    visited_list[2] = visited_list[11] = [2, 11]
+    seek_idx = multiprocessing.Value("i", -1)
+
+    processor, processed = _process(video_path, visited_list, seek_idx, shard_count)
+
+    frame_indices = [frame_idx for frame_idx, _ in processed]
+    expected = [idx for idx in range(FRAME_COUNT) if idx not in (2, 11)]
+    assert sorted(frame_indices) == expected
+
+    for frame_idx, result in processed:
+        visited_list[frame_idx] = result
+    assert visited_list == [
+        [2, 11] if idx in (2, 11) else idx for idx in range(FRAME_COUNT)
+    ]
+
+    unvisited_ranges = [
+        {idx for idx, visited in enumerate(shard.args[3]) if not visited}
+        for shard in processor._shards
+        if shard is not None
+    ]
+    assert sum(len(frames) for frames in unvisited_ranges) == len(expected)
+    assert set.union(*unvisited_ranges) == set(expected)
+
+
+def test_fully_visited_shards_are_skipped(video_path, synchronous_tasks):
+    visited_list = [None] * FRAME_COUNT
+    visited_list[: FRAME_COUNT // 2] = [[]] * (FRAME_COUNT // 2)
+    seek_idx = multiprocessing.Value("i", -1)
+
+    processor, processed = _process(video_path, visited_list, seek_idx, 2)
+
+    assert processor._shards[0] is None
+    assert [idx for idx, _ in processed] == list(range(FRAME_COUNT // 2, FRAME_COUNT))
+
+
+def test_seek_request_is_forwarded_to_shard(video_path, synchronous_tasks):
+    seek_idx = multiprocessing.Value("i", 20)
+    processor = background_tasks.sharded_background_video_processor(
+        video_path,
+        _frame_index,
+        [None] * FRAME_COUNT,
+        seek_idx,
+        multiprocessing.get_context(),
+        3,
+    )
+    shard_results = [list(shard.fetch()) for shard in processor._shards[:2]]
+    assert shard_results[0][0][0] == 0
+    assert shard_results[1][0][0] == 8
+
+    processed = list(processor.fetch())
+
+    assert seek_idx.value == -1
+    assert processed[8][0] == 20
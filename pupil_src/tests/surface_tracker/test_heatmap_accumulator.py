@@ -0,0 +1,94 @@
+"""
+(*)~---------------------------------------------------------------------------
+Pupil - eye tracking platform
+Copyright (C) 2012-2020 Pupil Labs
+
+Distributed under the terms of the GNU
+Lesser General Public License (LGPL v3.0).
+See COPYING and COPYING.LESSER for license details.
+---------------------------------------------------------------------------~(*)
+"""
+import numpy as np
+import pytest
+
+from surface_tracker.heatmap_accumulator import Heatmap_Accumulator
+from surface_tracker.surface import Surface_Mapped_Events
+
+FRAME_COUNT = 100
+
+
+@pytest.fixture
+def gaze_on_surf():
+    rng = np.random.default_rng(0)
+    row_count = 2000
+    norm_pos = rng.uniform(-0.2, 1.2, size=(row_count, 2))
+    norm_pos[:10] = [[0.0, 0.0], [1.0, 1.0], [0.5, 1.0], [1.0, 0.5], [0.2, 0.8]] * 2
+    return Surface_Mapped_Events(
+        world_index=np.sort(rng.integers(0, FRAME_COUNT, size=row_count)),
+        source_index=np.arange(row_count),
+        timestamp=np.arange(row_count) / 100.0,
+        confidence=rng.choice([0.0, 0.3, 0.6, 0.8, 1.0], size=row_count),
+        norm_pos=norm_pos,
+        on_surf=np.all((norm_pos >= 0.0) & (norm_pos <= 1.0), axis=1),
+    )
+
+
+def _expected_histogram(gaze_on_surf, section, grid, min_confidence):
+    frames = range(FRAME_COUNT)[section]
+    mask = (
+        gaze_on_surf.on_surf
+        & (gaze_on_surf.confidence >= min_confidence)
+        & (gaze_on_surf.world_index >= frames.start)
+        & (gaze_on_surf.world_index < frames.stop)
+    )
+    norm_pos = gaze_on_surf.norm_pos[mask]
+    hist, *edges = np.histogram2d(
+        1.0 - norm_pos[:, 1], norm_pos[:, 0], bins=grid, range=[[0, 1.0], [0, 1.0]]
+    )
+    return hist
+
+
+@pytest.mark.parametrize(
+    "section", [slice(None), slice(0, 7), slice(3, 5), slice(5, 50), slice(16, 96)]
+)
+def test_histogram_matches_histogram2d(gaze_on_surf, section):
+    grid = (7, 11)
+    accumulator = Heatmap_Accumulator(
+        gaze_on_surf, FRAME_COUNT, grid, min_confidence=0.6, block_length=8
+    )
+    for min_confidence in (0.6, 0.3, 0.8, 0.0, 0.6):
+        accumulator.set_min_confidence(min_confidence)
+        expected = _expected_histogram(gaze_on_surf, section, grid, min_confidence)
+        assert np.array_equal(accumulator.histogram(section), expected)
+
+
+def test_set_grid_and_gaze_count(gaze_on_surf):
+    accumulator = Heatmap_Accumulator(
+        gaze_on_surf, FRAME_COUNT, (3, 3), min_confidence=0.8, block_length=8
+    )
+    accumulator.set_grid((20, 30))
+    expected = _expected_histogram(gaze_on_surf, slice(10, 60), (20, 30), 0.8)
+    assert np.array_equal(accumulator.histogram(slice(10, 60)), expected)
+
+    in_section = (gaze_on_surf.world_index >= 10) & (gaze_on_surf.world_index < 60)
+    expected_count = np.count_nonzero(gaze_on_surf.on_surf & in_section)
+    assert accumulator.gaze_count(slice(10, 60)) == expected_count
+    assert accumulator.gaze_count(slice(30, 30)) == 0
+
+
+def test_block_length_grows_within_memory_budget(gaze_on_surf, monkeypatch):
+    monkeypatch.setattr(
+        "surface_tracker.heatmap_accumulator._max_cumulative_hists_bytes",
+        12 * 20 * 30 * 8,
+    )
+    accumulator = Heatmap_Accumulator(
+        gaze_on_surf, FRAME_COUNT, (3, 3), min_confidence=0.8, block_length=8
+    )
+    assert accumulator.block_length == 8
+
+    accumulator.set_grid((20, 30))
+    assert accumulator.block_length > 8
+    assert accumulator._cumulative_hists.nbytes <= 12 * 20 * 30 * 8
+    for section in (slice(None), slice(10, 60), slice(3, 5)):
+        expected = _expected_histogram(gaze_on_surf, section, (20, 30), 0.8)
+        assert np.array_equal(accumulator.histogram(section), expected)
@@ -0,0 +1,113 @@
+"""
+(*)~---------------------------------------------------------------------------
+Pupil - eye tracking platform
+Copyright (C) 2012-2020 Pupil Labs
+
+Distributed under the terms of the GNU
+Lesser General Public License (LGPL v3.0).
+See COPYING and COPYING.LESSER for license details.
+---------------------------------------------------------------------------~(*)
+"""
+import numpy as np
+
+import player_methods as pm
+from camera_models import Dummy_Camera
+from surface_tracker.surface import Surface_Location
+from surface_tracker.surface_offline import Surface_Offline
+
+
+def _location(scale):
+    trans = np.diag([scale / 1280, scale / 720, 1.0])
+    return Surface_Location(
+        True,
+        dist_img_to_surf_trans=trans,
+        surf_to_dist_img_trans=np.linalg.inv(trans),
+        img_to_surf_trans=trans,
+        surf_to_img_trans=np.linalg.inv(trans),
+        num_detected_markers=1,
+    )
+
+
+def _map_section_per_frame(surface, section, world_timestamps, events, camera_model):
+    results = []
+    for frame_idx in range(section.start, section.stop):
+        location = surface.location_cache[frame_idx]
+        if not (location and location.detected):
+            continue
+        window = pm.enclosing_window(world_timestamps, frame_idx)
+        mapped = surface.map_gaze_and_fixation_events(
+            events.by_ts_window(window),
+            camera_model,
+            trans_matrix=location.img_to_surf_trans,
+        )
+        results.extend((frame_idx, datum) for datum in mapped)
+    return results
+
+
+def _assert_same_mapping(mapped_events, expected, events):
+    assert mapped_events.world_index.tolist() == [idx for idx, _ in expected]
+    for datum, (_, expected_datum) in zip(mapped_events.to_dicts(events), expected):
+        assert datum["timestamp"] == expected_datum["timestamp"]
+        assert datum["on_surf"] == expected_datum["on_surf"]
+        assert np.allclose(datum["norm_pos"], expected_datum["norm_pos"])
+
+
+def test_map_section_matches_per_frame_mapping():
+    camera_model = Dummy_Camera((1280, 720), "world")
+    world_timestamps = np.arange(10) / 10.0
+    surface = Surface_Offline(name="test")
+    surface.location_cache = [_location(1.0 + idx % 3) for idx in range(10)]
+    surface.location_cache[4] = Surface_Location(detected=False)
+
+    gaze_ts = np.arange(-0.05, 1.05, 0.02)
+    gaze = pm.Bisector(
+        [
+            {
+                "topic": "gaze.3d.01.",
+                "norm_pos": (0.1 + (ts % 0.4), 0.25),
+                "confidence": 0.9,
+                "timestamp": ts,
+            }
+            for ts in gaze_ts
+        ],
+        gaze_ts,
+    )
+    section = slice(2, 8)
+    mapped = surface.map_section(section, world_timestamps, gaze, camera_model)
+    expected = _map_section_per_frame(
+        surface, range(2, 8), world_timestamps, gaze, camera_model
+    )
+    assert mapped.count == len(expected) > 0
+    assert not (mapped.world_index == 4).any()
+    _assert_same_mapping(mapped, expected, gaze)
+
+
+def test_map_section_fixations_spanning_frames():
+    camera_model = Dummy_Camera((1280, 720), "world")
+    world_timestamps = np.arange(10) / 10.0
+    surface = Surface_Offline(name="test")
+    surface.location_cache = [_location(1.0) for _ in range(10)]
+
+    fixations = [
+        {
+            "topic": "fixations",
+            "norm_pos": (0.5, 0.5),
+            "confidence": 1.0,
+            "timestamp": start,
+            "duration": (stop - start) * 1000,
+            "dispersion": 1.0,
+            "id": fixation_id,
+        }
+        for fixation_id, (start, stop) in enumerate([(0.12, 0.34), (0.51, 0.52)])
+    ]
+    start_ts = [f["timestamp"] for f in fixations]
+    stop_ts = [f["timestamp"] + f["duration"] / 1000 for f in fixations]
+    affiliator = pm.Affiliator(fixations, start_ts, stop_ts)
+
+    mapped = surface.map_section(slice(0, 10), world_timestamps, affiliator, camera_model)
+    expected = _map_section_per_frame(
+        surface, range(0, 10), world_timestamps, affiliator, camera_model
+    )
+    assert mapped.world_index.tolist() == [1, 2, 3, 5]
+    assert mapped.source_index.tolist() == [0, 0, 0, 1]
+    _assert_same_mapping(mapped, expected, affiliator)
@@ -0,0 +1,64 @@
+"""
+(*)~---------------------------------------------------------------------------
+Pupil - eye tracking platform
+Copyright (C) 2012-2020 Pupil Labs
+
+Distributed under the terms of the GNU
+Lesser General Public License (LGPL v3.0).
+See COPYING and COPYING.LESSER for license details.
+---------------------------------------------------------------------------~(*)
+"""
+import numpy as np
+
+import audio_utils
+from audio_utils import Audio_Envelope
+
+
+def _envelope():
+    minima = np.array([-0.1, -0.5, -0.2, 0.0, -0.3])
+    maxima = np.array([0.2, 0.1, 0.9, 0.4, 0.1])
+    return Audio_Envelope.from_base_level(minima, maxima, 1000, 10)
+
+
+def test_envelope_levels():
+    envelope = _envelope()
+    assert envelope.level_count == 4
+    np.testing.assert_allclose(
+        envelope.level(1), [[-0.5, 0.2], [-0.2, 0.9], [-0.3, 0.1]]
+    )
+    np.testing.assert_allclose(envelope.level(3), [[-0.5, 0.9]])
+    assert envelope.peak == np.float32(0.9)
+
+    assert envelope.bin_duration(0) == 0.01
+    assert envelope.level_idx_for(0.005) == 0
+    assert envelope.level_idx_for(0.015) == 1
+    assert envelope.level_idx_for(10.0) == 3
+
+
+def test_envelope_cache_is_keyed_by_audio_file(tmp_path):
+    audio_path = tmp_path / "audio.mp4"
+    audio_path.write_bytes(b"audio")
+    cache_dir = str(tmp_path / "cache")
+
+    assert Audio_Envelope.load(cache_dir, str(audio_path)) is None
+    _envelope().save(cache_dir, str(audio_path))
+    loaded = Audio_Envelope.load(cache_dir, str(audio_path))
+    assert loaded.level_count == 4
+    np.testing.assert_allclose(loaded.level(2), _envelope().level(2))
+
+    audio_path.write_bytes(b"other audio")
+    assert Audio_Envelope.load(cache_dir, str(audio_path)) is None
+
+
+def test_envelopes_are_built_without_writable_cache(tmp_path, monkeypatch):
+    audio_path = tmp_path / "audio.mp4"
+    audio_path.write_bytes(b"audio")
+    # a file in place of the cache directory makes saving fail
+    (tmp_path / "offline_data").write_bytes(b"")
+    cache_dir = str(tmp_path / "offline_data" / "audio_envelopes")
+    monkeypatch.setattr(audio_utils, "compute_audio_envelope", lambda _: _envelope())
+
+    built = list(audio_utils.build_audio_envelopes([str(audio_path)], cache_dir))
+    assert [file_path for file_path, _ in built] == [str(audio_path)]
+    np.testing.assert_allclose(built[0][1].level(1), _envelope().level(1))
+    assert Audio_Envelope.load(cache_dir, str(audio_path)) is None
@@ -0,0 +1,164 @@
+"""
+(*)~---------------------------------------------------------------------------
+Pupil - eye tracking platform
+Copyright (C) 2012-2020 Pupil Labs
+
+Distributed under the terms of the GNU
+Lesser General Public License (LGPL v3.0).
+See COPYING and COPYING.LESSER for license details.
+---------------------------------------------------------------------------~(*)
+"""
+import os
+
+import file_methods as fm
+from batch_pipeline import (
+    Pipeline_Runner,
+    Recording_Job,
+    Stage,
+    Stage_Cache,
+    Stage_Scheduler,
+)
+from batch_pipeline.stages import Pupil_Detection_Stage
+from pupil_producers import Offline_Pupil_Detection
+
+
+class _Stage(Stage):
+    def __init__(self, name, depends_on=()):
+        self.name = name
+        self.depends_on = depends_on
+
+    def run(self, job):
+        return self.name
+
+
+class _Crashing_Stage(_Stage):
+    def run(self, job):
+        os._exit(1)
+
+
+def _result(status):
+    return {"status": status, "message": "", "duration_s": 0.0}
+
+
+def _ready_names(scheduler):
+    return [(job_idx, stage.name) for job_idx, stage in scheduler.pop_ready()]
+
+
+def test_scheduler_runs_stages_after_dependencies():
+    stages = [
+        _Stage("lookup"),
+        _Stage("pupil", depends_on=("lookup",)),
+        _Stage("gaze", depends_on=("pupil", "not_scheduled")),
+    ]
+    scheduler = Stage_Scheduler(2, stages)
+    assert _ready_names(scheduler) == [(0, "lookup"), (1, "lookup")]
+    assert _ready_names(scheduler) == []
+
+    scheduler.complete(1, "lookup", _result("cached"))
+    assert _ready_names(scheduler) == [(1, "pupil")]
+    scheduler.complete(1, "pupil", _result("not_applicable"))
+    assert _ready_names(scheduler) == [(1, "gaze")]
+    scheduler.complete(1, "gaze", _result("completed"))
+    assert not scheduler.finished
+
+    scheduler.complete(0, "lookup", _result("completed"))
+    assert _ready_names(scheduler) == [(0, "pupil")]
+    scheduler.complete(0, "pupil", _result("completed"))
+    assert _ready_names(scheduler) == [(0, "gaze")]
+    scheduler.complete(0, "gaze", _result("completed"))
+    assert scheduler.finished
+
+
+def test_scheduler_blocks_dependents_of_failed_stages():
+    stages = [
+        _Stage("lookup"),
+        _Stage("pupil", depends_on=("lookup",)),
+        _Stage("blinks", depends_on=("pupil",)),
+        _Stage("export", depends_on=("lookup",)),
+    ]
+    scheduler = Stage_Scheduler(1, stages)
+    assert _ready_names(scheduler) == [(0, "lookup")]
+    scheduler.complete(0, "lookup", _result("completed"))
+    assert _ready_names(scheduler) == [(0, "pupil"), (0, "export")]
+    scheduler.complete(0, "pupil", _result("failed"))
+    assert scheduler.results[0]["blinks"]["status"] == "blocked"
+    assert _ready_names(scheduler) == []
+    scheduler.complete(0, "export", _result("completed"))
+    assert scheduler.finished
+
+
+def test_stage_cache_validity(tmp_path):
+    input_path = tmp_path / "input.txt"
+    output_path = tmp_path / "output.txt"
+    input_path.write_text("input")
+    cache = Stage_Cache(str(tmp_path))
+
+    fingerprint = cache.fingerprint(1, {"threshold": (0.5, 1)}, [str(input_path)])
+    assert not cache.is_valid("stage", fingerprint, [str(output_path)])
+    output_path.write_text("output")
+    cache.store("stage", fingerprint)
+    assert cache.is_valid("stage", fingerprint, [str(output_path)])
+
+    changed_settings = cache.fingerprint(1, {"threshold": 0.6}, [str(input_path)])
+    assert not cache.is_valid("stage", changed_settings, [str(output_path)])
+    changed_version = cache.fingerprint(2, {"threshold": (0.5, 1)}, [str(input_path)])
+    assert not cache.is_valid("stage", changed_version, [str(output_path)])
+
+    input_path.write_text("changed input")
+    changed_input = cache.fingerprint(1, {"threshold": (0.5, 1)}, [str(input_path)])
+    assert not cache.is_valid("stage", changed_input, [str(output_path)])
+
+    cache.invalidate("stage")
+    assert not cache.is_valid("stage", fingerprint, [str(output_path)])
+
+
+def test_runner_fails_stages_of_crashed_workers(tmp_path):
+    stages = [
+        _Stage("lookup"),
+        _Crashing_Stage("pupil", depends_on=("lookup",)),
+        _Stage("blinks", depends_on=("pupil",)),
+        _Stage("export", depends_on=("lookup",)),
+    ]
+    job = Recording_Job(str(tmp_path), str(tmp_path), str(tmp_path), {}, 0.6, 0.8)
+    report = Pipeline_Runner(stages, worker_count=2).run([job])
+
+    results = report["recordings"][0]["stages"]
+    assert results["lookup"]["status"] == "completed"
+    assert results["pupil"]["status"] == "failed"
+    assert results["blinks"]["status"] == "blocked"
+    assert results["export"]["status"] == "completed"
+
+
+def test_pupil_detection_reuses_complete_offline_data(tmp_path):
+    (tmp_path / "eye0.mp4").touch()
+    data_dir = tmp_path / "offline_data"
+    data_dir.mkdir()
+    with fm.PLData_Writer(str(data_dir), "offline_pupil") as writer:
+        writer.append(
+            {
+                "topic": "pupil.0.2d",
+                "id": 0,
+                "timestamp": 0.0,
+                "confidence": 1.0,
+                "method": "2d c++",
+            }
+        )
+    meta_path = str(data_dir / "offline_pupil.meta")
+    session_meta_data = {
+        "detection_status": ["complete", "No eye video found."],
+        "version": Offline_Pupil_Detection.session_data_version,
+    }
+    fm.save_object(session_meta_data, meta_path)
+
+    stage = Pupil_Detection_Stage()
+    job = Recording_Job(str(tmp_path), str(tmp_path), str(tmp_path), {}, 0.6, 0.8)
+    # the empty eye video would fail detection
+    assert stage.run(job) == "Reused 1 detected pupil positions"
+
+    # data of earlier runs with other Roi settings is detected again
+    session_meta_data["roi_settings"] = "[null, null, {}]"
+    fm.save_object(session_meta_data, meta_path)
+    assert not stage._is_detection_complete(job, str(data_dir))
+    session_meta_data["roi_settings"] = stage._roi_fingerprint(job)
+    fm.save_object(session_meta_data, meta_path)
+    assert stage._is_detection_complete(job, str(data_dir))
@@ -0,0 +1,27 @@
+"""
+(*)~---------------------------------------------------------------------------
+Pupil - eye tracking platform
+Copyright (C) 2012-2020 Pupil Labs
+
+Distributed under the terms of the GNU
+Lesser General Public License (LGPL v3.0).
+See COPYING and COPYING.LESSER for license details.
+---------------------------------------------------------------------------~(*)
+"""
+from circle_marker_detection import contiguous_ranges, split_frame_indices
+
+
+def test_tasks_are_split_at_keyframes():
+    frame_indices = [0, 1, 2, 3, 6, 7, 8, 9, 10, 11, 14]
+    keyframes = [0, 2, 5, 10]
+    tasks = split_frame_indices(frame_indices, keyframes, min_frames=3)
+    assert tasks == [[0, 1, 2, 3], [6, 7, 8, 9], [10, 11, 14]]
+    assert split_frame_indices(frame_indices, keyframes, min_frames=100) == [
+        frame_indices
+    ]
+    assert split_frame_indices([], keyframes) == []
+
+
+def test_contiguous_ranges():
+    assert contiguous_ranges([2, 3, 4, 7, 9, 10]) == [(2, 5), (7, 8), (9, 11)]
+    assert contiguous_ranges([]) == []
@@ -0,0 +1,121 @@
+"""
+(*)~---------------------------------------------------------------------------
+Pupil - eye tracking platform
+Copyright (C) 2012-2020 Pupil Labs
+
+Distributed under the terms of the GNU
+Lesser General Public License (LGPL v3.0).
+See COPYING and COPYING.LESSER for license details.
+---------------------------------------------------------------------------~(*)
+"""
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+import file_methods as fm
+import player_methods as pm
+
+
+@pytest.fixture
+def pldata_dir(tmpdir):
+    with fm.PLData_Writer(str(tmpdir), "pupil") as writer:
+        for idx in range(100):
+            writer.append(_pupil_datum(idx))
+    return str(tmpdir)
+
+
+def _pupil_datum(idx):
+    eye_id = idx % 2
+    return {
+        "topic": f"pupil.{eye_id}",
+        "timestamp": idx * 0.01,
+        "id": eye_id,
+        "confidence": (idx % 10) / 10,
+        "norm_pos": (idx / 100, 1.0 - idx / 100),
+        "method": "3d c++" if idx % 4 < 2 else "2d c++",
+        "ellipse": {"center": (idx, idx), "axes": (1.0, 2.0), "angle": 90.0},
+    }
+
+
+def test_columns_sidecar(pldata_dir):
+    pldata = fm.load_pldata_file(pldata_dir, "pupil")
+    assert os.path.exists(fm.PLData_Columns.table_path(pldata_dir, "pupil"))
+    assert isinstance(pldata.data, fm.Serialized_Dict_View)
+    assert set(pldata.data._columns.fields) == {
+        "topic",
+        "timestamp",
+        "id",
+        "confidence",
+        "norm_pos",
+        "method",
+    }
+    assert pldata.topics == [_pupil_datum(idx)["topic"] for idx in range(100)]
+
+    # second load uses the sidecar
+    pldata = fm.load_pldata_file(pldata_dir, "pupil")
+    assert isinstance(pldata.data._columns._table, np.memmap)
+
+    expected = [_pupil_datum(idx) for idx in range(100)]
+    norm_pos = fm.extract_column(pldata.data, "norm_pos")
+    assert norm_pos.shape == (100, 2)
+    assert np.allclose(norm_pos, [d["norm_pos"] for d in expected])
+    assert list(fm.extract_column(pldata.data, "method")) == [
+        d["method"] for d in expected
+    ]
+    # nested fields fall back to the payload
+    assert pldata.data[42]["ellipse"]["center"] == (42, 42)
+    assert [d["id"] for d in pldata.data[10:20]] == [d["id"] for d in expected[10:20]]
+
+
+def test_columns_rebuilt_on_change(pldata_dir):
+    fm.load_pldata_file(pldata_dir, "pupil")
+    with fm.PLData_Writer(pldata_dir, "pupil") as writer:
+        for idx in range(10):
+            writer.append(_pupil_datum(idx + 1000))
+    pldata = fm.load_pldata_file(pldata_dir, "pupil")
+    assert len(pldata.data) == 10
+    assert pldata.data[0]["timestamp"] == _pupil_datum(1000)["timestamp"]
+
+
+def test_append_serialized_is_independent_of_datum(tmpdir):
+    datum = _pupil_datum(0)
+    serialized = fm.PLData_Writer.serialize(datum)
+    datum["confidence"] = -1.0
+    with fm.PLData_Writer(str(tmpdir), "pupil") as writer:
+        writer.append_serialized(*serialized)
+    pldata = fm.load_pldata_file(str(tmpdir), "pupil")
+    assert pldata.data[0]["confidence"] == _pupil_datum(0)["confidence"]
+
+
+def test_overwrite_loaded_pldata(pldata_dir):
+    pupil_data = pm.PupilDataBisector.load_from_file(pldata_dir, "pupil")
+    bisector = pupil_data[0, "3d"]
+    expected = [d.copy() for d in bisector]
+    pupil_data.save_to_file(pldata_dir, "pupil")
+    assert [d.copy() for d in bisector] == expected
+
+
+def test_pupil_data_bisector_columnar_grouping(pldata_dir):
+    pldata = fm.load_pldata_file(pldata_dir, "pupil")
+    data_in_memory = fm.PLData(list(pldata.data), pldata.timestamps, pldata.topics)
+
+    columnar = pm.PupilDataBisector(pldata)
+    in_memory = pm.PupilDataBisector(data_in_memory)
+    for key in [(0, "2d"), (0, "3d"), (1, "2d"), (1, "3d"), (..., ...)]:
+        assert np.array_equal(columnar[key].timestamps, in_memory[key].timestamps)
+        assert np.array_equal(
+            columnar[key].column("confidence"), in_memory[key].column("confidence")
+        )
+
+    window = columnar.by_ts_window((0.2, 0.5))
+    assert isinstance(window.data, fm.Serialized_Dict_View)
+    assert len(window) == 30
+
+
+def test_serialized_dict_view_pickle(pldata_dir):
+    pldata = fm.load_pldata_file(pldata_dir, "pupil")
+    unpickled = pickle.loads(pickle.dumps(pldata.data[5:8]))
+    assert isinstance(unpickled, np.ndarray)
+    assert [d["timestamp"] for d in unpickled] == [0.05, 0.06, 0.07]
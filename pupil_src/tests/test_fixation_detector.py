@@ -0,0 +1,239 @@
+"""
+(*)~---------------------------------------------------------------------------
+Pupil - eye tracking platform
+Copyright (C) 2012-2020 Pupil Labs
+
+Distributed under the terms of the GNU
+Lesser General Public License (LGPL v3.0).
+See COPYING and COPYING.LESSER for license details.
+---------------------------------------------------------------------------~(*)
+"""
+from collections import deque
+from types import SimpleNamespace
+
+import msgpack
+import numpy as np
+import pytest
+
+import fixation_detector as fd
+from camera_models import Radial_Dist_Camera
+
+
+def _reference_detect_fixations(
+    capture, gaze_data, max_dispersion, min_duration, max_duration, min_data_confidence
+):
+    """Fixation detection computing the full dispersion at every step"""
+    yield "Detecting fixations...", ()
+    gaze_data = (
+        fd.fm.Serialized_Dict(msgpack_bytes=serialized) for serialized in gaze_data
+    )
+    gaze_data = [
+        datum for datum in gaze_data if datum["confidence"] > min_data_confidence
+    ]
+    if not gaze_data:
+        return "Fixation detection failed", ()
+
+    method = (
+        fd.FixationDetectionMethod.GAZE_3D
+        if fd.can_use_3d_gaze_mapping(gaze_data)
+        else fd.FixationDetectionMethod.GAZE_2D
+    )
+    fixation_result = fd.Fixation_Result_Factory()
+
+    working_queue = deque()
+    remaining_gaze = deque(gaze_data)
+
+    while remaining_gaze:
+        if (
+            len(working_queue) < 2
+            or (working_queue[-1]["timestamp"] - working_queue[0]["timestamp"])
+            < min_duration
+        ):
+            datum = remaining_gaze.popleft()
+            working_queue.append(datum)
+            continue
+
+        dispersion = fd.gaze_dispersion(capture, working_queue, method)
+        if dispersion > max_dispersion:
+            working_queue.popleft()
+            continue
+
+        left_idx = len(working_queue)
+
+        while remaining_gaze:
+            datum = remaining_gaze[0]
+            if datum["timestamp"] > working_queue[0]["timestamp"] + max_duration:
+                break
+            working_queue.append(remaining_gaze.popleft())
+
+        dispersion = fd.gaze_dispersion(capture, working_queue, method)
+        if dispersion <= max_dispersion:
+            fixation = fixation_result.from_data(
+                dispersion, method, working_queue, capture.timestamps
+            )
+            yield "Detecting fixations...", fixation
+            working_queue.clear()
+            continue
+
+        slicable = list(working_queue)
+        right_idx = len(working_queue)
+
+        while left_idx < right_idx - 1:
+            middle_idx = (left_idx + right_idx) // 2
+            dispersion = fd.gaze_dispersion(
+                capture, slicable[: middle_idx + 1], method
+            )
+            if dispersion <= max_dispersion:
+                left_idx = middle_idx
+            else:
+                right_idx = middle_idx
+
+        final_base_data = slicable[:left_idx]
+        to_be_placed_back = slicable[left_idx:]
+        dispersion_result = fd.gaze_dispersion(capture, final_base_data, method)
+
+        fixation = fixation_result.from_data(
+            dispersion_result, method, final_base_data, capture.timestamps
+        )
+        yield "Detecting fixations...", fixation
+        working_queue.clear()
+        remaining_gaze.extendleft(reversed(to_be_placed_back))
+
+    yield "Fixation detection complete", ()
+
+
+def synthetic_capture(duration):
+    resolution = (1280, 720)
+    K = [[800.0, 0.0, 640.0], [0.0, 800.0, 360.0], [0.0, 0.0, 1.0]]
+    D = [[-0.4, 0.2, 0.0, 0.0, -0.05]]
+    capture = SimpleNamespace()
+    capture.frame_size = resolution
+    capture.intrinsics = Radial_Dist_Camera(K, D, resolution, "synthetic")
+    capture.timestamps = np.arange(0.0, duration, 1 / 30)
+    return capture
+
+
+def synthetic_gaze(duration, rate=200.0, with_3d=True, seed=0):
+    """Serialized gaze alternating between fixations and saccades"""
+    rng = np.random.default_rng(seed)
+    timestamps = np.arange(0.0, duration, 1 / rate)
+    target = rng.uniform(0.2, 0.8, size=2)
+    next_switch = 0.0
+    gaze = []
+    for ts in timestamps:
+        if ts >= next_switch:
+            target = np.clip(target + rng.normal(scale=0.15, size=2), 0.05, 0.95)
+            next_switch = ts + rng.uniform(0.05, 0.8)
+        norm_pos = target + rng.normal(scale=0.001, size=2)
+        datum = {
+            "topic": "gaze.2d.0.",
+            "norm_pos": tuple(norm_pos.tolist()),
+            "confidence": float(rng.uniform(0.5, 1.0)),
+            "timestamp": float(ts),
+            "base_data": [],
+        }
+        if with_3d:
+            x, y = (norm_pos - 0.5) * (400.0, -300.0)
+            datum["gaze_point_3d"] = (float(x), float(y), 500.0)
+        gaze.append(msgpack.packb(datum, use_bin_type=True))
+    return gaze
+
+
+def _detect(detect, capture, gaze, max_dispersion=1.5):
+    args = (capture, gaze, np.deg2rad(max_dispersion), 0.08, 0.22, 0.6)
+    return [fixation for _, fixation in detect(*args) if fixation]
+
+
+@pytest.mark.parametrize("with_3d", [True, False])
+@pytest.mark.parametrize("max_dispersion", [0.5, 1.5, 3.0])
+def test_detect_fixations_matches_reference(with_3d, max_dispersion):
+    capture = synthetic_capture(duration=20)
+    gaze = synthetic_gaze(duration=20, with_3d=with_3d)
+
+    expected = _detect(_reference_detect_fixations, capture, gaze, max_dispersion)
+    actual = _detect(fd.detect_fixations, capture, gaze, max_dispersion)
+    assert len(expected) > 0
+    assert actual == expected
+
+
+def test_sliding_dispersion_window():
+    rng = np.random.default_rng(1)
+    vectors = rng.normal(size=(50, 3)) * 0.05 + (0.0, 0.0, 1.0)
+    window = fd.Sliding_Dispersion_Window(vectors)
+    window.extend(10)
+    for _ in range(20):
+        window.append()
+    for _ in range(5):
+        window.popleft()
+    window.extend(45)
+
+    exact = fd.vector_dispersion(vectors[window.start : window.stop])
+    assert window.dispersion() == pytest.approx(exact, abs=1e-9)
+
+    prefix_dispersions = window.prefix_dispersions()
+    for k in (1, 7, 20, len(window) - 1):
+        exact = fd.vector_dispersion(vectors[window.start : window.start + k + 1])
+        assert prefix_dispersions[k] == pytest.approx(exact, abs=1e-9)
+
+
+def _with_confidence_gaps(gaze, rate=200.0, seed=0):
+    """Mark random runs of gaze data as low-confidence"""
+    rng = np.random.default_rng(seed)
+    gaze = list(gaze)
+    idx = 0
+    while idx < len(gaze):
+        idx += int(rng.uniform(1.0, 4.0) * rate)
+        gap = int(rng.uniform(0.1, 0.5) * rate)
+        for i in range(idx, min(idx + gap, len(gaze))):
+            datum = msgpack.unpackb(gaze[i], raw=False)
+            datum["confidence"] = 0.1
+            gaze[i] = msgpack.packb(datum, use_bin_type=True)
+        idx += gap
+    return gaze
+
+
+def _detect_in_chunks(capture, gaze, chunk_count, max_dispersion=1.5):
+    args = (capture, gaze, np.deg2rad(max_dispersion), 0.08, 0.22, 0.6)
+    *_, (_, (method, chunks)) = fd.split_gaze_data(*args, chunk_count)
+    chunk_fixations = []
+    for chunk in chunks:
+        chunk_args = (capture, gaze[chunk], *args[2:])
+        detection = fd.detect_fixations(*chunk_args, method=method)
+        chunk_fixations.append([fixation for _, fixation in detection if fixation])
+    return chunks, list(fd.merge_chunk_fixations(chunk_fixations))
+
+
+@pytest.mark.parametrize("with_3d", [True, False])
+@pytest.mark.parametrize("chunk_count", [1, 4, 16])
+def test_detect_fixations_in_chunks_matches_serial(with_3d, chunk_count):
+    capture = synthetic_capture(duration=60)
+    gaze = _with_confidence_gaps(synthetic_gaze(duration=60, with_3d=with_3d))
+
+    expected = _detect(fd.detect_fixations, capture, gaze)
+    chunks, actual = _detect_in_chunks(capture, gaze, chunk_count)
+    assert len(chunks) <= chunk_count
+    if chunk_count > 1:
+        assert len(chunks) > 1
+    assert len(expected) > 0
+    assert actual == expected
+
+
+def bench_detect_fixations(duration=60 * 60):
+    import time
+
+    capture = synthetic_capture(duration)
+    gaze = synthetic_gaze(duration)
+    print(f"Generated {len(gaze)} gaze samples")
+
+    start = time.perf_counter()
+    actual = _detect(fd.detect_fixations, capture, gaze)
+    print(f"Incremental: {len(actual)} fixations in {time.perf_counter() - start:.1f}s")
+
+    start = time.perf_counter()
+    expected = _detect(_reference_detect_fixations, capture, gaze)
+    print(f"Reference: {len(expected)} fixations in {time.perf_counter() - start:.1f}s")
+    print("Identical results:", actual == expected)
+
+
+if __name__ == "__main__":
+    bench_detect_fixations()
@@ -0,0 +1,104 @@
+"""
+(*)~---------------------------------------------------------------------------
+Pupil - eye tracking platform
+Copyright (C) 2012-2020 Pupil Labs
+
+Distributed under the terms of the GNU
+Lesser General Public License (LGPL v3.0).
+See COPYING and COPYING.LESSER for license details.
+---------------------------------------------------------------------------~(*)
+"""
+from types import SimpleNamespace
+
+import numpy as np
+
+from head_pose_tracker import worker
+from marker_detection_store import (
+    Apriltag_Detection,
+    Apriltag_Detection_Store,
+    apriltag_detection_to_dict,
+)
+from surface_tracker.surface_tracker import DEFAULT_DETECTOR_MODE
+from surface_tracker.surface_tracker_offline import Surface_Tracker_Offline
+
+
+def _detection(tag_id):
+    corners = np.array([[0.0, 0.0], [10.0, 0.0], [10.0, 10.0], [0.0, 10.0]])
+    return Apriltag_Detection(
+        tag_family=b"tag36h11",
+        tag_id=tag_id,
+        hamming=0,
+        decision_margin=42.5,
+        homography=np.eye(3),
+        center=corners.mean(axis=0) + tag_id,
+        corners=corners + tag_id,
+    )
+
+
+def _assert_same_detection(actual, expected):
+    assert apriltag_detection_to_dict(actual) == apriltag_detection_to_dict(expected)
+
+
+def test_store_round_trip(tmp_path):
+    store = Apriltag_Detection_Store(tmp_path, "tag36h11", 2.0, 0.25)
+    assert len(store) == 0
+    store.update(3, 0.1, [_detection(1), _detection(7)])
+    store.update(5, 0.2, [])
+    store.save_to_disk()
+
+    loaded = Apriltag_Detection_Store(tmp_path, "tag36h11", 2.0, 0.25)
+    assert loaded.frame_indices == {3, 5}
+    assert 4 not in loaded
+    assert loaded.get(4) is None
+    assert loaded.get(5) == []
+    for actual, expected in zip(loaded.get(3), [_detection(1), _detection(7)]):
+        _assert_same_detection(actual, expected)
+
+    stored = loaded.get_range(range(10))
+    assert sorted(stored) == [3, 5]
+    detections = [Apriltag_Detection.from_dict(d) for d in stored[3]]
+    _assert_same_detection(detections[1], _detection(7))
+
+
+def test_store_keeps_unchanged_frames_on_save(tmp_path):
+    store = Apriltag_Detection_Store(tmp_path, "tag36h11", 2.0, 0.25)
+    store.update(0, 0.0, [_detection(2)])
+    store.save_to_disk()
+
+    loaded = Apriltag_Detection_Store(tmp_path, "tag36h11", 2.0, 0.25)
+    loaded.update(1, 0.1, [_detection(3)])
+    loaded.save_to_disk()
+
+    reloaded = Apriltag_Detection_Store(tmp_path, "tag36h11", 2.0, 0.25)
+    assert reloaded.frame_indices == {0, 1}
+    _assert_same_detection(reloaded.get(0)[0], _detection(2))
+
+
+def test_store_per_detector_parameters(tmp_path):
+    store = Apriltag_Detection_Store.for_recording(tmp_path, "tag36h11", 2.0, 0.25)
+    assert store is Apriltag_Detection_Store.for_recording(
+        tmp_path, "tag36h11", 2.0, 0.25
+    )
+    store.update(0, 0.0, [_detection(2)])
+    store.save_to_disk()
+
+    other = Apriltag_Detection_Store.for_recording(tmp_path, "tag36h11", 2.0, 1.0)
+    assert other is not store
+    assert len(other) == 0
+
+
+def test_plugin_defaults_share_store(tmp_path):
+    surface_tracker = Surface_Tracker_Offline.__new__(Surface_Tracker_Offline)
+    surface_tracker.g_pool = SimpleNamespace(rec_dir=str(tmp_path))
+    surface_tracker.marker_detector = SimpleNamespace(
+        marker_detector_mode=DEFAULT_DETECTOR_MODE
+    )
+    surface_tracker._set_detector_params_from_previous_cache({})
+
+    head_pose_store = Apriltag_Detection_Store.for_recording(
+        str(tmp_path),
+        family=worker.APRILTAG_FAMILY,
+        quad_decimate=worker.APRILTAG_QUAD_DECIMATE,
+        decode_sharpening=worker.APRILTAG_DECODE_SHARPENING,
+    )
+    assert surface_tracker._get_marker_detection_store() is head_pose_store
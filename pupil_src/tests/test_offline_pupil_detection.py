@@ -0,0 +1,71 @@
+"""
+(*)~---------------------------------------------------------------------------
+Pupil - eye tracking platform
+Copyright (C) 2012-2020 Pupil Labs
+
+Distributed under the terms of the GNU
+Lesser General Public License (LGPL v3.0).
+See COPYING and COPYING.LESSER for license details.
+---------------------------------------------------------------------------~(*)
+"""
+import file_methods as fm
+import offline_pupil_detection as opd
+
+
+def _pupil_datum(eye_id, timestamp):
+    return {
+        "topic": f"pupil.{eye_id}.2d",
+        "id": eye_id,
+        "timestamp": timestamp,
+        "confidence": 1.0,
+    }
+
+
+def _save_chunk(data_dir, eye_id, start_frame, stop_frame):
+    data = [_pupil_datum(eye_id, float(idx)) for idx in range(start_frame, stop_frame)]
+    opd._save_chunk(data_dir, eye_id, start_frame, stop_frame, data)
+
+
+def test_resumes_after_consecutive_chunks(tmp_path):
+    assert opd.next_frame_to_detect(tmp_path, 0) == 0
+
+    _save_chunk(tmp_path, 0, 0, 10)
+    _save_chunk(tmp_path, 0, 10, 20)
+    _save_chunk(tmp_path, 0, 30, 40)
+    assert opd.next_frame_to_detect(tmp_path, 0) == 20
+    assert opd.next_frame_to_detect(tmp_path, 1) == 0
+
+    # chunks without timestamps file are incomplete
+    (tmp_path / "offline_pupil_chunks" / "eye0_00000020_00000030.pldata").touch()
+    assert opd.next_frame_to_detect(tmp_path, 0) == 20
+
+
+def test_merge_detected_chunks(tmp_path):
+    _save_chunk(tmp_path, 0, 0, 10)
+    _save_chunk(tmp_path, 0, 10, 15)
+    _save_chunk(tmp_path, 1, 0, 5)
+    opd.merge_detected_chunks(tmp_path, "offline_pupil")
+
+    merged = fm.load_pldata_file(tmp_path, "offline_pupil")
+    assert len(merged.timestamps) == 20
+    assert merged.topics.count("pupil.0.2d") == 15
+    assert merged.topics.count("pupil.1.2d") == 5
+    assert merged.timestamps[:15].tolist() == list(range(15))
+
+    opd.clear_detected_chunks(tmp_path, 0)
+    assert opd.next_frame_to_detect(tmp_path, 0) == 0
+    assert opd.next_frame_to_detect(tmp_path, 1) == 5
+
+
+def test_merge_keeps_previously_detected_eyes(tmp_path):
+    with fm.PLData_Writer(str(tmp_path), "offline_pupil") as writer:
+        for idx in range(4):
+            writer.extend(_pupil_datum(eye_id, float(idx)) for eye_id in (0, 1))
+    _save_chunk(tmp_path, 1, 0, 10)
+    opd.merge_detected_chunks(tmp_path, "offline_pupil", keep_eye_ids=[0])
+
+    merged = fm.load_pldata_file(tmp_path, "offline_pupil")
+    assert merged.topics.count("pupil.0.2d") == 4
+    assert merged.topics.count("pupil.1.2d") == 10
+    assert len(merged.timestamps) == 14
+    assert [datum["id"] for datum in merged.data] == [0] * 4 + [1] * 10
@@ -0,0 +1,130 @@
+"""
+(*)~---------------------------------------------------------------------------
+Pupil - eye tracking platform
+Copyright (C) 2012-2020 Pupil Labs
+
+Distributed under the terms of the GNU
+Lesser General Public License (LGPL v3.0).
+See COPYING and COPYING.LESSER for license details.
+---------------------------------------------------------------------------~(*)
+"""
+import json
+
+import pytest
+
+from plugin_timing import Plugin_Timer, Rolling_Durations
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class _Plugin:
+    def __init__(self, clock, duration, gaze_count=0):
+        self.clock = clock
+        self.duration = duration
+        self.gaze_count = gaze_count
+
+    @property
+    def class_name(self):
+        return type(self).__name__
+
+    def recent_events(self, events):
+        self.clock.now += self.duration
+        events.setdefault("gaze", []).extend([{}] * self.gaze_count)
+
+    def on_notify(self, notification):
+        self.clock.now += self.duration
+
+    def gl_display(self):
+        self.clock.now += self.duration
+
+
+class Fast_Plugin(_Plugin):
+    pass
+
+
+class Slow_Plugin(_Plugin):
+    pass
+
+
+def _timer(clock, notifications, tmp_path, budget=None):
+    return Plugin_Timer(
+        "world",
+        notifications.append,
+        str(tmp_path),
+        get_budget=lambda: budget,
+        window_size=10,
+        clock=clock,
+    )
+
+
+def test_rolling_durations_summary():
+    durations = Rolling_Durations(window_size=4)
+    for duration in (0.5, 0.00005, 0.002, 0.002, 0.002):
+        durations.add(duration)
+    summary = durations.summary()
+    assert summary["count"] == 4
+    assert summary["total_count"] == 5
+    assert summary["median_ms"] == 2.0
+    assert summary["max_ms"] == 2.0
+    assert summary["histogram"] == [1, 0, 0, 3, 0, 0, 0, 0, 0, 0]
+
+
+def test_overruns_are_attributed_to_slowest_hook(tmp_path):
+    clock = _Clock()
+    notifications = []
+    timer = _timer(clock, notifications, tmp_path, budget=0.03)
+    plugins = [Fast_Plugin(clock, 0.001, gaze_count=2), Slow_Plugin(clock, 0.01)]
+
+    timer.finish_iteration()
+    for _ in range(3):
+        events = {"dt": 0.01}
+        timer.recent_events(plugins, events)
+        timer.gl_display(plugins)
+        timer.finish_iteration()
+    assert timer.overrun_count == 0
+
+    plugins[1].duration = 0.05
+    timer.recent_events(plugins, {"dt": 0.01})
+    timer.finish_iteration()
+    assert timer.overrun_count == 1
+
+    assert timer.slowest_hooks(1)[0][:2] == ("Slow_Plugin", "recent_events")
+    timer.on_notify(plugins, {"subject": "plugin_timing.should_report"})
+    report = notifications[-1]["report"]
+    assert notifications[-1]["subject"] == "plugin_timing.report"
+    assert report["loop"]["overrun_culprits"] == {"Slow_Plugin.recent_events": 1}
+    assert report["loop"]["iterations"]["count"] == 4
+    assert report["plugins"]["Fast_Plugin"]["gl_display"]["count"] == 3
+    assert report["events"]["gaze"] == {"mean": 2.0, "max": 2}
+
+
+def test_report_requests_for_other_processes_are_ignored(tmp_path):
+    notifications = []
+    timer = _timer(_Clock(), notifications, tmp_path)
+    timer.on_notify([], {"subject": "plugin_timing.should_report", "process": "eye0"})
+    assert not notifications
+
+
+def test_chrome_trace(tmp_path):
+    clock = _Clock()
+    timer = _timer(clock, [], tmp_path)
+    plugins = [Slow_Plugin(clock, 0.01, gaze_count=1)]
+
+    timer.on_notify(plugins, {"subject": "plugin_timing.trace.should_start"})
+    timer.recent_events(plugins, {})
+    timer.finish_iteration()
+    timer.on_notify(plugins, {"subject": "plugin_timing.trace.should_stop"})
+
+    with open(tmp_path / "plugin_timing_world.trace.json") as trace_file:
+        trace = json.load(trace_file)
+    assert [event["ph"] for event in trace] == ["M", "X", "X", "C"]
+    assert trace[2]["name"] == "Slow_Plugin"
+    assert trace[2]["cat"] == "recent_events"
+    assert trace[2]["dur"] == pytest.approx(0.01 * 1e6)
+    assert trace[3]["args"] == {"gaze": 1}
@@ -8,6 +8,7 @@ Lesser General Public License (LGPL v3.0).
 See COPYING and COPYING.LESSER for license details.
 ---------------------------------------------------------------------------~(*)
 """
+import numpy as np
 import pytest
 
 from raw_data_exporter import Pupil_Positions_Exporter
@@ -23,6 +24,14 @@ def _test_exporter(exporter, positions, expected_dict_export, world_index=123):
     assert set(sample_labels) == set(actual_dict_export.keys()), "Labels must be the keys for the exported dict"
     assert actual_dict_export == expected_dict_export, "Actual pupil export must be the same as expeted export"
 
+    columns = exporter.column_export([positions], np.array([world_index]))
+    assert set(sample_labels) == set(columns.keys()), "Labels must be the keys for the exported columns"
+    for label, expected in expected_dict_export.items():
+        (actual,) = exporter._csv_column(label, columns[label])
+        expected = None if expected is None else str(expected)
+        actual = None if actual is None else str(actual)
+        assert actual == expected, f"Column export of {label} must match dict export"
+
 
 def test_pupil_positions_exporter_capture():
     _test_exporter(
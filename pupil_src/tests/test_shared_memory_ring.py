@@ -0,0 +1,63 @@
+"""
+(*)~---------------------------------------------------------------------------
+Pupil - eye tracking platform
+Copyright (C) 2012-2020 Pupil Labs
+
+Distributed under the terms of the GNU
+Lesser General Public License (LGPL v3.0).
+See COPYING and COPYING.LESSER for license details.
+---------------------------------------------------------------------------~(*)
+"""
+import os
+
+import pytest
+
+from shared_memory_ring import Shared_Memory_Ring_Reader, Shared_Memory_Ring_Writer
+
+
+@pytest.fixture
+def ring(tmp_path):
+    writer = Shared_Memory_Ring_Writer(capacity=1000, directory=str(tmp_path))
+    reader = Shared_Memory_Ring_Reader(writer.path)
+    yield writer, reader
+    reader.close()
+    writer.close()
+
+
+def _frames(idx):
+    return [bytes([idx]) * (20 + idx), bytearray([idx]) * 5]
+
+
+def test_records_are_read_without_copy(ring):
+    writer, reader = ring
+    location = writer.write(_frames(1))
+    frames = reader.read(*location)
+    assert all(isinstance(frame, memoryview) for frame in frames)
+    assert [bytes(frame) for frame in frames] == [bytes(f) for f in _frames(1)]
+
+
+def test_overwritten_records_are_invalid(ring):
+    writer, reader = ring
+    locations = [writer.write(_frames(idx)) for idx in range(30)]
+    valid = [idx for idx, location in enumerate(locations) if reader.is_valid(*location)]
+
+    # The newest records are kept, all older ones were invalidated
+    assert valid == list(range(valid[0], 30))
+    assert valid[0] > 0
+    for idx in valid:
+        assert [bytes(f) for f in reader.read(*locations[idx])] == [
+            bytes(f) for f in _frames(idx)
+        ]
+    assert reader.read(*locations[0]) is None
+
+
+def test_large_records_are_rejected(ring):
+    writer, _ = ring
+    assert writer.write([b"x" * 300]) is None
+
+
+def test_close_removes_ring_file(tmp_path):
+    writer = Shared_Memory_Ring_Writer(capacity=100, directory=str(tmp_path))
+    assert os.path.exists(writer.path)
+    writer.close()
+    assert not os.path.exists(writer.path)
@@ -0,0 +1,83 @@
+"""
+(*)~---------------------------------------------------------------------------
+Pupil - eye tracking platform
+Copyright (C) 2012-2020 Pupil Labs
+
+Distributed under the terms of the GNU
+Lesser General Public License (LGPL v3.0).
+See COPYING and COPYING.LESSER for license details.
+---------------------------------------------------------------------------~(*)
+"""
+import threading
+
+from threaded_writer import Threaded_Writer
+
+
+def test_writes_all_items_in_order():
+    written = []
+    writer = Threaded_Writer("test", written.append, max_queue_size=4)
+    for item in range(100):
+        assert writer.put(item)
+    writer.close()
+
+    assert written == list(range(100))
+    stats = writer.stats()
+    assert stats.written == 100
+    assert stats.dropped == 0
+    assert stats.queue_depth == 0
+
+
+def test_drops_items_when_full():
+    release = threading.Event()
+    written = []
+
+    def slow_write(item):
+        release.wait()
+        written.append(item)
+
+    writer = Threaded_Writer("test", slow_write, max_queue_size=2, drop_when_full=True)
+    accepted = [item for item in range(10) if writer.put(item)]
+    release.set()
+    writer.close()
+
+    assert 2 <= len(accepted) < 10
+    assert written == accepted
+    assert writer.stats().dropped == 10 - len(accepted)
+
+
+def test_blocks_when_full():
+    written = []
+    writer = Threaded_Writer("test", written.append, max_queue_size=1)
+    for item in range(50):
+        assert writer.put(item)
+    writer.close()
+
+    assert written == list(range(50))
+    assert writer.stats().dropped == 0
+
+
+def test_stops_writing_after_error():
+    written = []
+
+    def write(item):
+        if item == 3:
+            raise ValueError(item)
+        written.append(item)
+
+    writer = Threaded_Writer("test", write, max_queue_size=10)
+    for item in range(6):
+        writer.put(item)
+    writer.close()
+
+    assert written == [0, 1, 2]
+    assert isinstance(writer.pop_error(), ValueError)
+    assert writer.pop_error() is None
+
+
+def test_flushes_periodically():
+    flushed = threading.Event()
+    writer = Threaded_Writer(
+        "test", lambda item: None, 10, flush=flushed.set, flush_interval=0.01
+    )
+    assert flushed.wait(timeout=5.0)
+    writer.close()
@@ -0,0 +1,82 @@
+"""
+(*)~---------------------------------------------------------------------------
+Pupil - eye tracking platform
+Copyright (C) 2012-2020 Pupil Labs
+
+Distributed under the terms of the GNU
+Lesser General Public License (LGPL v3.0).
+See COPYING and COPYING.LESSER for license details.
+---------------------------------------------------------------------------~(*)
+"""
+import numpy as np
+
+from timeline_pyramid import Timeline_Pyramid, Timeline_Pyramid_Store
+
+
+def _samples(count=1000, rate=200.0, seed=0):
+    timestamps = 100.0 + np.arange(count) / rate
+    values = np.random.default_rng(seed).normal(size=count)
+    return timestamps, values
+
+
+def test_query_bins_cover_all_samples():
+    timestamps, values = _samples()
+    values[10] = np.nan
+    pyramid = Timeline_Pyramid.from_samples(timestamps, values)
+    assert pyramid.sample_count == len(values) - 1
+
+    bins = pyramid.query(timestamps[0], timestamps[-1], 50)
+    assert 25 <= len(bins.timestamps) <= 100
+    assert np.all(np.diff(bins.timestamps) > 0)
+    assert np.nanmin(values) == bins.minimum.min()
+    assert np.nanmax(values) == bins.maximum.max()
+    assert np.all(bins.minimum <= bins.mean) and np.all(bins.mean <= bins.maximum)
+
+    finest = pyramid.query(timestamps[0], timestamps[-1], 10 ** 6)
+    assert len(finest.timestamps) == len(values) - 1
+
+
+def test_extend_matches_building_at_once():
+    timestamps, values = _samples()
+    complete = Timeline_Pyramid.from_samples(timestamps, values)
+    extended = Timeline_Pyramid.from_samples(timestamps[:600], values[:600])
+    extended.extend(timestamps[600:], values[600:])
+
+    assert extended.level_count == complete.level_count
+    for bin_count in (1, 10, 100, 1000):
+        expected = complete.query(timestamps[0], timestamps[-1], bin_count)
+        actual = extended.query(timestamps[0], timestamps[-1], bin_count)
+        for expected_field, actual_field in zip(expected, actual):
+            np.testing.assert_allclose(actual_field, expected_field)
+
+
+def test_store_reuses_and_extends_stored_pyramids(tmp_path):
+    timestamps, values = _samples()
+    store = Timeline_Pyramid_Store(str(tmp_path))
+    requested = []
+    sample_count = 600
+
+    def get_values(samples):
+        requested.append(samples)
+        return values[:sample_count][samples]
+
+    store.get("stream", timestamps[:sample_count], get_values)
+    assert requested == [slice(None)]
+
+    # e.g. further detected data, announced with a new data_changed token
+    sample_count = len(values)
+    pyramid = Timeline_Pyramid_Store(str(tmp_path)).get(
+        "stream", timestamps, get_values
+    )
+    assert requested[1:] == [slice(600), slice(600, None)]
+    assert pyramid.sample_count == len(values)
+
+    del requested[:]
+    store.get("stream", timestamps, get_values)
+    assert requested == [slice(len(values))]
+
+    values = values.copy()
+    values[100] += 1.0
+    del requested[:]
+    store.get("stream", timestamps, get_values)
+    assert requested[-1] == slice(None)
@@ -13,9 +13,11 @@ import logging
 from multiprocessing import cpu_count
 from types import SimpleNamespace
 
+import numpy as np
 import pytest
 
 import av
+from av_writer import MPEG_Writer
 from ..common import broken_data, multiple_data, single_data
 from video_capture.base_backend import NoMoreVideoError
 from video_capture.file_backend import Decoder, File_Source, OnDemandDecoder
@@ -63,3 +65,38 @@ def test_get_rec_set_name(single_fill_gaps):
     assert ("/foo", "eye0_timestamp") == single_fill_gaps.get_rec_set_name(
         "/foo/eye0_timestamp.npy"
     )
+
+
+@pytest.fixture
+def recorded_video(tmp_path):
+    """Returns the path to a video with timestamps"""
+    path = str(tmp_path / "world.mp4")
+    writer = MPEG_Writer(path, 0.0)
+    for index in range(10):
+        img = np.full((48, 64, 3), index * 20, dtype=np.uint8)
+        frame = SimpleNamespace(
+            timestamp=index / 30,
+            index=index,
+            width=64,
+            height=48,
+            img=img,
+            yuv_buffer=None,
+        )
+        writer.write_video_frame(frame)
+    writer.close()
+    return path
+
+
+def test_seeking_back_reads_cached_frames(recorded_video):
+    file_source = File_Source(
+        SimpleNamespace(), source_path=recorded_video, timing=None
+    )
+    frames = [file_source.get_frame() for _ in range(5)]
+
+    file_source.seek_to_frame(1)
+    frame = file_source.get_frame()
+    assert frame.index == 1
+    assert frame.timestamp == frames[1].timestamp
+    assert file_source._frame_cache.hits >= 1
+    assert frame is not frames[1]  # cached frames are returned as copies
+    file_source.cleanup()
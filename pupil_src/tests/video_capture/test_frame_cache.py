@@ -0,0 +1,91 @@
+"""
+(*)~---------------------------------------------------------------------------
+Pupil - eye tracking platform
+Copyright (C) 2012-2020 Pupil Labs
+
+Distributed under the terms of the GNU
+Lesser General Public License (LGPL v3.0).
+See COPYING and COPYING.LESSER for license details.
+---------------------------------------------------------------------------~(*)
+"""
+import time
+from types import SimpleNamespace
+
+from video_capture.frame_cache import FrameCache, FrameReadAhead
+
+
+def _frame(index, nbytes=10):
+    return SimpleNamespace(index=index, nbytes=nbytes)
+
+
+class _Decoder:
+    def __init__(self):
+        self.decoded = []
+        self.cleaned_up = False
+
+    def is_decodable(self, index):
+        return True
+
+    def decode(self, start, stop):
+        for index in range(start, stop):
+            self.decoded.append(index)
+            yield _frame(index)
+
+    def cleanup(self):
+        self.cleaned_up = True
+
+
+def test_cache_evicts_least_recently_used():
+    cache = FrameCache(max_bytes=30)
+    for index in range(3):
+        cache.put(_frame(index))
+    assert cache.get(0) is not None  # 1 is least recently used now
+    cache.put(_frame(3))
+
+    assert 1 not in cache
+    assert {0, 2, 3} == {idx for idx in range(4) if idx in cache}
+    assert cache.nbytes == 30
+    assert cache.get(1) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    cache.put(_frame(4, nbytes=31))  # too large to be cached at all
+    assert 4 not in cache
+    assert len(cache) == 3
+
+
+def test_read_ahead_in_play_direction():
+    cache = FrameCache(max_bytes=1000)
+    decoder = _Decoder()
+    read_ahead = FrameReadAhead(
+        cache, lambda: decoder, total_frame_count=100, frame_count=5
+    )
+
+    read_ahead.request(10, direction=1)
+    assert cache.wait_for(15, lambda: True, timeout=5.0) is not None
+    assert all(idx in cache for idx in range(11, 16))
+
+    read_ahead.request(10, direction=-1)
+    assert cache.wait_for(5, lambda: True, timeout=5.0) is not None
+    assert all(idx in cache for idx in range(5, 10))
+
+    read_ahead.stop()
+    assert decoder.cleaned_up
+    assert 10 not in decoder.decoded
+    assert sorted(decoder.decoded) == [*range(5, 10), *range(11, 16)]
+
+
+def test_read_ahead_exits_when_idle():
+    decoder = _Decoder()
+    read_ahead = FrameReadAhead(
+        FrameCache(max_bytes=1000),
+        lambda: decoder,
+        total_frame_count=10,
+        frame_count=5,
+        idle_timeout=0.01,
+    )
+    read_ahead.request(0, direction=1)
+    deadline = time.monotonic() + 5.0
+    while not decoder.cleaned_up and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert decoder.cleaned_up
+    assert read_ahead._thread is None
@@ -0,0 +1,52 @@
+"""
+(*)~---------------------------------------------------------------------------
+Pupil - eye tracking platform
+Copyright (C) 2012-2020 Pupil Labs
+
+Distributed under the terms of the GNU
+Lesser General Public License (LGPL v3.0).
+See COPYING and COPYING.LESSER for license details.
+---------------------------------------------------------------------------~(*)
+"""
+import os
+import shutil
+
+import numpy as np
+
+from video_capture.utils import Video, VideoSet
+from .common import single_data
+
+
+def test_match_sorted():
+    sorted_timestamps = np.array([0.0, 0.5, 1.0, 1.5, 2.0, 2.5])
+    timestamps = np.array([0.5, 1.5, 1.7, 2.5, 3.0])
+    lookup_idc, idc = VideoSet._match_sorted(sorted_timestamps, timestamps)
+    assert lookup_idc.tolist() == [1, 3, 5]
+    assert idc.tolist() == [0, 1, 3]
+
+    lookup_idc, idc = VideoSet._match_sorted(sorted_timestamps, np.array([]))
+    assert lookup_idc.size == idc.size == 0
+
+
+def test_pts_cache(tmp_path):
+    video_path = str(tmp_path / "eye0.mp4")
+    shutil.copy(single_data, video_path)
+
+    video = Video(video_path)
+    pts = video.load_pts()
+    assert pts.size > 0
+    # e.g. exported videos are not cached
+    assert not os.path.exists(video.pts_cache_loc)
+
+    assert np.array_equal(video.load_pts(cache=True), pts)
+    assert os.path.exists(video.pts_cache_loc)
+
+    video = Video(video_path)
+    video._read_pts = None  # cache hit does not read the container
+    assert np.array_equal(video.load_pts(cache=True), pts)
+
+    # changing the video invalidates the cache
+    with open(video_path, "ab") as video_file:
+        video_file.write(b"\0")
+    video = Video(video_path)
+    assert video._load_cached_pts() is None
@@ -0,0 +1,58 @@
+"""
+(*)~---------------------------------------------------------------------------
+Pupil - eye tracking platform
+Copyright (C) 2012-2020 Pupil Labs
+
+Distributed under the terms of the GNU
+Lesser General Public License (LGPL v3.0).
+See COPYING and COPYING.LESSER for license details.
+---------------------------------------------------------------------------~(*)
+"""
+import shutil
+
+import av
+import numpy as np
+
+from ..video_capture.common import single_data
+from video_export.plugin_base.isolated_frame_exporter import _copy_video_packets
+
+
+def _run_to_completion(generator):
+    try:
+        while True:
+            next(generator)
+    except StopIteration as stop:
+        return stop.value
+
+
+def _packet_count(video_file):
+    container = av.open(str(video_file))
+    count = sum(1 for packet in container.demux(video=0) if packet.size)
+    container.close()
+    return count
+
+
+def test_copy_video_packets_of_export_range(tmp_path):
+    input_file = tmp_path / "eye0.mp4"
+    shutil.copy(single_data, input_file)
+    timestamps = 100.0 + np.arange(_packet_count(input_file)) / 30.0
+    np.save(tmp_path / "eye0_timestamps.npy", timestamps)
+
+    # world camera with half the frame rate, export all but its last frame
+    world_timestamps = timestamps[::2]
+    output_file = tmp_path / "eye0_export.mp4"
+    copied = _run_to_completion(
+        _copy_video_packets(
+            str(input_file),
+            str(output_file),
+            (0, len(world_timestamps) - 1),
+            world_timestamps,
+            "npy",
+        )
+    )
+
+    assert copied
+    exported_timestamps = np.load(tmp_path / "eye0_export_timestamps.npy")
+    expected_stop = np.flatnonzero(timestamps == world_timestamps[-2])[0]
+    assert np.array_equal(exported_timestamps, timestamps[:expected_stop])
+    assert _packet_count(output_file) == len(exported_timestamps)
@@ -0,0 +1,132 @@
+"""
+(*)~---------------------------------------------------------------------------
+Pupil - eye tracking platform
+Copyright (C) 2012-2020 Pupil Labs
+
+Distributed under the terms of the GNU
+Lesser General Public License (LGPL v3.0).
+See COPYING and COPYING.LESSER for license details.
+---------------------------------------------------------------------------~(*)
+"""
+import os
+import types
+
+import av
+import numpy as np
+import pytest
+
+from av_writer import MPEG_Writer, concatenate_video_segments
+from video_export.plugins.world_video_exporter import (
+    MIN_SEGMENT_LENGTH,
+    Segmented_World_Video_Export,
+    split_export_range,
+)
+
+START_TIME = 100.0
+
+
+@pytest.mark.parametrize(
+    "start_frame, end_frame, segment_count",
+    [(0, 10_000, 7), (17, 3017, 4), (5, 5 + 2 * MIN_SEGMENT_LENGTH - 1, 8), (3, 4, 3)],
+)
+def test_split_export_range(start_frame, end_frame, segment_count):
+    segments = split_export_range(start_frame, end_frame, segment_count)
+
+    assert 1 <= len(segments) <= segment_count
+    assert segments[0][0] == start_frame
+    assert segments[-1][1] == end_frame
+    for (_, end), (start, _) in zip(segments, segments[1:]):
+        assert end == start
+    lengths = [end - start for start, end in segments]
+    assert max(lengths) - min(lengths) <= 1
+    if len(segments) > 1:
+        assert min(lengths) >= MIN_SEGMENT_LENGTH
+
+
+def _frame(timestamp, index, size=(64, 48)):
+    width, height = size
+    img = np.full((height, width, 3), index * 10 % 256, dtype=np.uint8)
+    return types.SimpleNamespace(
+        timestamp=timestamp,
+        index=index,
+        width=width,
+        height=height,
+        img=img,
+        yuv_buffer=None,
+    )
+
+
+def _write_segment(path, timestamps, first_index, size=(64, 48)):
+    writer = MPEG_Writer(str(path), START_TIME)
+    for index, timestamp in enumerate(timestamps, start=first_index):
+        writer.write_video_frame(_frame(timestamp, index, size))
+    writer.close()
+
+
+def _decoded_frame_count(path):
+    with av.open(str(path)) as container:
+        return sum(1 for _ in container.decode(video=0))
+
+
+def test_concatenate_video_segments(tmp_path):
+    timestamps = START_TIME + np.arange(45) / 30
+    segment_paths = []
+    for segment, (start, end) in enumerate(split_export_range(0, 45, 3)):
+        path = tmp_path / f"segment_{segment:03d}.mp4"
+        _write_segment(path, timestamps[start:end], start)
+        segment_paths.append(str(path))
+
+    output_path = tmp_path / "world.mp4"
+    concatenate_video_segments(segment_paths, str(output_path), START_TIME)
+
+    assert _decoded_frame_count(output_path) == len(timestamps)
+    np.testing.assert_array_equal(
+        np.load(tmp_path / "world_timestamps.npy"), timestamps
+    )
+
+
+def test_concatenate_rejects_incompatible_segments(tmp_path):
+    timestamps = START_TIME + np.arange(10) / 30
+    segment_paths = [str(tmp_path / f"segment_{idx:03d}.mp4") for idx in range(2)]
+    _write_segment(segment_paths[0], timestamps[:5], 0)
+    _write_segment(segment_paths[1], timestamps[5:], 5, size=(32, 24))
+
+    output_path = tmp_path / "world.mp4"
+    with pytest.raises(ValueError):
+        concatenate_video_segments(segment_paths, str(output_path), START_TIME)
+    assert not output_path.exists()
+
+
+class _Failing_Task:
+    completed = False
+    canceled = False
+
+    def __init__(self):
+        self.cancel_calls = 0
+
+    def fetch(self):
+        raise RuntimeError("segment export failed")
+        yield
+
+    def cancel(self, timeout=None):
+        self.cancel_calls += 1
+
+
+def test_failed_segment_cancels_export_and_removes_segments(tmp_path):
+    segment_dir = tmp_path / ".world_video_segments_test"
+    segment_dir.mkdir()
+    (segment_dir / "segment_000.mp4").write_bytes(b"")
+
+    export = Segmented_World_Video_Export.__new__(Segmented_World_Video_Export)
+    export._segment_dir = str(segment_dir)
+    export._segment_exports = [_Failing_Task(), _Failing_Task()]
+    export._progress = [0, 0]
+    export._canceled = False
+    export._concatenation = None
+
+    with pytest.raises(RuntimeError):
+        list(export.fetch())
+
+    assert export.canceled
+    assert [task.cancel_calls for task in export._segment_exports] == [1, 1]
+    assert not os.path.exists(segment_dir)